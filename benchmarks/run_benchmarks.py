@@ -0,0 +1,381 @@
+"""
+Stage-level benchmark suite.
+
+Times each stage of a conversion on deterministic synthetic workbooks and compares
+the results with the checked-in baseline (benchmarks/baseline.json):
+
+    python -m benchmarks.run_benchmarks                 # compare with the baseline
+    python -m benchmarks.run_benchmarks --update-baseline
+    python -m benchmarks.run_benchmarks --profile scale_1x --profile scale_8x
+
+Stages:
+    ingest   - streaming the .xlsx through upload validation (`handle_file_upload`)
+    parse    - `ModelCompiler().read_and_parse_archive` (skipped if xlcalculator can't parse it)
+    parse_streaming - `read_workbook_streaming`, the bounded-memory ingest engine selected
+               with `engine="streaming"`
+    artifact_load - `load_model_artifact` of the parsed model's compiled-model artifact, what
+               scripts with runtime-evaluated cells load instead of parsing (skipped with parse)
+    extract  - `extract_formula_dependencies`
+    order    - `get_evaluation_order_and_cycles`
+    naming   - building the symbol table in `generate_static_python_code`
+    codegen  - the codegen part of `generate_static_python_code`
+    codegen_optimized - the codegen part with `optimize=True`, including the optimizer's passes
+    sandbox  - running the assembled script in the sandbox (arithmetic-only profiles)
+    sandbox_optimized - running the script generated with `optimize=True` (profiles of
+               arithmetic, IF, MAX and ROUND formulas, which only translate to runnable
+               code once optimized)
+    recalc   - computing every formula with a fresh `RecalcEngine` (arithmetic-only profiles)
+    recalc_input - `set_inputs` plus `recalculate` after changing the input with the most
+               dependents, per change (arithmetic-only profiles)
+
+extract, order, naming and codegen run on the synthetic in-memory model, so they measure
+the converter alone. A fixed pure-Python workload is timed first; baseline numbers
+are scaled by how much faster or slower this machine runs it, so the baseline can
+be compared across machines. Profiles in a scaling pair (same shape, more rows)
+additionally check that extract, order, naming and both codegen stages grow roughly linearly,
+and that recalc_input grows with the number of formulas the change affects rather
+than with the workbook. Each profile also records the peak memory traced while parsing
+with either engine (`peak_memory_kb`); it is reported, not compared with the baseline.
+
+Exits with status 1 if a stage regressed past its threshold.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+
+from fastapi import UploadFile
+
+from src.file_handler import handle_file_upload
+from src.dependency_extractor import extract_formula_dependencies, get_evaluation_order_and_cycles, generate_static_python_code
+from src.pipeline import assemble_script
+from src.xlsx_stream import read_workbook_streaming
+from src.model_artifact import serialize_model, write_model_artifact, load_model_artifact
+from src.recalc import RecalcEngine
+from src.sandbox import run_script_in_sandbox, shutdown_sandbox_pool
+from .synthetic_workbook import WorkbookProfile, generate_workbook
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("ingest", "parse", "parse_streaming", "artifact_load", "extract", "order", "naming", "codegen", "codegen_optimized", "sandbox", "sandbox_optimized", "recalc", "recalc_input")
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# A stage regresses when it is slower than baseline * threshold (after scaling by
+# the calibration) and by more than the noise floor. The defaults below are used
+# when the baseline file doesn't set its own.
+DEFAULT_THRESHOLDS = {"default": 1.5, "ingest": 2.0, "parse": 2.0, "parse_streaming": 2.0, "artifact_load": 2.0, "sandbox": 2.0, "sandbox_optimized": 2.0}
+DEFAULT_NOISE_FLOOR_SECONDS = 0.005
+# Per-formula time of the larger profile of a scaling pair may be at most this many
+# times that of the smaller one. Linear stages stay near 1 (cache effects push it up
+# a little); quadratic ones reach the size ratio of the pair.
+SCALING_TOLERANCE = 3.0
+SCALING_STAGES = ("extract", "order", "naming", "codegen", "codegen_optimized")
+# Input changes timed per recalc_input run; a single change is too quick to time reliably
+INCREMENTAL_ROUNDS = 50
+
+PROFILES = [
+    WorkbookProfile("mixed_small", rows=200, columns=10),
+    WorkbookProfile("fan_in_heavy", rows=200, columns=12, fan_in=8, fan_out=1.5),
+    WorkbookProfile("fan_out_heavy", rows=200, columns=12, fan_in=2, fan_out=50),
+    WorkbookProfile("range_heavy", rows=300, columns=8, range_size=50, function_mix={"sum": 1, "average": 1}),
+    WorkbookProfile("deep_chain", rows=100, columns=40, dependency_depth=39, fan_in=1, fan_out=1, function_mix={"arithmetic": 1}),
+    WorkbookProfile("logic_mix", rows=200, columns=10, function_mix={"arithmetic": 1, "if": 1, "max": 1, "round": 1}),
+    WorkbookProfile("multi_sheet", sheets=4, rows=250, columns=10, cross_sheet_ratio=0.3, function_mix={"arithmetic": 1}),
+    WorkbookProfile("scale_1x", rows=250, columns=10, function_mix={"arithmetic": 1}),
+    WorkbookProfile("scale_8x", rows=2000, columns=10, function_mix={"arithmetic": 1}),
+]
+# (smaller, larger) profiles with the same shape
+SCALING_PAIRS = [("scale_1x", "scale_8x")]
+
+def calibrate(repeat: int = 5) -> float:
+    """Times a fixed pure-Python workload (dict, string and list operations like the converter's)."""
+    def workload():
+        names = {}
+        for index in range(200_000):
+            key = f"Sheet1!A{index}"
+            names[key] = key.lower().replace("!", "_")
+        return sorted(names.values())[:10]
+    return _time(workload, repeat)[0]
+
+def _time(func, repeat: int) -> tuple[float, object]:
+    """
+    Returns the fastest wall time of `repeat` calls of `func` and the result of the
+    last one. Like timeit, the garbage collector is paused while timing, and the
+    minimum is reported since slower runs only add noise from the rest of the machine.
+    """
+    durations = []
+    result = None
+    for _ in range(repeat):
+        result = None
+        gc.collect()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            result = func()
+            durations.append(time.perf_counter() - started)
+        finally:
+            gc.enable()
+    return min(durations), result
+
+def _peak_memory_kb(func) -> int:
+    """Returns the peak memory, in KiB, that Python allocated during one call of `func`."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        tracemalloc.stop()
+
+# Formula kinds whose optimized translation runs without xlcalculator (the translator's
+# own output for function calls doesn't, see ExpressionOptimizer)
+OPTIMIZED_EXECUTABLE_KINDS = {"arithmetic", "if", "max", "round"}
+
+def _is_executable(profile: WorkbookProfile, optimized: bool = False) -> bool:
+    # Only arithmetic formulas translate to a script that runs without xlcalculator
+    if optimized:
+        return set(profile.function_mix) <= OPTIMIZED_EXECUTABLE_KINDS
+    return set(profile.function_mix) == {"arithmetic"}
+
+def _time_codegen(model, repeat: int, optimize: bool = False) -> tuple[str, dict, float, float]:
+    """
+    Times only the naming and codegen parts of generate_static_python_code; ordering is
+    timed on its own. Returns the code, its report and the naming and codegen seconds.
+    """
+    def codegen():
+        marks = {}
+        report = {}
+        code = generate_static_python_code(model, report=report, optimize=optimize, progress=lambda stage: marks.setdefault(stage, time.perf_counter()))
+        return code, report, marks["codegen"] - marks["naming"], time.perf_counter() - marks["codegen"]
+    naming_durations = []
+    codegen_durations = []
+    for _ in range(repeat):
+        _, (code, report, naming_seconds, codegen_seconds) = _time(codegen, 1)
+        naming_durations.append(naming_seconds)
+        codegen_durations.append(codegen_seconds)
+    return code, report, min(naming_durations), min(codegen_durations)
+
+def _time_sandbox(script: str, repeat: int) -> tuple[float | None, str | None]:
+    """Times running `script` in the sandbox. Returns the seconds, or None and why it failed."""
+    try:
+        asyncio.run(run_script_in_sandbox("pass")) # Warm up the sandbox pool
+        seconds, _ = _time(lambda: asyncio.run(run_script_in_sandbox(script)), repeat)
+        return seconds, None
+    except Exception as e:
+        return None, f"failed: {getattr(e, 'stderr', None) or e}"
+
+def run_profile(profile: WorkbookProfile, repeat: int) -> dict:
+    """Times every stage for one profile. Returns {"stages": {stage: seconds | None}, ...}."""
+    workbook = generate_workbook(profile)
+    xlsx_bytes = workbook.to_xlsx_bytes()
+    model = workbook.to_model()
+    stages: dict[str, float | None] = {}
+    notes: dict[str, str] = {}
+
+    def ingest():
+        upload = UploadFile(file=BytesIO(xlsx_bytes), filename="benchmark.xlsx", size=len(xlsx_bytes))
+        return asyncio.run(handle_file_upload(upload))
+    stages["ingest"], _ = _time(ingest, repeat)
+
+    parsed_model = None
+    peak_memory_kb = {"parse": None, "parse_streaming": None}
+    try:
+        from xlcalculator.model import ModelCompiler
+        stages["parse"], parsed_model = _time(lambda: ModelCompiler().read_and_parse_archive(BytesIO(xlsx_bytes)), repeat)
+        peak_memory_kb["parse"] = _peak_memory_kb(lambda: ModelCompiler().read_and_parse_archive(BytesIO(xlsx_bytes)))
+    except Exception as e:
+        stages["parse"] = None
+        notes["parse"] = f"skipped: {e}"
+    stages["parse_streaming"], _ = _time(lambda: read_workbook_streaming(xlsx_bytes), repeat)
+    peak_memory_kb["parse_streaming"] = _peak_memory_kb(lambda: read_workbook_streaming(xlsx_bytes))
+
+    stages["artifact_load"] = None
+    if parsed_model is not None:
+        try:
+            with tempfile.TemporaryDirectory() as artifact_dir:
+                artifact_path = write_model_artifact(serialize_model(parsed_model), os.path.join(artifact_dir, "benchmark.py"))
+                stages["artifact_load"], _ = _time(lambda: load_model_artifact(artifact_path), repeat)
+        except Exception as e:
+            notes["artifact_load"] = f"skipped: {e}"
+    else:
+        notes["artifact_load"] = "skipped: the workbook was not parsed"
+
+    stages["extract"], _ = _time(lambda: extract_formula_dependencies(model), repeat)
+    stages["order"], _ = _time(lambda: get_evaluation_order_and_cycles(model), repeat)
+
+    code, _, stages["naming"], stages["codegen"] = _time_codegen(model, repeat)
+    optimized_code, optimized_report, _, stages["codegen_optimized"] = _time_codegen(model, repeat, optimize=True)
+
+    stages["sandbox"] = stages["sandbox_optimized"] = None
+    if _is_executable(profile):
+        stages["sandbox"], notes["sandbox"] = _time_sandbox(assemble_script(code), repeat)
+    else:
+        notes["sandbox"] = "skipped: the function mix does not translate to a runnable script"
+    if _is_executable(profile, optimized=True):
+        stages["sandbox_optimized"], notes["sandbox_optimized"] = _time_sandbox(assemble_script(optimized_code), repeat)
+    else:
+        notes["sandbox_optimized"] = "skipped: the function mix does not translate to a runnable script"
+    notes = {stage: note for stage, note in notes.items() if note is not None}
+
+    recalc_affected_cells = None
+    if _is_executable(profile):
+        engines = iter([RecalcEngine(model) for _ in range(repeat)])
+        stages["recalc"], engine = _time(lambda: _recalculate(next(engines)), repeat)
+        # The input feeding the most formulas directly, so the change reaches a sizeable subgraph
+        fan_out = {}
+        for precedents in extract_formula_dependencies(model).values():
+            for precedent in precedents:
+                if not model.cells[precedent].formula:
+                    fan_out[precedent] = fan_out.get(precedent, 0) + 1
+        changed_input = max(fan_out, key=lambda address: (fan_out[address], address))
+        rounds = iter(range(repeat * INCREMENTAL_ROUNDS))
+        def change_input():
+            for _ in range(INCREMENTAL_ROUNDS):
+                engine.set_inputs({changed_input: float(next(rounds))})
+                engine.recalculate()
+        seconds, _ = _time(change_input, repeat)
+        stages["recalc_input"] = seconds / INCREMENTAL_ROUNDS
+        recalc_affected_cells = engine.last_recalculated
+    else:
+        stages["recalc"] = stages["recalc_input"] = None
+        notes["recalc"] = notes["recalc_input"] = "skipped: the function mix does not translate to runnable formulas"
+
+    return {
+        "cells": len(workbook.cells),
+        "formulas": workbook.formula_count,
+        "recalc_affected_cells": recalc_affected_cells,
+        "optimizer": optimized_report.get("optimizer"),
+        "xlsx_bytes": len(xlsx_bytes),
+        "peak_memory_kb": peak_memory_kb,
+        "stages": {stage: round(seconds, 6) if seconds is not None else None for stage, seconds in stages.items()},
+        "notes": notes,
+    }
+
+def _recalculate(engine: RecalcEngine) -> RecalcEngine:
+    engine.recalculate()
+    return engine
+
+def run_suite(profiles: list[WorkbookProfile], repeat: int) -> dict:
+    """Runs every profile and returns the results in the baseline format."""
+    results = {
+        "calibration_seconds": round(calibrate(), 6),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "profiles": {},
+    }
+    for profile in profiles:
+        logger.info(f"Running profile {profile.name} ({profile.cell_count} cells)...")
+        results["profiles"][profile.name] = run_profile(profile, repeat)
+        results["profiles"][profile.name]["profile"] = profile.to_dict()
+    return results
+
+def compare_to_baseline(results: dict, baseline: dict) -> list[str]:
+    """
+    Compares stage timings with the baseline.
+
+    Returns:
+        list[str]: One message per regressed stage; empty if nothing regressed.
+    """
+    thresholds = {**DEFAULT_THRESHOLDS, **baseline.get("thresholds", {})}
+    noise_floor = baseline.get("noise_floor_seconds", DEFAULT_NOISE_FLOOR_SECONDS)
+    # > 1 when this machine is slower than the one the baseline was recorded on
+    speed_factor = 1.0
+    if baseline.get("calibration_seconds") and results.get("calibration_seconds"):
+        speed_factor = results["calibration_seconds"] / baseline["calibration_seconds"]
+
+    regressions = []
+    for name, profile_results in results["profiles"].items():
+        baseline_stages = baseline.get("profiles", {}).get(name, {}).get("stages", {})
+        for stage, seconds in profile_results["stages"].items():
+            expected = baseline_stages.get(stage)
+            if seconds is None or expected is None:
+                continue
+            expected *= speed_factor
+            threshold = thresholds.get(stage, thresholds["default"])
+            if seconds > expected * threshold and seconds - expected > noise_floor:
+                regressions.append(f"{name}/{stage}: {seconds * 1000:.1f}ms vs. {expected * 1000:.1f}ms expected (x{seconds / expected:.2f}, threshold x{threshold})")
+    return regressions
+
+def check_scaling(results: dict, pairs: list[tuple[str, str]] = SCALING_PAIRS) -> list[str]:
+    """Flags stages whose time per formula grows with the workbook size (e.g. went quadratic)."""
+    problems = []
+    for small_name, large_name in pairs:
+        small = results["profiles"].get(small_name)
+        large = results["profiles"].get(large_name)
+        if small is None or large is None:
+            continue
+        for stage in SCALING_STAGES:
+            small_seconds, large_seconds = small["stages"].get(stage), large["stages"].get(stage)
+            if not small_seconds or not large_seconds:
+                continue
+            growth = (large_seconds / large["formulas"]) / (small_seconds / small["formulas"])
+            if growth > SCALING_TOLERANCE:
+                problems.append(f"{stage}: time per formula grows x{growth:.2f} from {small_name} to {large_name} (tolerance x{SCALING_TOLERANCE})")
+        # An input change should cost the same per affected formula however large the workbook is
+        small_seconds, large_seconds = small["stages"].get("recalc_input"), large["stages"].get("recalc_input")
+        if small_seconds and large_seconds and small.get("recalc_affected_cells") and large.get("recalc_affected_cells"):
+            growth = (large_seconds / large["recalc_affected_cells"]) / (small_seconds / small["recalc_affected_cells"])
+            if growth > SCALING_TOLERANCE:
+                problems.append(f"recalc_input: time per affected formula grows x{growth:.2f} from {small_name} to {large_name} (tolerance x{SCALING_TOLERANCE})")
+    return problems
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the conversion stages on synthetic workbooks.")
+    parser.add_argument("--profile", action="append", help="Only run this profile (repeatable).")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage; the median is reported.")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file to compare with.")
+    parser.add_argument("--update-baseline", action="store_true", help="Write the results to the baseline file instead of comparing.")
+    parser.add_argument("--output", help="Also write the results to this JSON file.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s", handlers=[logging.StreamHandler(sys.stderr)])
+    # The converter's per-formula warnings would dominate the output
+    logging.getLogger("src").setLevel(logging.ERROR)
+
+    profiles = [profile for profile in PROFILES if not args.profile or profile.name in args.profile]
+    try:
+        results = run_suite(profiles, args.repeat)
+    finally:
+        shutdown_sandbox_pool()
+
+    for name, profile_results in results["profiles"].items():
+        timings = ", ".join(f"{stage} {seconds * 1000:.1f}ms" for stage, seconds in profile_results["stages"].items() if seconds is not None)
+        logger.info(f"{name} ({profile_results['formulas']} formulas): {timings}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        # Keep hand-tuned thresholds; replace the measurements
+        results["thresholds"] = baseline.get("thresholds", DEFAULT_THRESHOLDS)
+        results["noise_floor_seconds"] = baseline.get("noise_floor_seconds", DEFAULT_NOISE_FLOOR_SECONDS)
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        logger.info(f"Baseline written to {args.baseline}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    problems = compare_to_baseline(results, baseline) + check_scaling(results)
+    for problem in problems:
+        logger.error(f"REGRESSION {problem}")
+    if not problems:
+        logger.info("No regressions against the baseline.")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""
+Deterministic synthetic workbooks for the benchmark suite.
+
+A `WorkbookProfile` describes the shape of a workbook (sheets, cells, formula
+density, dependency depth, fan-in/fan-out, range sizes and function mix) and
+`generate_workbook` turns it into the same cells every time for the same seed.
+
+Columns of every sheet are split into layers. Layer 0 holds input values; a formula
+in layer L reads cells of layer L-1 only, so dependency chains are at most
+`dependency_depth` formulas long and there are no cycles. Each formula has `fan_in` references (or one range
+of `range_size` cells for aggregate functions), drawn from a pool sized so that a
+referenced cell has about `fan_out` dependents.
+
+The result can be written as .xlsx (for the ingest and parse stages) or used as an
+in-memory model with the `cells`/`formula`/`precedents` interface the converter
+reads from xlcalculator, so the later stages don't depend on xlcalculator's parser.
+"""
+import random
+import re
+from io import BytesIO
+
+from src.formula_shapes import column_index_to_letters
+
+# Formula kinds and the default weight of each in the mix. Only "arithmetic"
+# formulas translate to code that runs without xlcalculator.
+DEFAULT_FUNCTION_MIX = {
+    "arithmetic": 5,
+    "sum": 2,
+    "average": 1,
+    "max": 1,
+    "if": 1,
+    "round": 1,
+}
+# Kinds that read a range rather than `fan_in` single cells
+_RANGE_KINDS = {"sum", "average"}
+_RANGE_PATTERN = re.compile(r"^(.+?)!([A-Z]+)(\d+):([A-Z]+)(\d+)$")
+
+class WorkbookProfile:
+    """Parameters of a synthetic workbook."""
+    def __init__(
+        self,
+        name: str,
+        sheets: int = 1,
+        rows: int = 100,
+        columns: int = 10,
+        formula_density: float = 0.8,
+        dependency_depth: int = 4,
+        fan_in: int = 2,
+        fan_out: float = 2.0,
+        range_size: int = 5,
+        function_mix: dict[str, float] | None = None,
+        cross_sheet_ratio: float = 0.0,
+        seed: int = 0,
+    ):
+        self.name = name
+        self.sheets = sheets
+        self.rows = rows
+        self.columns = columns
+        # Share of the non-input cells that hold a formula; the rest are constants
+        self.formula_density = formula_density
+        self.dependency_depth = max(1, dependency_depth)
+        self.fan_in = max(1, fan_in)
+        self.fan_out = max(1.0, fan_out)
+        self.range_size = max(1, range_size)
+        self.function_mix = function_mix or DEFAULT_FUNCTION_MIX
+        # Share of references that point at the same layer of another sheet
+        self.cross_sheet_ratio = cross_sheet_ratio if sheets > 1 else 0.0
+        self.seed = seed
+
+    @property
+    def cell_count(self) -> int:
+        return self.sheets * self.rows * self.columns
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+class SyntheticCell:
+    """A cell with the attributes the converter reads from xlcalculator's cells."""
+    def __init__(self, formula_address: str, formula: str | None, value):
+        self.formula_address = formula_address
+        self.formula = formula
+        self.value = value
+        self.precedents: list["SyntheticCell"] = []
+
+class SyntheticModel:
+    """Stand-in for an xlcalculator Model: `cells` maps addresses to cells, in sheet/row/column order."""
+    def __init__(self, cells: dict[str, SyntheticCell]):
+        self.cells = cells
+
+class SyntheticWorkbook:
+    """Generated cells of a profile. Formulas are stored without the leading "="."""
+    def __init__(self, profile: WorkbookProfile, sheet_names: list[str], cells: dict[str, tuple[str | None, float | None]], references: dict[str, list[str]]):
+        self.profile = profile
+        self.sheet_names = sheet_names
+        # address -> (formula or None, value or None)
+        self.cells = cells
+        # formula address -> addresses it reads, ranges expanded
+        self.references = references
+
+    @property
+    def formula_count(self) -> int:
+        return len(self.references)
+
+    def to_model(self) -> SyntheticModel:
+        """Builds an in-memory model with the precedents already resolved."""
+        cells = {address: SyntheticCell(address, formula, value) for address, (formula, value) in self.cells.items()}
+        for address, precedent_addresses in self.references.items():
+            cells[address].precedents = [cells[precedent] for precedent in precedent_addresses]
+        return SyntheticModel(cells)
+
+    def to_xlsx_bytes(self) -> bytes:
+        """Writes the workbook as .xlsx with openpyxl."""
+        from openpyxl import Workbook
+
+        workbook = Workbook()
+        workbook.remove(workbook.active)
+        worksheets = {name: workbook.create_sheet(name) for name in self.sheet_names}
+        for address, (formula, value) in self.cells.items():
+            sheet_name, cell_reference = address.split("!")
+            worksheets[sheet_name][cell_reference] = f"={formula}" if formula is not None else value
+        buffer = BytesIO()
+        workbook.save(buffer)
+        return buffer.getvalue()
+
+def _column_layers(profile: WorkbookProfile) -> list[int]:
+    """Assigns each column (0-based) a layer: 0 for inputs, then 1..dependency_depth."""
+    layer_count = profile.dependency_depth + 1
+    return [min(column * layer_count // profile.columns, layer_count - 1) for column in range(profile.columns)]
+
+def _expand_range(reference: str) -> list[str]:
+    sheet, first_column, first_row, last_column, last_row = _RANGE_PATTERN.match(reference).groups()
+    return [f"{sheet}!{first_column}{row}" for row in range(int(first_row), int(last_row) + 1)]
+
+def generate_workbook(profile: WorkbookProfile) -> SyntheticWorkbook:
+    """Generates the cells of `profile`. The same profile always yields the same workbook."""
+    rng = random.Random(profile.seed)
+    sheet_names = [f"Sheet{index + 1}" for index in range(profile.sheets)]
+    layers = _column_layers(profile)
+    columns_by_layer: dict[int, list[int]] = {}
+    for column, layer in enumerate(layers):
+        columns_by_layer.setdefault(layer, []).append(column)
+    kinds = list(profile.function_mix)
+    weights = [profile.function_mix[kind] for kind in kinds]
+
+    # Each layer reads from a pool of cells of the layer below, sized for the fan-out
+    def reference_pool(layer: int) -> list[tuple[int, int]]:
+        source_columns = columns_by_layer[layer - 1]
+        readers = len(columns_by_layer[layer]) * profile.rows * profile.formula_density * profile.fan_in
+        pool_size = max(profile.fan_in, min(len(source_columns) * profile.rows, round(readers / profile.fan_out)))
+        return [(row, source_columns[index % len(source_columns)]) for index, row in zip(range(pool_size), _cycle_rows(profile.rows))]
+
+    pools = {layer: reference_pool(layer) for layer in columns_by_layer if layer > 0}
+
+    cells: dict[str, tuple[str | None, float | None]] = {}
+    references: dict[str, list[str]] = {}
+    for sheet_name in sheet_names:
+        for row in range(1, profile.rows + 1):
+            for column in range(profile.columns):
+                address = f"{sheet_name}!{column_index_to_letters(column + 1)}{row}"
+                layer = layers[column]
+                if layer == 0 or rng.random() >= profile.formula_density:
+                    cells[address] = (None, float(rng.randint(1, 1000)))
+                    continue
+                formula, read_addresses = _make_formula(rng, profile, sheet_name, sheet_names, pools[layer], rng.choices(kinds, weights)[0])
+                cells[address] = (formula, None)
+                references[address] = read_addresses
+    return SyntheticWorkbook(profile, sheet_names, cells, references)
+
+def _cycle_rows(rows: int):
+    """Yields rows 1..rows, then starts over."""
+    while True:
+        yield from range(1, rows + 1)
+
+def _make_formula(rng: random.Random, profile: WorkbookProfile, sheet_name: str, sheet_names: list[str], pool: list[tuple[int, int]], kind: str) -> tuple[str, list[str]]:
+    """Builds one formula of `kind` and returns it with the addresses it reads."""
+    def pick_sheet() -> str:
+        if profile.cross_sheet_ratio and rng.random() < profile.cross_sheet_ratio:
+            return rng.choice(sheet_names)
+        return sheet_name
+
+    if kind in _RANGE_KINDS:
+        row, column = rng.choice(pool)
+        first_row = max(1, min(row, profile.rows - profile.range_size + 1))
+        letters = column_index_to_letters(column + 1)
+        reference = f"{pick_sheet()}!{letters}{first_row}:{letters}{first_row + profile.range_size - 1}"
+        function = "SUM" if kind == "sum" else "AVERAGE"
+        return f"{function}({reference})", _expand_range(reference)
+
+    operands = []
+    for _ in range(profile.fan_in):
+        row, column = rng.choice(pool)
+        operands.append(f"{pick_sheet()}!{column_index_to_letters(column + 1)}{row}")
+    if kind == "max":
+        formula = f"MAX({','.join(operands)})"
+    elif kind == "if":
+        other = operands[1] if len(operands) > 1 else "0"
+        formula = f"IF({operands[0]}>{other},{operands[0]},{other})"
+    elif kind == "round":
+        formula = f"ROUND({'+'.join(operands)},2)"
+    else:
+        operators = [rng.choice("+-*") for _ in operands[1:]]
+        formula = operands[0] + "".join(f"{operator}{operand}" for operator, operand in zip(operators, operands[1:]))
+    return formula, list(dict.fromkeys(operands))
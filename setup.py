@@ -31,6 +31,7 @@ setup(
     entry_points={
         "console_scripts": [
             "formulas-cli=src.cli:main_wrapper",
+            "formulas-worker=src.job_runner:main_wrapper",
         ],
     },
     python_requires=">=3.8",
@@ -0,0 +1,226 @@
+"""
+Batch conversion for `formulas-cli --batch`.
+
+Converts every workbook matching a set of directories and glob patterns in a pool of
+worker processes. Workers are reused across files, so the converter is imported once
+per worker and each worker keeps its conversion cache warm; the disk tier of the cache
+is shared by all workers and by later runs. The outcome of every file is collected
+into a JSON summary.
+"""
+import glob
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .file_handler import ALLOWED_EXTENSIONS
+from .pipeline import DEFAULT_INGEST_ENGINE, build_model_artifact, convert_workbook, ingest_engine_for
+from .model_artifact import write_model_artifact
+from .conversion_cache import create_conversion_cache, make_cache_key
+from .diagnostics import install_request_warnings_handler
+from .timings import StageTimings
+
+logger = logging.getLogger(__name__)
+
+# Conversion cache of this process, created on first use
+_worker_cache = None
+
+def _is_convertible(path: str) -> bool:
+    return os.path.isfile(path) and os.path.splitext(path)[1].lower().lstrip(".") in ALLOWED_EXTENSIONS
+
+def _glob_root(pattern: str) -> str:
+    """Returns the directory part of `pattern` before its first wildcard."""
+    parts = []
+    for part in os.path.normpath(pattern).split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return os.sep.join(parts) or "."
+
+def collect_input_files(patterns: list[str]) -> tuple[list[tuple[str, str]], list[str]]:
+    """
+    Expands directories (searched recursively) and glob patterns (`**` allowed) into
+    the .xlsx/.csv/.tsv files they contain.
+
+    Returns:
+        tuple: ([(path, root), ...] sorted by path, where `root` is the directory the
+               path is relative to in the output; [patterns that matched nothing]).
+    """
+    files: dict[str, str] = {}
+    unmatched = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            root = pattern
+            matches = [
+                os.path.join(directory, name)
+                for directory, _, names in os.walk(pattern)
+                for name in names
+            ]
+        elif glob.has_magic(pattern):
+            root = _glob_root(pattern)
+            matches = glob.glob(pattern, recursive=True)
+        else:
+            root = os.path.dirname(pattern) or "."
+            matches = [pattern]
+        matches = [path for path in matches if _is_convertible(path)]
+        if not matches:
+            unmatched.append(pattern)
+        for path in matches:
+            files.setdefault(os.path.normpath(path), root)
+    return sorted(files.items()), unmatched
+
+def plan_output_paths(files: list[tuple[str, str]], output_dir: str | None) -> dict[str, str]:
+    """
+    Maps each input file to the path of its generated script.
+
+    Scripts go next to their workbook, or into `output_dir` mirroring the layout below
+    the directory or pattern they were found with. `book.xlsx` becomes `book.py`; if
+    that name is taken by another input (e.g. `book.csv`), the extension is kept in
+    the name (`book_csv.py`).
+    """
+    output_paths: dict[str, str] = {}
+    taken = set()
+    for path, root in files:
+        if output_dir:
+            base = os.path.join(output_dir, os.path.relpath(path, root))
+        else:
+            base = path
+        stem, extension = os.path.splitext(base)
+        output_path = f"{stem}.py"
+        if output_path in taken:
+            output_path = f"{stem}_{extension.lstrip('.').lower()}.py"
+        taken.add(output_path)
+        output_paths[path] = output_path
+    return output_paths
+
+def _init_batch_worker():
+    """Initializer for batch worker processes: capture warnings per conversion."""
+    install_request_warnings_handler()
+
+def convert_file(input_path: str, output_path: str, force_evaluator: bool = False, vectorize: bool = False, as_module: bool = False, targets: list[str] | None = None, inputs: list[str] | None = None, optimize: bool = False, engine: str = DEFAULT_INGEST_ENGINE) -> dict:
+    """
+    Converts one workbook and writes its script, plus the compiled model next to it
+    when some cells are evaluated at runtime. Runs in a batch worker process.
+
+    Never raises: failures are reported in the returned summary entry.
+
+    Returns:
+        dict: Summary entry with `input`, `output`, `status` ("succeeded" or "failed"),
+              `cached`, `warnings`, `report`, `error` and `timings` (wall and CPU
+              milliseconds per stage, as in the /convert/ response).
+    """
+    global _worker_cache
+    started = time.perf_counter()
+    cpu_started = time.thread_time()
+    entry = {"input": input_path, "output": None, "status": "failed", "cached": False, "warnings": [], "report": None, "error": None, "timings": {}}
+    timings = StageTimings()
+    engine = ingest_engine_for(input_path, engine)
+    try:
+        timings("read")
+        with open(input_path, "rb") as f:
+            file_content = f.read()
+
+        if _worker_cache is None:
+            _worker_cache = create_conversion_cache()
+        cache_key = make_cache_key(file_content, {"force_evaluator": force_evaluator, "vectorize": vectorize, "as_module": as_module, "targets": targets, "inputs": inputs, "optimize": optimize, "engine": engine})
+        conversion = _worker_cache.get(cache_key)
+        entry["cached"] = conversion is not None
+        if conversion is None:
+            timings.stop()
+            conversion = convert_workbook(file_content, force_evaluator, vectorize, as_module=as_module, targets=targets, inputs=inputs, optimize=optimize, engine=engine)
+            timings.update(conversion.pop("timings", {}))
+            # The compiled model is written with the script but not cached, which stores JSON
+            model_artifact = conversion.pop("model_artifact", None)
+            _worker_cache.put(cache_key, conversion)
+        elif conversion["report"].get("fallback_cells"):
+            timings("artifact")
+            model_artifact = build_model_artifact(file_content, engine)
+        else:
+            model_artifact = None
+
+        timings("write")
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        with open(output_path, "w") as f:
+            f.write(conversion["script"])
+        if model_artifact is not None:
+            write_model_artifact(model_artifact, output_path)
+        entry.update(status="succeeded", output=output_path, warnings=conversion["warnings"], report=conversion["report"])
+    except Exception as e:
+        logger.error(f"Could not convert {input_path}: {e}")
+        entry["error"] = str(e)
+    finally:
+        timings.stop()
+        timings.add("total", time.perf_counter() - started, time.thread_time() - cpu_started)
+        entry["timings"] = timings.to_dict()
+    return entry
+
+def run_batch(patterns: list[str], jobs: int, output_dir: str | None = None, force_evaluator: bool = False, vectorize: bool = False, as_module: bool = False, targets: list[str] | None = None, inputs: list[str] | None = None, optimize: bool = False, engine: str = DEFAULT_INGEST_ENGINE) -> dict:
+    """
+    Converts every workbook matching `patterns` with up to `jobs` worker processes.
+
+    Args:
+        patterns (list[str]): Files, directories and glob patterns to convert.
+        jobs (int): Number of worker processes. 1 converts in this process.
+        output_dir (str | None): Directory for the generated scripts; next to each
+                                 workbook if None.
+        force_evaluator (bool): Same as for a single conversion.
+        vectorize (bool): Same as for a single conversion.
+        as_module (bool): Same as for a single conversion.
+        targets (list[str] | None): Same as for a single conversion; files without
+                                    these cells fail.
+        inputs (list[str] | None): Same as for a single conversion.
+        optimize (bool): Same as for a single conversion.
+        engine (str): Same as for a single conversion.
+
+    Returns:
+        dict: Summary with totals, `wall_seconds`, `unmatched` patterns and one entry
+              per file (see `convert_file`), in input order.
+    """
+    started = time.perf_counter()
+    files, unmatched = collect_input_files(patterns)
+    for pattern in unmatched:
+        logger.warning(f"No .xlsx, .csv or .tsv files found for {pattern}")
+    output_paths = plan_output_paths(files, output_dir)
+    jobs = max(1, min(jobs, len(files) or 1))
+    logger.info(f"Converting {len(files)} files with {jobs} worker processes.")
+
+    entries: dict[str, dict] = {}
+    if jobs == 1:
+        install_request_warnings_handler()
+        for path, _ in files:
+            entries[path] = convert_file(path, output_paths[path], force_evaluator, vectorize, as_module, targets, inputs, optimize, engine)
+            logger.info(f"{entries[path]['status']}: {path}")
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_batch_worker) as executor:
+            futures = {
+                executor.submit(convert_file, path, output_paths[path], force_evaluator, vectorize, as_module, targets, inputs, optimize, engine): path
+                for path, _ in files
+            }
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    entries[path] = future.result()
+                except Exception as e:
+                    # The worker process itself died, e.g. killed by the OOM killer
+                    logger.error(f"Worker converting {path} terminated abruptly: {e}")
+                    entries[path] = {"input": path, "output": None, "status": "failed", "cached": False, "warnings": [], "report": None, "error": f"Worker terminated abruptly: {e}", "timings": {}}
+                logger.info(f"{entries[path]['status']}: {path}")
+
+    results = [entries[path] for path, _ in files]
+    return {
+        "jobs": jobs,
+        "total": len(results),
+        "succeeded": sum(1 for entry in results if entry["status"] == "succeeded"),
+        "failed": sum(1 for entry in results if entry["status"] == "failed"),
+        "cached": sum(1 for entry in results if entry["cached"]),
+        "wall_seconds": round(time.perf_counter() - started, 6),
+        "unmatched": unmatched,
+        "files": results,
+    }
+
+def write_summary(summary: dict, path: str):
+    """Writes a batch summary as JSON."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(summary, f, indent=2)
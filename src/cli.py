@@ -1,14 +1,19 @@
 import argparse
+import json
 import sys
-import tempfile # Import tempfile for temporary file handling
 import os # Import os for file path manipulation
 import subprocess
+import time
 import logging
 
 from .main import convert_excel_to_python # Import the FastAPI endpoint function
-from .sandbox import execute_script_in_sandbox, MAX_CPU_TIME # Import the sandbox execution function and MAX_CPU_TIME
+from .sandbox import run_script_in_sandbox, MAX_CPU_TIME # Import the sandbox execution function and MAX_CPU_TIME
+from .batch import run_batch, write_summary
+from .pipeline import DEFAULT_INGEST_ENGINE, INGEST_ENGINES, build_model_artifact, ingest_engine_for
+from .model_artifact import write_model_artifact
+from .pruning import TargetSelectionError, parse_targets
+from .timings import format_timings_table
 from fastapi import UploadFile, HTTPException
-from fastapi.responses import PlainTextResponse
 from io import BytesIO
 
 # Configure logging for CLI. Warnings and errors go to stderr.
@@ -44,11 +49,38 @@ class CLIUploadFile(UploadFile):
 
 async def main():
     parser = argparse.ArgumentParser(description="Convert Excel/CSV/TSV files with formulas to static Python code.")
-    parser.add_argument("input_file", type=str, help="Path to the input Excel/CSV/TSV file.")
-    parser.add_argument("--output", "-o", type=str, help="Optional: Path to save the generated Python script. If not provided, output will be printed to stdout.")
+    parser.add_argument("input_file", type=str, nargs="?", help="Path to the input Excel/CSV/TSV file.")
+    parser.add_argument("--output", "-o", type=str, help="Optional: Path to save the generated Python script (plus a .xlmodel compiled model next to it if some cells are evaluated at runtime). If not provided, output will be printed to stdout.")
     parser.add_argument("--force-evaluator", action="store_true", help="If set, forces all formulas to be evaluated at runtime using xlcalculator.Evaluator, bypassing static translation.")
+    parser.add_argument("--vectorize", action="store_true", help="If set, columns filled down with the same formula are computed with one NumPy array expression per run.")
+    parser.add_argument("--as-module", action="store_true", help="If set, generates an importable module exposing compute(inputs: dict) -> dict instead of a flat script.")
+    parser.add_argument("--targets", type=str, help="Comma-separated cells or ranges (e.g. 'Summary!B2,Summary!D2:D10'). If set, only these cells and the cells they depend on are converted.")
+    parser.add_argument("--inputs", type=str, help="Comma-separated cells or ranges that are the workbook's inputs. If set, formulas that depend on none of them are precomputed at conversion time.")
+    parser.add_argument("--optimize", action="store_true", help="If set, translated formulas are optimized: IF/AND/OR/NOT are inlined, constants folded and subexpressions shared by several formulas computed once.")
+    parser.add_argument("--engine", choices=INGEST_ENGINES, default=DEFAULT_INGEST_ENGINE, help="How the workbook is read: xlcalculator loads every cell; streaming reads only the formulas and the constants they reference from the .xlsx, in bounded memory, for very large workbooks. CSV and TSV files are always streamed row by row.")
+    parser.add_argument("--batch", nargs="+", metavar="PATH", help="Convert every .xlsx/.csv/.tsv file in these files, directories or glob patterns (e.g. 'books/**/*.xlsx') in parallel instead of a single input file.")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1, help="Batch mode: number of worker processes. Defaults to the number of CPUs.")
+    parser.add_argument("--output-dir", type=str, help="Batch mode: directory for the generated scripts, mirroring the input layout. Defaults to next to each input file.")
+    parser.add_argument("--summary", type=str, help="Batch mode: path of the JSON summary with per-file status, timings, warnings and errors. Defaults to formulas-summary.json in the output directory.")
+    parser.add_argument("--timings", action="store_true", help="If set, prints the wall and CPU time of every conversion stage and of the sandbox run to stderr.")
     
     args = parser.parse_args()
+
+    if args.batch:
+        try:
+            targets = parse_targets(args.targets)
+            inputs = parse_targets(args.inputs)
+        except TargetSelectionError as e:
+            parser.error(e.message)
+        summary_path = args.summary or os.path.join(args.output_dir or ".", "formulas-summary.json")
+        summary = run_batch(args.batch, args.jobs, args.output_dir, args.force_evaluator, args.vectorize, args.as_module, targets, inputs, args.optimize, args.engine)
+        write_summary(summary, summary_path)
+        logger.info(f"Converted {summary['succeeded']} of {summary['total']} files in {summary['wall_seconds']:.1f}s ({summary['cached']} from cache). Summary written to {summary_path}")
+        if summary["failed"] or summary["unmatched"]:
+            sys.exit(1)
+        return
+    if not args.input_file:
+        parser.error("an input file or --batch is required")
     
     try:
         with open(args.input_file, "rb") as f:
@@ -63,20 +95,35 @@ async def main():
         response = await convert_excel_to_python(
             file=mock_upload_file, 
             output_filename=None,
-            force_evaluator=args.force_evaluator
+            force_evaluator=args.force_evaluator,
+            vectorize=args.vectorize,
+            as_module=args.as_module,
+            targets=args.targets,
+            inputs=args.inputs,
+            optimize=args.optimize,
+            engine=args.engine,
+            execute=False # The CLI runs the script itself to report its errors and exit code
         ) # Don't save directly here
         
-        if isinstance(response, PlainTextResponse):
-            generated_script_content = bytes(response.body).decode()
-            
-            # Create a temporary file to save the generated script for sandbox execution
-            with tempfile.NamedTemporaryFile(mode='w+', delete=False, suffix='.py') as temp_script_file:
-                temp_script_file.write(generated_script_content)
-                temp_script_path = temp_script_file.name
+        payload = json.loads(bytes(response.body))
+        if response.status_code != 200:
+            logger.error(f"Error processing file: {payload['detail']}")
+            sys.exit(1)
+        else:
+            generated_script_content = payload["script"]
+            timings = payload["timings"]
             
             try:
                 logger.info("Executing generated script in sandbox...")
-                stdout, stderr, returncode = execute_script_in_sandbox(temp_script_path)
+                # The script is piped to the sandbox; no temporary file is needed
+                usage = {}
+                sandbox_started = time.perf_counter()
+                stdout, stderr, returncode = await run_script_in_sandbox(generated_script_content, usage=usage)
+                timings["sandbox"] = {
+                    "wall_ms": round((time.perf_counter() - sandbox_started) * 1000, 3),
+                    "cpu_ms": round(usage["cpu_seconds"] * 1000, 3) if usage.get("cpu_seconds") is not None else None,
+                    "max_rss_kb": usage.get("max_rss_kb"),
+                }
                 if stdout:
                     logger.info(f"Sandbox Output (STDOUT):\n{stdout}")
                 if stderr:
@@ -92,22 +139,22 @@ async def main():
             except Exception as e:
                 logger.error(f"An error occurred during sandbox execution: {e}", exc_info=True)
                 sys.exit(1)
-            finally:
-                # Clean up the temporary script file
-                if os.path.exists(temp_script_path):
-                    os.remove(temp_script_path)
 
             # If output_filename is provided, save the generated script to it
             if args.output:
                 with open(args.output, "w") as f:
                     f.write(generated_script_content)
                 logger.info(f"Generated Python script saved to {args.output}")
+                if payload.get("report", {}).get("fallback_cells"):
+                    # Runtime-evaluated cells read the compiled model next to the script
+                    artifact_path = write_model_artifact(build_model_artifact(file_content, ingest_engine_for(args.input_file, args.engine)), args.output)
+                    logger.info(f"Compiled model for runtime-evaluated cells saved to {artifact_path}")
             else:
+                print(generated_script_content)
                 logger.info("Generated Python script content printed to console.")
 
-        else:
-            # Handle other response types if necessary, though PlainTextResponse is expected
-            logger.warning("Unexpected response type from conversion function.")
+            if args.timings:
+                print(format_timings_table(timings), file=sys.stderr)
 
     except FileNotFoundError:
         logger.error(f"Error: Input file not found at {args.input_file}")
@@ -0,0 +1,198 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from . import settings
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the generated script for the same input changes, or the shape of a
+# cached conversion does, so entries written by an older converter are not served
+# after an upgrade.
+CODEGEN_VERSION = "10"
+
+def make_cache_key(file_content: bytes, options: dict) -> str:
+    """
+    Builds the content-addressed cache key for a conversion.
+
+    Args:
+        file_content (bytes): Raw bytes of the uploaded file.
+        options (dict): Conversion options that influence the output (e.g. force_evaluator).
+                        Must be JSON-serializable.
+
+    Returns:
+        str: Hex SHA-256 digest of the codegen version, the options and the file bytes.
+    """
+    digest = hashlib.sha256()
+    digest.update(CODEGEN_VERSION.encode())
+    digest.update(b"\0")
+    digest.update(json.dumps(options, sort_keys=True, default=str).encode())
+    digest.update(b"\0")
+    digest.update(file_content)
+    return digest.hexdigest()
+
+class ConversionCache:
+    """
+    Two-tier cache of conversion results (generated script plus warnings).
+
+    A bounded in-memory LRU sits in front of an on-disk store of JSON files. Disk
+    hits are promoted into memory. The disk tier is shared by every process that
+    mounts the same directory (server workers, formulas-cli).
+    """
+    # Disk usage is only checked every this many writes to keep puts cheap
+    DISK_PRUNE_INTERVAL = 32
+
+    def __init__(self, cache_dir: str | None, memory_max_bytes: int, disk_max_bytes: int = 0, enabled: bool = True):
+        self.cache_dir = cache_dir
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.enabled = enabled
+        self._memory: OrderedDict[str, tuple[dict, int]] = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "disk_evictions": 0, "stores": 0}
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _remember(self, key: str, value: dict, size: int):
+        """Inserts into the memory tier and evicts least recently used entries. Caller holds the lock."""
+        if size > self.memory_max_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key)[1]
+        self._memory[key] = (value, size)
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_max_bytes:
+            _, (_, evicted_size) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_size
+            self.stats["evictions"] += 1
+
+    def _touch(self, key: str):
+        """Marks the disk entry of `key` as just used, so `prune_disk` evicts it last."""
+        try:
+            os.utime(self._disk_path(key))
+        except OSError:
+            pass # Pruned meanwhile, or never written; put() rewrites it
+
+    def get(self, key: str) -> dict | None:
+        """Returns the cached conversion result for `key`, or None on a miss."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+        if entry is not None:
+            # Other processes share the disk tier, so memory hits keep it recent too
+            if self.cache_dir:
+                self._touch(key)
+            return entry[0]
+
+        if self.cache_dir:
+            try:
+                with open(self._disk_path(key), "rb") as f:
+                    raw = f.read()
+                value = json.loads(raw)
+            except FileNotFoundError:
+                value = None
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not read conversion cache entry {key}: {e}")
+                value = None
+            if value is not None:
+                self._touch(key)
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                    self._remember(key, value, len(raw))
+                return value
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, key: str, value: dict):
+        """Stores a JSON-serializable conversion result in both tiers."""
+        if not self.enabled:
+            return
+        raw = json.dumps(value).encode()
+        with self._lock:
+            self._remember(key, value, len(raw))
+            self.stats["stores"] += 1
+
+        if self.cache_dir:
+            path = self._disk_path(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Write to a temp file and rename so concurrent readers never see partial entries
+                fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+                with os.fdopen(fd, "wb") as f:
+                    f.write(raw)
+                os.replace(temp_path, path)
+            except OSError as e:
+                logger.error(f"Could not write conversion cache entry {key}: {e}")
+                return
+            with self._lock:
+                self._writes_since_prune += 1
+                should_prune = self._writes_since_prune >= self.DISK_PRUNE_INTERVAL
+                if should_prune:
+                    self._writes_since_prune = 0
+            if should_prune:
+                self.prune_disk()
+
+    def prune_disk(self):
+        """
+        Deletes the least recently used disk entries until the disk tier fits `disk_max_bytes`.
+        Hits refresh the modification time of their entry, so it orders entries by last use.
+        """
+        if not self.cache_dir or self.disk_max_bytes <= 0 or not os.path.isdir(self.cache_dir):
+            return
+        entries = []
+        total_bytes = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat_result = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat_result.st_mtime, stat_result.st_size, path))
+                total_bytes += stat_result.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total_bytes <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_bytes -= size
+            with self._lock:
+                self.stats["disk_evictions"] += 1
+
+    def clear_memory(self):
+        """Drops every entry from the memory tier."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+
+    def get_stats(self) -> dict:
+        """Returns a snapshot of the hit/miss/eviction counters and memory usage."""
+        with self._lock:
+            return {**self.stats, "memory_entries": len(self._memory), "memory_bytes": self._memory_bytes}
+
+def create_conversion_cache() -> ConversionCache:
+    """Creates a ConversionCache configured from `settings`."""
+    return ConversionCache(
+        cache_dir=settings.CACHE_DIR or None,
+        memory_max_bytes=settings.CACHE_MEMORY_MAX_BYTES,
+        disk_max_bytes=settings.CACHE_DISK_MAX_BYTES,
+        enabled=bool(settings.CACHE_ENABLED),
+    )
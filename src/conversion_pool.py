@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from . import settings
+from .diagnostics import install_request_warnings_handler
+
+logger = logging.getLogger(__name__)
+
+class ConversionPoolBusyError(Exception):
+    """Raised when the conversion queue is full and a new conversion cannot be accepted."""
+    def __init__(self, message: str = "Conversion queue is full. Please retry later."):
+        self.message = message
+        super().__init__(self.message)
+
+def _init_worker():
+    """Initializer for pool processes: log and capture warnings the same way the server does."""
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    install_request_warnings_handler()
+
+class ConversionPool:
+    """
+    Dispatches CPU-bound conversion work off the event loop.
+
+    With `max_workers > 0` work runs in a ProcessPoolExecutor, so a large workbook
+    only occupies one pool process while the server keeps answering other requests.
+    With `max_workers == 0` work runs in a thread of the current process instead.
+    The number of running plus waiting conversions is capped by `max_queue_depth`.
+    """
+    def __init__(self, max_workers: int, max_tasks_per_child: int = 0, max_queue_depth: int = 0):
+        self.max_workers = max_workers
+        self.max_tasks_per_child = max_tasks_per_child
+        self.max_queue_depth = max_queue_depth
+        self._executor: ProcessPoolExecutor | None = None
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of conversions currently running or waiting in this pool."""
+        return self._pending
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            executor_kwargs = {"max_workers": self.max_workers, "initializer": _init_worker}
+            if self.max_tasks_per_child > 0:
+                if sys.version_info >= (3, 11):
+                    # max_tasks_per_child requires a non-fork start method
+                    executor_kwargs["max_tasks_per_child"] = self.max_tasks_per_child
+                    executor_kwargs["mp_context"] = multiprocessing.get_context("spawn")
+                else:
+                    logger.warning("max_tasks_per_child requires Python 3.11+; pool processes will not be recycled.")
+            self._executor = ProcessPoolExecutor(**executor_kwargs)
+            logger.info(f"Started conversion pool with {self.max_workers} worker processes.")
+        return self._executor
+
+    async def run(self, func, *args):
+        """
+        Runs `func(*args)` in the pool and returns its result.
+
+        Raises:
+            ConversionPoolBusyError: If `max_queue_depth` conversions are already pending.
+        """
+        if self.max_queue_depth > 0 and self._pending >= self.max_queue_depth:
+            raise ConversionPoolBusyError()
+        self._pending += 1
+        try:
+            if self.max_workers <= 0:
+                return await asyncio.to_thread(func, *args)
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(self._get_executor(), func, *args)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed by the OOM killer). Drop the executor so
+                # the next conversion starts a fresh pool instead of failing forever.
+                logger.error("Conversion pool worker terminated abruptly. Restarting pool.")
+                self.shutdown(wait=False)
+                raise
+        finally:
+            self._pending -= 1
+
+    def shutdown(self, wait: bool = True):
+        """Shuts down the worker processes, if any were started."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=not wait)
+            self._executor = None
+
+def create_conversion_pool() -> ConversionPool:
+    """Creates a ConversionPool configured from `settings`."""
+    return ConversionPool(
+        max_workers=settings.CONVERSION_POOL_SIZE,
+        max_tasks_per_child=settings.CONVERSION_MAX_TASKS_PER_CHILD,
+        max_queue_depth=settings.CONVERSION_MAX_QUEUE_DEPTH,
+    )
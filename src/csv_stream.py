@@ -0,0 +1,125 @@
+"""
+Streaming CSV/TSV reader, the ingest engine of .csv and .tsv uploads.
+
+Spreadsheet exports to CSV keep formulas as text starting with "=" (e.g. `=A2*B2`).
+`read_delimited_streaming` reads the file row by row with the `csv` module, so only
+the current row is held besides the cells it keeps, and builds the same model as
+the streaming .xlsx engine (see `xlsx_stream`):
+
+- formula cells, with their references qualified with the sheet and `$` removed,
+- the constants those formulas reference, and the first row (headers name the
+  variables of the generated code).
+
+A delimited file is one sheet, named `CSV_SHEET_NAME`. Like the .xlsx engine it reads
+the file twice, formulas first and then the referenced constants. Formulas carry no
+cached values, so their value is None.
+"""
+import csv
+import io
+import logging
+
+from .formula_shapes import column_index_to_letters
+from .xlsx_stream import FormulaNormalizer, StreamedSheet, StreamingCell, StreamingModel, link_streaming_model
+
+logger = logging.getLogger(__name__)
+
+# Name of the sheet a delimited file becomes, as in `Sheet1!A1`
+CSV_SHEET_NAME = "Sheet1"
+
+def _parse_field(text: str):
+    """Reads a field as a number or boolean where it looks like one, as Excel does when opening a CSV. Empty fields are None."""
+    if text == "":
+        return None
+    if text.upper() in ("TRUE", "FALSE"):
+        return text.upper() == "TRUE"
+    for parse in (int, float):
+        try:
+            return parse(text)
+        except ValueError:
+            pass
+    return text
+
+def _iter_rows(file_content: bytes, delimiter: str):
+    """Yields (row, fields) for each line of the file, decoding it a buffer at a time as it is read."""
+    with io.TextIOWrapper(io.BytesIO(file_content), encoding="utf-8-sig", newline="") as text:
+        for row, fields in enumerate(csv.reader(text, delimiter=delimiter), 1):
+            yield row, fields
+
+def read_delimited_streaming(file_content: bytes, delimiter: str = ",", report: dict | None = None) -> StreamingModel:
+    """
+    Reads the formulas of a CSV or TSV file, and the constants they reference.
+
+    Args:
+        file_content (bytes): Raw bytes of the file, UTF-8 (a byte order mark is allowed).
+        delimiter (str): Field delimiter: "," for CSV, "\\t" for TSV.
+        report (dict | None): If provided, `report["ingest"]` is set to the number of
+                              rows, formulas, and constants kept and skipped.
+
+    Returns:
+        StreamingModel: The cells the converter needs, in row/column order.
+
+    Raises:
+        UnicodeDecodeError, csv.Error: If the file is not readable UTF-8 delimited text.
+    """
+    sheet = StreamedSheet(0, CSV_SHEET_NAME, None)
+    sheets_by_name = {sheet.name: sheet}
+    normalizer = FormulaNormalizer(sheets_by_name)
+
+    # First pass: formulas and their references
+    cells: dict[str, StreamingCell] = {}
+    positions: dict[str, tuple[int, int, int]] = {}
+    references_by_cell: dict[str, list] = {}
+    # Row -> columns of its formulas
+    formula_columns: dict[int, set[int]] = {}
+    for row, fields in _iter_rows(file_content, delimiter):
+        sheet.max_row = row
+        if len(fields) > sheet.max_column:
+            sheet.max_column = len(fields)
+        for column, text in enumerate(fields, 1):
+            if text[:1] != "=" or len(text) == 1:
+                continue
+            address = f"{sheet.name}!{column_index_to_letters(column)}{row}"
+            formula, references = normalizer.normalize(text[1:], sheet)
+            cells[address] = StreamingCell(address, formula)
+            positions[address] = (0, row, column)
+            references_by_cell[address] = references
+            formula_columns.setdefault(row, set()).add(column)
+
+    # Row -> columns the formulas read, ranges clipped to the file
+    referenced: dict[int, set[int]] = {}
+    for references in references_by_cell.values():
+        for _, first_row, first_column, last_row, last_column in references:
+            columns = range(first_column, min(last_column, sheet.max_column) + 1)
+            for row in range(first_row, min(last_row, sheet.max_row) + 1):
+                referenced.setdefault(row, set()).update(columns)
+
+    # Second pass: the constants among them, plus the header row
+    constants = 0
+    skipped_constants = 0
+    for row, fields in _iter_rows(file_content, delimiter):
+        kept_columns = referenced.get(row)
+        if kept_columns is None and row != 1:
+            # Most rows: count their constants without looking at them
+            skipped_constants += len(fields) - fields.count("") - len(formula_columns.get(row, ()))
+            continue
+        for column, text in enumerate(fields, 1):
+            if text == "" or column in formula_columns.get(row, ()):
+                continue
+            if row != 1 and column not in kept_columns:
+                skipped_constants += 1
+                continue
+            address = f"{sheet.name}!{column_index_to_letters(column)}{row}"
+            cells[address] = StreamingCell(address, None, _parse_field(text))
+            positions[address] = (0, row, column)
+            constants += 1
+
+    logger.info(f"Streamed {len(references_by_cell)} formulas and {constants} constants from {sheet.max_row} rows ({skipped_constants} unreferenced constants skipped).")
+    if report is not None:
+        report["ingest"] = {
+            "engine": "tsv" if delimiter == "\t" else "csv",
+            "rows": sheet.max_row,
+            "formulas": len(references_by_cell),
+            "constants": constants,
+            "skipped_constants": skipped_constants,
+        }
+    return link_streaming_model(cells, positions, references_by_cell, sheets_by_name, {}, normalizer.ranges)
@@ -1,8 +1,17 @@
 from xlcalculator.model import Model
-from collections import defaultdict
-from .formula_translator import translate_formula_part, tokenize_formula, UNSUPPORTED_OR_VOLATILE_EXCEL_FUNCTIONS
+from collections import defaultdict, deque
+from .formula_translator import UNSUPPORTED_OR_VOLATILE_EXCEL_FUNCTIONS
+from .formula_shapes import TranslationCache, column_index_to_letters, column_letters_to_index, unquote_reference
+from .vectorizer import plan_vectorized_runs
+from .expression_optimizer import ExpressionOptimizer
+from .model_artifact import ARTIFACT_EXTENSION, ARTIFACT_RUNTIME
+from .pruning import prune_to_targets
+from .partial_evaluation import plan_constant_folding
+from .diagnostics import set_current_address, warn
 import re
+import keyword
 import logging
+import math
 
 logger = logging.getLogger(__name__)
 
@@ -25,77 +34,196 @@ def extract_formula_dependencies(model: Model) -> dict:
             dependencies[cell.formula_address] = precedents
     return dependencies
 
-def get_evaluation_order(model: Model) -> list:
+def _build_dependency_graph(model: Model) -> tuple[list[str], list[list[int]], list[int]]:
     """
-    Performs a topological sort on the cells to determine their evaluation order.
-
-    Args:
-        model: The xlcalculator Model object.
+    Builds an integer-indexed dependency graph from the model.
 
     Returns:
-        A list of cell addresses in topological order.
+        A tuple (addresses, successors, in_degree) where node `i` is `addresses[i]`,
+        `successors[i]` lists the nodes whose formulas reference node `i`, and
+        `in_degree[i]` is the number of precedents of node `i`. Precedents that are
+        not cells of the model are added as nodes so their dependents still get ordered.
     """
-    graph = defaultdict(list)
-    in_degree = defaultdict(int)
-    all_cells = set()
+    addresses = list(model.cells)
+    node_index = {address: index for index, address in enumerate(addresses)}
+    successors = [[] for _ in addresses]
+    in_degree = [0] * len(addresses)
+    get_index = node_index.get
 
-    for cell_address, cell in model.cells.items():
-        all_cells.add(cell_address)
-        if in_degree[cell_address] == 0:
-            in_degree[cell_address] = 0 # Ensure all cells are initialized in in_degree
+    for cell_index, cell in enumerate(model.cells.values()):
         if cell.formula:
             for precedent_cell in cell.precedents:
-                graph[precedent_cell.formula_address].append(cell_address)
-                in_degree[cell_address] += 1
+                precedent_index = get_index(precedent_cell.formula_address)
+                if precedent_index is None:
+                    precedent_index = len(addresses)
+                    node_index[precedent_cell.formula_address] = precedent_index
+                    addresses.append(precedent_cell.formula_address)
+                    successors.append([])
+                    in_degree.append(0)
+                successors[precedent_index].append(cell_index)
+                in_degree[cell_index] += 1
+    return addresses, successors, in_degree
 
-    # Add cells with no dependencies to the queue
-    queue = []
-    for cell_address in all_cells:
-        if in_degree[cell_address] == 0:
-            queue.append(cell_address)
+def _strongly_connected_components(nodes: list[int], successors: list[list[int]]) -> list[list[int]]:
+    """
+    Tarjan's strongly connected components algorithm, iterative so that long
+    dependency chains don't hit Python's recursion limit.
 
-    evaluation_order = []
-    while queue:
-        current_cell = queue.pop(0)
-        evaluation_order.append(current_cell)
+    Components are returned in reverse topological order: a component is emitted
+    only after every component that depends on it.
+    """
+    node_count = len(successors)
+    index_of = [-1] * node_count
+    lowlink = [0] * node_count
+    on_stack = [False] * node_count
+    stack = []
+    components = []
+    counter = 0
+
+    for root in nodes:
+        if index_of[root] != -1:
+            continue
+        index_of[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, 0)]
+        while work:
+            node, next_edge = work[-1]
+            node_successors = successors[node]
+            if next_edge < len(node_successors):
+                work[-1] = (node, next_edge + 1)
+                successor = node_successors[next_edge]
+                if index_of[successor] == -1:
+                    index_of[successor] = lowlink[successor] = counter
+                    counter += 1
+                    stack.append(successor)
+                    on_stack[successor] = True
+                    work.append((successor, 0))
+                elif on_stack[successor] and index_of[successor] < lowlink[node]:
+                    lowlink[node] = index_of[successor]
+                continue
+
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                if lowlink[node] < lowlink[parent]:
+                    lowlink[parent] = lowlink[node]
+            if lowlink[node] == index_of[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(component)
+    return components
 
-        for neighbor in graph[current_cell]:
-            in_degree[neighbor] -= 1
-            if in_degree[neighbor] == 0:
+def get_evaluation_order_and_cycles(model: Model) -> tuple[list[str], list[list[str]]]:
+    """
+    Determines the evaluation order of the cells and the circular references between them.
+
+    Kahn's algorithm over a deque orders every cell that is not part of, or downstream
+    of, a circular reference in O(V+E). If cells remain, Tarjan's algorithm is run on
+    that remainder to find the exact cyclic groups, and the remainder is appended in
+    topological order of its strongly connected components so that every cell still
+    gets code. Time budget: a 10^6-cell graph with 2*10^6 references (acyclic, or one
+    10^6-cell cycle) is ordered in under 10 seconds of CPU time on a single CPython core,
+    most of it spent building the graph from `model.cells`.
+
+    Args:
+        model: The xlcalculator Model object.
+
+    Returns:
+        A tuple (evaluation_order, circular_references): the list of all cell addresses
+        in evaluation order, and a list of cyclic cell groups, each a list of addresses
+        in workbook order. A cell referencing itself forms a group of one.
+    """
+    addresses, successors, in_degree = _build_dependency_graph(model)
+    remaining_in_degree = list(in_degree)
+
+    # Add cells with no dependencies to the queue
+    queue = deque(index for index, degree in enumerate(remaining_in_degree) if degree == 0)
+    order = []
+    while queue:
+        current_cell = queue.popleft()
+        order.append(current_cell)
+        for neighbor in successors[current_cell]:
+            remaining_in_degree[neighbor] -= 1
+            if remaining_in_degree[neighbor] == 0:
                 queue.append(neighbor)
 
-    # Check for circular dependencies (if evaluation_order doesn't contain all cells)
-    if len(evaluation_order) != len(all_cells):
-        # This indicates a circular dependency or an issue in graph construction
-        # For simplicity, we'll just return the current order, but in a real app,
-        # you might want to raise an error or log a warning.
-        pass # Handle circular dependency if necessary
+    circular_references = []
+    if len(order) != len(addresses):
+        # Every cell left over is either on a cycle or downstream of one.
+        remaining = [index for index, degree in enumerate(remaining_in_degree) if degree > 0]
+        components = _strongly_connected_components(remaining, successors)
+        for component in reversed(components):
+            component.sort()
+            if len(component) > 1 or component[0] in successors[component[0]]:
+                circular_references.append([addresses[index] for index in component])
+            order.extend(component)
+
+    return [addresses[index] for index in order], circular_references
 
-    return evaluation_order
+def get_evaluation_order(model: Model) -> list:
+    """
+    Performs a topological sort on the cells to determine their evaluation order.
 
-def extract_headers(model: Model) -> dict[str, dict[str, str]]:
+    Args:
+        model: The xlcalculator Model object.
+
+    Returns:
+        A list of cell addresses in topological order. Cells on circular references
+        are included after their non-cyclic precedents; use
+        `get_evaluation_order_and_cycles` to find out which they are.
+    """
+    return get_evaluation_order_and_cycles(model)[0]
+
+_ADDRESS_PATTERN = re.compile(r'(.+?)!([A-Za-z]+)(\d+)')
+_SHEET_PATTERN = re.compile(r'(.+?)!(.*)')
+_COLUMN_PATTERN = re.compile(r'([A-Za-z]+)(\d+)')
+# Sheet-qualified range reference, e.g. 'Sheet1!A2:A10'
+_QUALIFIED_RANGE_PATTERN = re.compile(r'^(.+)!([A-Za-z]+)(\d+):([A-Za-z]+)(\d+)$')
+_NON_IDENTIFIER_CHARACTERS = re.compile(r'[^a-zA-Z0-9_]')
+_IDENTIFIER_START_PATTERN = re.compile(r'^[a-zA-Z_]')
+_UNSUPPORTED_FUNCTION_PATTERN = re.compile(
+    r' (?:' + '|'.join(re.escape(func_name) for func_name in sorted(UNSUPPORTED_OR_VOLATILE_EXCEL_FUNCTIONS)) + r') ',
+    re.IGNORECASE
+)
+
+def extract_headers(model: Model, cell_positions: dict | None = None) -> dict[str, dict[str, str]]:
     """
     Extracts headers from the first row of each sheet in the xlcalculator model.
     Returns a dictionary mapping sheet names to another dictionary of column letter to header text.
+
+    If `cell_positions` is given, it is filled with address -> (sheet, column letters, row)
+    for every cell parsed along the way, so `SymbolTable.build` doesn't parse them again.
     """
     headers_by_sheet = defaultdict(dict)
     # xlcalculator.Model does not have a 'sheets' attribute directly accessible in this manner.
     # We need to iterate through all cells and infer sheets from cell addresses.
     for cell_address, cell in model.cells.items():
-        match = re.match(r'(.+?)!([A-Za-z]+)(\d+)', cell_address)
+        match = _ADDRESS_PATTERN.match(cell_address)
         if match:
             sheet_name, col_letter, row_number_str = match.groups()
             row_number = int(row_number_str)
+            if cell_positions is not None:
+                cell_positions[cell_address] = (sheet_name, col_letter, row_number)
             if row_number == 1 and cell.value:
                 headers_by_sheet[sheet_name][col_letter] = str(cell.value)
     return headers_by_sheet
 
-def get_python_variable_name(cell_address: str, headers_by_sheet: dict[str, dict[str, str]]) -> str:
+def _variable_name_from_address(cell_address: str, headers_by_sheet: dict[str, dict[str, str]]) -> tuple[str, str | None]:
     """
-    Generates a Python-compatible variable name for a given Excel cell address.
-    Prioritizes Header > Cell Reference (e.g., 'Sheet1!A1' to 'sheet1_A1').
+    Computes the variable name for a cell address without logging.
+
+    Returns:
+        A tuple (variable_name, header_name); header_name is None when the name
+        falls back to the cell reference.
     """
-    sheet_name_match = re.match(r'(.+?)!(.*)', cell_address)
+    sheet_name_match = _SHEET_PATTERN.match(cell_address)
     if sheet_name_match:
         sheet_name = sheet_name_match.group(1)
         base_cell_address = sheet_name_match.group(2)
@@ -103,25 +231,335 @@ def get_python_variable_name(cell_address: str, headers_by_sheet: dict[str, dict
         sheet_name = None
         base_cell_address = cell_address
 
-    col_match = re.match(r'([A-Za-z]+)(\d+)', base_cell_address)
+    col_match = _COLUMN_PATTERN.match(base_cell_address)
     if col_match:
         col_letter = col_match.group(1)
         # Attempt to use header if available
         if sheet_name and sheet_name in headers_by_sheet and col_letter in headers_by_sheet[sheet_name]:
             header_name = headers_by_sheet[sheet_name][col_letter]
             # Clean header name for Python variable: replace spaces/special chars, add sheet prefix
-            cleaned_header_name = re.sub(r'[^a-zA-Z0-9_]', '_', header_name)
-            logger.info(f"Inferred variable name for {cell_address} from header '{header_name}': {sheet_name.lower()}_{cleaned_header_name}")
-            return f"{sheet_name.lower()}_{cleaned_header_name}"
+            cleaned_header_name = _NON_IDENTIFIER_CHARACTERS.sub('_', header_name)
+            return f"{sheet_name.lower()}_{cleaned_header_name}", header_name
 
     # Fallback to cleaned cell reference if no header matches or no sheet name
-    variable_name = re.sub(r'[^a-zA-Z0-9_]', '_', cell_address)
-    if not re.match(r'^[a-zA-Z_]', variable_name):
+    variable_name = _NON_IDENTIFIER_CHARACTERS.sub('_', cell_address)
+    if not _IDENTIFIER_START_PATTERN.match(variable_name):
         variable_name = '_' + variable_name
-    logger.warning(f"Falling back to cell reference for variable name for {cell_address}: {variable_name.lower()}")
-    return variable_name.lower()
+    return variable_name.lower(), None
+
+def get_python_variable_name(cell_address: str, headers_by_sheet: dict[str, dict[str, str]]) -> str:
+    """
+    Generates a Python-compatible variable name for a given Excel cell address.
+    Prioritizes Header > Cell Reference (e.g., 'Sheet1!A1' to 'sheet1_A1').
+
+    Code generation uses a `SymbolTable` instead, which also resolves collisions
+    between cells that would get the same name.
+    """
+    variable_name, header_name = _variable_name_from_address(cell_address, headers_by_sheet)
+    if header_name is not None:
+        logger.info(f"Inferred variable name for {cell_address} from header '{header_name}': {variable_name}")
+    else:
+        warn(logger, "fallback_variable_name", "Falling back to cell reference for variable name for %s: %s", cell_address, variable_name, address=cell_address)
+    return variable_name
 
-def generate_static_python_code(model: Model, force_evaluator: bool = False) -> str:
+class SymbolTable:
+    """
+    Maps cell addresses to unique Python identifiers.
+
+    Names follow `get_python_variable_name` (Header > Cell Reference). When several
+    cells would get the same name, e.g. every row under one header, each of them is
+    suffixed with its row number, then with a counter if that still collides.
+    Sheet-qualified ranges are lists of the names of their cells.
+    """
+    def __init__(self, names: dict[str, str], headers_by_sheet: dict[str, dict[str, str]]):
+        self.names = names
+        self.headers_by_sheet = headers_by_sheet
+        self.used_names = set(names.values())
+        self.cell_addresses = set(names)
+        # Memoized ranges, named again once a cell is bound to another expression
+        self.range_references = set()
+
+    @classmethod
+    def build(cls, addresses, headers_by_sheet: dict[str, dict[str, str]], cell_positions: dict | None = None) -> "SymbolTable":
+        """
+        Names every address in one pass.
+
+        Args:
+            addresses: Iterable of cell addresses, in workbook order.
+            headers_by_sheet: Headers from `extract_headers`.
+            cell_positions: Optional address -> (sheet, column letters, row) from `extract_headers`.
+        """
+        cell_positions = cell_positions or {}
+        base_names = {}
+        base_name_counts = defaultdict(int)
+        header_named = 0
+        for cell_address in addresses:
+            position = cell_positions.get(cell_address)
+            if position is not None:
+                sheet_name, col_letter, _ = position
+                header_name = headers_by_sheet.get(sheet_name, {}).get(col_letter)
+                if header_name is not None:
+                    base_name = f"{sheet_name.lower()}_{_NON_IDENTIFIER_CHARACTERS.sub('_', header_name)}"
+                else:
+                    base_name, _ = _variable_name_from_address(cell_address, headers_by_sheet)
+            else:
+                base_name, header_name = _variable_name_from_address(cell_address, headers_by_sheet)
+            if header_name is not None:
+                header_named += 1
+            if not base_name.isidentifier() or keyword.iskeyword(base_name):
+                base_name = _NON_IDENTIFIER_CHARACTERS.sub('_', base_name)
+                if not base_name.isidentifier() or keyword.iskeyword(base_name):
+                    base_name = '_' + base_name
+            base_names[cell_address] = base_name
+            base_name_counts[base_name] += 1
+
+        names = {}
+        used_names = set(base_name for base_name, count in base_name_counts.items() if count == 1)
+        collisions = 0
+        for cell_address, base_name in base_names.items():
+            if base_name_counts[base_name] == 1:
+                names[cell_address] = base_name
+                continue
+            collisions += 1
+            position = cell_positions.get(cell_address)
+            if position is None:
+                col_match = _COLUMN_PATTERN.search(cell_address)
+                row_suffix = col_match.group(2) if col_match else ""
+            else:
+                row_suffix = str(position[2])
+            candidate = f"{base_name}_{row_suffix}" if row_suffix else base_name
+            suffix = 1
+            unique_name = candidate
+            while unique_name in used_names:
+                unique_name = f"{candidate}_{suffix}"
+                suffix += 1
+            used_names.add(unique_name)
+            names[cell_address] = unique_name
+
+        logger.info(f"Named {len(names)} cells: {header_named} from headers, {len(names) - header_named} from cell references, {collisions} disambiguated.")
+        return cls(names, headers_by_sheet)
+
+    def reserve(self, name: str) -> str:
+        """Returns `name`, suffixed with a counter if needed, as a new identifier that no cell uses."""
+        unique_name = name
+        suffix = 1
+        while unique_name in self.used_names:
+            unique_name = f"{name}_{suffix}"
+            suffix += 1
+        self.used_names.add(unique_name)
+        return unique_name
+
+    def bind(self, cell_address: str, expression: str):
+        """Makes `cell_address` refer to `expression` (e.g. an array element) instead of its own variable."""
+        self.names[cell_address] = expression
+        for reference in self.range_references:
+            del self.names[reference]
+        self.range_references.clear()
+
+    def name_for(self, reference: str) -> str:
+        """
+        Returns the variable name for a cell address or reference token. A sheet-qualified
+        range becomes a list of the names of its cells that are in the table (e.g.
+        `[sheet1_Total_2, sheet1_Total_3]`), since cells sharing a header are suffixed
+        and no variable has the bare header name. Other references that aren't cells
+        of the table (unqualified references) are named like `get_python_variable_name`
+        does. Both are memoized. Quoted sheet names (`'My Sheet'!A1`) are unquoted first,
+        as cell addresses don't quote them.
+        """
+        if reference.startswith("'"):
+            return self.name_for(unquote_reference(reference))
+        name = self.names.get(reference)
+        if name is None:
+            range_match = _QUALIFIED_RANGE_PATTERN.match(reference)
+            if range_match is not None:
+                name = self._range_expression(*range_match.groups())
+                self.range_references.add(reference)
+            else:
+                name = _variable_name_from_address(reference, self.headers_by_sheet)[0]
+            self.names[reference] = name
+        return name
+
+    def _range_expression(self, sheet_name: str, first_column: str, first_row: str, last_column: str, last_row: str) -> str:
+        """Returns a list display of the names of the range's cells, row by row."""
+        first_column_index, last_column_index = sorted((column_letters_to_index(first_column), column_letters_to_index(last_column)))
+        first_row_index, last_row_index = sorted((int(first_row), int(last_row)))
+        columns = [column_index_to_letters(index) for index in range(first_column_index, last_column_index + 1)]
+        names = []
+        for row in range(first_row_index, last_row_index + 1):
+            for column in columns:
+                cell_address = f"{sheet_name}!{column}{row}"
+                if cell_address in self.cell_addresses:
+                    names.append(self.names[cell_address])
+        return f"[{', '.join(names)}]"
+
+def _python_literal(value) -> str:
+    """Returns the source of a workbook value as a Python literal. Empty and unsupported values become 0."""
+    if isinstance(value, (bool, int, str)):
+        return repr(value)
+    if isinstance(value, float) and math.isfinite(value):
+        return repr(value)
+    return "0"
+
+# Runtime of the cells evaluated by xlcalculator, shared by flat scripts and compute modules.
+# Nothing imports xlcalculator unless a model has such cells. Fill in with `_fallback_runtime`.
+_FALLBACK_RUNTIME = '''
+# Cells that could not be translated are evaluated by xlcalculator from the model of
+# the source workbook, which load_workbook() reads once: by default from the compiled
+# model ({artifact_extension}) written next to this file, otherwise from the workbook.
+# One Evaluator computes all of them in a single batch, seeded with the values the
+# translated code already has.
+FALLBACK_CELLS = {fallback_cells}
+_evaluator = None
+
+class ModelArtifactError(RuntimeError):
+    """Raised when a compiled-model artifact is not valid or was written by an incompatible version."""
+{artifact_runtime}
+def _artifact_next_to_script():
+    """Returns the path of the compiled model written next to this file, if there is one."""
+    import os
+    script_path = globals().get("__file__")
+    if script_path:
+        path = os.path.splitext(script_path)[0] + "{artifact_extension}"
+        if os.path.exists(path):
+            return path
+    return None
+
+def load_workbook(path: str):
+    """Reads the model of the runtime-evaluated cells from a compiled model or the source workbook. Call once, before computing."""
+    global _evaluator
+    from xlcalculator import ModelCompiler, Evaluator
+    with open(path, "rb") as f:
+        is_artifact = f.read(8) == b"XLMODEL\\0"
+    _evaluator = Evaluator(load_model_artifact(path) if is_artifact else ModelCompiler().read_and_parse_archive(path))
+
+def _freeze_cell(address: str, value):
+    """Makes the evaluator use `value` for a cell instead of evaluating its formula."""
+    if hasattr(value, "item"):
+        value = value.item() # NumPy scalars of vectorized cells
+    _evaluator.set_cell_value(address, value)
+    formula = _evaluator.model.cells[address].formula
+    if formula is not None:
+        formula.evaluate = False
+
+def _evaluate_fallback_cells(seeds: dict) -> dict:
+    """
+    Evaluates every cell in FALLBACK_CELLS once. Seeded cells keep the values the
+    translated code computed, and each fallback cell is reused by the ones after it
+    (xlcalculator would otherwise re-evaluate every formula it reaches).
+    """
+    if _evaluator is None:
+        artifact_path = _artifact_next_to_script()
+        if artifact_path is None:
+            raise RuntimeError("This model has runtime-evaluated cells and no {artifact_extension} file next to it; {usage}.")
+        load_workbook(artifact_path)
+    for address, value in seeds.items():
+        _freeze_cell(address, value)
+    for address in FALLBACK_CELLS:
+        _evaluator.model.cells[address].formula.evaluate = True # Stale from the previous batch
+    values = {{}}
+    for address in FALLBACK_CELLS:
+        # evaluate() stores the value in the cell, which later cells then read
+        values[address] = _evaluator.evaluate(address)
+        _evaluator.model.cells[address].formula.evaluate = False
+    return values
+'''
+
+def _fallback_runtime(fallback_cells: list[str], usage: str) -> str:
+    """Returns the runtime of the given runtime-evaluated cells, with the compiled-model reader embedded."""
+    return _FALLBACK_RUNTIME.format(fallback_cells=tuple(fallback_cells), usage=usage, artifact_runtime=ARTIFACT_RUNTIME, artifact_extension=ARTIFACT_EXTENSION)
+
+# A flat script loads the workbook named by its first argument, if any
+_FLAT_SCRIPT_WORKBOOK_LOADING = '''import sys
+if len(sys.argv) > 1:
+    load_workbook(sys.argv[1])
+'''
+
+def _cells_downstream_of(model, fallback_cells: set[str], vector_plan) -> set[str]:
+    """
+    Returns the translated formula cells that depend, directly or not, on a
+    runtime-evaluated cell. A vectorized run is assigned by a single statement, so
+    it is downstream as a whole if any of its cells is.
+    """
+    dependents = {}
+    for cell_address, cell in model.cells.items():
+        if cell.formula:
+            for precedent in cell.precedents:
+                dependents.setdefault(precedent.formula_address, []).append(cell_address)
+    run_of = {}
+    if vector_plan is not None:
+        for run in vector_plan.runs:
+            for cell_address in run.cells:
+                run_of[cell_address] = run
+
+    downstream = set()
+    pending = list(fallback_cells)
+    while pending:
+        for dependent in dependents.get(pending.pop(), ()):
+            if dependent in downstream or dependent in fallback_cells:
+                continue
+            run = run_of.get(dependent)
+            for cell_address in (run.cells if run is not None else (dependent,)):
+                if cell_address not in downstream:
+                    downstream.add(cell_address)
+                    pending.append(cell_address)
+    return downstream
+
+def _assemble_compute_module(setup_lines: list[str], input_lines: list[str], formula_lines: list[str], input_defaults: dict[str, str], outputs: list[tuple[str, str]], fallback_cells: list[str], uses_numpy: bool) -> str:
+    """
+    Wraps generated statements into an importable module exposing `compute(inputs) -> dict`.
+
+    Args:
+        setup_lines: Statements run at the start of every call (array allocations).
+        input_lines: Assignments of the input cells from `inputs`.
+        formula_lines: Assignments of the formula cells, in evaluation order.
+        input_defaults: Input cell address -> literal of its value in the workbook.
+        outputs: (address, expression) of every cell returned by `compute`: the formula
+                 cells, or the targets of a pruned conversion.
+        fallback_cells: Addresses evaluated at runtime by xlcalculator.
+        uses_numpy: Whether the statements use `np`.
+    """
+    lines = [
+        '"""',
+        "Generated by formulas: computes the formula cells of a workbook from its input cells.",
+        "",
+        "    from model import compute",
+        "    outputs = compute({\"Sheet1!A1\": 10})",
+        "",
+        "`INPUTS` maps every input cell to its value in the workbook, used when it isn't",
+        "passed to `compute`; `OUTPUTS` lists the cells of the returned dict.",
+        '"""',
+    ]
+    if uses_numpy:
+        lines.append("import numpy as np")
+    lines.append("")
+    lines.append("INPUTS = {")
+    lines.extend(f"    {address!r}: {literal}," for address, literal in input_defaults.items())
+    lines.append("}")
+    lines.append("OUTPUTS = (")
+    lines.extend(f"    {address!r}," for address, _ in outputs)
+    lines.append(")")
+    if fallback_cells:
+        lines.append(_fallback_runtime(fallback_cells, "call load_workbook(path) before compute()"))
+    lines.append("")
+    lines.append("def compute(inputs: dict) -> dict:")
+    lines.append('    """Computes every cell in `OUTPUTS` from `inputs` (address -> value); missing inputs keep their workbook values."""')
+    lines.append("    unknown = inputs.keys() - INPUTS.keys()")
+    lines.append("    if unknown:")
+    lines.append("        raise KeyError(f\"Not input cells of this model: {sorted(unknown)}\")")
+    # Everything below is local to compute, so a call never sees another call's values
+    for line in setup_lines + input_lines + formula_lines:
+        lines.append(f"    {line}")
+    lines.append("    return {")
+    lines.extend(f"        {address!r}: {expression}," for address, expression in outputs)
+    lines.append("    }")
+    lines.append("")
+    lines.append('if __name__ == "__main__":')
+    lines.append("    import json")
+    lines.append("    print(json.dumps(compute({}), default=str, indent=2))")
+    lines.append("")
+    return "\n".join(lines)
+
+def generate_static_python_code(model: Model, force_evaluator: bool = False, report: dict | None = None, vectorize: bool = False, progress=None, as_module: bool = False, targets: list[str] | None = None, inputs: list[str] | None = None, optimize: bool = False) -> str:
     """
     Generates static Python code for the formulas in the xlcalculator model.
     This function aims to translate simple formulas into direct Python expressions.
@@ -130,56 +568,220 @@ def generate_static_python_code(model: Model, force_evaluator: bool = False) ->
         model: The xlcalculator Model object.
         force_evaluator (bool): If True, forces all formulas to be evaluated at runtime
                                 using `xlcalculator.Evaluator`, bypassing static translation.
+        report (dict | None): If provided, filled with statistics about the generated code:
+                              `circular_references` (the cyclic cell groups found),
+                              `translation_cache` (distinct formula shapes and cache hit ratio)
+                              and, when vectorizing, `vectorization` (runs and cells covered)
+                              and, when optimizing, `optimizer` (how often each pass applied).
+        vectorize (bool): If True, columns filled down with the same formula are computed
+                          with one NumPy array expression per run instead of one
+                          assignment per cell. See `plan_vectorized_runs`.
+        progress (callable | None): If provided, called with "order", "naming" and then
+                                    "codegen" as each stage starts.
+        as_module (bool): If True, emits a complete importable module exposing
+                          `compute(inputs: dict) -> dict` instead of top-level statements:
+                          inputs default to their workbook values, every cell is a local
+                          of `compute` and runtime-evaluated cells use a model loaded
+                          once, from the compiled model next to the module or
+                          with `load_workbook(path)`.
+        targets (list[str] | None): If provided (see `parse_targets`), only these cells and
+                                    their transitive precedents get code, and a module's
+                                    `compute` returns just these cells.
+        inputs (list[str] | None): If provided (same syntax as `targets`), only these value
+                                   cells are inputs: every other value cell is a constant,
+                                   and formulas that depend on no input are precomputed with
+                                   `xlcalculator.Evaluator` and emitted as literals (see
+                                   `plan_constant_folding`). A module's `INPUTS` holds just
+                                   these cells.
+        optimize (bool): If True, translated formulas go through `ExpressionOptimizer`:
+                         IF/AND/OR/NOT are inlined, constants folded, strength reduced
+                         and subexpressions shared by several formulas computed once.
 
     Returns:
         A string containing the generated Python code.
+
+    Raises:
+        TargetSelectionError: If a target or input selects no cell of the workbook, or
+                              an input is a formula.
     """
     python_code_lines = []
-    evaluation_order = get_evaluation_order(model)
+    if progress is not None:
+        progress("order")
+    # Pruning replaces `model` with just the cells the targets need
+    workbook = model
+    target_cells = None
+    if targets:
+        model = prune_to_targets(model, targets, report)
+        target_cells = set(model.targets)
+    evaluation_order, circular_references = get_evaluation_order_and_cycles(model)
+    # Cells on circular references can't be computed in a single static pass
+    cyclic_cells = set()
+    for cycle in circular_references:
+        cyclic_cells.update(cycle)
+        warn(logger, "circular_reference", "Circular reference detected between cells: %s. These cells will be evaluated at runtime using xlcalculator.Evaluator.", ", ".join(cycle), address=cycle[0])
+    if report is not None:
+        report["circular_references"] = circular_references
 
-    headers_by_sheet = extract_headers(model) # Extract headers once
+    fold_plan = None
+    if inputs is not None:
+        if progress is not None:
+            progress("fold")
+        fold_plan = plan_constant_folding(model, workbook, evaluation_order, inputs, cyclic_cells)
+        if report is not None:
+            report["constant_folding"] = fold_plan.get_stats()
+    folded = fold_plan.folded if fold_plan is not None else {}
 
+    if progress is not None:
+        progress("naming")
+    # Headers come from the whole workbook, so pruned cells keep the names they'd get unpruned
+    cell_positions = {}
+    headers_by_sheet = extract_headers(workbook, cell_positions) # Extract headers once
+    # Every cell is named once up front; codegen below only does dict lookups
+    symbols = SymbolTable.build(model.cells.keys(), headers_by_sheet, cell_positions)
+
+    if progress is not None:
+        progress("codegen")
+    name_for = symbols.name_for
+    translation_cache = TranslationCache(name_for)
+
+    # Decide up front which formulas need xlcalculator.Evaluator at runtime
+    fallback_cells = set()
+    for cell_address, cell in model.cells.items():
+        if cell.formula and cell_address not in folded and (force_evaluator or cell_address in cyclic_cells or _UNSUPPORTED_FUNCTION_PATTERN.search(cell.formula)):
+            fallback_cells.add(cell_address)
+    if report is not None:
+        report["fallback_cells"] = len(fallback_cells)
+    ordered_fallback_cells = [cell_address for cell_address in evaluation_order if cell_address in fallback_cells]
+    if ordered_fallback_cells and not as_module:
+        python_code_lines.append(_fallback_runtime(ordered_fallback_cells, "run the script with the workbook path as its first argument"))
+        python_code_lines.append(_FLAT_SCRIPT_WORKBOOK_LOADING)
+
+    vector_plan = None
+    if vectorize:
+        vector_plan = plan_vectorized_runs(model, evaluation_order, fallback_cells, symbols, cell_positions, constant_cells=folded, translation_cache=translation_cache)
+        # A module allocates the arrays in compute(), and imports numpy at the top
+        python_code_lines.extend(vector_plan.array_setup_lines(include_import=not as_module))
+        if report is not None:
+            report["vectorization"] = vector_plan.get_stats()
+
+    # Runtime-evaluated cells are computed in one batch. The translated cells that don't
+    # depend on any of them come first, so their values can seed the evaluator; then
+    # the batch (None in the order), which assigns every fallback cell; then the cells
+    # downstream of it.
+    statement_order = evaluation_order
+    downstream_cells = set()
+    if fallback_cells:
+        downstream_cells = _cells_downstream_of(model, fallback_cells, vector_plan)
+        statement_order = (
+            [cell_address for cell_address in evaluation_order if cell_address not in fallback_cells and cell_address not in downstream_cells]
+            + [None]
+            + [cell_address for cell_address in evaluation_order if cell_address in downstream_cells]
+        )
+
+    optimizer = None
+    if optimize:
+        # Every formula is parsed before any is emitted, so subexpressions shared
+        # with later formulas can be assigned to temporaries at their first use
+        optimizer = ExpressionOptimizer(name_for, symbols.reserve)
+        for cell_address in statement_order:
+            cell = model.cells.get(cell_address) if cell_address is not None else None
+            if cell is None or not cell.formula or cell_address in folded or cell_address in fallback_cells:
+                continue
+            if vector_plan is not None and cell_address in vector_plan.run_cells:
+                continue
+            optimizer.add(cell_address, cell.formula, name_for(cell_address))
+        optimizer.eliminate_common_subexpressions()
+        if report is not None:
+            report["optimizer"] = optimizer.get_stats()
+
+    # A module reads its inputs from compute()'s argument, defaulting to the workbook values
+    input_lines = []
+    input_defaults = {}
     # Initialize cell values (assuming all inputs are initially 0 or empty for static code)
     # In a real scenario, these would come from user input or source data.
     for cell_address in evaluation_order:
-        cell_var_name = get_python_variable_name(cell_address, headers_by_sheet) # Pass headers
+        cell = model.cells.get(cell_address)
+        # With declared inputs, the other value cells keep their workbook values
+        is_constant = fold_plan is not None and (cell is None or not cell.formula) and cell_address not in fold_plan.input_cells
+        if as_module:
+            if cell is not None and cell.formula:
+                continue # Assigned below, in evaluation order
+            literal = _python_literal(cell.value if cell is not None else None)
+            if is_constant:
+                # Constants only read by precomputed formulas are dropped
+                if cell_address in fold_plan.referenced_constants or (target_cells is not None and cell_address in target_cells):
+                    input_lines.append(f"{name_for(cell_address)} = {literal} # Constant")
+                continue
+            input_defaults[cell_address] = literal
+            input_lines.append(f"{name_for(cell_address)} = inputs.get({cell_address!r}, {literal})")
+            continue
+        cell_var_name = name_for(cell_address)
+        if is_constant:
+            python_code_lines.append(f"{cell_var_name} = {_python_literal(cell.value if cell is not None else None)} # Constant {cell_address}")
+            continue
+        if vector_plan is not None and cell_address in vector_plan.array_cells:
+            continue # Already zeroed by its column array
         python_code_lines.append(f"{cell_var_name} = 0 # Initialize for {cell_address}") # Placeholder initialization
 
-    python_code_lines.append("\n# Translated Formulas\n")
+    formula_lines = [] if as_module else python_code_lines
+    if not as_module:
+        python_code_lines.append("\n# Translated Formulas\n")
 
-    for cell_address in evaluation_order:
+    for cell_address in statement_order:
+        if cell_address is None:
+            # Seeds: the inputs of a module and the translated cells the fallback cells read
+            seeds = {address: name_for(address) for address in input_defaults}
+            for fallback_address in ordered_fallback_cells:
+                if not force_evaluator and fallback_address not in cyclic_cells: # Cyclic cells were already reported by group
+                    warn(logger, "runtime_evaluation_fallback", "Formula for cell %s contains unsupported/volatile functions. Falling back to runtime evaluation.", fallback_address, address=fallback_address)
+                formula_lines.append(f"# NOTE: Cell {fallback_address} will be evaluated at runtime using xlcalculator.Evaluator.")
+                for precedent in model.cells[fallback_address].precedents:
+                    precedent_cell = model.cells.get(precedent.formula_address)
+                    if precedent_cell is not None and precedent_cell.formula and precedent.formula_address not in fallback_cells and precedent.formula_address not in downstream_cells:
+                        seeds[precedent.formula_address] = name_for(precedent.formula_address)
+            seed_items = ", ".join(f"{address!r}: {expression}" for address, expression in seeds.items())
+            formula_lines.append(f"_fallback_values = _evaluate_fallback_cells({{{seed_items}}})")
+            for fallback_address in ordered_fallback_cells:
+                formula_lines.append(f"{name_for(fallback_address)} = _fallback_values[{fallback_address!r}] # Runtime evaluation")
+            continue
+        if vector_plan is not None and cell_address in vector_plan.run_cells:
+            # The whole run is assigned at once, after the last of its cells in evaluation order
+            run = vector_plan.emit_after.get(cell_address)
+            if run is not None:
+                formula_lines.extend(vector_plan.run_lines(run))
+            continue
         cell = model.cells.get(cell_address)
         if cell and cell.formula:
-            # Check for unsupported or volatile functions, or if force_evaluator is True
             formula_text = cell.formula
-            requires_runtime_fallback = force_evaluator # If force_evaluator is true, always use runtime
-            if not requires_runtime_fallback:
-                for func_name in UNSUPPORTED_OR_VOLATILE_EXCEL_FUNCTIONS:
-                    if re.search(r' ' + re.escape(func_name) + r' ', formula_text, re.IGNORECASE):
-                        requires_runtime_fallback = True
-                        break
-
-            cell_var_name = get_python_variable_name(cell_address, headers_by_sheet) # Pass headers
+            cell_var_name = name_for(cell_address)
+            optimized = optimizer.render(cell_address) if optimizer is not None else None
 
-            if requires_runtime_fallback:
-                if force_evaluator:
-                    logger.info(f"Formula for cell {cell_address} will be evaluated at runtime due to force_evaluator flag.")
-                else:
-                    logger.warning(f"Formula for cell {cell_address} contains unsupported/volatile functions. Falling back to runtime evaluation.")
-                python_code_lines.append(f"# NOTE: Cell {cell_address} will be evaluated at runtime using xlcalculator.Evaluator.")
-                python_code_lines.append(f"{cell_var_name} = evaluator.evaluate(model, '{cell_address}') # Runtime evaluation")
+            if cell_address in folded:
+                formula_lines.append(f"{cell_var_name} = {folded[cell_address]} # Precomputed at conversion time")
+            elif optimized is not None:
+                temporaries, expression = optimized
+                for temporary, temporary_expression in temporaries:
+                    formula_lines.append(f"{temporary} = {temporary_expression}")
+                formula_lines.append(f"{cell_var_name} = {expression}")
             else:
-                # Tokenize the formula
-                tokens = tokenize_formula(formula_text)
-                translated_parts = []
-                for token in tokens:
-                    if re.match(r'^[A-Za-z]+[0-9]+(?::[A-Za-z]+[0-9]+)?$', token) or re.match(r'^[A-Za-z_][A-Za-z0-9_]*![A-Za-z]+[0-9]+(?::[A-Za-z]+[0-9]+)?$', token):
-                        # It's a cell reference, convert to Python variable name
-                        translated_parts.append(get_python_variable_name(token, headers_by_sheet)) # Pass headers
-                    else:
-                        # Translate other parts (operators, functions, literals)
-                        translated_parts.append(translate_formula_part(token))
-                
-                translated_formula = "".join(translated_parts)
-                python_code_lines.append(f"{cell_var_name} = {translated_formula}")
+                # Formulas sharing an R1C1 shape (e.g. filled-down columns) are tokenized
+                # and translated once; the rest only get their references substituted.
+                set_current_address(cell_address) # Sample address of translation warnings
+                translated_formula = translation_cache.translate(formula_text, cell_address)
+                formula_lines.append(f"{cell_var_name} = {translated_formula}")
+    set_current_address(None)
+    if force_evaluator:
+        logger.info("All formulas will be evaluated at runtime due to force_evaluator flag.")
+    if report is not None:
+        report["translation_cache"] = translation_cache.get_stats()
+    if as_module:
+        formula_addresses = [cell_address for cell_address in evaluation_order if cell_address in model.cells and model.cells[cell_address].formula]
+        # With targets, compute() returns the requested cells, even input cells among them
+        output_addresses = formula_addresses if target_cells is None else [cell_address for cell_address in evaluation_order if cell_address in target_cells]
+        return _assemble_compute_module(
+            python_code_lines, input_lines, formula_lines, input_defaults,
+            [(cell_address, name_for(cell_address)) for cell_address in output_addresses],
+            ordered_fallback_cells,
+            uses_numpy=vector_plan is not None and bool(vector_plan.arrays),
+        )
     return "\n".join(python_code_lines) 
\ No newline at end of file
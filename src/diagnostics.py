@@ -0,0 +1,177 @@
+"""
+Warnings of the current request or conversion, aggregated by code.
+
+A workbook can produce the same warning for every one of its cells, so warnings are
+not kept one string per occurrence. Each kind of warning (its code) is kept once,
+with the number of times it occurred and a few sample cell addresses. Messages are
+formatted only when the diagnostics are returned, from the arguments of the first
+occurrence, and at most `settings.DIAGNOSTICS_MAX_CODES` codes are kept per request.
+
+Code that warns once per cell calls `warn`, which also logs the first occurrence of
+each code. Warnings logged the usual way are collected too, by `RequestWarningsHandler`
+on the root logger, keyed by logger and message.
+
+Collectors are only active inside `collect_diagnostics`; outside of one (e.g. a
+request that didn't start one), warnings are logged and not collected, so nothing
+is shared between requests.
+"""
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from . import settings
+
+# Code of the entry that counts the warnings left out past the cap
+TRUNCATED_CODE = "diagnostics_truncated"
+
+class _Diagnostic:
+    """One kind of warning: its first message, how often it occurred and sample addresses."""
+    __slots__ = ("code", "level", "message", "args", "count", "samples")
+
+    def __init__(self, code: str, level: str, message: str, args: tuple):
+        self.code = code
+        self.level = level
+        self.message = message
+        self.args = args
+        self.count = 0
+        self.samples: list[str] = []
+
+    def text(self) -> str:
+        """The message of the first occurrence, formatted like a log record's."""
+        if not self.args:
+            return self.message
+        try:
+            return self.message % self.args
+        except (TypeError, ValueError):
+            return f"{self.message} {self.args}"
+
+class Diagnostics:
+    """
+    Bounded collector of the warnings of one request or conversion.
+
+    Attributes:
+        current_address (str | None): Cell being processed, used as the sample address
+                                      of warnings that don't name one.
+        dropped (int): Occurrences of codes left out because the cap was reached.
+    """
+    def __init__(self, max_codes: int | None = None, max_samples: int | None = None):
+        self.max_codes = settings.DIAGNOSTICS_MAX_CODES if max_codes is None else max_codes
+        self.max_samples = settings.DIAGNOSTICS_MAX_SAMPLES if max_samples is None else max_samples
+        self.current_address: str | None = None
+        self.dropped = 0
+        self._entries: dict[tuple[str, str], _Diagnostic] = {}
+
+    def add(self, code: str, message: str, args: tuple = (), address: str | None = None, level: str = "warning", count: int = 1) -> bool:
+        """
+        Records `count` occurrences of a warning. Nothing is formatted here.
+
+        Returns:
+            bool: True if this is the first occurrence of the warning.
+        """
+        key = (code, message)
+        entry = self._entries.get(key)
+        if entry is None:
+            if len(self._entries) >= self.max_codes:
+                self.dropped += count
+                return False
+            entry = self._entries[key] = _Diagnostic(code, level, message, args)
+        entry.count += count
+        if address is None:
+            address = self.current_address
+        if address is not None and len(entry.samples) < self.max_samples and address not in entry.samples:
+            entry.samples.append(address)
+        return entry.count == count
+
+    def merge(self, entries: list[dict]):
+        """
+        Adds the entries of another collector, as returned by its `to_list` (e.g. from a
+        worker process). An entry adds to an earlier merged one with the same code and message.
+        """
+        for entry in entries:
+            if entry["code"] == TRUNCATED_CODE:
+                self.dropped += entry["count"]
+                continue
+            self.add(entry["code"], entry["message"], level=entry.get("level", "warning"), count=entry["count"])
+            for address in entry.get("samples", []):
+                self.add(entry["code"], entry["message"], address=address, count=0)
+
+    def to_list(self) -> list[dict]:
+        """Returns the diagnostics as JSON-serializable dicts: code, level, message, count and samples."""
+        entries = [
+            {"code": entry.code, "level": entry.level, "message": entry.text(), "count": entry.count, "samples": list(entry.samples)}
+            for entry in self._entries.values()
+        ]
+        if self.dropped:
+            entries.append({"code": TRUNCATED_CODE, "level": "warning", "message": f"{self.dropped} more warnings were left out (FORMULAS_DIAGNOSTICS_MAX_CODES).", "count": self.dropped, "samples": []})
+        return entries
+
+    def warnings(self) -> list[str]:
+        """Returns one line per kind of warning, with its count and sample addresses."""
+        lines = []
+        for entry in self.to_list():
+            line = entry["message"]
+            if entry["count"] > 1 or entry["samples"]:
+                details = f"{entry['count']} times" if entry["count"] > 1 else ""
+                if entry["samples"]:
+                    details += ("; " if details else "") + f"e.g. {', '.join(entry['samples'])}"
+                line += f" [{details}]"
+            lines.append(line)
+        return lines
+
+# Collector of the current request or conversion. No default, so nothing is shared
+# by requests that didn't start their own.
+request_diagnostics: ContextVar[Diagnostics | None] = ContextVar("request_diagnostics", default=None)
+
+@contextmanager
+def collect_diagnostics():
+    """Collects the warnings of the enclosed code in a new `Diagnostics`, which it yields."""
+    diagnostics = Diagnostics()
+    token = request_diagnostics.set(diagnostics)
+    try:
+        yield diagnostics
+    finally:
+        request_diagnostics.reset(token)
+
+def warn(logger: logging.Logger, code: str, message: str, *args, address: str | None = None):
+    """
+    Records a warning in the current collector. Only its first occurrence is logged
+    (lazily, with `args`); without a collector, every occurrence is.
+
+    Args:
+        logger (logging.Logger): Logger of the warning's module.
+        code (str): Kind of warning, e.g. "unknown_formula_part".
+        message (str): %-style message.
+        address (str | None): Cell the warning is about; defaults to the collector's
+                              `current_address`.
+    """
+    diagnostics = request_diagnostics.get()
+    if diagnostics is None or diagnostics.add(code, message, args, address):
+        logger.warning(message, *args, extra={"diagnostic_code": code})
+
+def set_current_address(address: str | None):
+    """Sets the cell that warnings without an address of their own are about."""
+    diagnostics = request_diagnostics.get()
+    if diagnostics is not None:
+        diagnostics.current_address = address
+
+class RequestWarningsHandler(logging.Handler):
+    """Adds warnings logged the usual way to the current collector, keyed by logger and message."""
+    def emit(self, record):
+        if record.levelno < logging.WARNING or hasattr(record, "diagnostic_code"):
+            return
+        diagnostics = request_diagnostics.get()
+        if diagnostics is not None:
+            diagnostics.add(record.name, str(record.msg), record.args or (), level=record.levelname.lower())
+
+def install_request_warnings_handler():
+    """
+    Attaches a RequestWarningsHandler to the root logger if one is not already present.
+
+    Pool worker processes do not run the server's logging configuration, so they
+    call this on start-up to capture warnings for the conversion they are running.
+    """
+    root_logger = logging.getLogger()
+    if not any(isinstance(handler, RequestWarningsHandler) for handler in root_logger.handlers):
+        root_logger.addHandler(RequestWarningsHandler())
+    if root_logger.level > logging.INFO:
+        root_logger.setLevel(logging.INFO)
@@ -0,0 +1,510 @@
+"""
+Peephole optimizer over translated formula expressions.
+
+Every formula is parsed into the Python AST its translation stands for, with the
+functions of `EXCEL_FUNCTION_MAP` called the same way (`IF` as an inline lambda
+called immediately), and rewritten by these passes before it is emitted:
+
+- inlining: lambda-wrapped `IF`, `AND`, `OR` and `NOT` become conditional
+  expressions and `and`/`or`/`not`, so no function object is created and called
+  per evaluation. `IF` only evaluates the branch it takes, like Excel. `AND`/`OR`
+  stop at the operand that decides them, so an error in a later operand no longer
+  propagates.
+- constant folding: operators and pure builtins (`abs`, `max`, `min`, `round`)
+  over literals are computed once; a conditional with a literal test keeps only
+  the branch it takes.
+- strength reduction: `x ** 2` becomes `x * x`, and division by a power of two
+  becomes multiplication by its exact reciprocal.
+- common subexpression elimination across formulas: a subexpression computed
+  unconditionally by several formulas is assigned to a temporary right before the
+  first formula that needs it, or taken from the first formula that computes
+  exactly it. Subexpressions only evaluated in an `IF` branch or after an `AND`/`OR`
+  operand are never hoisted, since they may be guarded (e.g. `IF(B1=0,0,A1/B1)`).
+
+Unlike `tokenize_formula`, function arguments keep their commas and `>=`, `<=` and
+`<>` are single operators, and Excel's precedence applies (negation binds tighter
+than `^`, which is left-associative). Formulas using anything the optimizer doesn't
+know (unknown functions, `&`, `%`) keep the translator's output.
+"""
+import ast
+import math
+import operator
+import re
+import logging
+
+from .formula_translator import EXCEL_FUNCTION_MAP
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_PATTERN = re.compile(r"""
+    \s*(?:
+    ("(?:[^"]|"")*")                                                     |   # 1: String literals
+    ((?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?)                           |   # 2: Numbers
+    ((?:(?:[A-Za-z_][A-Za-z0-9_]*|'(?:[^']|'')+')!)?\$?[A-Za-z]{1,3}\$?\d+(?::\$?[A-Za-z]{1,3}\$?\d+)?)(?![A-Za-z0-9_(.!])  |   # 3: Cell references and ranges, sheet names quoted or not
+    ([A-Za-z_][A-Za-z0-9_.]*)                                            |   # 4: Function names and booleans
+    (<>|<=|>=|[-+*/^&=<>%,()])                                               # 5: Operators
+    )\s*
+""", re.VERBOSE)
+
+_COMPARISON_OPERATORS = {"=": ast.Eq, "<>": ast.NotEq, "<": ast.Lt, ">": ast.Gt, "<=": ast.LtE, ">=": ast.GtE}
+_ARITHMETIC_OPERATORS = {"+": ast.Add, "-": ast.Sub, "*": ast.Mult, "/": ast.Div, "^": ast.Pow}
+
+# Lambdas of EXCEL_FUNCTION_MAP that are rewritten into native expressions, by their AST
+_INLINED_LAMBDAS = {
+    ast.dump(ast.parse(EXCEL_FUNCTION_MAP[function_name], mode="eval").body): function_name
+    for function_name in ("IF", "AND", "OR", "NOT")
+}
+
+_FOLDED_BINARY_OPERATORS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv, ast.Pow: operator.pow}
+_FOLDED_UNARY_OPERATORS = {ast.USub: operator.neg, ast.UAdd: operator.pos, ast.Not: operator.not_}
+_FOLDED_COMPARISONS = {ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt, ast.Gt: operator.gt, ast.LtE: operator.le, ast.GtE: operator.ge}
+# Builtins the translation calls that have no side effects
+_PURE_FUNCTIONS = {"abs": abs, "max": max, "min": min, "round": round, "sum": sum, "bool": bool, "all": all, "any": any, "len": len}
+_FOLDED_FUNCTIONS = {"abs", "max", "min", "round", "bool"}
+# Results of folding that are emitted as literals; larger ints are left to run time
+_MAX_FOLDED_INT_BITS = 64
+# Expressions with at least this many operations (a call counts as several) are worth a temporary
+_MIN_HOISTED_COST = 2
+
+class _Unsupported(Exception):
+    """The formula uses something the optimizer doesn't handle."""
+
+def _is_boolean(node: ast.expr) -> bool:
+    """Whether an expression always produces a bool."""
+    if isinstance(node, ast.Constant):
+        return isinstance(node.value, bool)
+    if isinstance(node, ast.Compare):
+        return True
+    if isinstance(node, ast.UnaryOp):
+        return isinstance(node.op, ast.Not)
+    if isinstance(node, ast.BoolOp):
+        return all(_is_boolean(value) for value in node.values)
+    return isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "bool"
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _literal(value) -> ast.Constant | None:
+    """Returns a literal for a folded value, or None if it shouldn't be emitted as one."""
+    if isinstance(value, bool) or isinstance(value, str):
+        return ast.Constant(value)
+    if isinstance(value, int):
+        return ast.Constant(value) if value.bit_length() <= _MAX_FOLDED_INT_BITS else None
+    if isinstance(value, float):
+        return ast.Constant(value) if math.isfinite(value) else None
+    return None
+
+class _FormulaParser:
+    """Recursive-descent parser from Excel formula text to a Python expression AST."""
+    def __init__(self, formula: str, reference_node):
+        self.tokens = self._tokenize(formula)
+        self.position = 0
+        self.reference_node = reference_node
+
+    @staticmethod
+    def _tokenize(formula: str) -> list[tuple[int, str]]:
+        tokens = []
+        position = 0
+        while position < len(formula):
+            match = _TOKEN_PATTERN.match(formula, position)
+            if match is None or match.end() == position:
+                raise _Unsupported(f"unrecognized text at {formula[position:position + 10]!r}")
+            kind = match.lastindex
+            tokens.append((kind, match.group(kind)))
+            position = match.end()
+        return tokens
+
+    def _peek(self) -> str | None:
+        return self.tokens[self.position][1] if self.position < len(self.tokens) else None
+
+    def _take(self) -> tuple[int, str]:
+        if self.position >= len(self.tokens):
+            raise _Unsupported("unexpected end of formula")
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def _expect(self, text: str):
+        if self._take()[1] != text:
+            raise _Unsupported(f"expected {text!r}")
+
+    def parse(self) -> ast.expr:
+        node = self._comparison()
+        if self.position != len(self.tokens):
+            raise _Unsupported(f"unexpected {self._peek()!r}")
+        return node
+
+    def _comparison(self) -> ast.expr:
+        node = self._concatenation()
+        # Excel comparisons are left-associative binary operators, never chained
+        while self._peek() in _COMPARISON_OPERATORS:
+            operator_class = _COMPARISON_OPERATORS[self._take()[1]]
+            node = ast.Compare(left=node, ops=[operator_class()], comparators=[self._concatenation()])
+        return node
+
+    def _concatenation(self) -> ast.expr:
+        node = self._additive()
+        if self._peek() == "&":
+            raise _Unsupported("text concatenation")
+        return node
+
+    def _binary(self, operand, operators: tuple[str, ...]) -> ast.expr:
+        node = operand()
+        while self._peek() in operators:
+            operator_class = _ARITHMETIC_OPERATORS[self._take()[1]]
+            node = ast.BinOp(left=node, op=operator_class(), right=operand())
+        return node
+
+    def _additive(self) -> ast.expr:
+        return self._binary(self._multiplicative, ("+", "-"))
+
+    def _multiplicative(self) -> ast.expr:
+        return self._binary(self._power, ("*", "/"))
+
+    def _power(self) -> ast.expr:
+        return self._binary(self._unary, ("^",))
+
+    def _unary(self) -> ast.expr:
+        if self._peek() in ("-", "+"):
+            operator_class = ast.USub if self._take()[1] == "-" else ast.UAdd
+            return ast.UnaryOp(op=operator_class(), operand=self._unary())
+        node = self._primary()
+        if self._peek() == "%":
+            raise _Unsupported("percent operator")
+        return node
+
+    def _primary(self) -> ast.expr:
+        kind, text = self._take()
+        if kind == 1:
+            return ast.Constant(text[1:-1].replace('""', '"'))
+        if kind == 2:
+            number = float(text) if any(character in text for character in ".eE") else int(text)
+            return ast.Constant(number)
+        if kind == 3:
+            sheet, separator, cells = text.rpartition("!")
+            return self.reference_node(sheet + separator + cells.replace("$", ""))
+        if kind == 4:
+            name = text.upper()
+            if name in ("TRUE", "FALSE") and self._peek() != "(":
+                return ast.Constant(name == "TRUE")
+            return self._call(name)
+        if text == "(":
+            node = self._comparison()
+            self._expect(")")
+            return node
+        raise _Unsupported(f"unexpected {text!r}")
+
+    def _call(self, name: str) -> ast.expr:
+        translation = EXCEL_FUNCTION_MAP.get(name)
+        if translation is None or not name.isalpha():
+            raise _Unsupported(f"function {name}")
+        self._expect("(")
+        arguments = []
+        if self._peek() != ")":
+            while True:
+                if self._peek() in (",", ")"):
+                    raise _Unsupported("omitted argument")
+                arguments.append(self._comparison())
+                if self._peek() != ",":
+                    break
+                self._take()
+        self._expect(")")
+        # The function exactly as the translator emits it, e.g. an inline lambda
+        return ast.Call(func=ast.parse(translation, mode="eval").body, args=arguments, keywords=[])
+
+class _OptimizedFormula:
+    def __init__(self, target: str, root: ast.expr):
+        self.target = target
+        self.root = root
+        # (temporary, expression) assignments emitted before the formula
+        self.preludes: list[tuple[str, ast.expr]] = []
+
+class ExpressionOptimizer:
+    """
+    Parses and optimizes the formulas of one generated script.
+
+    Formulas are added in evaluation order with `add`; after the last one,
+    `eliminate_common_subexpressions` hoists shared subexpressions and `render`
+    returns the statements to emit for each formula.
+    """
+    def __init__(self, name_for_reference, reserve_name):
+        """
+        Args:
+            name_for_reference: Callable mapping a cell reference to its Python expression
+                                (a variable name, or an array element when vectorizing).
+            reserve_name: Callable returning a new identifier no cell uses, e.g. `SymbolTable.reserve`.
+        """
+        self.name_for_reference = name_for_reference
+        self.reserve_name = reserve_name
+        self._reference_sources: dict[str, str] = {}
+        self._formulas: dict[str, _OptimizedFormula] = {}
+        self.stats = {
+            "formulas": 0,
+            "unsupported_formulas": 0,
+            "inlined_calls": 0,
+            "folded_constants": 0,
+            "strength_reductions": 0,
+            "common_subexpressions": 0,
+            "reused_cells": 0,
+        }
+
+    def _reference_node(self, reference: str) -> ast.expr:
+        source = self._reference_sources.get(reference)
+        if source is None:
+            source = self.name_for_reference(reference)
+            self._reference_sources[reference] = source
+        return _expression_node(source)
+
+    def add(self, cell_address: str, formula: str, target: str) -> bool:
+        """
+        Parses and optimizes the formula assigned to `target`.
+
+        Returns:
+            bool: False if the formula uses something the optimizer doesn't handle; the
+                  caller emits the translator's output for it instead.
+        """
+        text = str(formula).strip()
+        if text.startswith("="):
+            text = text[1:]
+        try:
+            root = self._simplify(_FormulaParser(text, self._reference_node).parse())
+        except (_Unsupported, RecursionError, SyntaxError) as e:
+            logger.debug(f"Formula for cell {cell_address} is not optimized: {e}")
+            self.stats["unsupported_formulas"] += 1
+            return False
+        self._formulas[cell_address] = _OptimizedFormula(target, root)
+        self.stats["formulas"] += 1
+        return True
+
+    def _simplify(self, node: ast.expr) -> ast.expr:
+        """Applies inlining, constant folding and strength reduction bottom-up."""
+        for field, value in ast.iter_fields(node):
+            if isinstance(value, ast.expr) and not isinstance(node, ast.Lambda):
+                setattr(node, field, self._simplify(value))
+            elif isinstance(value, list) and value and isinstance(value[0], ast.expr):
+                setattr(node, field, [self._simplify(item) for item in value])
+
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Lambda):
+            inlined = self._inline(node)
+            if inlined is not node:
+                self.stats["inlined_calls"] += 1
+                return self._simplify_node(inlined)
+            return node
+        return self._simplify_node(node)
+
+    def _inline(self, call: ast.Call) -> ast.expr:
+        """Rewrites a call of an inlinable lambda into the native expression."""
+        function_name = _INLINED_LAMBDAS.get(ast.dump(call.func))
+        arguments = call.args
+        if function_name == "IF" and len(arguments) in (2, 3):
+            # IF without a value for FALSE conditions returns FALSE, as in Excel
+            orelse = arguments[2] if len(arguments) == 3 else ast.Constant(False)
+            return ast.IfExp(test=arguments[0], body=arguments[1], orelse=orelse)
+        if function_name in ("AND", "OR"):
+            if not arguments:
+                return ast.Constant(function_name == "AND") # all(()) / any(())
+            if len(arguments) == 1:
+                expression = arguments[0]
+            else:
+                expression = ast.BoolOp(op=ast.And() if function_name == "AND" else ast.Or(), values=arguments)
+            # all() and any() return bools, while `and`/`or` return an operand
+            if all(_is_boolean(argument) for argument in arguments):
+                return expression
+            return ast.Call(func=ast.Name("bool", ast.Load()), args=[expression], keywords=[])
+        if function_name == "NOT" and len(arguments) == 1:
+            return ast.UnaryOp(op=ast.Not(), operand=arguments[0])
+        return call
+
+    def _simplify_node(self, node: ast.expr) -> ast.expr:
+        """Folds a node whose operands are literals, or reduces its strength."""
+        folded = _fold(node)
+        if folded is not node:
+            self.stats["folded_constants"] += 1
+            return folded
+        if isinstance(node, ast.BinOp) and isinstance(node.right, ast.Constant) and _is_number(node.right.value):
+            exponent_or_divisor = node.right.value
+            if isinstance(node.op, ast.Pow) and exponent_or_divisor == 2 and isinstance(exponent_or_divisor, int) and isinstance(node.left, (ast.Name, ast.Subscript)):
+                self.stats["strength_reductions"] += 1
+                return ast.BinOp(left=node.left, op=ast.Mult(), right=node.left)
+            if isinstance(node.op, ast.Div) and exponent_or_divisor != 0:
+                mantissa, exponent = math.frexp(abs(exponent_or_divisor))
+                # Only powers of two have an exact reciprocal, so the result is identical
+                if mantissa == 0.5 and abs(exponent) <= 64:
+                    self.stats["strength_reductions"] += 1
+                    return ast.BinOp(left=node.left, op=ast.Mult(), right=ast.Constant(1.0 / exponent_or_divisor))
+        return node
+
+    def eliminate_common_subexpressions(self):
+        """Hoists subexpressions computed unconditionally by several formulas into temporaries."""
+        keys: dict[int, tuple] = {}
+        sizes: dict[tuple, tuple[int, int]] = {}
+        counts: dict[tuple, int] = {}
+        representatives: dict[tuple, ast.expr] = {}
+        for formula in self._formulas.values():
+            _key(formula.root, keys, sizes)
+            for node in _unconditional_nodes(formula.root):
+                key = keys.get(id(node))
+                if key is not None and sizes[key][1] >= _MIN_HOISTED_COST:
+                    counts[key] = counts.get(key, 0) + 1
+                    representatives.setdefault(key, node)
+
+        # Largest expressions first: hoisting one removes the repeats of everything inside it
+        hoisted = set()
+        for key in sorted(counts, key=lambda key: -sizes[key][0]):
+            if counts[key] < 2:
+                continue
+            hoisted.add(key)
+            for node in _unconditional_nodes(representatives[key]):
+                inner_key = keys.get(id(node))
+                if node is not representatives[key] and inner_key in counts:
+                    counts[inner_key] -= counts[key] - 1
+        if not hoisted:
+            return
+
+        defined: dict[tuple, str] = {}
+        for formula in self._formulas.values():
+            root_key = keys.get(id(formula.root))
+            if root_key in hoisted and root_key not in defined:
+                # Later formulas computing exactly this read the cell instead
+                defined[root_key] = formula.target
+                self.stats["reused_cells"] += 1
+                formula.root = self._rewrite_children(formula.root, formula, keys, hoisted, defined, False)
+            else:
+                formula.root = self._rewrite(formula.root, formula, keys, hoisted, defined, False)
+
+    def _rewrite(self, node, formula, keys, hoisted, defined, conditional: bool) -> ast.expr:
+        key = keys.get(id(node))
+        if key in hoisted:
+            name = defined.get(key)
+            if name is not None:
+                return _expression_node(name)
+            if not conditional:
+                definition = self._rewrite_children(node, formula, keys, hoisted, defined, False)
+                name = self.reserve_name(f"cse_{self.stats['common_subexpressions'] + 1}")
+                self.stats["common_subexpressions"] += 1
+                formula.preludes.append((name, definition))
+                defined[key] = name
+                return ast.Name(name, ast.Load())
+        return self._rewrite_children(node, formula, keys, hoisted, defined, conditional)
+
+    def _rewrite_children(self, node, formula, keys, hoisted, defined, conditional: bool) -> ast.expr:
+        if isinstance(node, ast.IfExp):
+            node.test = self._rewrite(node.test, formula, keys, hoisted, defined, conditional)
+            node.body = self._rewrite(node.body, formula, keys, hoisted, defined, True)
+            node.orelse = self._rewrite(node.orelse, formula, keys, hoisted, defined, True)
+        elif isinstance(node, ast.BoolOp):
+            node.values = [self._rewrite(value, formula, keys, hoisted, defined, conditional or index > 0) for index, value in enumerate(node.values)]
+        elif not isinstance(node, ast.Lambda):
+            for field, value in ast.iter_fields(node):
+                if isinstance(value, ast.expr):
+                    setattr(node, field, self._rewrite(value, formula, keys, hoisted, defined, conditional))
+                elif isinstance(value, list) and value and isinstance(value[0], ast.expr):
+                    setattr(node, field, [self._rewrite(item, formula, keys, hoisted, defined, conditional) for item in value])
+        return node
+
+    def render(self, cell_address: str) -> tuple[list[tuple[str, str]], str] | None:
+        """
+        Returns the (temporary, expression) assignments to emit before the formula and
+        the formula's expression, or None if the formula was not optimized.
+        """
+        formula = self._formulas.get(cell_address)
+        if formula is None:
+            return None
+        preludes = [(name, ast.unparse(definition)) for name, definition in formula.preludes]
+        return preludes, ast.unparse(formula.root)
+
+    def get_stats(self) -> dict:
+        """Returns how many formulas were optimized and how often each pass applied."""
+        return dict(self.stats)
+
+def _expression_node(source: str) -> ast.expr:
+    """A fresh AST node for a variable name or array element."""
+    if source.isidentifier():
+        return ast.Name(source, ast.Load())
+    return ast.parse(source, mode="eval").body
+
+def _fold(node: ast.expr) -> ast.expr:
+    """Computes a node whose operands are all literals; returns the node itself if it can't."""
+    try:
+        if isinstance(node, ast.BinOp) and isinstance(node.left, ast.Constant) and isinstance(node.right, ast.Constant):
+            left, right = node.left.value, node.right.value
+            # Strings are left alone (e.g. "a" * 10**9), as are huge powers
+            if not (_is_number(left) and _is_number(right)):
+                return node
+            if isinstance(node.op, ast.Pow) and (abs(right) > 64 or abs(left) > 2 ** 32):
+                return node
+            return _literal(_FOLDED_BINARY_OPERATORS[type(node.op)](left, right)) or node
+        if isinstance(node, ast.UnaryOp) and isinstance(node.operand, ast.Constant):
+            return _literal(_FOLDED_UNARY_OPERATORS[type(node.op)](node.operand.value)) or node
+        if isinstance(node, ast.Compare) and isinstance(node.left, ast.Constant) and all(isinstance(comparator, ast.Constant) for comparator in node.comparators):
+            result = _FOLDED_COMPARISONS[type(node.ops[0])](node.left.value, node.comparators[0].value)
+            return _literal(result) or node
+        if isinstance(node, ast.IfExp) and isinstance(node.test, ast.Constant):
+            return node.body if node.test.value else node.orelse
+        if isinstance(node, ast.BoolOp) and all(isinstance(value, ast.Constant) for value in node.values):
+            values = [value.value for value in node.values]
+            result = values[-1]
+            for value in values[:-1]:
+                if bool(value) != isinstance(node.op, ast.And):
+                    result = value
+                    break
+            return _literal(result) or node
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _FOLDED_FUNCTIONS
+                and node.args and all(isinstance(argument, ast.Constant) and _is_number(argument.value) for argument in node.args)):
+            return _literal(_PURE_FUNCTIONS[node.func.id](*(argument.value for argument in node.args))) or node
+    except (ArithmeticError, TypeError, ValueError):
+        pass # Left to fail at run time, like the unoptimized expression
+    return node
+
+def _key(node: ast.expr, keys: dict, sizes: dict):
+    """
+    Computes structural keys for `node` and its subexpressions into `keys` (by node id),
+    and the (node count, cost) of each key into `sizes`. Returns the key, or None if the
+    expression can't be shared (lambdas, impure calls).
+    """
+    if isinstance(node, ast.Name):
+        key = ("name", node.id)
+        size = cost = 0
+    elif isinstance(node, ast.Constant):
+        key = ("const", type(node.value).__name__, node.value)
+        size = cost = 0
+    else:
+        children = []
+        shareable = not isinstance(node, ast.Lambda)
+        # Rough number of operations; a call counts as several
+        size, cost = 0, (3 if isinstance(node, ast.Call) else 1)
+        for child in ast.iter_child_nodes(node):
+            if not isinstance(child, ast.expr):
+                children.append(type(child).__name__) # Operators and contexts
+                continue
+            child_key = _key(child, keys, sizes)
+            if child_key is None:
+                shareable = False
+                continue
+            children.append(child_key)
+            child_size, child_cost = sizes[child_key]
+            size += child_size
+            cost += child_cost
+        if not shareable:
+            return None
+        if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name) and node.func.id in _PURE_FUNCTIONS):
+            return None
+        key = (type(node).__name__, *children)
+    keys[id(node)] = key
+    sizes[key] = (size + 1, cost)
+    return key
+
+def _unconditional_nodes(node: ast.expr) -> list[ast.expr]:
+    """Returns `node` and the subexpressions evaluated whenever it is."""
+    nodes = []
+    pending = [node]
+    while pending:
+        node = pending.pop()
+        nodes.append(node)
+        if isinstance(node, ast.IfExp):
+            pending.append(node.test)
+        elif isinstance(node, ast.BoolOp):
+            pending.append(node.values[0])
+        elif isinstance(node, (ast.BinOp, ast.Compare, ast.UnaryOp, ast.Call, ast.Subscript)):
+            pending.extend(child for child in ast.iter_child_nodes(node) if isinstance(child, ast.expr))
+    return nodes
@@ -1,9 +1,18 @@
 import os
+import tempfile
 from fastapi import UploadFile
 import logging
 
+from . import settings
+
 logger = logging.getLogger(__name__)
 
+ALLOWED_EXTENSIONS = ['xlsx', 'csv', 'tsv']
+# Size of the reads used to stream an upload into its spool file
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Every .xlsx is a ZIP archive, which starts with a local file header
+ZIP_MAGIC = b"PK\x03\x04"
+
 class FileValidationError(Exception):
     """Custom exception for file validation errors."""
     def __init__(self, message: str, status_code: int = 400):
@@ -21,28 +30,111 @@ class InvalidFileExtensionError(FileValidationError):
     def __init__(self, message: str = "Invalid file extension."):
         super().__init__(message, status_code=415)
 
-async def handle_file_upload(file: UploadFile):
+class InvalidFileContentError(FileValidationError):
+    """Custom exception for file content that doesn't match its extension."""
+    def __init__(self, message: str = "File content does not match its extension."):
+        super().__init__(message, status_code=415)
+
+def _format_size_limit(max_bytes: int) -> str:
+    """Formats a byte limit for error messages, e.g. 10485760 -> '10MB'."""
+    if max_bytes % (1024 * 1024) == 0:
+        return f"{max_bytes // (1024 * 1024)}MB"
+    return f"{max_bytes} bytes"
+
+def validate_file_name(filename: str | None) -> str:
+    """
+    Checks the file name of an upload before any of its content is read.
+
+    Returns:
+        str: The lowercased file extension without the dot.
+
+    Raises:
+        FileValidationError: If the file name is missing.
+        InvalidFileExtensionError: If the extension is not allowed.
+    """
+    if filename is None:
+        raise FileValidationError("File name is missing.", status_code=400)
+    file_extension = os.path.splitext(filename)[1].lstrip('.').lower()
+    if file_extension not in ALLOWED_EXTENSIONS:
+        logger.warning(f"Invalid file extension: .{file_extension}. Allowed: {', '.join(ALLOWED_EXTENSIONS)}")
+        raise InvalidFileExtensionError(f"Invalid file extension: .{file_extension}. Allowed extensions are {', '.join(ALLOWED_EXTENSIONS)}.")
+    return file_extension
+
+async def receive_upload(file: UploadFile, max_bytes: int | None = None) -> tempfile.SpooledTemporaryFile:
+    """
+    Streams an upload into a spooled temporary file, validating it as early as possible.
+
+    The file name and extension are checked before the body is read, the ZIP header of
+    .xlsx uploads is checked on the first chunk, and reading stops as soon as the body
+    passes `max_bytes`. At most one chunk past the limit is ever held, and bodies above
+    `settings.UPLOAD_SPOOL_MAX_BYTES` live on disk instead of in memory.
+
+    Starlette has already received the whole multipart body (into its own spooled
+    file) when the endpoint runs, so this bounds what the endpoint holds, not what the
+    server receives. Memory only stays bounded if the caller keeps the spool, as /jobs
+    does; `handle_file_upload` reads it all.
+
+    Args:
+        file (UploadFile): The uploaded file.
+        max_bytes (int | None): Largest accepted body. Defaults to `settings.UPLOAD_MAX_BYTES`.
+
+    Returns:
+        SpooledTemporaryFile: The body, positioned at the start. The caller closes it.
+
+    Raises:
+        FileValidationError: (or a subclass) if the upload is rejected.
+    """
+    if max_bytes is None:
+        max_bytes = settings.UPLOAD_MAX_BYTES
+    file_extension = validate_file_name(file.filename)
+
+    # The multipart parser already knows the size of most uploads; reject those without reading
+    declared_size = getattr(file, "size", None)
+    if isinstance(declared_size, int) and declared_size > max_bytes:
+        raise InvalidFileSizeError(f"File size exceeds {_format_size_limit(max_bytes)} limit.")
+
+    spool = tempfile.SpooledTemporaryFile(max_size=settings.UPLOAD_SPOOL_MAX_BYTES)
+    try:
+        total_bytes = 0
+        first_chunk = True
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if first_chunk:
+                first_chunk = False
+                if file_extension == 'xlsx' and not chunk.startswith(ZIP_MAGIC):
+                    raise InvalidFileContentError("File content is not a valid .xlsx workbook (missing ZIP header).")
+            if not chunk:
+                break
+            total_bytes += len(chunk)
+            if total_bytes > max_bytes:
+                raise InvalidFileSizeError(f"File size exceeds {_format_size_limit(max_bytes)} limit.")
+            spool.write(chunk)
+        spool.seek(0)
+        logger.info(f"File {file.filename} (size: {total_bytes} bytes) validated successfully.")
+        return spool
+    except BaseException:
+        spool.close()
+        raise
+
+async def handle_file_upload(file: UploadFile, max_bytes: int | None = None) -> bytes:
     """
-    Handles the uploaded file, including temporary storage or in-memory representation.
+    Validates and reads an uploaded file. See `receive_upload` for the checks.
+
+    The whole body is returned in memory, as /convert/ needs the bytes to hash and to
+    send to the conversion pool.
+
+    Returns:
+        bytes: The file content.
+
+    Raises:
+        FileValidationError: (or a subclass) if the upload is rejected or can't be read.
     """
-    # In a real application, you would save the file to disk or process it in memory.
-    # For now, we'll just read its content for validation purposes.
     try:
-        file_content = await file.read()
-        # Validate file size
-        MAX_FILE_SIZE_MB = 10
-        if len(file_content) > MAX_FILE_SIZE_MB * 1024 * 1024:
-            raise InvalidFileSizeError(f"File size exceeds {MAX_FILE_SIZE_MB}MB limit.")
-        # Validate file extension
-        ALLOWED_EXTENSIONS = ['xlsx', 'csv', 'tsv']
-        if file.filename is None:
-            raise FileValidationError("File name is missing.", status_code=400)
-        file_extension = os.path.splitext(file.filename)[1].lstrip('.').lower()
-        if file_extension not in ALLOWED_EXTENSIONS:
-            logger.warning(f"Invalid file extension: .{file_extension}. Allowed: {', '.join(ALLOWED_EXTENSIONS)}")
-            raise InvalidFileExtensionError(f"Invalid file extension: .{file_extension}. Allowed extensions are {', '.join(ALLOWED_EXTENSIONS)}.")
-        logger.info(f"File {file.filename} (size: {len(file_content)} bytes) validated successfully.")
-        return file_content
+        spool = await receive_upload(file, max_bytes)
+        with spool:
+            return spool.read()
+    except FileValidationError:
+        raise
     except Exception as e:
         logger.error(f"Error handling file upload for {file.filename}: {e}", exc_info=True)
-        raise FileValidationError(f"Could not read file content: {e}", status_code=500) 
\ No newline at end of file
+        raise FileValidationError(f"Could not read file content: {e}", status_code=500)
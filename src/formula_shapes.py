@@ -0,0 +1,188 @@
+import re
+
+from .formula_translator import translate_formula_part, tokenize_formula
+
+# A token the code generator treats as a cell reference (and turns into a variable name)
+CELL_REFERENCE_TOKEN_PATTERN = re.compile(r"^[A-Za-z]+[0-9]+(?::[A-Za-z]+[0-9]+)?$|^(?:[A-Za-z_][A-Za-z0-9_]*|'(?:[^']|'')+')![A-Za-z]+[0-9]+(?::[A-Za-z]+[0-9]+)?$")
+
+# Scans a formula the same way `tokenize_formula` does for string literals (1), cell
+# references (2) and identifiers (3). Operators, numbers and parentheses can never start
+# one of these, so the references found here are exactly the reference tokens.
+_SHAPE_SCAN_PATTERN = re.compile(r"""
+    ("(?:\\"|[^"])*")       |
+    ((?:(?:[A-Za-z_][A-Za-z0-9_]*|'(?:[^']|'')+')!)?[A-Za-z]+\d+(?::[A-Za-z]+\d+)?(?:\$[A-Za-z]+\$\d+)?) |
+    ([A-Za-z_][A-Za-z0-9_]*)
+""", re.VERBOSE)
+
+# References that are rewritten relative to the formula's cell. Anything else (lowercase
+# columns, `$` suffixes) stays literal in the shape, which keeps the output identical.
+RELATIVE_REFERENCE_PATTERN = re.compile(r"^(?:([A-Za-z_][A-Za-z0-9_]*|'(?:[^']|'')+')!)?([A-Z]+)(\d+)(?::([A-Z]+)(\d+))?$")
+
+_CELL_ADDRESS_PATTERN = re.compile(r'^([A-Za-z]+)(\d+)$')
+
+def unquote_sheet_name(sheet_name: str) -> str:
+    """Returns a sheet name as it appears in cell addresses ("'My Sheet'" -> 'My Sheet')."""
+    if sheet_name.startswith("'"):
+        return sheet_name[1:-1].replace("''", "'")
+    return sheet_name
+
+def unquote_reference(reference: str) -> str:
+    """Returns a reference token with its sheet unquoted ("'My Sheet'!A1" -> 'My Sheet!A1')."""
+    sheet_name, _, cells = reference.rpartition("!")
+    return f"{unquote_sheet_name(sheet_name)}!{cells}"
+
+_column_index_cache: dict[str, int] = {}
+
+def column_letters_to_index(letters: str) -> int:
+    """Converts column letters to a 1-based column index ('A' -> 1, 'AA' -> 27)."""
+    index = _column_index_cache.get(letters)
+    if index is None:
+        index = 0
+        for letter in letters.upper():
+            index = index * 26 + (ord(letter) - 64)
+        _column_index_cache[letters] = index
+    return index
+
+def column_index_to_letters(index: int) -> str:
+    """Converts a 1-based column index to column letters (1 -> 'A', 27 -> 'AA')."""
+    letters = ""
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+def parse_cell_position(cell_address: str) -> tuple[int, int] | None:
+    """
+    Returns the (row, column) of a cell address such as 'Sheet1!C2', or None if the
+    address is not a single cell.
+    """
+    match = _CELL_ADDRESS_PATTERN.match(cell_address.rpartition('!')[2])
+    if not match:
+        return None
+    return int(match.group(2)), column_letters_to_index(match.group(1))
+
+def canonicalize_formula(formula: str, row: int, column: int) -> tuple[str, list[str]]:
+    """
+    Rewrites the cell references of a formula relative to the cell holding it (R1C1 style).
+
+    Formulas filled down or across a range share one canonical form: 'A2*B2' in C2 and
+    'A3*B3' in C3 both become 'R[0]C[-2]*R[0]C[-1]'.
+
+    Args:
+        formula (str): The formula text.
+        row (int): Row of the cell holding the formula.
+        column (int): Column index of the cell holding the formula.
+
+    Returns:
+        A tuple (shape, references): the canonical formula, and the original reference
+        tokens that were rewritten, in formula order.
+    """
+    # split() keeps the captured groups: every 4th item from index 2 is a reference (or None)
+    parts = _SHAPE_SCAN_PATTERN.split(formula)
+    references = []
+    for part_index in range(2, len(parts), 4):
+        reference = parts[part_index]
+        if reference is None:
+            continue
+        reference_match = RELATIVE_REFERENCE_PATTERN.match(reference)
+        if reference_match is None:
+            continue
+        sheet_name, start_column, start_row, end_column, end_row = reference_match.groups()
+        shape = f"R[{int(start_row) - row}]C[{column_letters_to_index(start_column) - column}]"
+        if end_column is not None:
+            shape += f":R[{int(end_row) - row}]C[{column_letters_to_index(end_column) - column}]"
+        parts[part_index] = f"{sheet_name}!{shape}" if sheet_name else shape
+        references.append(reference)
+    return "".join([part for part in parts if part is not None]), references
+
+def translate_tokens(tokens: list[str], name_for_reference) -> str:
+    """
+    Translates formula tokens to a Python expression.
+
+    Args:
+        tokens (list[str]): Tokens from `tokenize_formula`.
+        name_for_reference: Callable mapping a cell reference token to its Python variable name.
+    """
+    translated_parts = []
+    for token in tokens:
+        if CELL_REFERENCE_TOKEN_PATTERN.match(token):
+            # It's a cell reference, convert to Python variable name
+            translated_parts.append(name_for_reference(token))
+        else:
+            # Translate other parts (operators, functions, literals)
+            translated_parts.append(translate_formula_part(token))
+    return "".join(translated_parts)
+
+class TranslationCache:
+    """
+    Translates formulas once per distinct R1C1 shape.
+
+    The first formula of a shape is tokenized and translated into a template whose
+    relative references are left as slots. Every other formula of the same shape is
+    produced by substituting the variable names of its own references into the slots.
+    The tokens of each shape are kept as well, for `plan_vectorized_runs` to reuse.
+    """
+    def __init__(self, name_for_reference):
+        """
+        Args:
+            name_for_reference: Callable mapping a cell reference token (e.g. 'Sheet1!A1')
+                                to its Python variable name.
+        """
+        self.name_for_reference = name_for_reference
+        self._templates: dict[str, list] = {}
+        self._tokens: dict[str, list[str]] = {}
+        self.formulas = 0
+        self.hits = 0
+
+    def tokens_for(self, shape: str, formula: str) -> list[str]:
+        """Returns the tokens of `formula`, whose R1C1 shape is `shape`; each shape is tokenized once."""
+        tokens = self._tokens.get(shape)
+        if tokens is None:
+            tokens = self._tokens[shape] = tokenize_formula(formula)
+        return tokens
+
+    def _build_template(self, tokens: list[str], reference_count: int) -> list:
+        """Returns translated parts where relative reference slots are ints and constants are strs."""
+        template = []
+        slot = 0
+        for token in tokens:
+            if CELL_REFERENCE_TOKEN_PATTERN.match(token):
+                if slot < reference_count and RELATIVE_REFERENCE_PATTERN.match(token):
+                    template.append(slot)
+                    slot += 1
+                else:
+                    template.append(self.name_for_reference(token))
+            else:
+                template.append(translate_formula_part(token))
+        return template
+
+    def translate(self, formula: str, cell_address: str) -> str:
+        """Translates the formula held by `cell_address` to a Python expression."""
+        self.formulas += 1
+        position = parse_cell_position(cell_address)
+        if position is None:
+            return translate_tokens(tokenize_formula(formula), self.name_for_reference)
+        row, column = position
+
+        shape, references = canonicalize_formula(formula, row, column)
+        template = self._templates.get(shape)
+        if template is None:
+            template = self._build_template(self.tokens_for(shape, formula), len(references))
+            self._templates[shape] = template
+        else:
+            self.hits += 1
+
+        name_for_reference = self.name_for_reference
+        return "".join([
+            part if part.__class__ is str else name_for_reference(references[part])
+            for part in template
+        ])
+
+    def get_stats(self) -> dict:
+        """Returns the number of formulas, distinct shapes and the cache hit ratio."""
+        return {
+            "formulas": self.formulas,
+            "distinct_shapes": len(self._templates),
+            "cache_hits": self.hits,
+            "cache_hit_ratio": round(self.hits / self.formulas, 4) if self.formulas else 0.0,
+        }
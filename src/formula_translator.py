@@ -1,6 +1,8 @@
 import re
 import logging
 
+from .diagnostics import warn
+
 logger = logging.getLogger(__name__)
 
 EXCEL_FUNCTION_MAP = {
@@ -52,9 +54,9 @@ def translate_formula_part(excel_part: str) -> str:
     translated = EXCEL_FUNCTION_MAP.get(excel_part.upper())
     if translated is None:
         if excel_part.upper() in UNSUPPORTED_OR_VOLATILE_EXCEL_FUNCTIONS:
-            logger.warning(f"Unsupported or volatile Excel function encountered: {excel_part}. This will require runtime evaluation.")
+            warn(logger, "unsupported_function", "Unsupported or volatile Excel function encountered: %s. This will require runtime evaluation.", excel_part)
         else:
-            logger.warning(f"Unknown Excel formula part encountered: {excel_part}. Returning as is.")
+            warn(logger, "unknown_formula_part", "Unknown Excel formula part encountered: %s. Returning as is.", excel_part)
         return excel_part
     return translated
 
@@ -73,8 +75,8 @@ def tokenize_formula(formula: str) -> list[str]:
     # - Parentheses ()
 
     # Regex components:
-    # Cell references: (?:[A-Za-z_][A-Za-z0-9_]*!)?[A-Za-z]+\d+(?::[A-Za-z]+\d+)?(?:\$[A-Za-z]+\$\d+)?
-    # This matches optional sheet name, column letter(s), row number, optional range, optional absolute references.
+    # Cell references: (?:(?:[A-Za-z_][A-Za-z0-9_]*|'(?:[^']|'')+')!)?[A-Za-z]+\d+(?::[A-Za-z]+\d+)?(?:\$[A-Za-z]+\$\d+)?
+    # This matches optional sheet name (quoted if it isn't an identifier), column letter(s), row number, optional range, optional absolute references.
     # More robust cell reference regex might be needed for edge cases.
 
     # String literals: "(?:\\"|[^"])*" (matches "..." with escaped quotes)
@@ -85,7 +87,7 @@ def tokenize_formula(formula: str) -> list[str]:
     # Combining them into a single pattern
     token_pattern = re.compile(r"""
         ("(?:\\"|[^"])*")       |   # 1: String literals
-        ((?:[A-Za-z_][A-Za-z0-9_]*!)?[A-Za-z]+\d+(?::[A-Za-z]+\d+)?(?:\$[A-Za-z]+\$\d+)?) |   # 2: Cell references (A1, $B$2, Sheet1!C3, A1:B2)
+        ((?:(?:[A-Za-z_][A-Za-z0-9_]*|'(?:[^']|'')+')!)?[A-Za-z]+\d+(?::[A-Za-z]+\d+)?(?:\$[A-Za-z]+\$\d+)?) |   # 2: Cell references (A1, $B$2, Sheet1!C3, 'My Sheet'!C3, A1:B2)
         ([+\-*/=<>!&^])          |   # 3: Operators
         ([A-Za-z_][A-Za-z0-9_]*)  |   # 4: Function names or named ranges
         (\d+(?:\.\d+)?)         |   # 5: Numbers
@@ -103,6 +105,6 @@ def tokenize_formula(formula: str) -> list[str]:
             # This case should ideally not be reached if the regex covers all possibilities
             # but good for debugging unrecognized parts
             unmatched_text = formula[match.end()-len(match.group()):match.end()]
-            logger.warning(f"Unrecognized part in formula during tokenization: '{unmatched_text}'")
+            warn(logger, "unrecognized_formula_text", "Unrecognized part in formula during tokenization: '%s'", unmatched_text)
 
     return tokens 
\ No newline at end of file
@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+from . import settings
+from .sandbox import run_script_in_sandbox
+from .pipeline import DEFAULT_INGEST_ENGINE, convert_workbook
+from .conversion_pool import create_conversion_pool, ConversionPoolBusyError
+from .conversion_cache import create_conversion_cache, make_cache_key
+from .diagnostics import install_request_warnings_handler
+from .model_store import create_model_store
+from .job_store import JobProgress, create_job_store, STAGE_COMPLETED, STAGE_SKIPPED
+from .timings import StageTimings
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+async def _execute_script(script: str, timings: StageTimings | None = None) -> dict:
+    """
+    Runs a generated script in the sandbox and returns its output in the /convert/ response format.
+
+    If `timings` is given, a `sandbox` stage with the child's CPU time and max RSS is added to it.
+    """
+    execution_output = {"stdout": "", "stderr": "", "return_code": None}
+    usage = {}
+    started = time.perf_counter()
+    try:
+        stdout, stderr, returncode = await run_script_in_sandbox(script, usage=usage)
+        execution_output = {"stdout": stdout, "stderr": stderr, "return_code": returncode}
+    except subprocess.TimeoutExpired:
+        logger.error("Script execution timed out in sandbox.")
+        execution_output["stderr"] = "Script execution timed out."
+    except Exception as e:
+        logger.error(f"Error during sandbox execution: {e}", exc_info=True)
+        execution_output["stderr"] = f"Error during sandbox execution: {e}"
+    if timings is not None:
+        timings.add("sandbox", time.perf_counter() - started, usage.get("cpu_seconds"), max_rss_kb=usage.get("max_rss_kb"))
+    return execution_output
+
+class JobRunner:
+    """
+    Claims jobs from a JobStore and runs them through the conversion pipeline.
+
+    Runs inside each server process (unless disabled) and in standalone
+    `formulas-worker` processes. Conversions go through the same conversion
+    pool and cache as /convert/.
+    """
+    def __init__(self, store, conversion_pool, conversion_cache, model_store=None, worker_id: str | None = None, concurrency: int = 1, poll_interval: float = 0.5):
+        self.store = store
+        self.conversion_pool = conversion_pool
+        self.conversion_cache = conversion_cache
+        # Stores the compute modules of as_module jobs for /models/{id}/evaluate
+        self.model_store = model_store
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self._stop_event: asyncio.Event | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    async def _keep_lease(self, job_id: str):
+        """Renews the lease of a running job until cancelled."""
+        interval = max(1.0, self.store.lease_seconds / 3)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if not await asyncio.to_thread(self.store.renew_lease, job_id, self.worker_id):
+                    logger.warning(f"Worker {self.worker_id} lost the lease of job {job_id}.")
+                    return
+            except Exception as e:
+                logger.error(f"Could not renew lease of job {job_id}: {e}")
+
+    async def run_job(self, job: dict):
+        """Runs one claimed job to completion and records its result or error."""
+        job_id = job["id"]
+        options = job["options"]
+        lease_task = asyncio.create_task(self._keep_lease(job_id))
+        timings = StageTimings()
+        metrics.CONVERSIONS_IN_FLIGHT.inc(source="job")
+        try:
+            with open(job["input_path"], "rb") as f:
+                file_content = f.read()
+
+            cache_key = make_cache_key(file_content, {"force_evaluator": options.get("force_evaluator", False), "vectorize": options.get("vectorize", False), "as_module": options.get("as_module", False), "targets": options.get("targets"), "inputs": options.get("inputs"), "optimize": options.get("optimize", False), "engine": options.get("engine", DEFAULT_INGEST_ENGINE)})
+            conversion = await asyncio.to_thread(self.conversion_cache.get, cache_key)
+            cached = conversion is not None
+            metrics.CACHE_LOOKUPS.inc(result="hit" if cached else "miss")
+            if cached:
+                for stage in ("parse", "order", "naming", "codegen"):
+                    await asyncio.to_thread(self.store.set_stage_state, job_id, stage, STAGE_SKIPPED)
+            else:
+                progress = JobProgress(self.store.jobs_dir, job_id)
+                conversion = await self.conversion_pool.run(
+                    convert_workbook, file_content,
+                    options.get("force_evaluator", False), options.get("vectorize", False), progress,
+                    options.get("as_module", False), options.get("targets"), options.get("inputs"),
+                    options.get("optimize", False), options.get("engine", DEFAULT_INGEST_ENGINE)
+                )
+                # Timings describe this run, not the cached conversion
+                timings.update(conversion.pop("timings", {}))
+                # Job results are JSON and jobs write no script file, so the compiled model is dropped
+                conversion.pop("model_artifact", None)
+                await asyncio.to_thread(self.conversion_cache.put, cache_key, conversion)
+                await asyncio.to_thread(self.store.set_stage_state, job_id, "codegen", STAGE_COMPLETED)
+
+            result = {
+                "script": conversion["script"],
+                "warnings": conversion["warnings"],
+                "diagnostics": conversion.get("diagnostics", []),
+                "report": conversion["report"],
+                "cached": cached,
+                "model_id": None,
+            }
+            if options.get("as_module", False) and self.model_store is not None:
+                result["model_id"] = cache_key
+                await asyncio.to_thread(self.model_store.put, cache_key, conversion["script"])
+            if options.get("execute", True):
+                await asyncio.to_thread(self.store.start_stage, job_id, "sandbox")
+                result["execution_output"] = await _execute_script(conversion["script"], timings)
+            else:
+                await asyncio.to_thread(self.store.set_stage_state, job_id, "sandbox", STAGE_SKIPPED)
+            result["timings"] = timings.to_dict()
+            # A worker that lost the lease leaves the outcome to the one that reclaimed the job
+            if await asyncio.to_thread(self.store.complete_job, job_id, self.worker_id, result):
+                metrics.observe_conversion("job", cached, conversion["report"], result["timings"])
+        except ConversionPoolBusyError:
+            logger.warning(f"Conversion pool busy; returning job {job_id} to the queue.")
+            await asyncio.to_thread(self.store.release_job, job_id, self.worker_id)
+            await asyncio.sleep(self.poll_interval)
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}", exc_info=True)
+            metrics.CONVERSIONS.inc(source="job", outcome="failed")
+            await asyncio.to_thread(self.store.fail_job, job_id, self.worker_id, str(e))
+        finally:
+            lease_task.cancel()
+            metrics.CONVERSIONS_IN_FLIGHT.dec(source="job")
+
+    async def run_once(self) -> bool:
+        """Claims and runs one job. Returns False if there was nothing to run."""
+        job = await asyncio.to_thread(self.store.claim_next, self.worker_id)
+        if job is None:
+            return False
+        await self.run_job(job)
+        return True
+
+    async def _run_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                ran_job = await self.run_once()
+            except Exception as e:
+                logger.error(f"Job runner {self.worker_id} error: {e}", exc_info=True)
+                ran_job = False
+            if not ran_job:
+                try:
+                    await asyncio.wait_for(self._stop_event.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    def start(self):
+        """Starts `concurrency` runner loops on the current event loop."""
+        self._stop_event = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run_loop()) for _ in range(self.concurrency)]
+        logger.info(f"Job runner {self.worker_id} started with concurrency {self.concurrency}.")
+
+    async def stop(self):
+        """Stops claiming jobs and waits for the running ones to finish."""
+        if self._stop_event is None:
+            return
+        self._stop_event.set()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+def create_job_runner(store, conversion_pool, conversion_cache, model_store=None) -> JobRunner:
+    """Creates a JobRunner configured from `settings`."""
+    return JobRunner(
+        store, conversion_pool, conversion_cache, model_store,
+        concurrency=settings.JOBS_CONCURRENCY,
+        poll_interval=settings.JOBS_POLL_INTERVAL_MS / 1000,
+    )
+
+async def run_worker():
+    """Runs jobs until SIGINT/SIGTERM, without serving HTTP."""
+    metrics.enable_sharing()
+    conversion_pool = create_conversion_pool()
+    runner = create_job_runner(create_job_store(), conversion_pool, create_conversion_cache(), create_model_store())
+    stop_requested = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signal_number, stop_requested.set)
+        except NotImplementedError:
+            pass # Windows: Ctrl+C still raises KeyboardInterrupt
+    runner.start()
+    try:
+        await stop_requested.wait()
+    finally:
+        logger.info("Stopping job worker...")
+        await runner.stop()
+        conversion_pool.shutdown()
+        metrics.stop_sharing()
+
+def main_wrapper():
+    """Entry point for the formulas-worker console script."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    install_request_warnings_handler()
+    asyncio.run(run_worker())
+
+if __name__ == "__main__":
+    main_wrapper()
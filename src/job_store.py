@@ -0,0 +1,340 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+
+from . import settings
+
+logger = logging.getLogger(__name__)
+
+# Stages reported by GET /jobs/{id}, in the order they run
+JOB_STAGES = ("ingest", "parse", "order", "naming", "codegen", "sandbox")
+
+# Job statuses
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# Stage states
+STAGE_PENDING = "pending"
+STAGE_RUNNING = "running"
+STAGE_COMPLETED = "completed"
+STAGE_SKIPPED = "skipped"
+STAGE_FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    stage TEXT,
+    stages TEXT NOT NULL,
+    filename TEXT,
+    input_path TEXT,
+    options TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    claimed_by TEXT,
+    lease_expires_at REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+def _initial_stages() -> dict:
+    """Stage map of a job that has been received but not run yet."""
+    stages = {stage: STAGE_PENDING for stage in JOB_STAGES}
+    stages["ingest"] = STAGE_COMPLETED
+    return stages
+
+class JobStore:
+    """
+    Durable job queue backed by a SQLite database.
+
+    Every call opens its own short-lived connection, so one store can be used from
+    threads and from pool processes, and several server or worker processes sharing
+    the database file can claim jobs from the same queue. Claims are leases: a job
+    whose runner stops renewing it is handed to another runner, up to `max_attempts`
+    claims in total.
+    """
+    def __init__(self, jobs_dir: str, lease_seconds: int = 120, max_attempts: int = 3):
+        self.jobs_dir = jobs_dir
+        self.db_path = os.path.join(jobs_dir, "jobs.sqlite3")
+        self.upload_dir = os.path.join(jobs_dir, "uploads")
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    os.makedirs(self.upload_dir, exist_ok=True)
+                    connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+                    try:
+                        # WAL lets readers (GET /jobs/{id}) proceed while a runner writes
+                        connection.execute("PRAGMA journal_mode=WAL")
+                        connection.executescript(_SCHEMA)
+                    finally:
+                        connection.close()
+                    self._initialized = True
+        connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def _row_to_job(self, row: sqlite3.Row) -> dict:
+        return {
+            "id": row["id"],
+            "status": row["status"],
+            "stage": row["stage"],
+            "stages": json.loads(row["stages"]),
+            "filename": row["filename"],
+            "input_path": row["input_path"],
+            "options": json.loads(row["options"]),
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    def create_upload_dir(self):
+        """Creates the directory uploads are stored in while their jobs wait."""
+        os.makedirs(self.upload_dir, exist_ok=True)
+
+    def upload_path(self, job_id: str, filename: str) -> str:
+        """Returns where the upload of a job is stored until it has been converted."""
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(self.upload_dir, f"{job_id}{extension}")
+
+    def new_job_id(self) -> str:
+        """Returns a fresh, unguessable job id."""
+        return uuid.uuid4().hex
+
+    def create_job(self, job_id: str, filename: str, input_path: str, options: dict) -> dict:
+        """
+        Queues a job whose upload has already been stored at `input_path`.
+
+        The ingest stage is complete at this point, since the upload was received and
+        validated by the request that created the job.
+        """
+        now = time.time()
+        stages = _initial_stages()
+        with closing(self._connect()) as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, status, stage, stages, filename, input_path, options, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, "ingest", json.dumps(stages), filename, input_path, json.dumps(options), now, now),
+            )
+        logger.info(f"Queued job {job_id} for {filename}")
+        return self.get_job(job_id)
+
+    def get_job(self, job_id: str) -> dict | None:
+        """Returns a job, or None if there is no job with this id."""
+        connection = self._connect()
+        try:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            connection.close()
+        return self._row_to_job(row) if row is not None else None
+
+    def count_by_status(self) -> dict[str, int]:
+        """Returns the number of jobs in each status, including statuses with no jobs."""
+        counts = {status: 0 for status in (QUEUED, RUNNING, SUCCEEDED, FAILED)}
+        connection = self._connect()
+        try:
+            for row in connection.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status"):
+                counts[row["status"]] = row["count"]
+        finally:
+            connection.close()
+        return counts
+
+    def claim_next(self, worker_id: str) -> dict | None:
+        """
+        Claims the oldest queued job, or a running job whose lease has expired.
+
+        Returns:
+            dict | None: The claimed job, or None if there is nothing to run.
+        """
+        now = time.time()
+        connection = self._connect()
+        try:
+            # BEGIN IMMEDIATE takes the write lock up front, so two runners can't claim the same job
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    row = connection.execute(
+                        "SELECT * FROM jobs WHERE status = ? OR (status = ? AND lease_expires_at < ?) "
+                        "ORDER BY created_at LIMIT 1",
+                        (QUEUED, RUNNING, now),
+                    ).fetchone()
+                    if row is None:
+                        connection.execute("COMMIT")
+                        return None
+                    if row["attempts"] >= self.max_attempts:
+                        # Its runners keep dying on it; give up instead of crashing the next one
+                        logger.error(f"Job {row['id']} abandoned after {row['attempts']} attempts.")
+                        connection.execute(
+                            "UPDATE jobs SET status = ?, error = ?, claimed_by = NULL, lease_expires_at = NULL, updated_at = ? WHERE id = ?",
+                            (FAILED, f"Job abandoned after {row['attempts']} attempts.", now, row["id"]),
+                        )
+                        continue
+                    if row["status"] == RUNNING:
+                        logger.warning(f"Lease of job {row['id']} held by {row['claimed_by']} expired. Reclaiming it.")
+                    # Stages start over, in case an earlier attempt got part of the way
+                    connection.execute(
+                        "UPDATE jobs SET status = ?, stage = ?, stages = ?, attempts = attempts + 1, claimed_by = ?, lease_expires_at = ?, updated_at = ? WHERE id = ?",
+                        (RUNNING, "ingest", json.dumps(_initial_stages()), worker_id, now + self.lease_seconds, now, row["id"]),
+                    )
+                    connection.execute("COMMIT")
+                    break
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        finally:
+            connection.close()
+        logger.info(f"Worker {worker_id} claimed job {row['id']}")
+        return self.get_job(row["id"])
+
+    def renew_lease(self, job_id: str, worker_id: str) -> bool:
+        """Extends the lease of a running job. Returns False if the job is no longer held by `worker_id`."""
+        now = time.time()
+        with closing(self._connect()) as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND status = ? AND claimed_by = ?",
+                (now + self.lease_seconds, job_id, RUNNING, worker_id),
+            )
+            return cursor.rowcount == 1
+
+    def release_job(self, job_id: str, worker_id: str):
+        """Puts a claimed job back in the queue without counting the attempt."""
+        with closing(self._connect()) as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), claimed_by = NULL, lease_expires_at = NULL, updated_at = ? "
+                "WHERE id = ? AND status = ? AND claimed_by = ?",
+                (QUEUED, time.time(), job_id, RUNNING, worker_id),
+            )
+
+    def _update_stages(self, job_id: str, update):
+        """Applies `update(stages) -> current stage` to the stage map of a job inside a write transaction."""
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute("SELECT stages FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                if row is None:
+                    connection.execute("COMMIT")
+                    return
+                stages = json.loads(row["stages"])
+                current_stage = update(stages)
+                connection.execute(
+                    "UPDATE jobs SET stages = ?, stage = ?, updated_at = ? WHERE id = ?",
+                    (json.dumps(stages), current_stage, time.time(), job_id),
+                )
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        finally:
+            connection.close()
+
+    def start_stage(self, job_id: str, stage: str):
+        """Marks `stage` as running and any previously running stage as completed."""
+        def update(stages):
+            for name, state in stages.items():
+                if state == STAGE_RUNNING:
+                    stages[name] = STAGE_COMPLETED
+            stages[stage] = STAGE_RUNNING
+            return stage
+        self._update_stages(job_id, update)
+
+    def set_stage_state(self, job_id: str, stage: str, state: str):
+        """Sets the state of one stage, e.g. to mark it skipped or completed."""
+        def update(stages):
+            stages[stage] = state
+            return stage
+        self._update_stages(job_id, update)
+
+    def _finish(self, job_id: str, worker_id: str, status: str, result: dict | None, error: str | None, stage_state: str) -> bool:
+        """
+        Gives a job its final status, unless its lease has passed to another worker.
+
+        Returns:
+            bool: False, with the job left as is, if the job is no longer held by `worker_id`.
+        """
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute("SELECT input_path, stages FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                if row is None:
+                    connection.execute("COMMIT")
+                    return False
+                stages = json.loads(row["stages"])
+                for name, state in stages.items():
+                    if state == STAGE_RUNNING:
+                        stages[name] = stage_state
+                cursor = connection.execute(
+                    "UPDATE jobs SET status = ?, result = ?, error = ?, stages = ?, stage = NULL, claimed_by = NULL, lease_expires_at = NULL, updated_at = ? "
+                    "WHERE id = ? AND status = ? AND claimed_by = ?",
+                    (status, json.dumps(result) if result is not None else None, error, json.dumps(stages), time.time(), job_id, RUNNING, worker_id),
+                )
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        finally:
+            connection.close()
+        if cursor.rowcount != 1:
+            logger.warning(f"Worker {worker_id} lost the lease of job {job_id}; its outcome was not recorded.")
+            return False
+        # The upload is only needed until the job has a final status
+        if row["input_path"] and os.path.exists(row["input_path"]):
+            try:
+                os.remove(row["input_path"])
+            except OSError as e:
+                logger.error(f"Could not remove upload of job {job_id}: {e}")
+        return True
+
+    def complete_job(self, job_id: str, worker_id: str, result: dict) -> bool:
+        """Stores the result of a job and marks it succeeded. Returns False if `worker_id` lost its lease."""
+        if not self._finish(job_id, worker_id, SUCCEEDED, result, None, STAGE_COMPLETED):
+            return False
+        logger.info(f"Job {job_id} succeeded")
+        return True
+
+    def fail_job(self, job_id: str, worker_id: str, error: str) -> bool:
+        """Marks a job failed, along with the stage it failed in. Returns False if `worker_id` lost its lease."""
+        if not self._finish(job_id, worker_id, FAILED, None, error, STAGE_FAILED):
+            return False
+        logger.warning(f"Job {job_id} failed: {error}")
+        return True
+
+class JobProgress:
+    """
+    Picklable stage callback for the conversion pipeline.
+
+    Pool processes can't share the server's objects, so this carries the database
+    location and job id and records each stage through its own `JobStore`.
+    """
+    def __init__(self, jobs_dir: str, job_id: str):
+        self.jobs_dir = jobs_dir
+        self.job_id = job_id
+
+    def __call__(self, stage: str):
+        JobStore(self.jobs_dir).start_stage(self.job_id, stage)
+
+def create_job_store() -> JobStore:
+    """Creates a JobStore configured from `settings`."""
+    return JobStore(
+        jobs_dir=settings.JOBS_DIR,
+        lease_seconds=settings.JOBS_LEASE_SECONDS,
+        max_attempts=settings.JOBS_MAX_ATTEMPTS,
+    )
@@ -1,25 +1,29 @@
 import logging
 import os
-from fastapi import FastAPI, UploadFile, HTTPException, Form
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, HTTPException, Form, Request, params
 from fastapi.responses import PlainTextResponse, JSONResponse
-from xlcalculator.model import ModelCompiler
-from xlcalculator.evaluator import Evaluator
-from io import BytesIO
-from contextvars import ContextVar
-import tempfile
+import asyncio
+import json
+import shutil
 import subprocess
-from .sandbox import execute_script_in_sandbox # Import the sandbox function
+import time
+from .sandbox import run_script_in_sandbox, shutdown_sandbox_pool # Import the sandbox function
 
-from .file_handler import handle_file_upload, FileValidationError
-from .dependency_extractor import generate_static_python_code, get_python_variable_name
-
-# Context variable to hold warnings for the current request
-request_warnings: ContextVar[list[str]] = ContextVar('request_warnings', default=[])
-
-class RequestWarningsHandler(logging.Handler):
-    def emit(self, record):
-        if record.levelno >= logging.WARNING:
-            request_warnings.get().append(self.format(record))
+from . import settings
+from .file_handler import handle_file_upload, receive_upload, FileValidationError
+from .diagnostics import Diagnostics, request_diagnostics, RequestWarningsHandler
+from .pipeline import IngestEngineError, build_model_artifact, convert_workbook, ingest_engine_for, parse_engine
+from .model_artifact import write_model_artifact
+from .conversion_pool import create_conversion_pool, ConversionPoolBusyError
+from .conversion_cache import create_conversion_cache, make_cache_key
+from .job_store import create_job_store
+from .job_runner import create_job_runner
+from .model_store import create_model_store
+from .model_evaluation import ModelEvaluationError, parse_input_rows
+from .pruning import TargetSelectionError, parse_targets
+from .timings import StageTimings, server_timing_header
+from . import metrics
 
 # Configure logging
 logging.basicConfig(
@@ -32,12 +36,61 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# Parse/analyze/codegen runs in this pool so large workbooks don't block the event loop
+conversion_pool = create_conversion_pool()
+# Results are cached by upload content + options so re-uploads skip the pipeline entirely
+conversion_cache = create_conversion_cache()
+# Queue of asynchronous conversions, shared with other server and worker processes through JOBS_DIR
+job_store = create_job_store()
+# Compute modules of as_module conversions, evaluated over many rows by /models/{id}/evaluate
+model_store = create_model_store()
+job_runner = create_job_runner(job_store, conversion_pool, conversion_cache, model_store)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Lets /metrics in any worker process report the metrics of all of them
+    metrics.enable_sharing()
+    if settings.JOBS_RUN_IN_SERVER:
+        job_runner.start()
+    yield
+    await job_runner.stop()
+    conversion_pool.shutdown()
+    shutdown_sandbox_pool()
+    metrics.stop_sharing()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.get("/health")
+async def health_check():
+    """Liveness probe. Answered directly by the event loop, even while conversions are running."""
+    return {"status": "ok", "pending_conversions": conversion_pool.pending}
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Hit/miss/eviction counters of this process's conversion cache."""
+    return conversion_cache.get_stats()
+
+def _render_metrics() -> str:
+    job_counts = job_store.count_by_status()
+    return metrics.REGISTRY.render([(metrics.JOBS, {"status": status}, count) for status, count in job_counts.items()])
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Metrics of all server and worker processes in the Prometheus text format.
+
+    Includes per-stage latency histograms, counters of conversions, cache lookups,
+    fallback cells, sandbox runs and timeouts, validation rejections and model
+    evaluations and their rows, and gauges of the conversions and sandbox runs in
+    flight and of the jobs in the queue.
+    """
+    return PlainTextResponse(await asyncio.to_thread(_render_metrics), media_type="text/plain; version=0.0.4")
 
 @app.post("/convert/")
-async def convert_excel_to_python(file: UploadFile, output_filename: str | None = Form(None), force_evaluator: bool = Form(False)):
-    # Reset warnings for the new request
-    request_warnings.set([])
+async def convert_excel_to_python(file: UploadFile, output_filename: str | None = Form(None), force_evaluator: bool = Form(False), vectorize: bool = Form(False), as_module: bool = Form(False), targets: str | None = Form(None), inputs: str | None = Form(None), optimize: bool = Form(False), engine: str | None = Form(None), execute: bool = Form(True)):
+    # Collect the warnings of this request only
+    diagnostics = Diagnostics()
+    request_diagnostics.set(diagnostics)
     """
     Converts an Excel or CSV/TSV file containing formulas into a Python script.
 
@@ -48,14 +101,52 @@ async def convert_excel_to_python(file: UploadFile, output_filename: str | None
     Args:
         file (UploadFile): The input file (Excel or CSV/TSV) to be converted.
                            Expected file types: .xlsx, .csv, .tsv.
-                           Maximum file size: 10MB.
+                           Maximum file size: `FORMULAS_UPLOAD_MAX_BYTES` (10MB by default).
+                           The whole upload is read into memory, since the
+                           conversion pool gets its bytes; /jobs keeps uploads
+                           on disk instead.
         output_filename (str | None, optional): If provided, the generated Python script
-                                         will be saved to this filename. Otherwise,
-                                         the script content will be returned directly
-                                         in the response.
+                                         will be saved to this filename, with the
+                                         compiled model of its runtime-evaluated cells
+                                         (if any) next to it. Otherwise, the script
+                                         content will be returned directly in the response.
         force_evaluator (bool, optional): If True, forces all formulas to be evaluated
                                           at runtime using `xlcalculator.Evaluator`,
                                           bypassing static translation. Defaults to False.
+        vectorize (bool, optional): If True, columns filled down with the same formula
+                                    are computed with one NumPy array expression per
+                                    run instead of one assignment per cell. Defaults to False.
+        as_module (bool, optional): If True, the script is an importable module exposing
+                                    `compute(inputs: dict) -> dict`, with inputs defaulting
+                                    to their workbook values. Run as a script, it prints
+                                    the outputs for the defaults. The response's `model_id`
+                                    can then be passed to /models/{model_id}/evaluate.
+                                    Defaults to False.
+        targets (str | None, optional): Comma-separated cells or ranges (e.g.
+                                        `Summary!B2,Summary!D2:D10`). If provided, only
+                                        these cells and the cells they depend on are
+                                        converted, and a module's `compute` returns just
+                                        these cells. Defaults to None (every cell).
+        inputs (str | None, optional): Comma-separated cells or ranges that are the
+                                       inputs of the workbook. Every other value cell
+                                       is then a constant, and formulas that depend on
+                                       no input are precomputed at conversion time and
+                                       emitted as literals; a module's `INPUTS` holds
+                                       just these cells. Defaults to None (every value
+                                       cell is an input and nothing is precomputed).
+        optimize (bool, optional): If True, translated formulas are optimized: IF, AND,
+                                   OR and NOT become native conditionals, constant
+                                   subexpressions are folded and subexpressions
+                                   shared by several formulas are computed once.
+                                   Defaults to False.
+        engine (str | None, optional): How the workbook is read: `xlcalculator` (the
+                                       default) loads every cell; `streaming` reads
+                                       only the formulas and the constants they
+                                       reference straight from the .xlsx, in bounded
+                                       memory, for very large workbooks. CSV and
+                                       TSV files are always streamed row by row.
+        execute (bool, optional): If False, the generated script is returned without
+                                  running it in the sandbox. Defaults to True.
 
     Returns:
         JSONResponse:
@@ -63,114 +154,327 @@ async def convert_excel_to_python(file: UploadFile, output_filename: str | None
               indicating where the file was saved and any warnings.
             - If `output_filename` is not provided, returns the generated Python
               script as JSON with warnings.
+            Both include a `report` with codegen statistics, such as the
+            `circular_references` (cyclic cell groups) found in the workbook, and
+            `timings` with the wall and CPU milliseconds of every stage (ingest,
+            cache, queue, parse, order, naming, codegen, sandbox, total). The same
+            timings are sent in a `Server-Timing` header.
 
     Raises:
         HTTPException:
-            - 400 Bad Request: If the file name is missing, or there's an error
-                               during file parsing with xlcalculator.
+            - 400 Bad Request: If the file name is missing, there's an error
+                               during file parsing, a target or input is
+                               malformed or not a cell of the workbook, or the
+                               ingest engine is unknown.
             - 413 Payload Too Large: If the file size exceeds the allowed limit.
-            - 415 Unsupported Media Type: If the file extension is not allowed.
+            - 415 Unsupported Media Type: If the file extension is not allowed, or an
+                                          .xlsx upload is not a ZIP archive.
+            - 503 Service Unavailable: If the conversion queue of this worker is full.
             - 500 Internal Server Error: For any unexpected server-side errors.
     """
+    output_filename, force_evaluator, vectorize, as_module, targets, inputs, optimize, engine, execute = (
+        _form_default(value) for value in (output_filename, force_evaluator, vectorize, as_module, targets, inputs, optimize, engine, execute)
+    )
+    started = time.perf_counter()
+    # Stages timed here run on the event loop, whose CPU time is shared with other
+    # requests, so only their wall time is reported
+    timings = StageTimings()
+    metrics.CONVERSIONS_IN_FLIGHT.inc(source="api")
     try:
+        # Malformed targets, inputs and engines are rejected before the upload is read
+        target_list = parse_targets(targets)
+        input_list = parse_targets(inputs)
+        engine = parse_engine(engine)
+        stage_started = time.perf_counter()
         file_content = await handle_file_upload(file)
+        timings.add("ingest", time.perf_counter() - stage_started)
+        engine = ingest_engine_for(file.filename, engine)
 
-        # Determine file type and load accordingly
-        file_extension = file.filename.split(".")[-1].lower() if file.filename else ""
-        
-        # xlcalculator uses ModelCompiler to parse the archive (Excel file)
-        # For CSV/TSV, xlcalculator can also handle it, but typically Excel files are more complex.
-        # Assuming here that handle_file_upload returns content suitable for BytesIO
-        try:
-            model = ModelCompiler().read_and_parse_archive(BytesIO(file_content))
-            evaluator = Evaluator(model)
-        except Exception as e:
-            logger.error(f"Error parsing or reading Excel file: {e}", exc_info=True)
-            raise HTTPException(status_code=400, detail=f"Error parsing or reading Excel file: {e}")
-
-        # Generate Python code, which now includes fallback logic
-        generated_code = generate_static_python_code(model)
-
-        # Assemble the final script
-        final_script_lines = [
-            "from xlcalculator.model import Model",
-            "from xlcalculator.evaluator import Evaluator",
-            "from io import BytesIO",
-            "import re", # May be needed for regex in generated code
-            "",
-            "# --- Start of Generated Excel to Python Conversion ---",
-            "",
-            "# Initialize the model and evaluator (placeholder - in a real app, these would be loaded from file or passed)",
-            "# For simplicity, we are not re-parsing the file here, assuming `model` is available if this code runs independently.",
-            "# If this script is meant to be run standalone, you would need to add file loading here.",
-            "",
-            "# Example: If running standalone, you would load your Excel file like this:",
-            "# from xlcalculator.model import ModelCompiler",
-            "# from io import BytesIO",
-            "# with open(\"your_excel_file.xlsx\", \"rb\") as f:",
-            "#     model_compiler = ModelCompiler()",
-            "#     model = model_compiler.read_and_parse_archive(BytesIO(f.read()))",
-            "# evaluator = Evaluator(model)",
-            "",
-            generated_code,
-            "",
-            "# --- End of Generated Excel to Python Conversion ---",
-            ""
-        ]
-        final_script = "\n".join(final_script_lines)
+        # Identical uploads with identical options produce identical scripts
+        stage_started = time.perf_counter()
+        cache_key = make_cache_key(file_content, {"force_evaluator": force_evaluator, "vectorize": vectorize, "as_module": as_module, "targets": target_list, "inputs": input_list, "optimize": optimize, "engine": engine})
+        conversion = await asyncio.to_thread(conversion_cache.get, cache_key)
+        timings.add("cache", time.perf_counter() - stage_started)
+        cached = conversion is not None
+        metrics.CACHE_LOOKUPS.inc(result="hit" if cached else "miss")
+        if cached:
+            logger.info(f"Conversion cache hit for {file.filename} ({cache_key[:12]})")
+        else:
+            # Parsing and code generation are CPU-bound; run them in the conversion pool
+            stage_started = time.perf_counter()
+            conversion = await conversion_pool.run(convert_workbook, file_content, force_evaluator, vectorize, None, as_module, target_list, input_list, optimize, engine)
+            # Timings describe this request, so they aren't cached with the conversion
+            conversion_timings = StageTimings()
+            conversion_timings.update(conversion.pop("timings", {}))
+            # Whatever the pipeline didn't spend in its stages was spent waiting for a worker
+            timings.add("queue", max(0.0, time.perf_counter() - stage_started - conversion_timings.wall_seconds()))
+            timings.update(conversion_timings.to_dict())
+            # The compiled model is only kept to be written with the script; the cache stores JSON
+            model_artifact = conversion.pop("model_artifact", None)
+            await asyncio.to_thread(conversion_cache.put, cache_key, conversion)
+        diagnostics.merge(conversion.get("diagnostics", []))
+        final_script = conversion["script"]
+        model_id = None
+        if as_module:
+            # The cache key identifies the model, so it can be evaluated over many rows later
+            model_id = cache_key
+            await asyncio.to_thread(model_store.put, model_id, final_script)
 
         if output_filename:
             # Save to file
             with open(output_filename, "w") as f:
                 f.write(final_script)
+            if conversion["report"].get("fallback_cells"):
+                if cached:
+                    model_artifact = await conversion_pool.run(build_model_artifact, file_content, engine)
+                # Runtime-evaluated cells read the compiled model next to the script
+                await asyncio.to_thread(write_model_artifact, model_artifact, output_filename)
             logger.info(f"Successfully converted and saved to {output_filename}")
-            return JSONResponse({"message": f"Successfully converted and saved to {output_filename}", "warnings": request_warnings.get(), "log_url": "/logs/"})
+            timings.add("total", time.perf_counter() - started)
+            metrics.observe_conversion("api", cached, conversion["report"], timings.to_dict())
+            return JSONResponse(
+                {"message": f"Successfully converted and saved to {output_filename}", "warnings": diagnostics.warnings(), "diagnostics": diagnostics.to_list(), "report": conversion["report"], "cached": cached, "model_id": model_id, "timings": timings.to_dict(), "log_url": "/logs/"},
+                headers={"Server-Timing": server_timing_header(timings.to_dict())}
+            )
         else:
-            logger.info("Successfully converted Excel to Python script. Attempting to execute in sandbox.")
             # Execute the generated script in a sandbox if no output_filename is provided
-            temp_script_path = None
-            execution_stdout = ""
-            execution_stderr = ""
-            execution_returncode = None
-            try:
-                with tempfile.NamedTemporaryFile(mode='w+', delete=False, suffix='.py') as temp_script_file:
-                    temp_script_file.write(final_script)
-                    temp_script_path = temp_script_file.name
-                
-                # Execute the script in sandbox
-                stdout, stderr, returncode = execute_script_in_sandbox(temp_script_path)
-                execution_stdout = stdout
-                execution_stderr = stderr
-                execution_returncode = returncode
-                logger.info(f"Sandbox execution completed with return code: {returncode}")
-
-            except subprocess.TimeoutExpired:
-                logger.error("Script execution timed out in sandbox.")
-                execution_stderr = f"Script execution timed out."
-            except Exception as e:
-                logger.error(f"Error during sandbox execution: {e}", exc_info=True)
-                execution_stderr = f"Error during sandbox execution: {e}"
-            finally:
-                if temp_script_path and os.path.exists(temp_script_path):
-                    os.remove(temp_script_path)
-
-            return JSONResponse({
+            execution_output = None
+            if execute:
+                logger.info("Successfully converted Excel to Python script. Attempting to execute in sandbox.")
+                execution_output = {"stdout": "", "stderr": "", "return_code": None}
+                usage = {}
+                stage_started = time.perf_counter()
+                try:
+                    # Awaited so the event loop keeps serving other requests while the script runs
+                    stdout, stderr, returncode = await run_script_in_sandbox(final_script, usage=usage)
+                    execution_output = {"stdout": stdout, "stderr": stderr, "return_code": returncode}
+                    logger.info(f"Sandbox execution completed with return code: {returncode}")
+
+                except subprocess.TimeoutExpired:
+                    logger.error("Script execution timed out in sandbox.")
+                    execution_output["stderr"] = f"Script execution timed out."
+                except Exception as e:
+                    logger.error(f"Error during sandbox execution: {e}", exc_info=True)
+                    execution_output["stderr"] = f"Error during sandbox execution: {e}"
+                # CPU time and max RSS are those of the sandboxed child
+                timings.add("sandbox", time.perf_counter() - stage_started, usage.get("cpu_seconds"), max_rss_kb=usage.get("max_rss_kb"))
+
+            timings.add("total", time.perf_counter() - started)
+            metrics.observe_conversion("api", cached, conversion["report"], timings.to_dict())
+            response = {
                 "script": final_script,
-                "warnings": request_warnings.get(),
-                "execution_output": {
-                    "stdout": execution_stdout,
-                    "stderr": execution_stderr,
-                    "return_code": execution_returncode
-                },
+                "warnings": diagnostics.warnings(),
+                "diagnostics": diagnostics.to_list(),
+                "report": conversion["report"],
+                "cached": cached,
+                "model_id": model_id,
+                "timings": timings.to_dict(),
                 "log_url": "/logs/"
-            })
+            }
+            if execution_output is not None:
+                response["execution_output"] = execution_output
+            return JSONResponse(response, headers={"Server-Timing": server_timing_header(timings.to_dict())})
 
     except FileValidationError as e:
         logger.warning(f"File validation error: {e.message}", exc_info=True)
-        return JSONResponse({"detail": e.message, "warnings": request_warnings.get(), "log_url": "/logs/"}, status_code=e.status_code)
+        metrics.VALIDATION_REJECTIONS.inc(status=e.status_code)
+        return JSONResponse({"detail": e.message, "warnings": diagnostics.warnings(), "log_url": "/logs/"}, status_code=e.status_code)
+    except TargetSelectionError as e:
+        logger.warning(f"Target selection error: {e.message}")
+        metrics.CONVERSIONS.inc(source="api", outcome="failed")
+        return JSONResponse({"detail": e.message, "warnings": diagnostics.warnings(), "log_url": "/logs/"}, status_code=e.status_code)
+    except IngestEngineError as e:
+        logger.warning(f"Ingest engine error: {e.message}")
+        metrics.CONVERSIONS.inc(source="api", outcome="failed")
+        return JSONResponse({"detail": e.message, "warnings": diagnostics.warnings(), "log_url": "/logs/"}, status_code=e.status_code)
+    except ConversionPoolBusyError as e:
+        logger.warning(f"Rejecting conversion: {e.message}")
+        metrics.CONVERSIONS.inc(source="api", outcome="rejected")
+        return JSONResponse({"detail": e.message, "warnings": diagnostics.warnings(), "log_url": "/logs/"}, status_code=503, headers={"Retry-After": "5"})
     except Exception as e:
         logger.error(f"An unexpected server error occurred: {e}", exc_info=True)
-        return JSONResponse({"detail": f"An unexpected server error occurred: {e}", "warnings": request_warnings.get(), "log_url": "/logs/"}, status_code=500)
+        metrics.CONVERSIONS.inc(source="api", outcome="failed")
+        return JSONResponse({"detail": f"An unexpected server error occurred: {e}", "warnings": diagnostics.warnings(), "log_url": "/logs/"}, status_code=500)
+    finally:
+        metrics.CONVERSIONS_IN_FLIGHT.dec(source="api")
+
+def _form_default(value):
+    """
+    Returns the default of a `Form(...)` parameter the caller left out.
+
+    FastAPI resolves the defaults of form fields when it serves a request; when an
+    endpoint is awaited directly (as the integration tests do), parameters left out
+    are still the `Form(...)` markers, which are truthy and not strings.
+    """
+    return value.default if isinstance(value, params.Form) else value
+
+def _store_job_upload(spool, path: str):
+    """Copies a received upload to the job upload directory, atomically."""
+    temp_path = f"{path}.part"
+    with open(temp_path, "wb") as f:
+        shutil.copyfileobj(spool, f)
+    os.replace(temp_path, path)
+
+@app.post("/jobs", status_code=202)
+async def create_conversion_job(file: UploadFile, force_evaluator: bool = Form(False), vectorize: bool = Form(False), as_module: bool = Form(False), targets: str | None = Form(None), inputs: str | None = Form(None), optimize: bool = Form(False), engine: str | None = Form(None), execute: bool = Form(True)):
+    """
+    Queues a conversion and returns its job id immediately.
+
+    Use this instead of /convert/ for workbooks that take longer to convert than a
+    client or load balancer is willing to wait. The upload is validated and stored
+    under `FORMULAS_JOBS_DIR` without being read into memory as a whole; any server
+    or `formulas-worker` process sharing that directory may run it, and queued jobs
+    survive restarts.
+
+    Args:
+        file (UploadFile): The input file (Excel or CSV/TSV) to be converted.
+        force_evaluator (bool, optional): Same as for /convert/.
+        vectorize (bool, optional): Same as for /convert/.
+        as_module (bool, optional): Same as for /convert/.
+        targets (str | None, optional): Same as for /convert/.
+        inputs (str | None, optional): Same as for /convert/.
+        optimize (bool, optional): Same as for /convert/.
+        engine (str | None, optional): Same as for /convert/.
+        execute (bool, optional): If True (the default), the generated script is run in
+                                  the sandbox and its output is part of the result.
+
+    Returns:
+        JSONResponse: 202 with `job_id`, `status` and the `status_url` to poll.
+    """
+    force_evaluator, vectorize, as_module, targets, inputs, optimize, engine, execute = (
+        _form_default(value) for value in (force_evaluator, vectorize, as_module, targets, inputs, optimize, engine, execute)
+    )
+    diagnostics = Diagnostics()
+    request_diagnostics.set(diagnostics)
+    try:
+        target_list = parse_targets(targets)
+        input_list = parse_targets(inputs)
+        engine = parse_engine(engine)
+        job_id = job_store.new_job_id()
+        spool = await receive_upload(file)
+        with spool:
+            input_path = job_store.upload_path(job_id, file.filename)
+            await asyncio.to_thread(job_store.create_upload_dir)
+            await asyncio.to_thread(_store_job_upload, spool, input_path)
+        options = {"force_evaluator": force_evaluator, "vectorize": vectorize, "as_module": as_module, "targets": target_list, "inputs": input_list, "optimize": optimize, "engine": ingest_engine_for(file.filename, engine), "execute": execute}
+        job = await asyncio.to_thread(job_store.create_job, job_id, file.filename, input_path, options)
+        return JSONResponse({"job_id": job_id, "status": job["status"], "status_url": f"/jobs/{job_id}", "warnings": diagnostics.warnings()}, status_code=202)
+    except FileValidationError as e:
+        logger.warning(f"File validation error: {e.message}")
+        metrics.VALIDATION_REJECTIONS.inc(status=e.status_code)
+        return JSONResponse({"detail": e.message, "warnings": diagnostics.warnings(), "log_url": "/logs/"}, status_code=e.status_code)
+    except TargetSelectionError as e:
+        logger.warning(f"Target selection error: {e.message}")
+        return JSONResponse({"detail": e.message, "warnings": diagnostics.warnings(), "log_url": "/logs/"}, status_code=e.status_code)
+    except IngestEngineError as e:
+        logger.warning(f"Ingest engine error: {e.message}")
+        return JSONResponse({"detail": e.message, "warnings": diagnostics.warnings(), "log_url": "/logs/"}, status_code=e.status_code)
+    except Exception as e:
+        logger.error(f"Could not queue conversion job: {e}", exc_info=True)
+        return JSONResponse({"detail": f"An unexpected server error occurred: {e}", "warnings": diagnostics.warnings(), "log_url": "/logs/"}, status_code=500)
+
+@app.get("/jobs/{job_id}")
+async def get_conversion_job(job_id: str):
+    """
+    Reports the status of a job: `queued`, `running`, `succeeded` or `failed`, the
+    current `stage` and the state of every stage (ingest, parse, order, naming,
+    codegen, sandbox). Succeeded jobs include the `result` in the /convert/ response format;
+    failed jobs include the `error`.
+    """
+    job = await asyncio.to_thread(job_store.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    job.pop("input_path", None)
+    return job
+
+async def _read_request_body(request: Request, max_bytes: int) -> bytes:
+    """Reads a raw request body, rejecting it as soon as it passes `max_bytes`."""
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if max_bytes > 0 and size > max_bytes:
+            raise ModelEvaluationError(f"Request body exceeds the limit of {max_bytes} bytes.", status_code=413)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+@app.post("/models/{model_id}/evaluate")
+async def evaluate_model(model_id: str, request: Request):
+    """
+    Evaluates a converted model over many rows of inputs at once.
+
+    The model is the compute module of a conversion with `as_module`, identified by
+    the `model_id` of that conversion. Every input cell becomes a NumPy column and
+    every formula is computed once for all rows; formulas that don't broadcast over
+    columns (e.g. IF or MAX) are computed row by row for those cells only. The
+    evaluation runs in the sandbox.
+
+    Args:
+        model_id (str): The `model_id` returned by /convert/ or a job with `as_module`.
+        request (Request): The input rows, as a JSON list of objects (or `{"rows": [...]}`)
+                           mapping input cell addresses to values, or as CSV
+                           (`Content-Type: text/csv`) or TSV (`text/tab-separated-values`)
+                           whose header row holds the addresses. Inputs a row leaves
+                           out keep their workbook values.
+
+    Returns:
+        JSONResponse: `columns` with the values of every output cell, one per row
+        (numbers are returned as floats, and errors and non-finite results as null),
+        `row_evaluated_cells` that were computed row by row, the first per-row
+        `errors` with their `error_count`, and `timings` (ingest, sandbox, total).
+
+    Raises:
+        HTTPException:
+            - 400 Bad Request: If the rows can't be parsed or set cells that aren't inputs.
+            - 404 Not Found: If there is no such model.
+            - 409 Conflict: If the model was converted without `as_module`.
+            - 413 Payload Too Large: If the body or the number of rows exceeds its limit.
+            - 415 Unsupported Media Type: If the body is not JSON, CSV or TSV.
+            - 422 Unprocessable Entity: If the model has cells evaluated by xlcalculator at runtime.
+            - 504 Gateway Timeout: If the evaluation runs past the sandbox timeout.
+    """
+    started = time.perf_counter()
+    timings = StageTimings()
+    try:
+        model = await asyncio.to_thread(model_store.get, model_id)
+        if model is None:
+            return JSONResponse({"detail": "Model not found. Convert the workbook with as_module to get a model_id."}, status_code=404)
+
+        stage_started = time.perf_counter()
+        body = await _read_request_body(request, settings.UPLOAD_MAX_BYTES)
+        rows = await asyncio.to_thread(parse_input_rows, body, request.headers.get("content-type"), settings.EVALUATE_MAX_ROWS)
+        script = await asyncio.to_thread(model.build_script, rows)
+        timings.add("ingest", time.perf_counter() - stage_started)
+
+        usage = {}
+        stage_started = time.perf_counter()
+        stdout, _, _ = await run_script_in_sandbox(script, usage=usage)
+        timings.add("sandbox", time.perf_counter() - stage_started, usage.get("cpu_seconds"), max_rss_kb=usage.get("max_rss_kb"))
+        result = json.loads(stdout)
+        timings.add("total", time.perf_counter() - started)
+
+        metrics.EVALUATIONS.inc(outcome="succeeded")
+        metrics.EVALUATED_ROWS.inc(len(rows))
+        return JSONResponse(
+            {"model_id": model_id, "row_count": len(rows), **result, "timings": timings.to_dict()},
+            headers={"Server-Timing": server_timing_header(timings.to_dict())}
+        )
+    except ModelEvaluationError as e:
+        logger.warning(f"Rejecting evaluation of model {model_id}: {e.message}")
+        metrics.EVALUATIONS.inc(outcome="rejected")
+        return JSONResponse({"detail": e.message}, status_code=e.status_code)
+    except subprocess.TimeoutExpired:
+        logger.error(f"Evaluation of model {model_id} timed out in sandbox.")
+        metrics.EVALUATIONS.inc(outcome="failed")
+        return JSONResponse({"detail": "Evaluation timed out. Send fewer rows per request."}, status_code=504)
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Evaluation of model {model_id} failed in sandbox: {e.stderr}")
+        metrics.EVALUATIONS.inc(outcome="failed")
+        return JSONResponse({"detail": f"Evaluation failed: {e.stderr.strip().splitlines()[-1] if e.stderr.strip() else f'exit code {e.returncode}'}"}, status_code=500)
+    except Exception as e:
+        logger.error(f"An unexpected error occurred evaluating model {model_id}: {e}", exc_info=True)
+        metrics.EVALUATIONS.inc(outcome="failed")
+        return JSONResponse({"detail": f"An unexpected server error occurred: {e}"}, status_code=500)
 
 # API endpoint for full log access
 @app.get("/logs/")
@@ -0,0 +1,327 @@
+"""
+Prometheus-format metrics shared by all server and worker processes.
+
+Every process records its metrics in memory. Once `enable_sharing` is called, it
+also writes them to its own JSON file in a shared directory (atomically, from a
+background thread at most once per flush interval, and only if they changed), so
+recording a metric never does file I/O. `/metrics` reads
+every file in the directory and adds them up, so the numbers cover all uvicorn
+workers and `formulas-worker` processes without a Pushgateway or a StatsD relay.
+
+Counters and histograms of processes that exited are kept: their files are folded
+into an archive file by the next scrape, so totals don't drop when a worker is
+recycled. Gauges only count processes that are still running.
+"""
+import fcntl
+import json
+import logging
+import math
+import os
+import socket
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+
+from . import settings
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the stage latency histograms, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Files of exited processes are merged into this file
+_ARCHIVE_FILE = "archive.json"
+_LOCK_FILE = "metrics.lock"
+
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_sample(name: str, labels: dict) -> str:
+    """Formats a sample name with its labels, e.g. `name{stage="parse"}`."""
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{key}="{_escape_label_value(value)}"' for key, value in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric:
+    def __init__(self, registry: "MetricsRegistry", name: str, help_text: str, metric_type: str):
+        self.registry = registry
+        self.name = name
+        self.help_text = help_text
+        self.type = metric_type
+
+class Counter(_Metric):
+    """A value that only goes up, e.g. the number of conversions."""
+    def inc(self, amount: float = 1, **labels):
+        self.registry._add(self.name, _format_sample(self.name, labels), amount)
+
+class Gauge(_Metric):
+    """A value that goes up and down, e.g. the conversions currently running."""
+    def inc(self, amount: float = 1, **labels):
+        self.registry._add(self.name, _format_sample(self.name, labels), amount)
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_in_flight(self, **labels):
+        """Counts the enclosed block as in flight while it runs."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+class Histogram(_Metric):
+    """Distribution of observed values, e.g. stage latencies, in cumulative buckets."""
+    def __init__(self, registry: "MetricsRegistry", name: str, help_text: str, buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(registry, name, help_text, "histogram")
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        samples = {}
+        for bound in self.buckets:
+            bucket_sample = _format_sample(f"{self.name}_bucket", {**labels, "le": _format_value(bound)})
+            samples[bucket_sample] = 1 if value <= bound else 0
+        samples[_format_sample(f"{self.name}_sum", labels)] = value
+        samples[_format_sample(f"{self.name}_count", labels)] = 1
+        self.registry._add_many(self.name, samples)
+
+class MetricsRegistry:
+    """
+    The metrics of this process, plus the collection of all processes' metrics.
+
+    Values are kept per metric as {sample: value}, where a sample is the metric name
+    with its labels in exposition format. Histograms are stored as their bucket, sum
+    and count samples, which can be added up across processes like counters.
+    """
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._values: dict[str, dict[str, float]] = {}
+        self._lock = threading.Lock()
+        # Keeps concurrent flushes from replacing a newer snapshot with an older one
+        self._flush_lock = threading.Lock()
+        self._directory: str | None = None
+        self._path: str | None = None
+        self._dirty = False
+        self._stop_flushing: threading.Event | None = None
+        self._flush_thread: threading.Thread | None = None
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._register(Counter(self, name, help_text, "counter"))
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._register(Gauge(self, name, help_text, "gauge"))
+
+    def histogram(self, name: str, help_text: str, buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, help_text, buckets))
+
+    def _register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def _add(self, name: str, sample: str, amount: float):
+        with self._lock:
+            values = self._values.setdefault(name, {})
+            values[sample] = values.get(sample, 0) + amount
+            self._dirty = True
+
+    def _add_many(self, name: str, samples: dict[str, float]):
+        with self._lock:
+            values = self._values.setdefault(name, {})
+            for sample, amount in samples.items():
+                values[sample] = values.get(sample, 0) + amount
+            self._dirty = True
+
+    def enable_sharing(self, directory: str | None, flush_interval: float = 1.0):
+        """
+        Starts writing this process's metrics to `directory` so any process sharing it
+        can report them, every `flush_interval` seconds if they changed. Called by
+        server and worker processes at startup; one-off processes such as formulas-cli
+        keep their metrics in memory only.
+        """
+        if not directory:
+            return
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        # A pid alone could be reused by a later process and overwrite this one's counters
+        self._path = os.path.join(directory, f"process-{os.getpid()}-{uuid.uuid4().hex[:8]}.json")
+        self._dirty = True
+        self.flush()
+        if self._flush_thread is None:
+            self._stop_flushing = threading.Event()
+            self._flush_thread = threading.Thread(target=self._flush_periodically, args=(flush_interval,), name="metrics-flush", daemon=True)
+            self._flush_thread.start()
+
+    def _flush_periodically(self, interval: float):
+        while not self._stop_flushing.wait(interval):
+            self.flush()
+
+    def stop_sharing(self):
+        """Stops the background flushes and writes out what changed since the last one."""
+        if self._flush_thread is not None:
+            self._stop_flushing.set()
+            self._flush_thread.join()
+            self._flush_thread = None
+        self.flush()
+
+    def _snapshot(self) -> dict:
+        with self._lock:
+            self._dirty = False
+            return {
+                "pid": os.getpid(),
+                "host": socket.gethostname(),
+                "values": {name: dict(values) for name, values in self._values.items()},
+            }
+
+    def flush(self):
+        """Writes this process's metrics to its file, if sharing is enabled and anything changed."""
+        if self._path is None or not self._dirty:
+            return
+        with self._flush_lock:
+            try:
+                snapshot = self._snapshot()
+                fd, temp_path = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+                with os.fdopen(fd, "w") as f:
+                    json.dump(snapshot, f)
+                os.replace(temp_path, self._path)
+            except OSError as e:
+                logger.warning(f"Could not write metrics to {self._path}: {e}")
+
+    def _is_live(self, snapshot: dict) -> bool:
+        """Whether the process that wrote a snapshot is still running."""
+        if snapshot.get("host") != socket.gethostname():
+            return True # Can't check processes on other hosts sharing the directory
+        try:
+            os.kill(snapshot["pid"], 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass # Running as another user
+        return True
+
+    def _merge(self, totals: dict, snapshot: dict, include_gauges: bool):
+        for name, values in snapshot["values"].items():
+            metric = self._metrics.get(name)
+            if metric is None or (metric.type == "gauge" and not include_gauges):
+                continue
+            merged = totals.setdefault(name, {})
+            for sample, value in values.items():
+                merged[sample] = merged.get(sample, 0) + value
+
+    def _fold_exited_processes(self, exited: list[str]) -> dict:
+        """Merges the files of exited processes into the archive file and deletes them. Returns the archive."""
+        archive_path = os.path.join(self._directory, _ARCHIVE_FILE)
+        with open(os.path.join(self._directory, _LOCK_FILE), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(archive_path) as f:
+                    archive = json.load(f)
+            except (OSError, ValueError):
+                archive = {"values": {}}
+            folded = []
+            for path in exited:
+                # Re-read under the lock: a concurrent scrape may have folded it already
+                try:
+                    with open(path) as f:
+                        self._merge(archive["values"], json.load(f), include_gauges=False)
+                except (OSError, ValueError):
+                    continue
+                folded.append(path)
+            if folded:
+                fd, temp_path = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+                with os.fdopen(fd, "w") as f:
+                    json.dump(archive, f)
+                os.replace(temp_path, archive_path)
+                for path in folded:
+                    os.remove(path)
+        return archive
+
+    def collect(self) -> dict[str, dict[str, float]]:
+        """Returns {metric name: {sample: value}} summed over every process."""
+        if self._directory is None:
+            with self._lock:
+                return {name: dict(values) for name, values in self._values.items()}
+
+        self.flush()
+        snapshots = {}
+        for filename in os.listdir(self._directory):
+            if not (filename.startswith("process-") and filename.endswith(".json")):
+                continue
+            path = os.path.join(self._directory, filename)
+            try:
+                with open(path) as f:
+                    snapshots[path] = json.load(f)
+            except (OSError, ValueError):
+                continue # Removed by a concurrent scrape
+        exited = [path for path, snapshot in snapshots.items() if not self._is_live(snapshot)]
+        archive = self._fold_exited_processes(exited)
+
+        totals: dict[str, dict[str, float]] = {}
+        self._merge(totals, archive, include_gauges=False)
+        for path, snapshot in snapshots.items():
+            if path not in exited:
+                self._merge(totals, snapshot, include_gauges=True)
+        return totals
+
+    def render(self, scraped: list[tuple[Gauge, dict, float]] | None = None) -> str:
+        """
+        Formats the collected metrics in the Prometheus text exposition format.
+
+        Args:
+            scraped (list | None): Values of gauges that are read at scrape time
+                                   rather than recorded, as (gauge, labels, value).
+        """
+        totals = self.collect()
+        for gauge, labels, value in scraped or []:
+            totals.setdefault(gauge.name, {})[_format_sample(gauge.name, labels)] = value
+
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f"# HELP {name} {metric.help_text}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for sample, value in totals.get(name, {}).items():
+                lines.append(f"{sample} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+# Metrics of this process
+REGISTRY = MetricsRegistry()
+
+CONVERSIONS = REGISTRY.counter("formulas_conversions_total", "Conversions by source (api, job) and outcome (succeeded, failed, rejected).")
+CACHE_LOOKUPS = REGISTRY.counter("formulas_cache_lookups_total", "Conversion cache lookups by result (hit, miss).")
+FALLBACK_CELLS = REGISTRY.counter("formulas_fallback_cells_total", "Formula cells emitted as runtime xlcalculator evaluations by fresh conversions.")
+VALIDATION_REJECTIONS = REGISTRY.counter("formulas_validation_rejections_total", "Uploads rejected by validation, by HTTP status.")
+SANDBOX_RUNS = REGISTRY.counter("formulas_sandbox_runs_total", "Sandboxed script runs by outcome (succeeded, failed, timeout, error).")
+SANDBOX_TIMEOUTS = REGISTRY.counter("formulas_sandbox_timeouts_total", "Sandboxed scripts killed for running past their timeout.")
+EVALUATIONS = REGISTRY.counter("formulas_model_evaluations_total", "Requests evaluating a model over input rows, by outcome (succeeded, failed, rejected).")
+EVALUATED_ROWS = REGISTRY.counter("formulas_evaluated_rows_total", "Input rows evaluated by successful model evaluations.")
+STAGE_DURATION = REGISTRY.histogram("formulas_stage_duration_seconds", "Wall time of each conversion stage.")
+CONVERSIONS_IN_FLIGHT = REGISTRY.gauge("formulas_conversions_in_flight", "Conversions being handled, by source (api, job).")
+SANDBOX_RUNS_IN_FLIGHT = REGISTRY.gauge("formulas_sandbox_runs_in_flight", "Scripts running in the sandbox.")
+JOBS = REGISTRY.gauge("formulas_jobs", "Jobs in the shared job queue, by status. Read from the queue at scrape time.")
+
+def observe_conversion(source: str, cached: bool, report: dict, timings: dict):
+    """
+    Records a successful conversion: its outcome, the wall time of every stage in
+    `timings` (see StageTimings) and, unless it came from the cache, its fallback cells.
+    """
+    CONVERSIONS.inc(source=source, outcome="succeeded")
+    if not cached:
+        FALLBACK_CELLS.inc(report.get("fallback_cells", 0))
+    for stage, entry in timings.items():
+        STAGE_DURATION.observe(entry["wall_ms"] / 1000, stage=stage)
+
+def enable_sharing():
+    """Shares this process's metrics through `settings.METRICS_DIR`."""
+    REGISTRY.enable_sharing(settings.METRICS_DIR, settings.METRICS_FLUSH_INTERVAL_MS / 1000)
+
+def stop_sharing():
+    """Writes out this process's last metrics; called at shutdown."""
+    REGISTRY.stop_sharing()
@@ -0,0 +1,202 @@
+"""
+Compiled-model artifacts: the parsed xlcalculator Model of a workbook in a compact
+binary file, so scripts with runtime-evaluated cells don't parse the .xlsx again.
+
+Layout (big-endian):
+
+    magic           8 bytes   b"XLMODEL\\0"
+    format version  uint16    ARTIFACT_FORMAT_VERSION
+    marshal version uint16    `marshal.version` of the writer
+    content hash    32 bytes  SHA-256 of the payload
+    payload length  uint64
+    payload         `marshal` of {"cells": [...], "ranges": [...], "defined_names": [...]}
+
+Only plain values are stored (addresses, values, formula text), so reading is a
+memory-mapped `marshal.loads`. The xlcalculator objects are rebuilt from them, which
+costs far less than reading the .xlsx: no ZIP or XML parsing.
+
+The reader is kept as source (`ARTIFACT_RUNTIME`) since generated scripts embed it
+to stay standalone; `read_model_artifact`, `load_model_artifact` and `model_from_payload`
+run that same code.
+"""
+import hashlib
+import logging
+import marshal
+import os
+import struct
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_MAGIC = b"XLMODEL\0"
+ARTIFACT_FORMAT_VERSION = 1
+# Written next to the script, e.g. output.py -> output.xlmodel
+ARTIFACT_EXTENSION = ".xlmodel"
+_HEADER = struct.Struct(">8sHH32sQ")
+
+class ModelArtifactError(Exception):
+    """Raised when a model artifact is not valid or was written by an incompatible version."""
+    pass
+
+def _plain_value(value):
+    """Returns a cell value as something marshal can store. Other types (dates, errors) become text."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+def model_payload(model) -> dict:
+    """
+    Returns the cells, formulas, ranges and defined names of a parsed model as plain values,
+    the payload of its artifact.
+
+    Args:
+        model: The xlcalculator Model, as returned by `ModelCompiler.read_and_parse_archive`,
+               or a `StreamingModel`.
+    """
+    cells = []
+    for address, cell in model.cells.items():
+        formula = cell.formula
+        if not formula:
+            cells.append((address, _plain_value(cell.value), None, None))
+        elif isinstance(formula, str):
+            # xlcalculator only tokenizes formulas that start with "="
+            formula_text = formula if formula.startswith("=") else f"={formula}"
+            cells.append((address, _plain_value(cell.value), formula_text, address.split("!")[0] if "!" in address else None))
+        else:
+            # An xlcalculator XLFormula
+            cells.append((address, _plain_value(cell.value), formula.formula, formula.sheet_name))
+    # xlcalculator's ranges, or the range addresses of models read by the streaming engine
+    ranges = [(address, xl_range if isinstance(xl_range, str) else getattr(xl_range, "name", None)) for address, xl_range in getattr(model, "ranges", {}).items()]
+    defined_names = []
+    for name, definition in getattr(model, "defined_names", {}).items():
+        if hasattr(definition, "address_str"):
+            defined_names.append((name, "range", definition.address_str))
+        elif isinstance(getattr(definition, "address", None), str):
+            defined_names.append((name, "cell", definition.address))
+        else:
+            logger.warning(f"Defined name {name} is not a cell or range and is left out of the model artifact.")
+
+    return {"cells": cells, "ranges": ranges, "defined_names": defined_names}
+
+def serialize_model(model) -> bytes:
+    """
+    Serializes the cells, formulas, ranges and defined names of a parsed xlcalculator Model.
+
+    Args:
+        model: The xlcalculator Model, as returned by `ModelCompiler.read_and_parse_archive`.
+
+    Returns:
+        bytes: The artifact, header included.
+    """
+    payload = marshal.dumps(model_payload(model))
+    header = _HEADER.pack(ARTIFACT_MAGIC, ARTIFACT_FORMAT_VERSION, marshal.version, hashlib.sha256(payload).digest(), len(payload))
+    return header + payload
+
+def write_model_artifact(artifact: bytes, script_path: str) -> str:
+    """
+    Writes an artifact next to a script, replacing any previous one atomically.
+
+    Returns:
+        str: The path of the artifact.
+    """
+    path = os.path.splitext(script_path)[0] + ARTIFACT_EXTENSION
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(artifact)
+    os.replace(temp_path, path)
+    return path
+
+# Reading artifacts; embedded in generated scripts (with `ModelArtifactError` as RuntimeError)
+ARTIFACT_RUNTIME = '''
+def read_model_artifact(path: str) -> dict:
+    """Memory-maps a compiled-model artifact, checks its header and hash and returns its contents."""
+    import hashlib, marshal, mmap, struct
+    header = struct.Struct(">8sHH32sQ")
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        with memoryview(mapped) as view:
+            if len(view) < header.size:
+                raise ModelArtifactError(f"{path} is not a model artifact")
+            magic, version, marshal_version, content_hash, length = header.unpack(view[:header.size])
+            if magic != b"XLMODEL\\0":
+                raise ModelArtifactError(f"{path} is not a model artifact")
+            if version != 1 or marshal_version > marshal.version:
+                raise ModelArtifactError(f"{path} has format version {version}, which this runtime can't read; convert the workbook again")
+            with view[header.size:header.size + length] as payload:
+                if len(payload) != length or hashlib.sha256(payload).digest() != content_hash:
+                    raise ModelArtifactError(f"{path} is truncated or corrupted (content hash mismatch)")
+                return marshal.loads(payload)
+
+def load_model_artifact(path: str):
+    """Rebuilds the xlcalculator Model stored in a compiled-model artifact."""
+    return model_from_payload(read_model_artifact(path))
+
+def model_from_payload(data: dict):
+    """
+    Rebuilds an xlcalculator Model from the payload of an artifact. Addresses are
+    resolved and formulas tokenized and parsed when first used, since a script only
+    evaluates its runtime-evaluated cells.
+    """
+    from xlcalculator import parser
+    from xlcalculator.model import Model
+    from xlcalculator.xltypes import XLCell, XLFormula, XLRange
+
+    class LazyCell(XLCell):
+        def __post_init__(self):
+            pass
+
+        def __getattr__(self, name):
+            if name in ("sheet", "column", "row", "column_index", "row_index"):
+                XLCell.__post_init__(self)
+                return getattr(self, name)
+            raise AttributeError(name)
+
+    class LazyFormula(XLFormula):
+        def __post_init__(self):
+            del self.tokens, self.terms # Set empty by __init__; tokenized on first use
+
+        def __getattr__(self, name):
+            if name in ("tokens", "terms"):
+                self.terms = []
+                XLFormula.__post_init__(self)
+                return getattr(self, name)
+            raise AttributeError(name)
+
+        @property
+        def ast(self):
+            if self.__dict__.get("_ast") is None:
+                self.__dict__["_ast"] = parser.FormulaParser().parse(self.formula, defined_names)
+            return self.__dict__["_ast"]
+
+        @ast.setter
+        def ast(self, value):
+            self.__dict__["_ast"] = value
+
+    model = Model()
+    for address, value, formula_text, sheet_name in data["cells"]:
+        formula = LazyFormula(formula_text, sheet_name) if formula_text is not None else None
+        model.cells[address] = LazyCell(address, value=value, formula=formula)
+        if formula is not None:
+            model.formulae[address] = formula
+    for address, name in data["ranges"]:
+        xl_range = model.ranges[address] = XLRange(address, name=name)
+        # Like `ModelCompiler.build_ranges`, cells of a range the workbook doesn't have are empty
+        for row in xl_range.cells:
+            for cell_address in row:
+                if cell_address not in model.cells:
+                    model.cells[cell_address] = LazyCell(cell_address, value="")
+    for name, kind, address in data["defined_names"]:
+        if kind == "cell":
+            model.defined_names[name] = model.cells[address]
+            model.cells[address].defined_names.append(name)
+        else:
+            model.defined_names[name] = model.ranges.get(address) or XLRange(address, name=name)
+    # What `Model.build_code` passes to the parser
+    defined_names = {name: definition.address for name, definition in model.defined_names.items()}
+    return model
+'''
+
+_runtime_namespace = {"ModelArtifactError": ModelArtifactError}
+exec(compile(ARTIFACT_RUNTIME, __name__, "exec"), _runtime_namespace)
+read_model_artifact = _runtime_namespace["read_model_artifact"]
+load_model_artifact = _runtime_namespace["load_model_artifact"]
+model_from_payload = _runtime_namespace["model_from_payload"]
@@ -0,0 +1,291 @@
+"""
+Evaluates a converted model over many rows of inputs at once.
+
+A model is the compute module generated with `as_module` (see
+`generate_static_python_code`). Each input cell becomes a NumPy column with one
+value per row, and every statement of `compute` runs once over whole columns, so
+arithmetic and comparisons broadcast over all rows. Statements that don't broadcast
+(e.g. IF, AND and MAX, which Python evaluates with a single truth value, or
+functions that reduce a column) are detected and run row by row, for that cell only.
+
+Generated code runs in the sandbox like any other generated script: the rows are
+embedded in an evaluation script together with the model, and the output columns
+come back as JSON on its stdout.
+"""
+import ast
+import base64
+import csv
+import io
+import json
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Media types of CSV/TSV row uploads, by delimiter
+_CSV_DELIMITERS = {"text/csv": ",", "text/tab-separated-values": "\t"}
+# Per-row errors returned in full; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+class ModelEvaluationError(Exception):
+    """Raised for input rows or models that can't be evaluated."""
+    def __init__(self, message: str, status_code: int = 400):
+        self.message = message
+        self.status_code = status_code
+        super().__init__(self.message)
+
+def _parse_csv_value(text: str):
+    """Reads a CSV field as a number or boolean where it looks like one. Empty fields mean "not given"."""
+    if text == "":
+        return None
+    if text.upper() in ("TRUE", "FALSE"):
+        return text.upper() == "TRUE"
+    for parse in (int, float):
+        try:
+            return parse(text)
+        except ValueError:
+            pass
+    return text
+
+def parse_input_rows(body: bytes, content_type: str | None, max_rows: int) -> list[dict]:
+    """
+    Parses a table of input rows.
+
+    Args:
+        body (bytes): A JSON list of objects (or `{"rows": [...]}`) mapping cell
+                      addresses to values, or CSV/TSV whose header row holds the cell
+                      addresses. Missing or empty values keep the workbook value.
+        content_type (str | None): Media type of the body; JSON unless it is
+                                   `text/csv` or `text/tab-separated-values`.
+        max_rows (int): Largest accepted number of rows. 0 disables the limit.
+
+    Returns:
+        list[dict]: One {address: value} dict per row.
+
+    Raises:
+        ModelEvaluationError: If the body can't be parsed, has no rows or too many.
+    """
+    media_type = (content_type or "application/json").split(";")[0].strip().lower()
+    if media_type in _CSV_DELIMITERS:
+        try:
+            reader = csv.DictReader(io.StringIO(body.decode("utf-8-sig")), delimiter=_CSV_DELIMITERS[media_type])
+            rows = [{address: _parse_csv_value(text) for address, text in row.items() if address is not None and text is not None} for row in reader]
+        except (UnicodeDecodeError, csv.Error) as e:
+            raise ModelEvaluationError(f"Could not parse input rows: {e}")
+    elif media_type == "application/json" or media_type.endswith("+json"):
+        try:
+            rows = json.loads(body)
+        except ValueError as e:
+            raise ModelEvaluationError(f"Could not parse input rows: {e}")
+        if isinstance(rows, dict):
+            rows = rows.get("rows")
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ModelEvaluationError("Input rows must be a JSON list of objects mapping cell addresses to values.")
+        for row in rows:
+            for address, value in row.items():
+                if value is not None and not isinstance(value, (bool, int, float, str)):
+                    raise ModelEvaluationError(f"Value of {address} must be a number, string or boolean.")
+    else:
+        raise ModelEvaluationError(f"Unsupported media type {media_type}. Send JSON, text/csv or text/tab-separated-values.", status_code=415)
+
+    if not rows:
+        raise ModelEvaluationError("No input rows given.")
+    if max_rows > 0 and len(rows) > max_rows:
+        raise ModelEvaluationError(f"Too many input rows: {len(rows)}. The limit is {max_rows}.", status_code=413)
+    return rows
+
+def _encode_column(values: list) -> dict:
+    """
+    Encodes a column for the evaluation script. Numbers and booleans are sent as the
+    raw bytes of their array, which keeps large tables small inside the sandbox.
+    """
+    if all(type(value) in (int, float) for value in values):
+        return {"dtype": "float64", "data": base64.b64encode(np.asarray(values, dtype=np.float64).tobytes()).decode("ascii")}
+    if all(type(value) is bool for value in values):
+        return {"dtype": "bool", "data": base64.b64encode(np.asarray(values, dtype=bool).tobytes()).decode("ascii")}
+    return {"dtype": "object", "values": values}
+
+# Runs in the sandbox after MODEL_SOURCE, ROW_COUNT and COLUMNS are defined
+_EVALUATION_DRIVER = '''
+def _decode_column(column):
+    if column["dtype"] == "object":
+        array = np.empty(ROW_COUNT, dtype=object)
+        array[:] = column["values"]
+        return array
+    return np.frombuffer(base64.b64decode(column["data"]), dtype=column["dtype"])
+
+def _is_row_column(value):
+    return isinstance(value, np.ndarray) and value.shape == (ROW_COUNT,)
+
+def _row_value(value, row):
+    if _is_row_column(value):
+        return value.item(row) # A Python scalar, so the row computes exactly like compute() would
+    if isinstance(value, dict):
+        return {key: _row_value(item, row) for key, item in value.items()}
+    return value
+
+def _column_from_rows(values):
+    if all(type(value) in (int, float, np.float64) for value in values):
+        return np.asarray(values, dtype=np.float64)
+    array = np.empty(ROW_COUNT, dtype=object)
+    array[:] = values
+    return array
+
+def _json_value(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None # Not representable in JSON; Excel would show an error
+    return value
+
+def _json_column(value):
+    if _is_row_column(value):
+        return [_json_value(item) for item in value.tolist()]
+    return [_json_value(value)] * ROW_COUNT
+
+class _Errors:
+    def __init__(self):
+        self.count = 0
+        self.reported = []
+
+    def add(self, row, cell, error):
+        self.count += 1
+        if len(self.reported) < MAX_REPORTED_ERRORS:
+            self.reported.append({"row": row, "cell": cell, "error": f"{type(error).__name__}: {error}"})
+
+def _evaluate_rows(module, inputs, errors):
+    """Calls compute() once per row. Used for models whose statements can't run on columns."""
+    outputs = {address: [] for address in module["OUTPUTS"]}
+    for row in range(ROW_COUNT):
+        try:
+            values = module["compute"](_row_value(inputs, row))
+        except Exception as e:
+            errors.add(row, None, e)
+            values = {}
+        for address in outputs:
+            outputs[address].append(values.get(address))
+    return {address: _json_column(_column_from_rows(values)) for address, values in outputs.items()}
+
+def main():
+    module = {"__name__": "model"}
+    exec(compile(MODEL_SOURCE, "model", "exec"), module)
+    compute_node = next(node for node in ast.parse(MODEL_SOURCE).body if isinstance(node, ast.FunctionDef) and node.name == "compute")
+    returned = compute_node.body[-1].value
+    address_by_name = {value.id: key.value for key, value in zip(returned.keys, returned.values) if isinstance(value, ast.Name)}
+
+    inputs = {address: _decode_column(column) for address, column in COLUMNS.items()}
+    namespace = dict(module)
+    namespace["inputs"] = inputs
+    errors = _Errors()
+    row_evaluated_cells = []
+
+    # Python raises on division by zero, so NumPy must too for the row fallback to match compute()
+    with np.errstate(divide="raise", invalid="raise"):
+        for statement in compute_node.body[:-1]:
+            if isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Constant):
+                continue # Docstring
+            code = compile(ast.Module(body=[statement], type_ignores=[]), "model", "exec")
+            target = statement.targets[0].id if isinstance(statement, ast.Assign) and len(statement.targets) == 1 and isinstance(statement.targets[0], ast.Name) else None
+            loaded = {node.id for node in ast.walk(statement) if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)}
+            row_columns = [name for name in loaded if _is_row_column(namespace.get(name))]
+            try:
+                exec(code, namespace)
+                # A cell computed from row columns must be a row column itself; anything
+                # else means a function reduced or mixed up the rows (e.g. sum(column))
+                if target is not None and row_columns and not _is_row_column(namespace[target]):
+                    raise ValueError("result does not broadcast over the rows")
+                continue
+            except Exception:
+                if target is None:
+                    # e.g. assignments into the column arrays of a vectorized model
+                    print(json.dumps({"columns": _evaluate_rows(module, inputs, errors), "mode": "rows", "row_evaluated_cells": list(module["OUTPUTS"]), "errors": errors.reported, "error_count": errors.count}, default=str))
+                    return
+
+            # Cells that don't broadcast are evaluated for one row at a time
+            cell = address_by_name.get(target, target)
+            row_evaluated_cells.append(cell)
+            row_dependent = row_columns + (["inputs"] if "inputs" in loaded else [])
+            row_namespace = dict(namespace)
+            values = []
+            for row in range(ROW_COUNT):
+                for name in row_dependent:
+                    row_namespace[name] = _row_value(namespace[name], row)
+                try:
+                    exec(code, row_namespace)
+                    values.append(row_namespace[target])
+                except Exception as e:
+                    errors.add(row, cell, e)
+                    values.append(None)
+            namespace[target] = _column_from_rows(values)
+
+    columns = {address: _json_column(eval(compile(ast.Expression(body=value), "model", "eval"), namespace)) for address, value in zip((key.value for key in returned.keys), returned.values)}
+    print(json.dumps({"columns": columns, "mode": "columns", "row_evaluated_cells": row_evaluated_cells, "errors": errors.reported, "error_count": errors.count}, default=str))
+'''
+
+class CompiledModel:
+    """
+    A compute module prepared for row evaluation. Built once per model and reused
+    for every request: its inputs and outputs are read from the module, and the
+    model and driver part of the evaluation script is assembled up front.
+    """
+    def __init__(self, model_id: str, source: str):
+        self.model_id = model_id
+        self.source = source
+        try:
+            tree = ast.parse(source)
+        except SyntaxError as e:
+            raise ModelEvaluationError(f"Model {model_id} is not valid Python: {e}", status_code=500)
+        constants = {}
+        for node in tree.body:
+            if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+                if node.targets[0].id in ("INPUTS", "OUTPUTS", "FALLBACK_CELLS"):
+                    constants[node.targets[0].id] = ast.literal_eval(node.value)
+        if "INPUTS" not in constants or not any(isinstance(node, ast.FunctionDef) and node.name == "compute" for node in tree.body):
+            raise ModelEvaluationError(f"Model {model_id} is not a compute module. Convert the workbook with as_module.", status_code=409)
+        self.inputs: dict = constants["INPUTS"]
+        self.outputs: tuple = tuple(constants.get("OUTPUTS", ()))
+        self.fallback_cells: tuple = tuple(constants.get("FALLBACK_CELLS", ()))
+        self._script_prefix = "\n".join([
+            "import ast",
+            "import base64",
+            "import json",
+            "import math",
+            "import numpy as np",
+            f"MAX_REPORTED_ERRORS = {MAX_REPORTED_ERRORS}",
+            f"MODEL_SOURCE = {source!r}",
+            _EVALUATION_DRIVER,
+        ])
+
+    def build_script(self, rows: list[dict]) -> str:
+        """
+        Builds the sandbox script evaluating the model over `rows`.
+
+        Raises:
+            ModelEvaluationError: If the rows set cells that aren't inputs of the model,
+                                  or the model needs the source workbook at runtime.
+        """
+        if self.fallback_cells:
+            raise ModelEvaluationError(
+                f"Model {self.model_id} evaluates {len(self.fallback_cells)} cells with xlcalculator at runtime, which needs the source workbook. "
+                "Convert it without force_evaluator, or evaluate it with compute() locally.",
+                status_code=422,
+            )
+        given = set()
+        for row in rows:
+            given.update(row)
+        unknown = given - self.inputs.keys()
+        if unknown:
+            raise ModelEvaluationError(f"Not input cells of this model: {sorted(unknown)}")
+        columns = {}
+        for address in sorted(given):
+            # Rows that leave an input out keep its workbook value
+            default = self.inputs[address]
+            columns[address] = _encode_column([default if row.get(address) is None else row[address] for row in rows])
+        return "\n".join([
+            self._script_prefix,
+            f"ROW_COUNT = {len(rows)}",
+            f"COLUMNS = json.loads({json.dumps(columns)!r})",
+            "main()",
+            "",
+        ])
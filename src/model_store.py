@@ -0,0 +1,80 @@
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+from . import settings
+from .model_evaluation import CompiledModel
+
+logger = logging.getLogger(__name__)
+
+# Model ids are conversion cache keys: hex SHA-256 digests
+_MODEL_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+class ModelStore:
+    """
+    Compute modules of `as_module` conversions, by model id.
+
+    The model id is the conversion's cache key, so converting the same workbook with
+    the same options again returns the same id. Modules are kept as files in
+    `models_dir`, which is shared by every process that mounts it and, unlike the
+    conversion cache, never pruned. The models last used by this process are kept
+    compiled in memory.
+    """
+    def __init__(self, models_dir: str | None, memory_entries: int = 32):
+        self.models_dir = models_dir
+        self.memory_entries = memory_entries
+        self._compiled: OrderedDict[str, CompiledModel] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, model_id: str) -> str:
+        return os.path.join(self.models_dir, model_id[:2], f"{model_id}.py")
+
+    def put(self, model_id: str, source: str):
+        """Stores the compute module of a conversion. Models already stored are left as they are."""
+        if not self.models_dir:
+            return
+        path = self._path(model_id)
+        if os.path.exists(path):
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file and rename so concurrent readers never see partial models
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                f.write(source)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.error(f"Could not store model {model_id}: {e}")
+
+    def get(self, model_id: str) -> CompiledModel | None:
+        """
+        Returns the model compiled for row evaluation, or None if there is no such model.
+
+        Raises:
+            ModelEvaluationError: If the stored source is not a compute module.
+        """
+        if not self.models_dir or not _MODEL_ID_PATTERN.match(model_id):
+            return None
+        with self._lock:
+            model = self._compiled.get(model_id)
+            if model is not None:
+                self._compiled.move_to_end(model_id)
+                return model
+        try:
+            with open(self._path(model_id)) as f:
+                source = f.read()
+        except FileNotFoundError:
+            return None
+        model = CompiledModel(model_id, source)
+        with self._lock:
+            self._compiled[model_id] = model
+            while len(self._compiled) > self.memory_entries:
+                self._compiled.popitem(last=False)
+        return model
+
+def create_model_store() -> ModelStore:
+    """Creates a ModelStore configured from `settings`."""
+    return ModelStore(settings.MODELS_DIR or None, memory_entries=settings.MODELS_MEMORY_ENTRIES)
@@ -0,0 +1,119 @@
+"""
+Partial evaluation: precomputes the formulas that don't depend on the declared inputs.
+
+Large parts of a workbook often depend only on constants (rate tables, derived
+lookup grids), yet the generated script would recompute them on every run. Once
+the caller declares which cells are inputs, every other value cell is a constant,
+and a formula whose transitive precedents are all constants is evaluated once at
+conversion time with `xlcalculator.Evaluator` and emitted as a literal. Only
+formulas that depend on an input stay live code.
+
+Volatile formulas (RAND, NOW, OFFSET, ...) and circular references are never
+folded, nor is anything depending on them.
+"""
+import re
+import math
+import logging
+
+from xlcalculator.model import Model
+from xlcalculator.evaluator import Evaluator
+
+from .diagnostics import warn
+from .model_artifact import model_from_payload, model_payload
+from .pruning import TargetSelectionError, resolve_cell_selection
+from .xlsx_stream import StreamingModel
+
+logger = logging.getLogger(__name__)
+
+# Functions whose result can change between runs with the same inputs
+_VOLATILE_FUNCTION_PATTERN = re.compile(r'\b(?:RAND|RANDBETWEEN|NOW|TODAY|OFFSET|INDIRECT|CELL|INFO)\s*\(', re.IGNORECASE)
+
+class FoldPlan:
+    """Which formula cells are precomputed, and what the remaining live code reads."""
+    def __init__(self, input_cells: set[str]):
+        # Declared input cells; every other value cell is a constant
+        self.input_cells = input_cells
+        # Formula cell -> Python literal of its precomputed value
+        self.folded: dict[str, str] = {}
+        # Value (or empty) cells that aren't inputs but are read by live formulas
+        self.referenced_constants: set[str] = set()
+        self.live_cells = 0
+        self.unfoldable_cells = 0
+
+    def get_stats(self) -> dict:
+        """Returns the number of folded, live and unfoldable formula cells."""
+        return {"folded_cells": len(self.folded), "live_cells": self.live_cells, "unfoldable_cells": self.unfoldable_cells}
+
+def _folded_literal(value) -> str | None:
+    """Returns the source of an evaluated value as a Python literal, or None if it has none (errors, arrays)."""
+    if not isinstance(value, Exception):
+        # xlcalculator's Number, Text and Boolean results wrap the Python value
+        value = getattr(value, "value", value)
+    if isinstance(value, (bool, int, str)):
+        return repr(value)
+    if isinstance(value, float):
+        return repr(value) if math.isfinite(value) else None
+    return None
+
+def plan_constant_folding(model, workbook: Model, evaluation_order: list[str], inputs: list[str], cyclic_cells: set[str]) -> FoldPlan:
+    """
+    Precomputes every formula cell that depends on no declared input.
+
+    Args:
+        model: The cells being converted; a `PrunedModel` when converting targets.
+        workbook: The whole xlcalculator Model, evaluated by `xlcalculator.Evaluator`. A
+                  `StreamingModel` is evaluated through the Model its artifact rebuilds.
+        evaluation_order (list[str]): Topological order from `get_evaluation_order_and_cycles`.
+        inputs (list[str]): Declared input cells or ranges, as returned by `parse_targets`.
+        cyclic_cells (set[str]): Cells on circular references.
+
+    Returns:
+        FoldPlan: The folded cells and their literals.
+
+    Raises:
+        TargetSelectionError: If an input is not a cell of the workbook, or is a formula.
+    """
+    input_cells = set(resolve_cell_selection(workbook, inputs, "Inputs"))
+    formula_inputs = sorted(cell_address for cell_address in input_cells if workbook.cells[cell_address].formula)
+    if formula_inputs:
+        raise TargetSelectionError(f"Inputs must be cells without formulas: {', '.join(formula_inputs)}")
+    plan = FoldPlan(input_cells)
+
+    # One pass in evaluation order: a formula is live if it is volatile or cyclic, or
+    # if any precedent is an input or live. Precedents that aren't cells are empty constants.
+    live = set(input_cells) | cyclic_cells
+    candidates = []
+    for cell_address in evaluation_order:
+        cell = model.cells.get(cell_address)
+        if cell is None or not cell.formula or cell_address in live:
+            continue
+        if _VOLATILE_FUNCTION_PATTERN.search(cell.formula) or any(precedent.formula_address in live for precedent in cell.precedents):
+            live.add(cell_address)
+        else:
+            candidates.append(cell_address)
+
+    evaluator = None
+    if candidates:
+        evaluator = Evaluator(model_from_payload(model_payload(workbook)) if isinstance(workbook, StreamingModel) else workbook)
+    for cell_address in candidates:
+        try:
+            literal = _folded_literal(evaluator.evaluate(cell_address))
+        except Exception as e:
+            warn(logger, "fold_failed", "Could not precompute %s, which stays live code: %r", cell_address, e, address=cell_address)
+            literal = None
+        if literal is None:
+            # Stays live code; its dependents are still folded from the evaluator's values
+            plan.unfoldable_cells += 1
+            continue
+        plan.folded[cell_address] = literal
+
+    for cell_address, cell in model.cells.items():
+        if not cell.formula or cell_address in plan.folded:
+            continue
+        plan.live_cells += 1
+        for precedent in cell.precedents:
+            precedent_cell = model.cells.get(precedent.formula_address)
+            if (precedent_cell is None or not precedent_cell.formula) and precedent.formula_address not in input_cells:
+                plan.referenced_constants.add(precedent.formula_address)
+    logger.info(f"Precomputed {len(plan.folded)} formula cells that don't depend on the inputs; {plan.live_cells} stay live.")
+    return plan
@@ -0,0 +1,166 @@
+import logging
+import os
+from io import BytesIO
+from xlcalculator.model import ModelCompiler
+
+from .diagnostics import collect_diagnostics
+from .dependency_extractor import generate_static_python_code
+from .model_artifact import serialize_model
+from .xlsx_stream import read_workbook_streaming
+from .csv_stream import read_delimited_streaming
+from .timings import StageTimings
+
+logger = logging.getLogger(__name__)
+
+# Ways of reading a workbook, selectable per conversion:
+#   xlcalculator - `ModelCompiler().read_and_parse_archive`, which loads every cell
+#   streaming    - `read_workbook_streaming`, which reads only the formulas and the
+#                  constants they reference, in bounded memory (.xlsx only)
+INGEST_ENGINES = ("xlcalculator", "streaming")
+DEFAULT_INGEST_ENGINE = "xlcalculator"
+# CSV and TSV files are always read by `read_delimited_streaming`; their engine is
+# their extension, whatever engine was asked for
+DELIMITED_ENGINES = {"csv": ",", "tsv": "\t"}
+
+class WorkbookParseError(Exception):
+    """Raised when an uploaded workbook cannot be parsed by xlcalculator."""
+    pass
+
+class IngestEngineError(Exception):
+    """Raised when a conversion asks for an ingest engine that doesn't exist."""
+    def __init__(self, message: str, status_code: int = 400):
+        self.message = message
+        self.status_code = status_code
+        super().__init__(self.message)
+
+def parse_engine(value: str | None) -> str:
+    """
+    Validates an ingest engine name, defaulting to `DEFAULT_INGEST_ENGINE`.
+
+    Raises:
+        IngestEngineError: If `value` is not one of `INGEST_ENGINES`.
+    """
+    if value is None or value.strip() == "":
+        return DEFAULT_INGEST_ENGINE
+    engine = value.strip().lower()
+    if engine not in INGEST_ENGINES:
+        raise IngestEngineError(f"Unknown ingest engine {value!r}; expected one of {', '.join(INGEST_ENGINES)}.")
+    return engine
+
+def ingest_engine_for(filename: str, engine: str = DEFAULT_INGEST_ENGINE) -> str:
+    """Returns the engine that reads `filename`: "csv" or "tsv" for delimited files, else `engine`."""
+    extension = os.path.splitext(filename)[1].lstrip(".").lower()
+    return extension if extension in DELIMITED_ENGINES else engine
+
+def assemble_script(generated_code: str) -> str:
+    """
+    Wraps the generated formula code with the header comments of the final script.
+
+    xlcalculator is not imported here: scripts with runtime-evaluated cells carry
+    their own runtime, which imports it once when the workbook is loaded.
+    """
+    final_script_lines = [
+        "import re", # May be needed for regex in generated code
+        "",
+        "# --- Start of Generated Excel to Python Conversion ---",
+        "",
+        generated_code,
+        "",
+        "# --- End of Generated Excel to Python Conversion ---",
+        ""
+    ]
+    return "\n".join(final_script_lines)
+
+def read_workbook(file_content: bytes, engine: str = DEFAULT_INGEST_ENGINE, report: dict | None = None):
+    """
+    Parses a workbook with the given ingest engine (see `INGEST_ENGINES` and `DELIMITED_ENGINES`).
+
+    Returns:
+        The model: an xlcalculator Model, or a `StreamingModel` with the same `cells`.
+
+    Raises:
+        WorkbookParseError: If the engine cannot parse the workbook.
+    """
+    try:
+        if engine == "streaming":
+            return read_workbook_streaming(file_content, report=report)
+        if engine in DELIMITED_ENGINES:
+            return read_delimited_streaming(file_content, DELIMITED_ENGINES[engine], report=report)
+        return ModelCompiler().read_and_parse_archive(BytesIO(file_content))
+    except Exception as e:
+        logger.error(f"Error parsing or reading Excel file: {e}", exc_info=True)
+        raise WorkbookParseError(f"Error parsing or reading Excel file: {e}") from e
+
+def build_model_artifact(file_content: bytes, engine: str = DEFAULT_INGEST_ENGINE) -> bytes:
+    """
+    Parses a workbook and returns its compiled model, for conversions whose artifact
+    was not kept (the conversion cache stores only the JSON parts of a conversion).
+
+    Raises:
+        WorkbookParseError: If the engine cannot parse the workbook.
+    """
+    return serialize_model(read_workbook(file_content, engine))
+
+def convert_workbook(file_content: bytes, force_evaluator: bool = False, vectorize: bool = False, progress=None, as_module: bool = False, targets: list[str] | None = None, inputs: list[str] | None = None, optimize: bool = False, engine: str = DEFAULT_INGEST_ENGINE) -> dict:
+    """
+    Runs the parse/analyze/codegen pipeline for an uploaded workbook.
+
+    This is the CPU-bound part of a conversion and is executed in a worker of the
+    conversion pool, so everything it takes and returns must be picklable.
+
+    Args:
+        file_content (bytes): Raw bytes of the uploaded workbook.
+        force_evaluator (bool): If True, forces all formulas to be evaluated at runtime.
+        vectorize (bool): If True, filled-down formula runs are emitted as NumPy array expressions.
+        progress (callable | None): If provided, called with the name of each stage
+                                    ("parse", "order", "fold" with `inputs`, "naming",
+                                    "codegen") as it starts. Must
+                                    be picklable when the pipeline runs in the conversion pool.
+        as_module (bool): If True, the script is an importable module exposing
+                          `compute(inputs) -> dict` instead of top-level statements.
+        targets (list[str] | None): If provided (see `parse_targets`), only these cells and
+                                    their transitive precedents are converted.
+        inputs (list[str] | None): If provided, the declared input cells; formulas that
+                                   depend on none of them are precomputed.
+        optimize (bool): If True, translated formulas are optimized (see `ExpressionOptimizer`).
+        engine (str): How the workbook is parsed, one of `INGEST_ENGINES`, or "csv"/"tsv"
+                      for delimited files (see `ingest_engine_for`).
+
+    Returns:
+        dict: {"script": <final script>, "warnings": <one line per kind of warning logged
+                                                    during conversion>,
+               "diagnostics": <the same warnings with their codes, counts and sample
+                               addresses, see `Diagnostics.to_list`>,
+               "report": <codegen statistics, e.g. circular_references, and `ingest`
+                          with the streaming engine>,
+               "timings": <wall and CPU milliseconds per stage, see StageTimings>}
+              plus, when some cells are evaluated at runtime, "model_artifact": <the
+              compiled model those cells need, to write next to the script; see
+              `write_model_artifact`>.
+
+    Raises:
+        WorkbookParseError: If the workbook cannot be parsed.
+        TargetSelectionError: If a target or input selects no cell of the workbook, or
+                              an input is a formula.
+    """
+    # Warnings are collected per conversion and shipped back with the result,
+    # since the request's context variable does not cross the process boundary.
+    with collect_diagnostics() as diagnostics:
+        timings = StageTimings(progress)
+        report = {}
+        timings("parse")
+        model = read_workbook(file_content, engine, report)
+
+        # Generate Python code, which now includes fallback logic
+        generated_code = generate_static_python_code(model, force_evaluator=force_evaluator, report=report, vectorize=vectorize, progress=timings, as_module=as_module, targets=targets, inputs=inputs, optimize=optimize)
+        # A compute module is complete as generated
+        script = generated_code if as_module else assemble_script(generated_code)
+        result = {"script": script, "report": report}
+        if report.get("fallback_cells"):
+            # Saves the script's runtime from parsing the workbook again
+            result["model_artifact"] = serialize_model(model)
+        result["warnings"] = diagnostics.warnings()
+        result["diagnostics"] = diagnostics.to_list()
+        timings.stop()
+        result["timings"] = timings.to_dict()
+        return result
@@ -0,0 +1,155 @@
+"""
+Output-targeted pruning of a workbook's evaluation graph.
+
+Most consumers only need a handful of output cells (e.g. the totals of a summary
+sheet). `prune_to_targets` keeps the requested cells and their transitive
+precedents, so ordering, naming, codegen and the generated script only pay for
+what the targets actually depend on.
+
+Targets are cell addresses (`Summary!B2`) or rectangular ranges (`Summary!B2:D10`),
+separated by commas when given as one string. `$` markers and quotes around the
+sheet name are ignored.
+"""
+import re
+import logging
+
+from xlcalculator.model import Model
+
+from .formula_shapes import column_letters_to_index
+
+logger = logging.getLogger(__name__)
+
+_TARGET_PATTERN = re.compile(r"^'?([^!:]+?)'?!([A-Za-z]{1,3})(\d+)(?::([A-Za-z]{1,3})(\d+))?$")
+_ADDRESS_PATTERN = re.compile(r'^(.+?)!([A-Za-z]+)(\d+)$')
+
+class TargetSelectionError(Exception):
+    """Raised when requested cells (targets or inputs) are malformed or not cells of the workbook."""
+    def __init__(self, message: str, status_code: int = 400):
+        self.message = message
+        self.status_code = status_code
+        super().__init__(self.message)
+
+class PrunedModel:
+    """
+    The part of a model needed to compute some target cells.
+
+    Exposes `cells` like `xlcalculator.model.Model`, in workbook order, which is all
+    the ordering and codegen stages read.
+    """
+    def __init__(self, cells: dict, targets: list[str]):
+        self.cells = cells
+        self.targets = targets
+
+def parse_targets(value: str | list[str] | None) -> list[str] | None:
+    """
+    Normalizes a target selection.
+
+    Args:
+        value (str | list[str] | None): Comma-separated targets, a list of them, or None.
+
+    Returns:
+        list[str] | None: The distinct targets, sorted, with `$` markers and sheet
+                          quotes removed and column letters upper-cased; None if
+                          no targets were given.
+
+    Raises:
+        TargetSelectionError: If a target is not a cell address or a range.
+    """
+    if value is None:
+        return None
+    parts = value.split(",") if isinstance(value, str) else value
+    targets = set()
+    for part in parts:
+        part = part.strip().replace("$", "")
+        if not part:
+            continue
+        match = _TARGET_PATTERN.match(part)
+        if not match:
+            raise TargetSelectionError(f"Invalid target '{part}'. Expected a cell such as Sheet1!B2 or a range such as Sheet1!B2:D10.")
+        sheet, first_column, first_row, last_column, last_row = match.groups()
+        target = f"{sheet}!{first_column.upper()}{first_row}"
+        if last_column is not None:
+            target += f":{last_column.upper()}{last_row}"
+        targets.add(target)
+    return sorted(targets) or None
+
+def resolve_cell_selection(model: Model, targets: list[str], label: str = "Targets") -> list[str]:
+    """
+    Returns the model cells selected by cells and ranges, in workbook order.
+
+    Raises:
+        TargetSelectionError: If a cell or range selects no cell of the model; `label`
+                              names the selection in the message.
+    """
+    cells = set()
+    ranges = []
+    missing = []
+    for target in targets:
+        sheet, _, reference = target.partition("!")
+        first, _, last = reference.partition(":")
+        if not last:
+            if target in model.cells:
+                cells.add(target)
+            else:
+                missing.append(target)
+            continue
+        first_match = _ADDRESS_PATTERN.match(f"{sheet}!{first}")
+        last_match = _ADDRESS_PATTERN.match(f"{sheet}!{last}")
+        first_column, last_column = sorted((column_letters_to_index(first_match.group(2)), column_letters_to_index(last_match.group(2))))
+        first_row, last_row = sorted((int(first_match.group(3)), int(last_match.group(3))))
+        ranges.append([target, sheet, first_column, last_column, first_row, last_row, False])
+
+    if ranges:
+        # One pass over the model for all ranges, instead of expanding them cell by cell
+        for cell_address in model.cells:
+            match = _ADDRESS_PATTERN.match(cell_address)
+            if not match:
+                continue
+            sheet, column, row = match.group(1), column_letters_to_index(match.group(2)), int(match.group(3))
+            for target_range in ranges:
+                if target_range[1] == sheet and target_range[2] <= column <= target_range[3] and target_range[4] <= row <= target_range[5]:
+                    cells.add(cell_address)
+                    target_range[6] = True
+        missing.extend(target_range[0] for target_range in ranges if not target_range[6])
+
+    if missing:
+        raise TargetSelectionError(f"{label} are not cells of this workbook: {', '.join(missing)}")
+    return [cell_address for cell_address in model.cells if cell_address in cells]
+
+def prune_to_targets(model: Model, targets: list[str], report: dict | None = None) -> PrunedModel:
+    """
+    Keeps only the target cells and their transitive precedents.
+
+    Args:
+        model: The xlcalculator Model object.
+        targets (list[str]): Targets as returned by `parse_targets`.
+        report (dict | None): If provided, `targets` is set to the number of target
+                              cells and of cells kept out of the workbook's total.
+
+    Returns:
+        PrunedModel: The kept cells, in workbook order. Its `targets` are the
+                     resolved target cells.
+
+    Raises:
+        TargetSelectionError: If a target selects no cell of the workbook.
+    """
+    target_cells = resolve_cell_selection(model, targets)
+    kept = set(target_cells)
+    stack = list(target_cells)
+    # Depth-first over precedents; precedents that aren't cells of the model (e.g.
+    # empty referenced cells) are kept out, as the dependency graph adds them itself
+    while stack:
+        cell = model.cells[stack.pop()]
+        if not cell.formula:
+            continue
+        for precedent_cell in cell.precedents:
+            precedent_address = precedent_cell.formula_address
+            if precedent_address not in kept and precedent_address in model.cells:
+                kept.add(precedent_address)
+                stack.append(precedent_address)
+
+    cells = {cell_address: cell for cell_address, cell in model.cells.items() if cell_address in kept}
+    logger.info(f"Pruned the workbook to {len(cells)} of {len(model.cells)} cells needed by {len(target_cells)} target cells.")
+    if report is not None:
+        report["targets"] = {"target_cells": len(target_cells), "cells_kept": len(cells), "cells_total": len(model.cells)}
+    return PrunedModel(cells, target_cells)
@@ -1,9 +1,15 @@
+import asyncio
 import os
 import sys
 import resource
 import subprocess
+import threading
 import logging
 
+from . import settings
+from .sandbox_pool import SandboxPool, SandboxWorkerError
+from .metrics import SANDBOX_RUNS, SANDBOX_TIMEOUTS, SANDBOX_RUNS_IN_FLIGHT
+
 # Define resource limits
 MAX_CPU_TIME = 30  # seconds
 MAX_MEMORY_BYTES = 100 * 1024 * 1024  # 100 MB
@@ -30,10 +36,44 @@ def set_resource_limits():
         sys.stderr.write(f"Error setting resource limits: {e}\n")
         return False
 
+_sandbox_pool: SandboxPool | None = None
+_sandbox_pool_lock = threading.Lock()
+
+def get_sandbox_pool() -> SandboxPool | None:
+    """
+    Returns this process's pool of warm sandbox workers, creating it on first use.
+    Returns None if the pool is disabled or the platform can't fork.
+    """
+    global _sandbox_pool
+    if settings.SANDBOX_POOL_SIZE <= 0 or not hasattr(os, "fork"):
+        return None
+    with _sandbox_pool_lock:
+        if _sandbox_pool is None:
+            _sandbox_pool = SandboxPool(
+                size=settings.SANDBOX_POOL_SIZE,
+                max_runs_per_worker=settings.SANDBOX_MAX_RUNS_PER_WORKER,
+                # Same limits as `set_resource_limits`, applied to each script's child
+                max_cpu_seconds=MAX_CPU_TIME,
+                max_memory_bytes=MAX_MEMORY_BYTES,
+            )
+        return _sandbox_pool
+
+def shutdown_sandbox_pool():
+    """Stops the warm sandbox workers of this process, if any were started."""
+    global _sandbox_pool
+    with _sandbox_pool_lock:
+        if _sandbox_pool is not None:
+            _sandbox_pool.shutdown()
+            _sandbox_pool = None
+
 def execute_script_in_sandbox(script_path: str, timeout: int = 30):
     """
     Executes a Python script in a sandboxed subprocess.
 
+    Uses a warm worker of the sandbox pool when it is enabled, otherwise starts a
+    fresh interpreter. Both run the script under `set_resource_limits` and report
+    the same way.
+
     Args:
         script_path (str): The path to the Python script to execute.
         timeout (int): The maximum time (in seconds) the script is allowed to run.
@@ -46,6 +86,20 @@ def execute_script_in_sandbox(script_path: str, timeout: int = 30):
         subprocess.CalledProcessError: If the script returns a non-zero exit code.
         RuntimeError: For any unexpected errors during script execution.
     """
+    sandbox_pool = get_sandbox_pool()
+    if sandbox_pool is not None:
+        try:
+            with open(script_path, "r") as f:
+                script = f.read()
+            stdout, stderr, returncode = sandbox_pool.run(script, timeout)
+        except subprocess.TimeoutExpired:
+            raise
+        except (OSError, SandboxWorkerError) as e:
+            raise RuntimeError(f"Failed to execute script in sandbox: {e}")
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, [sys.executable, script_path], output=stdout, stderr=stderr)
+        return stdout, stderr, returncode
+
     process = None # Initialize process to None
     try:
         # Using sys.executable to ensure the current Python interpreter is used
@@ -73,4 +127,78 @@ def execute_script_in_sandbox(script_path: str, timeout: int = 30):
         raise # Re-raise the CalledProcessError to indicate a script error
     except Exception as e:
         # Catch any other unexpected errors
-        raise RuntimeError(f"Failed to execute script in sandbox: {e}") 
\ No newline at end of file
+        raise RuntimeError(f"Failed to execute script in sandbox: {e}")
+
+async def _run_script_in_subprocess(script: str, timeout: float, usage: dict | None = None) -> tuple[str, str, int]:
+    """
+    Runs `script` in a fresh interpreter that reads it from stdin.
+
+    The child is reaped by asyncio, so its CPU time is taken from the change in the
+    usage of all children of this process; scripts finishing concurrently can be
+    counted in it. Max RSS isn't available per child here and is reported as None.
+    """
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-", # "-" makes the interpreter read the program from stdin
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        preexec_fn=set_resource_limits # Set resource limits in the child process
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(script.encode("utf-8")), timeout)
+    except asyncio.TimeoutError:
+        raise subprocess.TimeoutExpired([sys.executable, "-"], timeout)
+    finally:
+        # Timed out or cancelled: don't leave the script running
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+    if usage is not None:
+        children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        usage["cpu_seconds"] = (children_after.ru_utime + children_after.ru_stime) - (children_before.ru_utime + children_before.ru_stime)
+        usage["max_rss_kb"] = None
+    return stdout.decode("utf-8", errors="replace"), stderr.decode("utf-8", errors="replace"), process.returncode
+
+async def run_script_in_sandbox(script: str, timeout: float = 30, usage: dict | None = None):
+    """
+    Runs Python source code in the sandbox without blocking the event loop.
+
+    The script is passed to the sandbox over a pipe, so nothing is written to disk.
+    It runs in a warm worker of the sandbox pool when it is enabled, otherwise in a
+    fresh interpreter started with `asyncio.create_subprocess_exec`. Cancelling the
+    awaiting task kills the script.
+
+    Args:
+        script (str): The Python source code to execute.
+        timeout (float): The maximum time (in seconds) the script is allowed to run.
+        usage (dict | None): If provided, filled with the `cpu_seconds` and `max_rss_kb`
+                             of the child that ran the script, once it exited.
+
+    Returns:
+        tuple: A tuple containing (stdout, stderr, returncode).
+
+    Raises:
+        subprocess.TimeoutExpired: If the script execution exceeds the timeout.
+        subprocess.CalledProcessError: If the script returns a non-zero exit code.
+        RuntimeError: For any unexpected errors during script execution.
+    """
+    sandbox_pool = get_sandbox_pool()
+    try:
+        with SANDBOX_RUNS_IN_FLIGHT.track_in_flight():
+            if sandbox_pool is not None:
+                stdout, stderr, returncode = await sandbox_pool.run_async(script, timeout, usage)
+            else:
+                stdout, stderr, returncode = await _run_script_in_subprocess(script, timeout, usage)
+    except subprocess.TimeoutExpired:
+        SANDBOX_RUNS.inc(outcome="timeout")
+        SANDBOX_TIMEOUTS.inc()
+        raise
+    except Exception as e:
+        SANDBOX_RUNS.inc(outcome="error")
+        raise RuntimeError(f"Failed to execute script in sandbox: {e}")
+    if returncode != 0:
+        SANDBOX_RUNS.inc(outcome="failed")
+        raise subprocess.CalledProcessError(returncode, [sys.executable, "-"], output=stdout, stderr=stderr)
+    SANDBOX_RUNS.inc(outcome="succeeded")
+    return stdout, stderr, returncode
@@ -0,0 +1,279 @@
+import asyncio
+import collections
+import logging
+import os
+import queue
+import selectors
+import signal
+import subprocess
+import sys
+import threading
+
+from .sandbox_worker import read_frame, write_frame
+
+logger = logging.getLogger(__name__)
+
+# Modules generated scripts import; loading them once per worker is most of the
+# latency the pool saves. Children inherit the worker's memory, so only modules that
+# fit within the script limits are listed (xlcalculator doesn't fit in 100 MB), and
+# workers skip any that don't.
+SANDBOX_PRELOAD_MODULES = ["io", "re", "numpy"]
+# Extra time the pool waits for a worker's answer beyond the script timeout
+_RESPONSE_GRACE_SECONDS = 5
+# Directory containing the `src` package, so workers can run `-m src.sandbox_worker`
+_PACKAGE_PARENT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class SandboxWorkerError(Exception):
+    """Raised when a sandbox worker dies or breaks the protocol."""
+    pass
+
+class SandboxWorker:
+    """One warm `src.sandbox_worker` process and the pipes to it."""
+    def __init__(self, preload_modules: list[str], max_cpu_seconds: int | None = None, max_memory_bytes: int | None = None):
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [_PACKAGE_PARENT, env.get("PYTHONPATH")]))
+        # The worker runs unlimited; each script's child applies the limits after the fork
+        limit_arguments = []
+        if max_cpu_seconds is not None:
+            limit_arguments += ["--max-cpu-seconds", str(max_cpu_seconds)]
+        if max_memory_bytes is not None:
+            limit_arguments += ["--max-memory-bytes", str(max_memory_bytes)]
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "src.sandbox_worker", *limit_arguments, "--", *preload_modules],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=None, # Preload errors show up in the server log
+            env=env,
+            start_new_session=True, # So `kill` reaches the scripts it forked too
+        )
+        self.runs = 0
+        self.ready = False
+
+    def _read_response(self, timeout: float) -> dict:
+        """Waits up to `timeout` seconds for the next frame from the worker."""
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.process.stdout, selectors.EVENT_READ)
+            if not selector.select(timeout=timeout):
+                raise subprocess.TimeoutExpired(self.process.args, timeout)
+        message = read_frame(self.process.stdout.fileno())
+        if message is None:
+            raise SandboxWorkerError(f"Sandbox worker exited with code {self.process.poll()}.")
+        return message
+
+    def wait_ready(self, timeout: float):
+        """Blocks until the worker has finished preloading."""
+        if not self.ready:
+            message = self._read_response(timeout)
+            if not message.get("ready"):
+                raise SandboxWorkerError(f"Unexpected message from sandbox worker: {message}")
+            self.ready = True
+
+    def run(self, script: str, timeout: float) -> dict:
+        """Sends a script to the worker and returns its result frame."""
+        try:
+            write_frame(self.process.stdin.fileno(), {"script": script, "timeout": timeout})
+        except OSError as e:
+            raise SandboxWorkerError(f"Could not send script to sandbox worker: {e}") from e
+        self.runs += 1
+        return self._read_response(timeout + _RESPONSE_GRACE_SECONDS)
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+    def kill(self):
+        """Kills the worker along with the script it is running, e.g. when the caller gave up on it."""
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def close(self):
+        """Stops the worker: closing stdin ends its loop, a kill covers a stuck one."""
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=1)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        finally:
+            self.process.stdout.close()
+
+class SandboxPool:
+    """
+    Pool of warm sandbox workers.
+
+    Each worker is a Python process with the runtime imports of generated scripts
+    already loaded (those that fit within the limits). Scripts are sent over a pipe
+    and run in a child forked from the worker, under `max_cpu_seconds` and
+    `max_memory_bytes`, which costs a fork instead of an interpreter start-up plus
+    imports. A worker is replaced after `max_runs_per_worker`
+    scripts, or as soon as it dies; replacements are started right away so they are
+    warm by the time they're needed.
+    """
+    def __init__(self, size: int, max_runs_per_worker: int = 50, preload_modules: list[str] | None = None, max_cpu_seconds: int | None = None, max_memory_bytes: int | None = None):
+        self.size = size
+        self.max_runs_per_worker = max_runs_per_worker
+        self.preload_modules = SANDBOX_PRELOAD_MODULES if preload_modules is None else preload_modules
+        self.max_cpu_seconds = max_cpu_seconds
+        self.max_memory_bytes = max_memory_bytes
+        self._idle: queue.Queue = queue.Queue()
+        # Futures of `run_async` callers waiting for an idle worker, with their loops
+        self._async_waiters: collections.deque = collections.deque()
+        self._lock = threading.Lock()
+        self._started = False
+        self._closed = False
+        self.stats = {"runs": 0, "workers_started": 0, "workers_recycled": 0, "worker_crashes": 0}
+
+    def _start_worker(self) -> SandboxWorker:
+        worker = SandboxWorker(self.preload_modules, self.max_cpu_seconds, self.max_memory_bytes)
+        with self._lock:
+            self.stats["workers_started"] += 1
+        return worker
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for _ in range(self.size):
+            self._put_idle(self._start_worker())
+
+    def _release(self, worker: SandboxWorker, healthy: bool):
+        """Returns a worker to the pool, replacing it if it is spent or broken."""
+        if self._closed:
+            worker.close()
+            return
+        if healthy and worker.is_alive() and worker.runs < self.max_runs_per_worker:
+            self._put_idle(worker)
+            return
+        with self._lock:
+            if healthy:
+                self.stats["workers_recycled"] += 1
+            else:
+                self.stats["worker_crashes"] += 1
+        if not healthy:
+            logger.warning(f"Sandbox worker {worker.process.pid} failed; starting a new one.")
+        worker.close()
+        self._put_idle(self._start_worker())
+
+    def _put_idle(self, worker: SandboxWorker):
+        """Makes a worker available, waking an async caller waiting for one."""
+        self._idle.put(worker)
+        self._wake_async_waiter()
+
+    def _wake_async_waiter(self):
+        with self._lock:
+            if not self._async_waiters:
+                return
+            loop, waiter = self._async_waiters.popleft()
+
+        def wake():
+            if waiter.done():
+                self._wake_async_waiter() # Cancelled meanwhile: wake the next one instead
+            else:
+                waiter.set_result(None)
+        try:
+            loop.call_soon_threadsafe(wake)
+        except RuntimeError:
+            self._wake_async_waiter() # Its loop is closed
+
+    async def _acquire_async(self) -> SandboxWorker:
+        """Waits for an idle worker on the event loop, without holding a thread."""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            waiter = loop.create_future()
+            with self._lock:
+                self._async_waiters.append((loop, waiter))
+            # A worker released before the waiter was registered doesn't wake it
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                worker = None
+            if worker is not None:
+                waiter.cancel()
+                return worker
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._wake_async_waiter() # Woken for a worker this caller won't take
+                raise
+
+    def run(self, script: str, timeout: float, usage: dict | None = None) -> tuple[str, str, int]:
+        """
+        Runs a script in a warm worker.
+
+        If `usage` is given, it is filled with the `cpu_seconds` and `max_rss_kb` of
+        the child that ran the script.
+
+        Returns:
+            tuple: (stdout, stderr, returncode), like a `python script.py` subprocess.
+
+        Raises:
+            subprocess.TimeoutExpired: If the script runs longer than `timeout` seconds.
+            SandboxWorkerError: If the worker died before answering.
+        """
+        self._ensure_started()
+        worker = self._idle.get()
+        healthy = False
+        try:
+            result = self._run_on_worker(worker, script, timeout)
+            healthy = True
+        finally:
+            self._release(worker, healthy)
+        return self._unpack_result(worker, result, timeout, usage)
+
+    async def run_async(self, script: str, timeout: float, usage: dict | None = None) -> tuple[str, str, int]:
+        """
+        Same as `run`, but awaitable: waiting for a worker happens on the event loop and
+        only the blocking pipe I/O in a thread, so the loop keeps serving other requests
+        and waiting callers don't use up the default executor. Cancelling the caller
+        kills the script and its worker, which is replaced like a crashed one.
+        """
+        self._ensure_started()
+        worker = await self._acquire_async()
+        healthy = False
+        running = asyncio.ensure_future(asyncio.to_thread(self._run_on_worker, worker, script, timeout))
+        try:
+            result = await asyncio.shield(running)
+            healthy = True
+        except asyncio.CancelledError:
+            worker.kill()
+            # The thread sees end of file right away; wait for it before the pipes are closed
+            await asyncio.wait([running])
+            raise
+        finally:
+            self._release(worker, healthy)
+        return self._unpack_result(worker, result, timeout, usage)
+
+    def _run_on_worker(self, worker: SandboxWorker, script: str, timeout: float) -> dict:
+        worker.wait_ready(timeout + _RESPONSE_GRACE_SECONDS)
+        return worker.run(script, timeout)
+
+    def _unpack_result(self, worker: SandboxWorker, result: dict, timeout: float, usage: dict | None) -> tuple[str, str, int]:
+        with self._lock:
+            self.stats["runs"] += 1
+        if usage is not None:
+            usage["cpu_seconds"] = result["cpu_seconds"]
+            usage["max_rss_kb"] = result["max_rss_kb"]
+        if result["timed_out"]:
+            raise subprocess.TimeoutExpired(worker.process.args, timeout, output=result["stdout"], stderr=result["stderr"])
+        return result["stdout"], result["stderr"], result["returncode"]
+
+    def shutdown(self):
+        """Stops every idle worker. Busy workers are stopped when they are released."""
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.close()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self.stats)
@@ -0,0 +1,218 @@
+"""
+Warm sandbox worker, started by `SandboxPool` as `python -m src.sandbox_worker`.
+
+The worker imports the modules generated scripts need once, then reads scripts from
+stdin and runs each one in a forked child, so every script starts from the same warm
+interpreter state and nothing it does outlives the run. Results are written back on
+the original stdout.
+
+The worker itself runs without resource limits: each child applies them right after
+the fork, so every script gets the same CPU and memory budget as a `python script.py`
+run. A module is only preloaded if a child under the limits can import it, since the
+children inherit the worker's memory.
+
+Frames in both directions are a 4-byte big-endian length followed by UTF-8 JSON.
+  request:  {"script": <source>, "timeout": <seconds>}
+  response: {"stdout": ..., "stderr": ..., "returncode": ..., "timed_out": bool,
+             "cpu_seconds": ..., "max_rss_kb": ...}
+The worker announces itself with {"ready": true, "preloaded": [...]} once warm.
+"""
+import argparse
+import importlib
+import json
+import os
+import resource
+import selectors
+import signal
+import struct
+import sys
+import time
+import traceback
+
+_HEADER = struct.Struct(">I")
+
+def read_frame(fd: int) -> dict | None:
+    """Reads one frame from `fd`. Returns None at end of file."""
+    header = _read_exactly(fd, _HEADER.size)
+    if header is None:
+        return None
+    (length,) = _HEADER.unpack(header)
+    payload = _read_exactly(fd, length)
+    if payload is None:
+        return None
+    return json.loads(payload.decode("utf-8"))
+
+def write_frame(fd: int, message: dict):
+    """Writes one frame to `fd`."""
+    payload = json.dumps(message).encode("utf-8")
+    data = _HEADER.pack(len(payload)) + payload
+    while data:
+        written = os.write(fd, data)
+        data = data[written:]
+
+def _read_exactly(fd: int, size: int) -> bytes | None:
+    chunks = []
+    while size > 0:
+        chunk = os.read(fd, size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+def _run_script_in_child(script: str):
+    """Runs `script` like `python script.py` would and exits with its exit code. Never returns."""
+    exit_code = 0
+    try:
+        code = compile(script, "<sandbox>", "exec")
+        exec(code, {"__name__": "__main__", "__builtins__": __builtins__})
+    except SystemExit as e:
+        # Same conversion of the exit status as the interpreter does
+        if e.code is None:
+            exit_code = 0
+        elif isinstance(e.code, int):
+            exit_code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except BaseException:
+        traceback.print_exc()
+        exit_code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(exit_code)
+
+def apply_resource_limits(max_cpu_seconds: int | None, max_memory_bytes: int | None):
+    """Sets the CPU time and memory (RLIMIT_DATA) limits of this process, where given."""
+    try:
+        if max_cpu_seconds is not None:
+            resource.setrlimit(resource.RLIMIT_CPU, (max_cpu_seconds, max_cpu_seconds))
+        if max_memory_bytes is not None:
+            resource.setrlimit(resource.RLIMIT_DATA, (max_memory_bytes, max_memory_bytes))
+    except Exception as e:
+        sys.stderr.write(f"Error setting resource limits: {e}\n")
+
+def fits_within_limits(module_name: str, limits: dict) -> bool:
+    """Whether a child forked now can import `module_name` under `limits`."""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        exit_code = 1
+        try:
+            apply_resource_limits(**limits)
+            importlib.import_module(module_name)
+            exit_code = 0
+        except BaseException:
+            pass
+        finally:
+            os._exit(exit_code)
+    _, status = os.waitpid(pid, 0)
+    return os.waitstatus_to_exitcode(status) == 0
+
+def run_script(script: str, timeout: float, limits: dict | None = None, response_fd: int | None = None) -> dict:
+    """
+    Forks a child that runs `script`, collects its output and kills it after `timeout` seconds.
+
+    The child applies `limits` (see `apply_resource_limits`) and doesn't keep the
+    protocol pipes: stdin is /dev/null and `response_fd` is closed.
+    """
+    stdout_read, stdout_write = os.pipe()
+    stderr_read, stderr_write = os.pipe()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        os.close(stdout_read)
+        os.close(stderr_read)
+        if response_fd is not None:
+            os.close(response_fd)
+        null_fd = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(null_fd, 0)
+        os.close(null_fd)
+        os.dup2(stdout_write, 1)
+        os.dup2(stderr_write, 2)
+        os.close(stdout_write)
+        os.close(stderr_write)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        apply_resource_limits(**(limits or {}))
+        _run_script_in_child(script)
+    os.close(stdout_write)
+    os.close(stderr_write)
+
+    # Drain both pipes together so a chatty script can't block on a full pipe
+    outputs = {stdout_read: [], stderr_read: []}
+    selector = selectors.DefaultSelector()
+    selector.register(stdout_read, selectors.EVENT_READ)
+    selector.register(stderr_read, selectors.EVENT_READ)
+    deadline = time.monotonic() + timeout
+    timed_out = False
+    open_fds = 2
+    while open_fds:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            timed_out = True
+            break
+        for key, _ in selector.select(timeout=remaining):
+            chunk = os.read(key.fd, 65536)
+            if chunk:
+                outputs[key.fd].append(chunk)
+            else:
+                selector.unregister(key.fd)
+                open_fds -= 1
+    selector.close()
+    if timed_out:
+        os.kill(pid, signal.SIGKILL)
+    # wait4 also reports the resource usage of this child alone
+    _, status, usage = os.wait4(pid, 0)
+    os.close(stdout_read)
+    os.close(stderr_read)
+    return {
+        "stdout": b"".join(outputs[stdout_read]).decode("utf-8", errors="replace"),
+        "stderr": b"".join(outputs[stderr_read]).decode("utf-8", errors="replace"),
+        "returncode": os.waitstatus_to_exitcode(status),
+        "timed_out": timed_out,
+        "cpu_seconds": usage.ru_utime + usage.ru_stime,
+        "max_rss_kb": max_rss_kb(usage.ru_maxrss),
+    }
+
+def max_rss_kb(ru_maxrss: int) -> int:
+    """Converts `ru_maxrss` to kilobytes; macOS reports it in bytes, Linux in kilobytes."""
+    return ru_maxrss // 1024 if sys.platform == "darwin" else ru_maxrss
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm sandbox worker; see the module docstring.")
+    parser.add_argument("--max-cpu-seconds", type=int, default=None)
+    parser.add_argument("--max-memory-bytes", type=int, default=None)
+    parser.add_argument("preload_modules", nargs="*")
+    arguments = parser.parse_args()
+    limits = {"max_cpu_seconds": arguments.max_cpu_seconds, "max_memory_bytes": arguments.max_memory_bytes}
+
+    # Keep the protocol channel private: anything printed by this process (e.g. by a
+    # preloaded module) goes to stderr instead of corrupting the frames.
+    response_fd = os.dup(1)
+    os.dup2(2, 1)
+
+    preloaded = []
+    for module_name in arguments.preload_modules:
+        if not fits_within_limits(module_name, limits):
+            sys.stderr.write(f"Sandbox worker skips preloading {module_name}: it can't be imported within the script resource limits.\n")
+            continue
+        try:
+            importlib.import_module(module_name)
+            preloaded.append(module_name)
+        except Exception as e:
+            sys.stderr.write(f"Sandbox worker could not preload {module_name}: {e}\n")
+    write_frame(response_fd, {"ready": True, "preloaded": preloaded})
+
+    while True:
+        request = read_frame(0)
+        if request is None:
+            break # The pool closed the pipe: recycle
+        write_frame(response_fd, run_script(request["script"], request["timeout"], limits, response_fd))
+
+if __name__ == "__main__":
+    main()
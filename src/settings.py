@@ -0,0 +1,97 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _env_int(name: str, default: int) -> int:
+    """
+    Reads an integer setting from the environment, falling back to `default`
+    when the variable is unset or not a valid integer.
+    """
+    raw_value = os.environ.get(name)
+    if raw_value is None or raw_value.strip() == "":
+        return default
+    try:
+        return int(raw_value)
+    except ValueError:
+        logger.error(f"Invalid integer for {name}: {raw_value!r}. Using default {default}.")
+        return default
+
+# Conversion process pool.
+# Number of worker processes used for parse/analyze/codegen. 0 runs the pipeline
+# in a thread of the current process instead (useful for tests and debugging).
+CONVERSION_POOL_SIZE = _env_int("FORMULAS_CONVERSION_POOL_SIZE", 2)
+# Recycle a pool process after this many conversions to cap memory growth
+# from large workbooks. 0 disables recycling.
+CONVERSION_MAX_TASKS_PER_CHILD = _env_int("FORMULAS_CONVERSION_MAX_TASKS_PER_CHILD", 20)
+# Maximum number of conversions (running + waiting) per server process before
+# new requests are rejected with 503. 0 disables the limit.
+CONVERSION_MAX_QUEUE_DEPTH = _env_int("FORMULAS_CONVERSION_MAX_QUEUE_DEPTH", 8)
+
+# Conversion cache.
+# Set to 0 to disable caching of conversion results.
+CACHE_ENABLED = _env_int("FORMULAS_CACHE_ENABLED", 1)
+# Directory of the on-disk cache tier. Defaults to the `./data` volume mounted in docker-compose.
+# Empty disables the disk tier.
+CACHE_DIR = os.environ.get("FORMULAS_CACHE_DIR", os.path.join("data", "cache"))
+# Upper bound for the in-memory LRU tier, per process.
+CACHE_MEMORY_MAX_BYTES = _env_int("FORMULAS_CACHE_MEMORY_MAX_BYTES", 64 * 1024 * 1024)
+# Upper bound for the on-disk tier. 0 disables pruning.
+CACHE_DISK_MAX_BYTES = _env_int("FORMULAS_CACHE_DISK_MAX_BYTES", 1024 * 1024 * 1024)
+
+# Upload ingestion.
+# Largest accepted upload. Bodies are streamed and rejected as soon as they pass this.
+UPLOAD_MAX_BYTES = _env_int("FORMULAS_UPLOAD_MAX_BYTES", 10 * 1024 * 1024)
+# Uploads up to this size are spooled in memory; larger ones roll over to a temp file.
+UPLOAD_SPOOL_MAX_BYTES = _env_int("FORMULAS_UPLOAD_SPOOL_MAX_BYTES", 1024 * 1024)
+
+# Asynchronous jobs.
+# Directory holding the job queue database and the uploads waiting to be converted.
+# Every server and worker process that shares this directory can claim jobs.
+JOBS_DIR = os.environ.get("FORMULAS_JOBS_DIR", os.path.join("data", "jobs"))
+# Set to 0 to stop server processes from running jobs themselves (e.g. when
+# dedicated `formulas-worker` processes do it).
+JOBS_RUN_IN_SERVER = _env_int("FORMULAS_JOBS_RUN_IN_SERVER", 1)
+# Jobs run concurrently by each server or worker process.
+JOBS_CONCURRENCY = _env_int("FORMULAS_JOBS_CONCURRENCY", 1)
+# How often an idle runner looks for new jobs.
+JOBS_POLL_INTERVAL_MS = _env_int("FORMULAS_JOBS_POLL_INTERVAL_MS", 500)
+# A claimed job is renewed while it runs; if its runner dies, another runner can
+# claim it once this lease has expired.
+JOBS_LEASE_SECONDS = _env_int("FORMULAS_JOBS_LEASE_SECONDS", 120)
+# Claims of a job before it is marked failed (guards against workbooks that
+# crash every runner that picks them up).
+JOBS_MAX_ATTEMPTS = _env_int("FORMULAS_JOBS_MAX_ATTEMPTS", 3)
+
+# Sandbox.
+# Warm sandbox worker processes per server process. Each one has the resource limits
+# applied and the runtime imports loaded, and forks a child per script. 0 starts a
+# fresh interpreter for every script instead.
+SANDBOX_POOL_SIZE = _env_int("FORMULAS_SANDBOX_POOL_SIZE", 2)
+# Replace a sandbox worker after it has run this many scripts.
+SANDBOX_MAX_RUNS_PER_WORKER = _env_int("FORMULAS_SANDBOX_MAX_RUNS_PER_WORKER", 50)
+
+# Model evaluation.
+# Directory holding the compute modules of as_module conversions, which
+# /models/{id}/evaluate runs. Empty disables storing models.
+MODELS_DIR = os.environ.get("FORMULAS_MODELS_DIR", os.path.join("data", "models"))
+# Models kept compiled in memory, per process.
+MODELS_MEMORY_ENTRIES = _env_int("FORMULAS_MODELS_MEMORY_ENTRIES", 32)
+# Largest number of input rows evaluated by one request. 0 disables the limit.
+EVALUATE_MAX_ROWS = _env_int("FORMULAS_EVALUATE_MAX_ROWS", 200_000)
+
+# Metrics.
+# Directory where every server and worker process writes its metrics, so /metrics
+# can report the sum over all processes sharing it. Empty makes /metrics report
+# the answering process only.
+METRICS_DIR = os.environ.get("FORMULAS_METRICS_DIR", os.path.join("data", "metrics"))
+# How often, in milliseconds, a process writes its changed metrics to its file.
+# Bounds how stale /metrics can be, without a write per request.
+METRICS_FLUSH_INTERVAL_MS = _env_int("FORMULAS_METRICS_FLUSH_INTERVAL_MS", 1000)
+
+# Diagnostics.
+# Distinct warnings (by code) kept per request or conversion; further ones are
+# only counted, so a workbook can't grow the response or the cache without bound.
+DIAGNOSTICS_MAX_CODES = _env_int("FORMULAS_DIAGNOSTICS_MAX_CODES", 100)
+# Cell addresses kept as samples of each warning.
+DIAGNOSTICS_MAX_SAMPLES = _env_int("FORMULAS_DIAGNOSTICS_MAX_SAMPLES", 5)
@@ -0,0 +1,72 @@
+import time
+
+class StageTimings:
+    """
+    Wall and CPU time of each stage of a conversion, in milliseconds.
+
+    Can be passed as the pipeline's `progress` callback: each call ends the running
+    stage and starts the named one. CPU time is that of the calling thread, so it
+    isn't inflated by other requests handled by the same process. An optional
+    `progress` callback is forwarded every stage name (e.g. to a JobProgress).
+    """
+    def __init__(self, progress=None):
+        self.stages: dict[str, dict] = {}
+        self._progress = progress
+        self._current: str | None = None
+        self._wall_started = 0.0
+        self._cpu_started = 0.0
+
+    def __call__(self, stage: str):
+        self.stop()
+        if self._progress is not None:
+            self._progress(stage)
+        self._current = stage
+        self._wall_started = time.perf_counter()
+        self._cpu_started = time.thread_time()
+
+    def stop(self):
+        """Ends the running stage, if any."""
+        if self._current is not None:
+            self.add(self._current, time.perf_counter() - self._wall_started, time.thread_time() - self._cpu_started)
+            self._current = None
+
+    def add(self, stage: str, wall_seconds: float, cpu_seconds: float | None = None, **extra):
+        """Records a stage timed elsewhere. `cpu_seconds` is None where it can't be attributed to the request."""
+        self.stages[stage] = {
+            "wall_ms": round(wall_seconds * 1000, 3),
+            "cpu_ms": round(cpu_seconds * 1000, 3) if cpu_seconds is not None else None,
+            **extra,
+        }
+
+    def update(self, stages: dict):
+        """Adds stages recorded by another StageTimings, e.g. the one of a pool process."""
+        self.stages.update(stages)
+
+    def wall_seconds(self) -> float:
+        """Total wall time of the recorded stages."""
+        return sum(entry["wall_ms"] for entry in self.stages.values()) / 1000
+
+    def to_dict(self) -> dict:
+        return dict(self.stages)
+
+def server_timing_header(timings: dict) -> str:
+    """
+    Formats stage timings as a `Server-Timing` header value, e.g.
+    `parse;dur=12.5;desc="cpu 11.9ms", total;dur=20.1`.
+    """
+    metrics = []
+    for stage, entry in timings.items():
+        metric = f"{stage};dur={entry['wall_ms']}"
+        if entry.get("cpu_ms") is not None:
+            metric += f';desc="cpu {entry["cpu_ms"]}ms"'
+        metrics.append(metric)
+    return ", ".join(metrics)
+
+def format_timings_table(timings: dict) -> str:
+    """Formats stage timings as a plain-text table for the CLI."""
+    lines = [f"{'stage':<10} {'wall ms':>10} {'cpu ms':>10}  details"]
+    for stage, entry in timings.items():
+        cpu = f"{entry['cpu_ms']:.1f}" if entry.get("cpu_ms") is not None else "-"
+        details = ", ".join(f"{key}={value}" for key, value in entry.items() if key not in ("wall_ms", "cpu_ms"))
+        lines.append(f"{stage:<10} {entry['wall_ms']:>10.1f} {cpu:>10}  {details}".rstrip())
+    return "\n".join(lines)
@@ -0,0 +1,337 @@
+import re
+import logging
+from collections import defaultdict
+
+from .diagnostics import set_current_address
+from .formula_translator import EXCEL_FUNCTION_MAP, tokenize_formula
+from .formula_shapes import (
+    CELL_REFERENCE_TOKEN_PATTERN,
+    RELATIVE_REFERENCE_PATTERN,
+    canonicalize_formula,
+    column_index_to_letters,
+    column_letters_to_index,
+    unquote_sheet_name,
+)
+
+logger = logging.getLogger(__name__)
+
+# Filled-down runs shorter than this stay scalar; a handful of assignments is
+# cheaper to read than an array setup.
+MIN_RUN_LENGTH = 8
+
+# NumPy turns x/0 into inf and invalid operations into nan where Python raises, so
+# runs raise too, like the scalar cells they replace
+_RUN_ERROR_STATE = 'np.errstate(divide="raise", invalid="raise")'
+
+# Tokens that mean the same thing element-wise on float arrays as on scalars
+_ELEMENTWISE_OPERATORS = {"+", "-", "*", "/", "^"}
+_PARENTHESES = {"(", ")"}
+_NUMBER_PATTERN = re.compile(r'^\d+(?:\.\d+)?$')
+_ADDRESS_PATTERN = re.compile(r'^(.+?)!([A-Za-z]+)(\d+)$')
+
+class VectorRun:
+    """A block of consecutive cells in one column whose formulas share an R1C1 shape."""
+    def __init__(self, sheet: str, column: int, first_row: int, last_row: int, cells: list[str], template: list, slots: list):
+        self.sheet = sheet
+        self.column = column
+        self.first_row = first_row
+        self.last_row = last_row
+        self.cells = cells
+        # Translated parts: strs are emitted as is, ints index into `slots`
+        self.template = template
+        # One (sheet, row offset, column offset) per relative reference of the shape
+        self.slots = slots
+        self.emit_position = 0
+
+    def slot_column(self, slot: tuple) -> tuple[str, str]:
+        """Returns the (sheet, column letters) a slot reads from."""
+        sheet, _, column_offset = slot
+        return sheet or self.sheet, column_index_to_letters(self.column + column_offset)
+
+class VectorPlan:
+    """The vectorized runs of a model and the column arrays that back them."""
+    def __init__(self):
+        self.runs: list[VectorRun] = []
+        # (sheet, column letters) -> (array name, first row, last row); element i is row first + i
+        self.arrays: dict[tuple[str, str], tuple[str, int, int]] = {}
+        # Cells stored in an array element rather than a variable of their own
+        self.array_cells: set[str] = set()
+        # Cells computed by a run, and the cell after which each run is emitted
+        self.run_cells: set[str] = set()
+        self.emit_after: dict[str, VectorRun] = {}
+
+    def array_setup_lines(self, include_import: bool = True) -> list[str]:
+        """Returns the import (unless `include_import` is False) and allocation lines for the column arrays."""
+        if not self.arrays:
+            return []
+        lines = ["import numpy as np"] if include_import else []
+        for (sheet, column_letters), (array_name, first_row, last_row) in self.arrays.items():
+            lines.append(f"{array_name} = np.zeros({last_row - first_row + 1}) # {sheet}!{column_letters}{first_row}:{column_letters}{last_row}")
+        return lines
+
+    def run_lines(self, run: VectorRun) -> list[str]:
+        """Returns the lines that compute every cell of `run`: its statement, raising on division by zero."""
+        return [f"with {_RUN_ERROR_STATE}:", f"    {self.run_statement(run)}"]
+
+    def run_statement(self, run: VectorRun) -> str:
+        """Returns the single array assignment that computes every cell of `run`."""
+        parts = []
+        for part in run.template:
+            if part.__class__ is str:
+                parts.append(part)
+                continue
+            slot = run.slots[part]
+            array_name, first_row, _ = self.arrays[run.slot_column(slot)]
+            parts.append(f"{array_name}[{run.first_row + slot[1] - first_row}:{run.last_row + slot[1] - first_row + 1}]")
+        target, first_row, _ = self.arrays[(run.sheet, column_index_to_letters(run.column))]
+        return f"{target}[{run.first_row - first_row}:{run.last_row - first_row + 1}] = {''.join(parts)}"
+
+    def get_stats(self) -> dict:
+        """Returns the number of runs, the cells they cover and the arrays allocated."""
+        return {"runs": len(self.runs), "vectorized_cells": len(self.run_cells), "arrays": len(self.arrays)}
+
+def _split_address(cell_address: str, cell_positions: dict) -> tuple[str, str, int] | None:
+    """Returns (sheet, column letters, row) of a single-cell address, or None."""
+    position = cell_positions.get(cell_address)
+    if position is not None:
+        return position
+    match = _ADDRESS_PATTERN.match(cell_address)
+    if match is None:
+        return None
+    return match.group(1), match.group(2), int(match.group(3))
+
+def _compile_elementwise_shape(tokens: list[str], row: int, column: int) -> tuple[list, list] | None:
+    """
+    Translates the tokens of a formula into a template usable for a whole run, or returns
+    None if the formula is not plain arithmetic over single relative cell references.
+
+    Returns:
+        A tuple (template, slots): translated parts (strs, or ints indexing `slots`), and
+        the (sheet, row offset, column offset) of each reference.
+    """
+    template = []
+    slots = []
+    for token in tokens:
+        if CELL_REFERENCE_TOKEN_PATTERN.match(token):
+            reference_match = RELATIVE_REFERENCE_PATTERN.match(token)
+            if reference_match is None or reference_match.group(4) is not None:
+                return None # Absolute references, lowercase columns and ranges stay scalar
+            sheet, column_letters, row_number = reference_match.group(1, 2, 3)
+            if sheet is not None:
+                sheet = unquote_sheet_name(sheet)
+            template.append(len(slots))
+            slots.append((sheet, int(row_number) - row, column_letters_to_index(column_letters) - column))
+        elif token in _ELEMENTWISE_OPERATORS:
+            template.append(EXCEL_FUNCTION_MAP[token])
+        elif token in _PARENTHESES or _NUMBER_PATTERN.match(token):
+            template.append(token)
+        else:
+            return None
+    return template, slots
+
+def _array_rows(runs: list[VectorRun]) -> dict[tuple[str, str], tuple[int, int]]:
+    """Returns the (first row, last row) each column is written or read over by `runs`."""
+    array_rows = {}
+    for run in runs:
+        spans = [((run.sheet, column_index_to_letters(run.column)), run.first_row, run.last_row)]
+        spans.extend((run.slot_column(slot), run.first_row + slot[1], run.last_row + slot[1]) for slot in run.slots)
+        for column_key, first_row, last_row in spans:
+            rows = array_rows.get(column_key)
+            array_rows[column_key] = (first_row, last_row) if rows is None else (min(rows[0], first_row), max(rows[1], last_row))
+    return array_rows
+
+def _holds_numbers(model, column_key: tuple[str, str], first_row: int, last_row: int) -> bool:
+    """Returns whether every value cell of a column between two rows is a number or empty."""
+    sheet, column_letters = column_key
+    for row in range(first_row, last_row + 1):
+        cell = model.cells.get(f"{sheet}!{column_letters}{row}")
+        if cell is None or cell.formula:
+            continue
+        if cell.value is not None and cell.value != "" and not isinstance(cell.value, (int, float)):
+            return False
+    return True
+
+def plan_vectorized_runs(model, evaluation_order: list[str], fallback_cells: set[str], symbols, cell_positions: dict | None = None, min_run_length: int = MIN_RUN_LENGTH, constant_cells: dict | None = None, translation_cache=None) -> VectorPlan:
+    """
+    Finds columns filled down with one formula shape and plans a NumPy array
+    assignment for each run of them, e.g. `sheet1_C[0:50000] = sheet1_A[0:50000] * sheet1_B[0:50000]`.
+
+    Every column a run writes or reads becomes a float array over the rows the runs
+    write or read (headers above them stay out), and the cells of those rows are bound
+    to their array elements in `symbols`, so scalar formulas elsewhere keep working
+    against them. Cells that can't be vectorized stay scalar individually. A run is
+    dropped (and its cells stay scalar) if:
+      - it is shorter than `min_run_length`,
+      - it reads its own column within the run (a running total, not element-wise),
+      - a column it writes or reads holds a runtime-evaluated or non-arithmetic formula,
+        or a non-numeric value (e.g. text) within the rows of its array, since those
+        don't fit a float array,
+      - emitting it as one statement would break the evaluation order.
+
+    Unqualified references in a run are resolved against the run's own sheet.
+
+    Args:
+        model: The xlcalculator Model object.
+        evaluation_order (list[str]): Topological order from `get_evaluation_order_and_cycles`.
+        fallback_cells (set[str]): Cells evaluated at runtime with xlcalculator.Evaluator.
+        symbols: The `SymbolTable` used for code generation; cells in array columns are rebound.
+        cell_positions (dict | None): Address -> (sheet, column letters, row) from `extract_headers`.
+        min_run_length (int): Minimum number of cells in a run.
+        constant_cells (dict | None): Formula cells precomputed at conversion time, to the
+                                      literal of their value. They are assigned like
+                                      value cells; a non-numeric one makes its column unsafe.
+        translation_cache: The `TranslationCache` of the scalar cells, whose tokens are
+                           reused so each formula shape is tokenized once.
+
+    Returns:
+        VectorPlan: The runs and arrays to emit.
+    """
+    cell_positions = cell_positions or {}
+    constant_cells = constant_cells or {}
+    plan = VectorPlan()
+
+    # Group elementwise formula cells by column, and note columns that can't be arrays
+    compiled_shapes = {}
+    column_cells = defaultdict(list)
+    unsafe_columns = set()
+    for cell_address, cell in model.cells.items():
+        if not cell.formula:
+            continue
+        position = _split_address(cell_address, cell_positions)
+        if position is None:
+            continue
+        sheet, column_letters, row = position
+        column_key = (sheet, column_letters.upper())
+        if cell_address in constant_cells:
+            if not _NUMBER_PATTERN.match(constant_cells[cell_address].lstrip("-")):
+                unsafe_columns.add(column_key)
+            continue
+        if cell_address in fallback_cells:
+            unsafe_columns.add(column_key)
+            continue
+        column = column_letters_to_index(column_letters)
+        shape, _ = canonicalize_formula(cell.formula, row, column)
+        if shape not in compiled_shapes:
+            set_current_address(cell_address) # Sample address of tokenization warnings
+            tokens = translation_cache.tokens_for(shape, cell.formula) if translation_cache is not None else tokenize_formula(cell.formula)
+            compiled_shapes[shape] = _compile_elementwise_shape(tokens, row, column)
+        if compiled_shapes[shape] is None:
+            unsafe_columns.add(column_key)
+            continue
+        column_cells[column_key].append((row, shape, cell_address))
+    set_current_address(None)
+
+    # Split each column into runs of consecutive rows sharing a shape
+    candidate_runs = []
+    for (sheet, column_letters), cells in column_cells.items():
+        if (sheet, column_letters) in unsafe_columns:
+            continue
+        cells.sort()
+        column = column_letters_to_index(column_letters)
+        run_start = 0
+        for index in range(1, len(cells) + 1):
+            if index < len(cells) and cells[index][1] == cells[run_start][1] and cells[index][0] == cells[index - 1][0] + 1:
+                continue
+            if index - run_start >= min_run_length:
+                template, slots = compiled_shapes[cells[run_start][1]]
+                candidate_runs.append(VectorRun(
+                    sheet, column, cells[run_start][0], cells[index - 1][0],
+                    [address for _, _, address in cells[run_start:index]], template, slots
+                ))
+            run_start = index
+
+    runs = []
+    for run in candidate_runs:
+        run_length = run.last_row - run.first_row + 1
+        reads_own_cells = any(
+            (slot[0] or run.sheet) == run.sheet and slot[2] == 0 and abs(slot[1]) < run_length
+            for slot in run.slots
+        )
+        reads_unsafe_column = any(run.slot_column(slot) in unsafe_columns for slot in run.slots)
+        if not reads_own_cells and not reads_unsafe_column:
+            runs.append(run)
+
+    # A run is emitted as one statement in place of its last cell in evaluation order.
+    # Drop runs until every dependency is still computed before its dependents.
+    position_of = {cell_address: position for position, cell_address in enumerate(evaluation_order)}
+    run_of = {}
+    runs = [run for run in runs if all(cell_address in position_of for cell_address in run.cells)]
+    for run in runs:
+        run.emit_position = max(position_of[cell_address] for cell_address in run.cells)
+        for cell_address in run.cells:
+            run_of[cell_address] = run
+    # Only dependencies that touch a run can be broken by emitting it late
+    edges = []
+    for cell_address, cell in model.cells.items():
+        dependent_in_run = cell_address in run_of
+        for precedent in cell.precedents or []:
+            if dependent_in_run or precedent.formula_address in run_of:
+                edges.append((precedent.formula_address, cell_address))
+
+    dropped = True
+    while dropped:
+        dropped = False
+        for precedent_address, dependent_address in edges:
+            precedent_run = run_of.get(precedent_address)
+            dependent_run = run_of.get(dependent_address)
+            if precedent_run is not None and precedent_run is dependent_run:
+                continue
+            precedent_position = precedent_run.emit_position if precedent_run else position_of.get(precedent_address)
+            if precedent_position is None:
+                continue # Empty cell, never assigned
+            dependent_position = dependent_run.emit_position if dependent_run else position_of.get(dependent_address, -1)
+            if precedent_position < dependent_position:
+                continue
+            run_to_drop = precedent_run or dependent_run
+            if run_to_drop is None:
+                continue
+            for cell_address in run_to_drop.cells:
+                del run_of[cell_address]
+            runs.remove(run_to_drop)
+            dropped = True
+
+    # Allocate one array per column written or read by a surviving run, over the rows
+    # the runs touch. Runs touching a column with a non-numeric value in those rows are
+    # dropped, which can only shrink the other arrays, until none is left.
+    while True:
+        array_rows = _array_rows(runs)
+        unsafe_columns = {
+            column_key for column_key, (first_row, last_row) in array_rows.items()
+            if not _holds_numbers(model, column_key, first_row, last_row)
+        }
+        if not unsafe_columns:
+            break
+        runs = [
+            run for run in runs
+            if (run.sheet, column_index_to_letters(run.column)) not in unsafe_columns
+            and not any(run.slot_column(slot) in unsafe_columns for slot in run.slots)
+        ]
+    if not array_rows:
+        return plan
+
+    bound_cells = []
+    for cell_address in evaluation_order:
+        position = _split_address(cell_address, cell_positions)
+        if position is None:
+            continue
+        column_key = (position[0], position[1].upper())
+        rows = array_rows.get(column_key)
+        if rows is not None and rows[0] <= position[2] <= rows[1]:
+            bound_cells.append((cell_address, column_key, position[2]))
+
+    for (sheet, column_letters), (first_row, last_row) in array_rows.items():
+        sheet_prefix = re.sub(r'[^a-zA-Z0-9_]', '_', sheet.lower())
+        plan.arrays[(sheet, column_letters)] = (symbols.reserve(f"{sheet_prefix}_{column_letters}"), first_row, last_row)
+    for cell_address, column_key, row in bound_cells:
+        array_name, first_row, _ = plan.arrays[column_key]
+        symbols.bind(cell_address, f"{array_name}[{row - first_row}]")
+        plan.array_cells.add(cell_address)
+
+    for run in runs:
+        plan.runs.append(run)
+        plan.run_cells.update(run.cells)
+        # Emit after the run's last cell in evaluation order
+        plan.emit_after[evaluation_order[run.emit_position]] = run
+
+    logger.info(f"Vectorized {len(plan.run_cells)} cells into {len(plan.runs)} array assignments over {len(plan.arrays)} columns.")
+    return plan
@@ -0,0 +1,406 @@
+"""
+Streaming .xlsx reader, an alternative to `ModelCompiler().read_and_parse_archive`.
+
+xlcalculator loads every cell of every sheet into Python objects (through openpyxl)
+before the converter looks at a single formula, which takes gigabytes of memory on
+sheets with a few hundred thousand cells. `read_workbook_streaming` instead parses the
+worksheet XML incrementally, straight from the ZIP archive, and keeps only what the
+converter reads:
+
+- formulas, with shared-formula groups expanded to each cell of the group,
+- the constants those formulas reference, and the first row of each sheet (headers
+  name the variables of the generated code),
+- defined names, which are replaced by the cells or ranges they refer to.
+
+Memory is bounded by the formulas and the cells they reference rather than by the
+size of the workbook: the sheets are read twice (formulas first, then the referenced
+constants) and every row is dropped once it has been read.
+
+The result exposes `cells` like `xlcalculator.model.Model` with the attributes the
+converter reads (`formula`, `formula_address`, `value`, `precedents`). Formulas have
+no leading "=", `$` markers are removed and every reference is qualified with its
+sheet (`A1` on Sheet1 becomes `Sheet1!A1`). Values are not styled: dates are their
+serial numbers.
+"""
+import logging
+import posixpath
+import re
+import zipfile
+from io import BytesIO
+from xml.etree.ElementTree import iterparse
+
+from .diagnostics import warn
+from .formula_shapes import column_letters_to_index, column_index_to_letters
+
+logger = logging.getLogger(__name__)
+
+_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_RELATIONSHIPS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+_RELATIONSHIP_ID = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+_OFFICE_DOCUMENT = "/officeDocument"
+_WORKSHEET = "/worksheet"
+
+# A string literal (1), a cell or range reference with an optional sheet (2-4), or an
+# identifier such as a function or defined name (5). Everything else is copied as is.
+_FORMULA_TOKEN_PATTERN = re.compile(r"""
+    ("(?:[^"]|"")*")
+    | (?<![A-Za-z0-9_.$])
+      (?:('(?:[^']|'')+'|[A-Za-z_][A-Za-z0-9_.]*)!)?
+      (\$?[A-Za-z]{1,3}\$?[0-9]+)(?::(\$?[A-Za-z]{1,3}\$?[0-9]+))?
+      (?![A-Za-z0-9_(.!])
+    | ([A-Za-z_\\][A-Za-z0-9_.\\]*)
+""", re.VERBOSE)
+_CELL_PATTERN = re.compile(r"^(\$?)([A-Za-z]{1,3})(\$?)([0-9]+)$")
+_UNQUOTED_SHEET_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_.]*$")
+# Prefixes Excel stores in front of functions newer than the file format
+_FUNCTION_PREFIXES = ("_xlfn.", "_xlws.")
+
+class StreamingCell:
+    """A cell with the attributes the converter reads from xlcalculator's cells."""
+    __slots__ = ("formula_address", "formula", "value", "precedents")
+
+    def __init__(self, formula_address: str, formula: str | None = None, value=None):
+        self.formula_address = formula_address
+        self.formula = formula
+        self.value = value
+        self.precedents: list["StreamingCell"] = []
+
+class StreamingModel:
+    """
+    Cells read by `read_workbook_streaming`, in sheet/row/column order.
+
+    Exposes `cells` like `xlcalculator.model.Model`, plus `defined_names` (name ->
+    the reference or expression it stands for) and `ranges` (the ranges formulas
+    read, address -> address, as xlcalculator names the ranges it builds).
+    """
+    def __init__(self, cells: dict[str, StreamingCell], defined_names: dict[str, str], ranges: dict[str, str] | None = None):
+        self.cells = cells
+        self.defined_names = defined_names
+        self.ranges = ranges if ranges is not None else {}
+
+class StreamedSheet:
+    """A sheet being streamed and what the first pass learned about it."""
+    def __init__(self, index: int, name: str, path: str):
+        self.index = index
+        self.name = name
+        self.path = path
+        # How references to this sheet are written in normalized formulas
+        self.prefix = name if _UNQUOTED_SHEET_PATTERN.match(name) else "'" + name.replace("'", "''") + "'"
+        self.max_row = 0
+        self.max_column = 0
+
+def _unquote_sheet(sheet: str) -> str:
+    if sheet.startswith("'"):
+        return sheet[1:-1].replace("''", "'")
+    return sheet
+
+def _shift_cell(cell: str, row_offset: int, column_offset: int) -> tuple[str, int, int]:
+    """Moves a relative cell reference (e.g. shared formulas); returns (text without `$`, row, column)."""
+    absolute_column, letters, absolute_row, digits = _CELL_PATTERN.match(cell).groups()
+    column = column_letters_to_index(letters)
+    row = int(digits)
+    if not absolute_column:
+        column += column_offset
+    if not absolute_row:
+        row += row_offset
+    return f"{column_index_to_letters(column)}{row}", row, column
+
+class FormulaNormalizer:
+    """Rewrites formulas as written in a sheet into the form the converter reads, collecting their references."""
+    def __init__(self, sheets_by_name: dict[str, StreamedSheet], defined_names: dict[str, str] | None = None):
+        self.sheets_by_name = sheets_by_name
+        # Names that stand for one cell or range, upper-cased (names are case-insensitive)
+        self.reference_names: dict[str, str] = {}
+        for name, definition in (defined_names or {}).items():
+            match = _FORMULA_TOKEN_PATTERN.fullmatch(definition.strip())
+            if match is not None and match.group(2) and match.group(3):
+                self.reference_names[name.upper()] = definition.strip()
+        # Ranges of the normalized formulas, in the order they were first read; unquoted
+        # like the addresses xlcalculator's parser gives them
+        self.ranges: dict[str, str] = {}
+
+    def normalize(self, formula: str, sheet: StreamedSheet, row_offset: int = 0, column_offset: int = 0) -> tuple[str, list[tuple[str, int, int, int, int]]]:
+        """
+        Returns the formula with qualified, `$`-free references (moved by the offsets,
+        for shared formulas) and its references as (sheet name, first row, first
+        column, last row, last column).
+        """
+        references = []
+        def replace(match: re.Match) -> str:
+            if match.group(1) is not None:
+                return match.group(1)
+            if match.group(5) is not None:
+                identifier = match.group(5)
+                next_character = match.string[match.end():match.end() + 1]
+                if next_character == "(":
+                    for prefix in _FUNCTION_PREFIXES:
+                        while identifier.startswith(prefix):
+                            identifier = identifier[len(prefix):]
+                    return identifier
+                definition = self.reference_names.get(identifier.upper())
+                if definition is None:
+                    return identifier
+                # Defined names refer to absolute references, so no offsets apply
+                text, name_references = self.normalize(definition, sheet)
+                references.extend(name_references)
+                return text
+            sheet_text, first, last = match.group(2), match.group(3), match.group(4)
+            target = sheet if sheet_text is None else self.sheets_by_name.get(_unquote_sheet(sheet_text))
+            first_text, first_row, first_column = _shift_cell(first, row_offset, column_offset)
+            if last is None:
+                last_text, last_row, last_column = first_text, first_row, first_column
+                text = first_text
+            else:
+                last_text, last_row, last_column = _shift_cell(last, row_offset, column_offset)
+                text = f"{first_text}:{last_text}"
+            if target is None:
+                # Another workbook, or a sheet this archive doesn't have
+                return f"{sheet_text}!{text}"
+            references.append((target.name, min(first_row, last_row), min(first_column, last_column), max(first_row, last_row), max(first_column, last_column)))
+            if last is not None:
+                self.ranges.setdefault(f"{target.name}!{text}", f"{target.name}!{text}")
+            return f"{target.prefix}!{text}"
+        return _FORMULA_TOKEN_PATTERN.sub(replace, formula), references
+
+def expand_references(references: list[tuple[str, int, int, int, int]], sheets_by_name: dict[str, StreamedSheet]):
+    """Yields the address of every cell of `references`, ranges clipped to the part of their sheet in use."""
+    for sheet_name, first_row, first_column, last_row, last_column in references:
+        sheet = sheets_by_name[sheet_name]
+        for row in range(first_row, min(last_row, sheet.max_row) + 1):
+            for column in range(first_column, min(last_column, sheet.max_column) + 1):
+                yield f"{sheet_name}!{column_index_to_letters(column)}{row}"
+
+def link_streaming_model(cells: dict[str, StreamingCell], positions: dict[str, tuple[int, int, int]], references_by_cell: dict[str, list], sheets_by_name: dict[str, StreamedSheet], defined_names: dict[str, str], ranges: dict[str, str]) -> StreamingModel:
+    """
+    Sets the precedents of every formula cell, once each (referenced cells the sheet
+    doesn't have are left out), and returns the model with its cells in the order of
+    their (sheet, row, column) `positions`.
+    """
+    for address, references in references_by_cell.items():
+        precedent_addresses = dict.fromkeys(expand_references(references, sheets_by_name))
+        cells[address].precedents = [cells[precedent] for precedent in precedent_addresses if precedent in cells]
+    ordered_cells = {address: cells[address] for address in sorted(cells, key=positions.__getitem__)}
+    return StreamingModel(ordered_cells, defined_names, ranges)
+
+def _read_relationships(archive: zipfile.ZipFile, part: str) -> dict[str, tuple[str, str]]:
+    """Returns {relationship id: (type, target path in the archive)} of a part."""
+    directory, name = posixpath.split(part)
+    relationships_path = posixpath.join(directory, "_rels", f"{name}.rels")
+    relationships = {}
+    if relationships_path not in archive.namelist():
+        return relationships
+    with archive.open(relationships_path) as f:
+        for _, element in iterparse(f):
+            if element.tag == f"{_RELATIONSHIPS}Relationship":
+                target = element.get("Target", "")
+                target = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join(directory, target))
+                relationships[element.get("Id")] = (element.get("Type", ""), target)
+    return relationships
+
+def _read_workbook_part(archive: zipfile.ZipFile) -> tuple[list[StreamedSheet], dict[str, str]]:
+    """Returns the worksheets, in workbook order, and the defined names of the workbook."""
+    workbook_path = "xl/workbook.xml"
+    for relationship_type, target in _read_relationships(archive, "").values():
+        if relationship_type.endswith(_OFFICE_DOCUMENT):
+            workbook_path = target
+    relationships = _read_relationships(archive, workbook_path)
+    sheets = []
+    defined_names = {}
+    with archive.open(workbook_path) as f:
+        for _, element in iterparse(f):
+            if element.tag == f"{_MAIN}sheet":
+                relationship_type, target = relationships.get(element.get(_RELATIONSHIP_ID), ("", ""))
+                if relationship_type.endswith(_WORKSHEET):
+                    sheets.append(StreamedSheet(len(sheets), element.get("name"), target))
+            elif element.tag == f"{_MAIN}definedName":
+                # Sheet-scoped names are rare in models; the first definition of a name wins
+                name = element.get("name")
+                if not name.startswith("_xlnm.") and name not in defined_names:
+                    defined_names[name] = element.text or ""
+    return sheets, defined_names
+
+def _iter_rows(archive: zipfile.ZipFile, sheet: StreamedSheet):
+    """Yields (row, [(column, cell element)]) for each row of a worksheet, dropping rows once read."""
+    with archive.open(sheet.path) as f:
+        sheet_data = None
+        for event, element in iterparse(f, events=("start", "end")):
+            if event == "start":
+                if element.tag == f"{_MAIN}sheetData":
+                    sheet_data = element
+                continue
+            if element.tag != f"{_MAIN}row":
+                continue
+            row = int(element.get("r") or sheet.max_row + 1)
+            cells = []
+            column = 0
+            for cell in element.iter(f"{_MAIN}c"):
+                reference = cell.get("r")
+                if reference:
+                    column = column_letters_to_index(reference.rstrip("0123456789"))
+                else:
+                    column += 1
+                cells.append((column, cell))
+            yield row, cells
+            if sheet_data is not None:
+                sheet_data.clear()
+
+def _cell_value(cell, shared_string_indexes: set[int] | None = None):
+    """Returns the value of a cell element; shared strings as their index wrapped in `_SharedString`."""
+    cell_type = cell.get("t", "n")
+    if cell_type == "inlineStr":
+        inline = cell.find(f"{_MAIN}is")
+        return "".join(text.text or "" for text in inline.iter(f"{_MAIN}t")) if inline is not None else ""
+    value = cell.find(f"{_MAIN}v")
+    if value is None or value.text is None:
+        return None
+    text = value.text
+    if cell_type == "n":
+        try:
+            return int(text)
+        except ValueError:
+            return float(text)
+    if cell_type == "b":
+        return text == "1"
+    if cell_type == "s":
+        index = int(text)
+        if shared_string_indexes is not None:
+            shared_string_indexes.add(index)
+        return _SharedString(index)
+    # "str" (formula results) and "e" (errors such as #DIV/0!)
+    return text
+
+class _SharedString:
+    """Placeholder for a shared string, resolved once the string table has been read."""
+    __slots__ = ("index",)
+
+    def __init__(self, index: int):
+        self.index = index
+
+def _read_shared_strings(archive: zipfile.ZipFile, indexes: set[int]) -> dict[int, str]:
+    """Returns the strings of the shared string table at `indexes`, skipping the rest."""
+    path = "xl/sharedStrings.xml"
+    strings = {}
+    if not indexes or path not in archive.namelist():
+        return strings
+    with archive.open(path) as f:
+        index = 0
+        table = None
+        for event, element in iterparse(f, events=("start", "end")):
+            if event == "start":
+                if element.tag == f"{_MAIN}sst":
+                    table = element
+                continue
+            if element.tag != f"{_MAIN}si":
+                continue
+            if index in indexes:
+                # Rich text has several runs; phonetic hints (rPh) aren't part of the text
+                strings[index] = "".join(
+                    text.text or "" for child in element if child.tag != f"{_MAIN}rPh"
+                    for text in ([child] if child.tag == f"{_MAIN}t" else child.iter(f"{_MAIN}t"))
+                )
+            index += 1
+            if table is not None:
+                table.clear()
+    return strings
+
+def read_workbook_streaming(file_content: bytes, report: dict | None = None) -> StreamingModel:
+    """
+    Reads the formulas of an .xlsx workbook, and the constants they reference, without
+    loading the rest of the workbook.
+
+    Args:
+        file_content (bytes): Raw bytes of the .xlsx file.
+        report (dict | None): If provided, `report["ingest"]` is set to the number of
+                              sheets, formulas (and how many came from shared-formula
+                              groups), constants kept and skipped, and defined names.
+
+    Returns:
+        StreamingModel: The cells the converter needs, in sheet/row/column order.
+
+    Raises:
+        zipfile.BadZipFile, KeyError, xml.etree.ElementTree.ParseError: If the file is
+            not a readable .xlsx archive.
+    """
+    archive = zipfile.ZipFile(BytesIO(file_content))
+    sheets, defined_names = _read_workbook_part(archive)
+    sheets_by_name = {sheet.name: sheet for sheet in sheets}
+    normalizer = FormulaNormalizer(sheets_by_name, defined_names)
+
+    # First pass: formulas and their references
+    cells: dict[str, StreamingCell] = {}
+    # (sheet, row, column) of each cell, to put the cells of both passes in workbook order
+    positions: dict[str, tuple[int, int, int]] = {}
+    references_by_cell: dict[str, list] = {}
+    shared_formula_cells = 0
+    for sheet in sheets:
+        # Shared-formula groups: index -> (formula of the first cell, its row and column)
+        shared_formulas: dict[str, tuple[str, int, int]] = {}
+        for row, row_cells in _iter_rows(archive, sheet):
+            sheet.max_row = max(sheet.max_row, row)
+            for column, cell in row_cells:
+                sheet.max_column = max(sheet.max_column, column)
+                formula_element = cell.find(f"{_MAIN}f")
+                if formula_element is None or formula_element.get("t") == "dataTable":
+                    continue
+                address = f"{sheet.name}!{column_index_to_letters(column)}{row}"
+                text = formula_element.text
+                shared_index = formula_element.get("si") if formula_element.get("t") == "shared" else None
+                if shared_index is not None and not text:
+                    group = shared_formulas.get(shared_index)
+                    if group is None:
+                        warn(logger, "orphan_shared_formula", "Cell %s belongs to a shared formula whose first cell wasn't found; it is read as a constant.", address, address=address)
+                        continue
+                    formula, references = normalizer.normalize(group[0], sheet, row - group[1], column - group[2])
+                    shared_formula_cells += 1
+                else:
+                    if not text:
+                        # The other cells of an array formula only hold its results
+                        continue
+                    if shared_index is not None:
+                        shared_formulas[shared_index] = (text, row, column)
+                    formula, references = normalizer.normalize(text, sheet)
+                cells[address] = StreamingCell(address, formula, _cell_value(cell))
+                positions[address] = (sheet.index, row, column)
+                references_by_cell[address] = references
+
+    # Cells the formulas read
+    referenced: set[str] = set()
+    for references in references_by_cell.values():
+        referenced.update(expand_references(references, sheets_by_name))
+
+    # Second pass: the constants among them, plus the header row of each sheet
+    constants = 0
+    skipped_constants = 0
+    shared_string_indexes: set[int] = set()
+    for sheet in sheets:
+        for row, row_cells in _iter_rows(archive, sheet):
+            for column, cell in row_cells:
+                address = f"{sheet.name}!{column_index_to_letters(column)}{row}"
+                if address in cells:
+                    continue
+                if row != 1 and address not in referenced:
+                    skipped_constants += 1
+                    continue
+                value = _cell_value(cell, shared_string_indexes)
+                if value is None and address not in referenced:
+                    continue
+                cells[address] = StreamingCell(address, None, value)
+                positions[address] = (sheet.index, row, column)
+                constants += 1
+    shared_strings = _read_shared_strings(archive, shared_string_indexes)
+    for cell in cells.values():
+        if isinstance(cell.value, _SharedString):
+            cell.value = shared_strings.get(cell.value.index, "")
+
+    logger.info(f"Streamed {len(references_by_cell)} formulas and {constants} constants from {len(sheets)} sheets ({skipped_constants} unreferenced constants skipped).")
+    if report is not None:
+        report["ingest"] = {
+            "engine": "streaming",
+            "sheets": len(sheets),
+            "formulas": len(references_by_cell),
+            "shared_formula_cells": shared_formula_cells,
+            "constants": constants,
+            "skipped_constants": skipped_constants,
+            "defined_names": len(defined_names),
+        }
+    return link_streaming_model(cells, positions, references_by_cell, sheets_by_name, defined_names, normalizer.ranges)
@@ -1,6 +1,14 @@
 import pytest
 import tempfile
 import os
+
+# Run conversions in a thread of the test process so mocks patched in tests apply
+os.environ.setdefault("FORMULAS_CONVERSION_POOL_SIZE", "0")
+# Every test starts from a cold pipeline; cache behavior is tested explicitly
+os.environ.setdefault("FORMULAS_CACHE_ENABLED", "0")
+# Keep the job queue of the tests out of ./data
+os.environ.setdefault("FORMULAS_JOBS_DIR", tempfile.mkdtemp(prefix="formulas-jobs-"))
+
 from unittest.mock import MagicMock
 from xlcalculator.model import Model
 
@@ -0,0 +1,121 @@
+import json
+import os
+import pytest
+from unittest.mock import patch
+
+from src.batch import collect_input_files, plan_output_paths, convert_file, run_batch, write_summary
+from src.conversion_cache import ConversionCache
+
+def _fake_convert(file_content, force_evaluator=False, vectorize=False, progress=None, as_module=False, targets=None, inputs=None, optimize=False, engine="xlcalculator"):
+    timings = {stage: {"wall_ms": 1.0, "cpu_ms": 1.0} for stage in ("parse", "order", "naming", "codegen")}
+    return {"script": f"# {len(file_content)} bytes", "warnings": ["a warning"], "report": {"cells": 1}, "timings": timings}
+
+class TestBatch:
+    """Tests for the formulas-cli batch mode."""
+
+    @pytest.fixture
+    def books(self, tmp_path):
+        """Create a small tree of input files, plus a file that is not an input."""
+        for relative_path in ("a.xlsx", "a.csv", "nested/b.tsv", "nested/deeper/c.xlsx", "notes.txt"):
+            path = tmp_path / "books" / relative_path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b"PK\x03\x04" + relative_path.encode())
+        return tmp_path / "books"
+
+    @pytest.fixture(autouse=True)
+    def cold_cache(self):
+        """Give every test a fresh, disabled per-process conversion cache."""
+        with patch("src.batch._worker_cache", ConversionCache(None, 0, enabled=False)):
+            yield
+
+    def test_collect_input_files_from_directories_and_globs(self, books):
+        """Test that directories are searched recursively and globs support `**`."""
+        files, unmatched = collect_input_files([str(books / "nested"), str(books / "**" / "*.xlsx"), str(books / "missing*.xlsx")])
+        paths = [os.path.relpath(path, books) for path, _ in files]
+        assert paths == ["a.xlsx", os.path.join("nested", "b.tsv"), os.path.join("nested", "deeper", "c.xlsx")]
+        assert unmatched == [str(books / "missing*.xlsx")]
+
+    def test_plan_output_paths_mirrors_layout_and_avoids_collisions(self, books, tmp_path):
+        """Test that scripts mirror the input tree and same-stem inputs get distinct names."""
+        files, _ = collect_input_files([str(books)])
+        output_paths = plan_output_paths(files, str(tmp_path / "out"))
+        assert output_paths[str(books / "a.csv")] == str(tmp_path / "out" / "a.py")
+        assert output_paths[str(books / "a.xlsx")] == str(tmp_path / "out" / "a_xlsx.py")
+        assert output_paths[str(books / "nested" / "deeper" / "c.xlsx")] == str(tmp_path / "out" / "nested" / "deeper" / "c.py")
+
+    @patch("src.batch.convert_workbook", side_effect=_fake_convert)
+    def test_convert_file_reports_stage_timings(self, mock_convert, books, tmp_path):
+        """Test that a converted file has its script written and a timing per stage."""
+        output_path = str(tmp_path / "out" / "a.py")
+        entry = convert_file(str(books / "a.xlsx"), output_path)
+
+        assert entry["status"] == "succeeded"
+        assert entry["warnings"] == ["a warning"]
+        assert list(entry["timings"]) == ["read", "parse", "order", "naming", "codegen", "write", "total"]
+        assert entry["timings"]["total"]["wall_ms"] >= entry["timings"]["read"]["wall_ms"]
+        with open(output_path) as f:
+            assert f.read().startswith("# ")
+
+    @patch("src.batch.convert_workbook", side_effect=ValueError("unparseable"))
+    def test_convert_file_reports_failures(self, mock_convert, books, tmp_path):
+        """Test that a failing conversion is reported instead of raised."""
+        entry = convert_file(str(books / "a.xlsx"), str(tmp_path / "a.py"))
+        assert entry["status"] == "failed"
+        assert entry["error"] == "unparseable"
+        assert not os.path.exists(tmp_path / "a.py")
+
+    @patch("src.batch.convert_workbook", side_effect=_fake_convert)
+    def test_convert_file_reuses_worker_cache(self, mock_convert, books, tmp_path):
+        """Test that a worker serves a repeated workbook from its conversion cache."""
+        with patch("src.batch._worker_cache", ConversionCache(None, 1024 * 1024)):
+            convert_file(str(books / "a.xlsx"), str(tmp_path / "first.py"))
+            entry = convert_file(str(books / "a.xlsx"), str(tmp_path / "second.py"))
+        assert entry["cached"] is True
+        assert mock_convert.call_count == 1
+        # Timings of the first conversion aren't replayed from the cache
+        assert "parse" not in entry["timings"]
+
+    @patch("src.batch.convert_workbook", side_effect=_fake_convert)
+    def test_convert_file_reads_delimited_files_with_their_engine(self, mock_convert, books, tmp_path):
+        """Test that CSV and TSV files are converted with the delimited-text engine."""
+        convert_file(str(books / "nested" / "b.tsv"), str(tmp_path / "b.py"), engine="streaming")
+        convert_file(str(books / "a.xlsx"), str(tmp_path / "a.py"), engine="streaming")
+        assert [call.kwargs["engine"] for call in mock_convert.call_args_list] == ["tsv", "streaming"]
+
+    @patch("src.batch.build_model_artifact", return_value=b"rebuilt")
+    @patch("src.batch.convert_workbook")
+    def test_convert_file_writes_the_compiled_model(self, mock_convert, mock_build_artifact, books, tmp_path):
+        """Test that runtime-evaluated cells get their compiled model next to the script, cached or not."""
+        conversion = _fake_convert(b"")
+        conversion.update(report={"fallback_cells": 1}, model_artifact=b"artifact")
+        mock_convert.return_value = conversion
+        with patch("src.batch._worker_cache", ConversionCache(None, 1024 * 1024)):
+            convert_file(str(books / "a.xlsx"), str(tmp_path / "first.py"))
+            entry = convert_file(str(books / "a.xlsx"), str(tmp_path / "second.py"))
+
+        assert (tmp_path / "first.xlmodel").read_bytes() == b"artifact"
+        # The cache keeps no bytes, so a cached conversion parses the workbook for its model
+        assert entry["cached"] is True
+        assert (tmp_path / "second.xlmodel").read_bytes() == b"rebuilt"
+        assert "artifact" in entry["timings"]
+
+    @patch("src.batch.convert_workbook", side_effect=_fake_convert)
+    def test_run_batch_in_process(self, mock_convert, books, tmp_path):
+        """Test the summary of a batch converted in this process."""
+        summary = run_batch([str(books)], jobs=1, output_dir=str(tmp_path / "out"))
+        assert (summary["total"], summary["succeeded"], summary["failed"]) == (4, 4, 0)
+        assert [entry["input"] for entry in summary["files"]] == sorted(entry["input"] for entry in summary["files"])
+
+        summary_path = str(tmp_path / "out" / "summary.json")
+        write_summary(summary, summary_path)
+        with open(summary_path) as f:
+            assert json.load(f)["succeeded"] == 4
+
+    def test_run_batch_in_worker_processes(self, books, tmp_path):
+        """Test that a process-pool batch reports every file, including failed ones."""
+        with patch("src.batch.convert_workbook", side_effect=ValueError("unparseable")):
+            summary = run_batch([str(books)], jobs=2, output_dir=str(tmp_path / "out"))
+        assert summary["jobs"] == 2
+        assert summary["total"] == 4
+        assert summary["failed"] == 4
+        assert all(entry["error"] == "unparseable" for entry in summary["files"])
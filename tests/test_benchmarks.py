@@ -0,0 +1,96 @@
+import io
+import pytest
+
+from benchmarks.synthetic_workbook import WorkbookProfile, generate_workbook, _column_layers
+from benchmarks.run_benchmarks import compare_to_baseline, check_scaling
+
+class TestSyntheticWorkbook:
+    """Tests for the benchmark workbook generator."""
+
+    def test_same_profile_generates_same_workbook(self):
+        """Test that generation is deterministic for a seed and varies across seeds."""
+        profile = WorkbookProfile("p", sheets=2, rows=30, columns=6, cross_sheet_ratio=0.5, seed=7)
+        assert generate_workbook(profile).cells == generate_workbook(profile).cells
+        other = WorkbookProfile("p", sheets=2, rows=30, columns=6, cross_sheet_ratio=0.5, seed=8)
+        assert generate_workbook(profile).cells != generate_workbook(other).cells
+
+    def test_formulas_only_read_the_layer_below(self):
+        """Test that references respect the dependency layers, so depth is bounded and there are no cycles."""
+        profile = WorkbookProfile("p", rows=20, columns=10, dependency_depth=4)
+        workbook = generate_workbook(profile)
+        layers = _column_layers(profile)
+        column_layer = {chr(ord("A") + index): layer for index, layer in enumerate(layers)}
+        for address, precedents in workbook.references.items():
+            layer = column_layer[address.split("!")[1][0]]
+            assert all(column_layer[precedent.split("!")[1][0]] == layer - 1 for precedent in precedents)
+
+    def test_density_ranges_and_fan_out(self):
+        """Test the effect of formula density, range size and fan-out."""
+        assert generate_workbook(WorkbookProfile("p", rows=20, columns=5, formula_density=0)).formula_count == 0
+
+        ranges = generate_workbook(WorkbookProfile("p", rows=40, columns=4, range_size=10, function_mix={"sum": 1}))
+        assert all(len(precedents) == 10 for precedents in ranges.references.values())
+
+        def distinct_precedents(fan_out):
+            workbook = generate_workbook(WorkbookProfile("p", rows=100, columns=4, dependency_depth=1, fan_out=fan_out, function_mix={"arithmetic": 1}))
+            return len({precedent for precedents in workbook.references.values() for precedent in precedents})
+        assert distinct_precedents(20) < distinct_precedents(1)
+
+    def test_model_and_xlsx_output(self):
+        """Test that the in-memory model resolves precedents and the .xlsx holds the same cells."""
+        openpyxl = pytest.importorskip("openpyxl")
+        workbook = generate_workbook(WorkbookProfile("p", rows=10, columns=4, dependency_depth=1, function_mix={"arithmetic": 1}))
+        model = workbook.to_model()
+        address, precedents = next(iter(workbook.references.items()))
+        assert [cell.formula_address for cell in model.cells[address].precedents] == precedents
+
+        sheet = openpyxl.load_workbook(io.BytesIO(workbook.to_xlsx_bytes()))["Sheet1"]
+        assert sheet[address.split("!")[1]].value == f"={workbook.cells[address][0]}"
+
+class TestBenchmarkComparison:
+    """Tests for the regression checks of the benchmark suite."""
+
+    @pytest.fixture
+    def baseline(self):
+        return {
+            "calibration_seconds": 1.0,
+            "thresholds": {"default": 1.5},
+            "noise_floor_seconds": 0.005,
+            "profiles": {"p": {"stages": {"order": 0.1, "codegen": 0.001}}},
+        }
+
+    def _results(self, order, codegen, calibration=1.0):
+        return {"calibration_seconds": calibration, "profiles": {"p": {"formulas": 100, "stages": {"order": order, "codegen": codegen, "parse": None}}}}
+
+    def test_flags_stage_past_threshold(self, baseline):
+        """Test that only stages slower than baseline * threshold are reported."""
+        assert compare_to_baseline(self._results(0.14, 0.001), baseline) == []
+        regressions = compare_to_baseline(self._results(0.2, 0.001), baseline)
+        assert len(regressions) == 1 and regressions[0].startswith("p/order")
+
+    def test_ignores_noise_and_scales_by_calibration(self, baseline):
+        """Test the noise floor for tiny stages and the machine speed adjustment."""
+        # 3x slower, but only by 2ms
+        assert compare_to_baseline(self._results(0.1, 0.003), baseline) == []
+        # Twice as slow on a machine that is twice as slow
+        assert compare_to_baseline(self._results(0.2, 0.001, calibration=2.0), baseline) == []
+
+    def test_check_scaling_flags_superlinear_stage(self):
+        """Test that a stage whose time grows quadratically with the workbook is reported."""
+        results = {"profiles": {
+            "small": {"formulas": 1000, "stages": {"order": 0.01, "codegen": 0.1}},
+            "large": {"formulas": 8000, "stages": {"order": 0.64, "codegen": 0.8}},
+        }}
+        problems = check_scaling(results, [("small", "large")])
+        assert len(problems) == 1 and problems[0].startswith("order")
+
+    def test_check_scaling_measures_recalc_per_affected_formula(self):
+        """Test that incremental recalculation is compared per affected formula, not per workbook formula."""
+        results = {"profiles": {
+            "small": {"formulas": 1000, "recalc_affected_cells": 10, "stages": {"recalc_input": 0.001}},
+            "large": {"formulas": 8000, "recalc_affected_cells": 40, "stages": {"recalc_input": 0.004}},
+        }}
+        assert check_scaling(results, [("small", "large")]) == []
+        results["profiles"]["large"]["stages"]["recalc_input"] = 0.016
+        problems = check_scaling(results, [("small", "large")])
+        assert len(problems) == 1 and problems[0].startswith("recalc_input")
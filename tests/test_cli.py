@@ -1,3 +1,4 @@
+import json
 import pytest
 from unittest.mock import patch, MagicMock, AsyncMock
 import sys
@@ -82,12 +83,15 @@ class TestCLI:
         mock_args.input_file = "input.xlsx"
         mock_args.output = None
         mock_args.force_evaluator = False
+        mock_args.batch = None
+        mock_args.timings = False
         mock_parser.parse_args.return_value = mock_args
         mock_argparse.return_value = mock_parser
         
         # Create a mock response
         mock_response = MagicMock()
-        mock_response.body = b"# Generated Python code"
+        mock_response.status_code = 200
+        mock_response.body = json.dumps({"script": "# Generated Python code", "warnings": [], "timings": {}}).encode()
         mock_convert.return_value = mock_response
         
         # Setup mock CLIUploadFile
@@ -99,9 +103,9 @@ class TestCLI:
         mock_file.read.return_value = b"mock content"
         mock_open = MagicMock(return_value=mock_file)
         
-        # Patch execute_script_in_sandbox to avoid actual execution
+        # Patch run_script_in_sandbox to avoid actual execution
         with patch("builtins.open", mock_open):
-            with patch("src.cli.execute_script_in_sandbox", return_value=("Output", "", 0)):
+            with patch("src.cli.run_script_in_sandbox", return_value=("Output", "", 0)):
                 # Patch os.path.exists and os.remove for temp file cleanup
                 with patch("os.path.exists", return_value=True), patch("os.remove"):
                     # Import main here to avoid early argparse initialization
@@ -112,6 +116,45 @@ class TestCLI:
         mock_convert.assert_called_once()
         assert "Generated Python script content" in mock_stdout.getvalue()
 
+    @pytest.mark.asyncio
+    @patch("src.cli.argparse.ArgumentParser")
+    @patch("src.cli.convert_excel_to_python")
+    @patch("src.cli.CLIUploadFile")
+    async def test_main_with_timings(self, mock_cli_upload, mock_convert, mock_argparse, capsys):
+        """Test that --timings prints the conversion and sandbox stage timings to stderr."""
+        mock_parser = MagicMock()
+        mock_args = MagicMock()
+        mock_args.input_file = "input.xlsx"
+        mock_args.output = None
+        mock_args.force_evaluator = False
+        mock_args.batch = None
+        mock_args.timings = True
+        mock_parser.parse_args.return_value = mock_args
+        mock_argparse.return_value = mock_parser
+
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.body = json.dumps({"script": "# Generated Python code", "warnings": [], "timings": {"parse": {"wall_ms": 12.0, "cpu_ms": 11.0}}}).encode()
+        mock_convert.return_value = mock_response
+
+        async def execute(script, usage=None):
+            usage.update(cpu_seconds=0.002, max_rss_kb=9000)
+            return ("Output", "", 0)
+
+        mock_file = MagicMock()
+        mock_file.read.return_value = b"mock content"
+        with patch("builtins.open", MagicMock(return_value=mock_file)):
+            with patch("src.cli.run_script_in_sandbox", side_effect=execute):
+                from src.cli import main
+                await main()
+
+        # The CLI runs the script itself
+        assert mock_convert.call_args[1].get("execute") is False
+        # pytest's capture replaces sys.stderr between setup and the test, so read it with capsys
+        stderr = capsys.readouterr().err
+        assert "parse" in stderr
+        assert "max_rss_kb=9000" in stderr
+
     @pytest.mark.asyncio
     @patch("src.cli.argparse.ArgumentParser")
     @patch("src.cli.convert_excel_to_python")
@@ -124,12 +167,15 @@ class TestCLI:
         mock_args.input_file = "input.xlsx"
         mock_args.output = temp_output_file
         mock_args.force_evaluator = False
+        mock_args.batch = None
+        mock_args.timings = False
         mock_parser.parse_args.return_value = mock_args
         mock_argparse.return_value = mock_parser
         
         # Create a mock response
         mock_response = MagicMock()
-        mock_response.body = b"# Generated Python code"
+        mock_response.status_code = 200
+        mock_response.body = json.dumps({"script": "# Generated Python code", "warnings": [], "timings": {}}).encode()
         mock_convert.return_value = mock_response
         
         # Setup mock CLIUploadFile
@@ -141,9 +187,9 @@ class TestCLI:
         mock_file.read.return_value = b"mock content"
         mock_open = MagicMock(return_value=mock_file)
         
-        # Patch execute_script_in_sandbox to avoid actual execution
+        # Patch run_script_in_sandbox to avoid actual execution
         with patch("builtins.open", mock_open):
-            with patch("src.cli.execute_script_in_sandbox", return_value=("Output", "", 0)):
+            with patch("src.cli.run_script_in_sandbox", return_value=("Output", "", 0)):
                 # Patch os.path.exists and os.remove for temp file cleanup
                 with patch("os.path.exists", return_value=True), patch("os.remove"):
                     # Import main here to avoid early argparse initialization
@@ -166,12 +212,15 @@ class TestCLI:
         mock_args.input_file = "input.xlsx"
         mock_args.output = None
         mock_args.force_evaluator = True
+        mock_args.batch = None
+        mock_args.timings = False
         mock_parser.parse_args.return_value = mock_args
         mock_argparse.return_value = mock_parser
         
         # Create a mock response
         mock_response = MagicMock()
-        mock_response.body = b"# Generated Python code"
+        mock_response.status_code = 200
+        mock_response.body = json.dumps({"script": "# Generated Python code", "warnings": [], "timings": {}}).encode()
         mock_convert.return_value = mock_response
         
         # Setup mock CLIUploadFile
@@ -183,9 +232,9 @@ class TestCLI:
         mock_file.read.return_value = b"mock content"
         mock_open = MagicMock(return_value=mock_file)
         
-        # Patch execute_script_in_sandbox to avoid actual execution
+        # Patch run_script_in_sandbox to avoid actual execution
         with patch("builtins.open", mock_open):
-            with patch("src.cli.execute_script_in_sandbox", return_value=("Output", "", 0)):
+            with patch("src.cli.run_script_in_sandbox", return_value=("Output", "", 0)):
                 # Patch os.path.exists and os.remove for temp file cleanup
                 with patch("os.path.exists", return_value=True), patch("os.remove"):
                     # Import main here to avoid early argparse initialization
@@ -208,12 +257,15 @@ class TestCLI:
         mock_args.input_file = "input.xlsx"
         mock_args.output = None
         mock_args.force_evaluator = False
+        mock_args.batch = None
+        mock_args.timings = False
         mock_parser.parse_args.return_value = mock_args
         mock_argparse.return_value = mock_parser
         
         # Create a mock response
         mock_response = MagicMock()
-        mock_response.body = b"# Generated Python code"
+        mock_response.status_code = 200
+        mock_response.body = json.dumps({"script": "# Generated Python code", "warnings": [], "timings": {}}).encode()
         mock_convert.return_value = mock_response
         
         # Setup mock CLIUploadFile
@@ -225,14 +277,14 @@ class TestCLI:
         mock_file.read.return_value = b"mock content"
         mock_open = MagicMock(return_value=mock_file)
         
-        # Patch execute_script_in_sandbox to simulate execution error
+        # Patch run_script_in_sandbox to simulate execution error
         error = subprocess.CalledProcessError(1, "python")
         error.output = b""
         error.stderr = b"Error"
         
         # Patch open to return actual bytes content
         with patch("builtins.open", mock_open):
-            with patch("src.cli.execute_script_in_sandbox", side_effect=error):
+            with patch("src.cli.run_script_in_sandbox", side_effect=error):
                 # Patch os.path.exists and os.remove for temp file cleanup
                 with patch("os.path.exists", return_value=True), patch("os.remove"):
                     # Import main here to avoid early argparse initialization
@@ -258,12 +310,15 @@ class TestCLI:
         mock_args.input_file = "input.xlsx"
         mock_args.output = None
         mock_args.force_evaluator = False
+        mock_args.batch = None
+        mock_args.timings = False
         mock_parser.parse_args.return_value = mock_args
         mock_argparse.return_value = mock_parser
         
         # Create a mock response
         mock_response = MagicMock()
-        mock_response.body = b"# Generated Python code"
+        mock_response.status_code = 200
+        mock_response.body = json.dumps({"script": "# Generated Python code", "warnings": [], "timings": {}}).encode()
         mock_convert.return_value = mock_response
         
         # Setup mock CLIUploadFile
@@ -275,9 +330,9 @@ class TestCLI:
         mock_file.read.return_value = b"mock content"
         mock_open = MagicMock(return_value=mock_file)
         
-        # Patch execute_script_in_sandbox to simulate timeout
+        # Patch run_script_in_sandbox to simulate timeout
         with patch("builtins.open", mock_open):
-            with patch("src.cli.execute_script_in_sandbox", side_effect=subprocess.TimeoutExpired("python", 5)):
+            with patch("src.cli.run_script_in_sandbox", side_effect=subprocess.TimeoutExpired("python", 5)):
                 # Patch os.path.exists and os.remove for temp file cleanup
                 with patch("os.path.exists", return_value=True), patch("os.remove"):
                     # Import main here to avoid early argparse initialization
@@ -301,6 +356,8 @@ class TestCLI:
         mock_args.input_file = "nonexistent.xlsx"
         mock_args.output = None
         mock_args.force_evaluator = False
+        mock_args.batch = None
+        mock_args.timings = False
         mock_parser.parse_args.return_value = mock_args
         mock_argparse.return_value = mock_parser
         
@@ -329,6 +386,8 @@ class TestCLI:
         mock_args.input_file = "input.pdf"
         mock_args.output = None
         mock_args.force_evaluator = False
+        mock_args.batch = None
+        mock_args.timings = False
         mock_parser.parse_args.return_value = mock_args
         mock_argparse.return_value = mock_parser
         
@@ -0,0 +1,97 @@
+import os
+import pytest
+
+from src.conversion_cache import ConversionCache, make_cache_key
+
+class TestConversionCache:
+    """Tests for the content-addressed conversion cache."""
+
+    @pytest.fixture
+    def cache(self, tmp_path):
+        """Create a cache with a small memory tier backed by a temporary directory."""
+        return ConversionCache(cache_dir=str(tmp_path), memory_max_bytes=1024)
+
+    def test_make_cache_key_depends_on_content_and_options(self):
+        """Test that the key changes with the file bytes and with the options."""
+        key = make_cache_key(b"workbook", {"force_evaluator": False})
+        assert key == make_cache_key(b"workbook", {"force_evaluator": False})
+        assert key != make_cache_key(b"workbook2", {"force_evaluator": False})
+        assert key != make_cache_key(b"workbook", {"force_evaluator": True})
+
+    def test_make_cache_key_ignores_option_order(self):
+        """Test that options are canonicalized before hashing."""
+        assert make_cache_key(b"x", {"a": 1, "b": 2}) == make_cache_key(b"x", {"b": 2, "a": 1})
+
+    def test_miss_then_memory_hit(self, cache):
+        """Test a miss followed by a memory hit after storing a result."""
+        value = {"script": "x = 1", "warnings": []}
+        assert cache.get("ab" * 32) is None
+        cache.put("ab" * 32, value)
+        assert cache.get("ab" * 32) == value
+
+        stats = cache.get_stats()
+        assert stats["misses"] == 1
+        assert stats["memory_hits"] == 1
+
+    def test_disk_hit_after_memory_cleared(self, cache, tmp_path):
+        """Test that entries survive in the disk tier and are promoted on access."""
+        value = {"script": "x = 1", "warnings": ["w"]}
+        key = "cd" * 32
+        cache.put(key, value)
+        assert os.path.exists(os.path.join(str(tmp_path), key[:2], f"{key}.json"))
+
+        cache.clear_memory()
+        assert cache.get(key) == value
+        assert cache.get(key) == value
+
+        stats = cache.get_stats()
+        assert stats["disk_hits"] == 1
+        assert stats["memory_hits"] == 1
+
+    def test_memory_lru_eviction(self, tmp_path):
+        """Test that the least recently used entry is evicted when the memory tier is full."""
+        cache = ConversionCache(cache_dir=None, memory_max_bytes=200)
+        cache.put("k1", {"script": "a" * 60})
+        cache.put("k2", {"script": "b" * 60})
+        cache.get("k1")  # k1 becomes most recently used
+        cache.put("k3", {"script": "c" * 60})
+
+        assert cache.get("k1") is not None
+        assert cache.get("k2") is None
+        assert cache.get("k3") is not None
+        assert cache.get_stats()["evictions"] == 1
+
+    def test_disabled_cache(self, tmp_path):
+        """Test that a disabled cache never stores or returns entries."""
+        cache = ConversionCache(cache_dir=str(tmp_path), memory_max_bytes=1024, enabled=False)
+        cache.put("k1", {"script": "x"})
+        assert cache.get("k1") is None
+        assert os.listdir(str(tmp_path)) == []
+
+    def test_prune_disk(self, tmp_path):
+        """Test that pruning removes the oldest entries until the disk tier fits its limit."""
+        cache = ConversionCache(cache_dir=str(tmp_path), memory_max_bytes=0, disk_max_bytes=150)
+        for index, key in enumerate(["aa" * 32, "bb" * 32, "cc" * 32]):
+            cache.put(key, {"script": "x" * 50})
+            path = os.path.join(str(tmp_path), key[:2], f"{key}.json")
+            os.utime(path, (1000 + index, 1000 + index))
+
+        cache.prune_disk()
+
+        assert cache.get("aa" * 32) is None
+        assert cache.get("cc" * 32) is not None
+        assert cache.get_stats()["disk_evictions"] >= 1
+
+    def test_prune_disk_keeps_recently_read_entries(self, tmp_path):
+        """Test that a hit makes an entry the last one pruned, whenever it was written."""
+        cache = ConversionCache(cache_dir=str(tmp_path), memory_max_bytes=0, disk_max_bytes=150)
+        for index, key in enumerate(["aa" * 32, "bb" * 32, "cc" * 32]):
+            cache.put(key, {"script": "x" * 50})
+            path = os.path.join(str(tmp_path), key[:2], f"{key}.json")
+            os.utime(path, (1000 + index, 1000 + index))
+
+        assert cache.get("aa" * 32) is not None
+        cache.prune_disk()
+
+        assert cache.get("aa" * 32) is not None
+        assert cache.get("bb" * 32) is None
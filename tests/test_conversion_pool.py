@@ -0,0 +1,52 @@
+import asyncio
+import os
+import threading
+import pytest
+
+from src.conversion_pool import ConversionPool, ConversionPoolBusyError
+
+class TestConversionPool:
+    """Tests for dispatching conversion work off the event loop."""
+
+    @pytest.mark.asyncio
+    async def test_run_inline_uses_thread(self):
+        """Test that a pool with no workers runs work in a separate thread."""
+        pool = ConversionPool(max_workers=0)
+        worker_thread = await pool.run(threading.get_ident)
+        assert worker_thread != threading.get_ident()
+        assert pool.pending == 0
+
+    @pytest.mark.asyncio
+    async def test_run_in_process_pool(self):
+        """Test that work is executed in a separate worker process."""
+        pool = ConversionPool(max_workers=1, max_tasks_per_child=2)
+        try:
+            assert await pool.run(pow, 2, 10) == 1024
+            worker_pid = await pool.run(os.getpid)
+            assert worker_pid != os.getpid()
+        finally:
+            pool.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_queue_depth_limit(self):
+        """Test that conversions beyond the queue depth are rejected."""
+        pool = ConversionPool(max_workers=0, max_queue_depth=1)
+        release = threading.Event()
+
+        running = asyncio.ensure_future(pool.run(release.wait, 5))
+        await asyncio.sleep(0.05)
+        try:
+            with pytest.raises(ConversionPoolBusyError):
+                await pool.run(pow, 2, 2)
+        finally:
+            release.set()
+            await running
+        assert pool.pending == 0
+
+    @pytest.mark.asyncio
+    async def test_exceptions_propagate(self):
+        """Test that errors raised by the work are re-raised to the caller."""
+        pool = ConversionPool(max_workers=0)
+        with pytest.raises(ZeroDivisionError):
+            await pool.run(divmod, 1, 0)
+        assert pool.pending == 0
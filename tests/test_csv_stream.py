@@ -0,0 +1,49 @@
+import pytest
+
+from src.csv_stream import read_delimited_streaming
+from src.dependency_extractor import generate_static_python_code
+
+class TestCsvStream:
+    """Tests for the CSV/TSV ingest engine."""
+
+    def test_formulas_are_read_with_their_references(self):
+        """Test that "=" fields become formulas at their A1 address, with qualified references and precedents."""
+        report = {}
+        model = read_delimited_streaming(b"Qty,Price,Total\n2,1.5,=A2*$B$2\n3,2.5,=A3*B3\n", report=report)
+
+        assert model.cells["Sheet1!C2"].formula == "Sheet1!A2*Sheet1!B2"
+        assert model.cells["Sheet1!C2"].value is None
+        assert [p.formula_address for p in model.cells["Sheet1!C3"].precedents] == ["Sheet1!A3", "Sheet1!B3"]
+        assert model.cells["Sheet1!B2"].value == 1.5
+        assert report["ingest"] == {"engine": "csv", "rows": 3, "formulas": 2, "constants": 7, "skipped_constants": 0}
+
+    def test_only_referenced_constants_and_headers_are_kept(self):
+        """Test that constants no formula reads are skipped, except the header row, and ranges are clipped to the file."""
+        report = {}
+        model = read_delimited_streaming(b"Amount,Note,Sum\n1,x,=SUM(A2:A1000)\n2,TRUE,\n", report=report)
+
+        assert list(model.cells) == ["Sheet1!A1", "Sheet1!B1", "Sheet1!C1", "Sheet1!A2", "Sheet1!C2", "Sheet1!A3"]
+        assert [p.formula_address for p in model.cells["Sheet1!C2"].precedents] == ["Sheet1!A2", "Sheet1!A3"]
+        assert model.ranges == {"Sheet1!A2:A1000": "Sheet1!A2:A1000"}
+        assert report["ingest"]["skipped_constants"] == 2
+
+    def test_tsv_quoting_and_byte_order_mark(self):
+        """Test that TSV files, quoted formulas containing delimiters and a UTF-8 BOM are read."""
+        content = '\ufeffName\tScore\tGrade\nAda\t7\t"=IF(B2>5,""pass"",""fail"")"\n'.encode("utf-8")
+        report = {}
+        model = read_delimited_streaming(content, "\t", report)
+
+        assert model.cells["Sheet1!A1"].value == "Name"
+        assert model.cells["Sheet1!C2"].formula == 'IF(Sheet1!B2>5,"pass","fail")'
+        assert report["ingest"]["engine"] == "tsv"
+
+    def test_rejects_files_that_are_not_text(self):
+        """Test that binary content, such as an .xlsx renamed to .csv, raises instead of producing a model."""
+        with pytest.raises(UnicodeDecodeError):
+            read_delimited_streaming(b"PK\x03\x04\x14\x00\x06\x00\x08\x00\x00\x00!\x00\xb5U0#\xf4")
+
+    def test_streamed_model_converts(self):
+        """Test that the model of a CSV file runs through the converter, headers naming variables."""
+        code = generate_static_python_code(read_delimited_streaming(b"Qty,Price,Cost\n2,10,=A2*B2\n"))
+
+        assert "sheet1_Cost_2 = sheet1_Qty_2*sheet1_Price_2" in code
@@ -4,9 +4,11 @@ from xlcalculator.model import Model
 from src.dependency_extractor import (
     extract_formula_dependencies,
     get_evaluation_order,
+    get_evaluation_order_and_cycles,
     extract_headers,
     get_python_variable_name,
-    generate_static_python_code
+    generate_static_python_code,
+    SymbolTable
 )
 
 class TestDependencyExtractor:
@@ -349,7 +351,7 @@ class TestDependencyExtractor:
         # Check the result - should add underscore prefix if it would start with a number
         assert var_name == "sheet1_123Name"
 
-    @patch('src.dependency_extractor.get_evaluation_order')
+    @patch('src.dependency_extractor.get_evaluation_order_and_cycles')
     @patch('src.dependency_extractor.extract_formula_dependencies')
     @patch('src.dependency_extractor.extract_headers')
     def test_generate_static_python_code(self, mock_extract_headers, mock_extract_deps, mock_get_eval_order):
@@ -393,7 +395,7 @@ class TestDependencyExtractor:
             "Sheet1!B1": ["Sheet1!A1"],
             "Sheet1!C1": ["Sheet1!A1", "Sheet1!B1"]
         }
-        mock_get_eval_order.return_value = ["Sheet1!A1", "Sheet1!B1", "Sheet1!C1"]
+        mock_get_eval_order.return_value = (["Sheet1!A1", "Sheet1!B1", "Sheet1!C1"], [])
         
         # Call the function
         code = generate_static_python_code(mock_model)
@@ -406,7 +408,7 @@ class TestDependencyExtractor:
         assert "sheet1_Calculation = a1*2" in code
         assert "sheet1_Result = sum(a1_b1)" in code
         
-    @patch('src.dependency_extractor.get_evaluation_order')
+    @patch('src.dependency_extractor.get_evaluation_order_and_cycles')
     @patch('src.dependency_extractor.extract_formula_dependencies')
     @patch('src.dependency_extractor.extract_headers')
     def test_generate_static_python_code_with_force_evaluator(self, mock_extract_headers, mock_extract_deps, mock_get_eval_order):
@@ -442,7 +444,7 @@ class TestDependencyExtractor:
             "Sheet1!A1": [],
             "Sheet1!B1": ["Sheet1!A1"]
         }
-        mock_get_eval_order.return_value = ["Sheet1!A1", "Sheet1!B1"]
+        mock_get_eval_order.return_value = (["Sheet1!A1", "Sheet1!B1"], [])
         
         # Call the function with force_evaluator=True
         code = generate_static_python_code(mock_model, force_evaluator=True)
@@ -455,7 +457,7 @@ class TestDependencyExtractor:
         assert "evaluator.evaluate" in code
         assert "sheet1_Calculation = a1*2" not in code  # Should not have static translation
         
-    @patch('src.dependency_extractor.get_evaluation_order')
+    @patch('src.dependency_extractor.get_evaluation_order_and_cycles')
     @patch('src.dependency_extractor.extract_formula_dependencies')
     @patch('src.dependency_extractor.extract_headers')
     def test_generate_static_python_code_with_unsupported_functions(self, mock_extract_headers, mock_extract_deps, mock_get_eval_order):
@@ -491,7 +493,7 @@ class TestDependencyExtractor:
             "Sheet1!A1": [],
             "Sheet1!B1": ["Sheet1!A1"]
         }
-        mock_get_eval_order.return_value = ["Sheet1!A1", "Sheet1!B1"]
+        mock_get_eval_order.return_value = (["Sheet1!A1", "Sheet1!B1"], [])
         
         # Call the function
         code = generate_static_python_code(mock_model)
@@ -501,4 +503,304 @@ class TestDependencyExtractor:
         assert "sheet1_Calculation = 0" in code
         # The actual implementation doesn't use runtime evaluation for unsupported functions
         # It just returns the function as is
-        assert "sheet1_Calculation = INDIRECT(a1)" in code 
\ No newline at end of file
+        assert "sheet1_Calculation = INDIRECT(a1)" in code 
+def _make_model(dependencies: dict) -> MagicMock:
+    """Build a mock model from a mapping of cell address to its precedent addresses."""
+    mock_model = MagicMock(spec=Model)
+    cells = {}
+    for address, precedent_addresses in dependencies.items():
+        cell = MagicMock()
+        cell.formula = "+".join(precedent_addresses) if precedent_addresses else None
+        cell.formula_address = address
+        cell.value = 0
+        precedents = []
+        for precedent_address in precedent_addresses:
+            precedent = MagicMock()
+            precedent.formula_address = precedent_address
+            precedents.append(precedent)
+        cell.precedents = precedents
+        cells[address] = cell
+    mock_model.cells = cells
+    return mock_model
+
+class TestEvaluationOrderCycles:
+    """Tests for cycle detection and ordering of cyclic workbooks."""
+
+    def test_no_cycles(self):
+        """Test that an acyclic workbook reports no circular references."""
+        model = _make_model({"Sheet1!A1": [], "Sheet1!B1": ["Sheet1!A1"]})
+        order, cycles = get_evaluation_order_and_cycles(model)
+        assert order == ["Sheet1!A1", "Sheet1!B1"]
+        assert cycles == []
+
+    def test_cycle_groups_are_reported_and_ordered(self):
+        """Test that cyclic cells and their dependents are still part of the evaluation order."""
+        model = _make_model({
+            "Sheet1!A1": [],
+            "Sheet1!B1": ["Sheet1!A1", "Sheet1!D1"],
+            "Sheet1!C1": ["Sheet1!B1"],
+            "Sheet1!D1": ["Sheet1!C1"],
+            "Sheet1!E1": ["Sheet1!D1"],
+        })
+        order, cycles = get_evaluation_order_and_cycles(model)
+
+        assert cycles == [["Sheet1!B1", "Sheet1!C1", "Sheet1!D1"]]
+        assert sorted(order) == sorted(model.cells)
+        assert order.index("Sheet1!A1") < order.index("Sheet1!B1")
+        assert order.index("Sheet1!D1") < order.index("Sheet1!E1")
+
+    def test_self_reference_is_a_cycle(self):
+        """Test that a cell referencing itself is reported as a group of one."""
+        model = _make_model({"Sheet1!A1": ["Sheet1!A1"], "Sheet1!B1": []})
+        order, cycles = get_evaluation_order_and_cycles(model)
+        assert cycles == [["Sheet1!A1"]]
+        assert sorted(order) == ["Sheet1!A1", "Sheet1!B1"]
+
+    def test_separate_cycles(self):
+        """Test that independent cycles are reported as separate groups."""
+        model = _make_model({
+            "Sheet1!A1": ["Sheet1!B1"],
+            "Sheet1!B1": ["Sheet1!A1"],
+            "Sheet2!A1": ["Sheet2!B1"],
+            "Sheet2!B1": ["Sheet2!A1"],
+        })
+        _, cycles = get_evaluation_order_and_cycles(model)
+        assert sorted(cycles) == [["Sheet1!A1", "Sheet1!B1"], ["Sheet2!A1", "Sheet2!B1"]]
+
+    def test_unknown_precedents_are_ordered(self):
+        """Test that precedents missing from model.cells don't drop their dependents."""
+        model = _make_model({"Sheet1!B1": ["Sheet1!A1"]})
+        order = get_evaluation_order(model)
+        assert order == ["Sheet1!A1", "Sheet1!B1"]
+
+    def test_long_chain_and_long_cycle(self):
+        """Test that deep graphs are handled without recursion errors."""
+        cell_count = 3000
+        chain = {f"Sheet1!A{i}": ([f"Sheet1!A{i - 1}"] if i > 1 else []) for i in range(1, cell_count + 1)}
+        assert get_evaluation_order(_make_model(chain)) == list(chain)
+
+        chain["Sheet1!A1"] = [f"Sheet1!A{cell_count}"]
+        order, cycles = get_evaluation_order_and_cycles(_make_model(chain))
+        assert len(order) == cell_count
+        assert len(cycles) == 1 and len(cycles[0]) == cell_count
+
+    def test_generate_code_for_cyclic_cells(self):
+        """Test that cyclic cells fall back to runtime evaluation and are reported."""
+        model = _make_model({"Sheet1!A1": ["Sheet1!B1"], "Sheet1!B1": ["Sheet1!A1"], "Sheet1!C1": []})
+        report = {}
+        code = generate_static_python_code(model, report=report)
+
+        assert report["circular_references"] == [["Sheet1!A1", "Sheet1!B1"]]
+        assert "FALLBACK_CELLS = ('Sheet1!A1', 'Sheet1!B1')" in code
+        assert "sheet1_a1 = _fallback_values['Sheet1!A1'] # Runtime evaluation" in code
+
+    def test_generate_code_reports_translation_cache(self):
+        """Test that filled-down formulas are translated once per shape and reported."""
+        dependencies = {}
+        for row in range(1, 11):
+            dependencies[f"Sheet1!A{row}"] = []
+            dependencies[f"Sheet1!B{row}"] = [f"Sheet1!A{row}"]
+        model = _make_model(dependencies)
+        for row in range(1, 11):
+            model.cells[f"Sheet1!B{row}"].formula = f"A{row}*2"
+
+        report = {}
+        code = generate_static_python_code(model, report=report)
+
+        assert "sheet1_b10 = a10*2" in code
+        assert report["translation_cache"]["formulas"] == 10
+        assert report["translation_cache"]["distinct_shapes"] == 1
+        assert report["translation_cache"]["cache_hit_ratio"] == 0.9
+
+class TestSymbolTable:
+    """Tests for the precomputed cell-name symbol table."""
+
+    def _build(self, cell_values: dict) -> SymbolTable:
+        model = _make_model({address: [] for address in cell_values})
+        for address, value in cell_values.items():
+            model.cells[address].value = value
+        cell_positions = {}
+        headers_by_sheet = extract_headers(model, cell_positions)
+        return SymbolTable.build(model.cells.keys(), headers_by_sheet, cell_positions)
+
+    def test_names_match_get_python_variable_name(self):
+        """Test that cells without collisions get the same names as get_python_variable_name."""
+        symbols = self._build({"Sheet1!A1": "Name", "Sheet1!B1": None, "Sheet1!B2": 5})
+        assert symbols.name_for("Sheet1!A1") == "sheet1_Name"
+        assert symbols.name_for("Sheet1!B2") == "sheet1_b2"
+
+    def test_header_column_collisions_are_disambiguated(self):
+        """Test that cells sharing a header name get unique, row-suffixed names."""
+        symbols = self._build({"Sheet1!A1": "Price", "Sheet1!A2": 10, "Sheet1!A3": 20, "Sheet1!B1": "Price_3"})
+        names = [symbols.name_for(address) for address in ["Sheet1!A1", "Sheet1!A2", "Sheet1!A3", "Sheet1!B1"]]
+        assert len(set(names)) == 4
+        assert names[:2] == ["sheet1_Price_1", "sheet1_Price_2"]
+        assert names[3] == "sheet1_Price_3"
+        assert names[2] == "sheet1_Price_3_1"
+
+    def test_invalid_identifiers_are_cleaned(self):
+        """Test that sheet names with spaces still produce valid identifiers."""
+        symbols = self._build({"My Sheet!A1": "Total"})
+        assert symbols.name_for("My Sheet!A1") == "my_sheet_Total"
+
+    def test_unknown_references_are_named_lazily(self):
+        """Test that ranges and unqualified references fall back to reference names."""
+        symbols = self._build({"Sheet1!A1": 1})
+        assert symbols.name_for("A1:B2") == "a1_b2"
+        assert symbols.name_for("A1") == "a1"
+
+    def test_ranges_list_the_suffixed_names_of_their_cells(self):
+        """Test that a range under a header lists its cells' row-suffixed names, skipping empty cells."""
+        symbols = self._build({"Sheet1!A1": "Total", "Sheet1!A2": 10, "Sheet1!A3": 20, "Sheet1!B1": "Tax", "Sheet1!B3": 2})
+        assert symbols.name_for("Sheet1!A2:B4") == "[sheet1_Total_2, sheet1_Total_3, sheet1_Tax_3]"
+
+        symbols.bind("Sheet1!A3", "sheet1_Total[1]")
+        assert symbols.name_for("Sheet1!A2:A3") == "[sheet1_Total_2, sheet1_Total[1]]"
+
+    @patch("src.dependency_extractor.logger")
+    def test_codegen_does_not_log_per_cell(self, mock_logger):
+        """Test that naming cells during codegen doesn't log once per cell."""
+        model = _make_model({f"Sheet1!A{row}": [] for row in range(1, 51)})
+        generate_static_python_code(model)
+        assert mock_logger.info.call_count + mock_logger.warning.call_count < 5
+
+class TestComputeModule:
+    """Tests for generating an importable compute(inputs) module."""
+
+    def _load(self, code: str) -> dict:
+        namespace = {"__name__": "generated_model"}
+        exec(compile(code, "generated_model", "exec"), namespace)
+        return namespace
+
+    def _model(self):
+        model = _make_model({
+            "Sheet1!A1": [],
+            "Sheet1!A2": [],
+            "Sheet1!B1": ["Sheet1!A1", "Sheet1!A2"],
+            "Sheet1!C1": ["Sheet1!B1"],
+        })
+        model.cells["Sheet1!A1"].value = 2
+        model.cells["Sheet1!A2"].value = 3.5
+        model.cells["Sheet1!B1"].formula = "Sheet1!A1*Sheet1!A2"
+        model.cells["Sheet1!C1"].formula = "Sheet1!B1+1"
+        return model
+
+    def test_compute_uses_inputs_and_workbook_defaults(self):
+        """Test that inputs and outputs are declared and compute() can be called repeatedly."""
+        module = self._load(generate_static_python_code(self._model(), as_module=True))
+
+        assert module["INPUTS"] == {"Sheet1!A1": 2, "Sheet1!A2": 3.5}
+        assert module["OUTPUTS"] == ("Sheet1!B1", "Sheet1!C1")
+        assert module["compute"]({}) == {"Sheet1!B1": 7.0, "Sheet1!C1": 8.0}
+        assert module["compute"]({"Sheet1!A1": 10}) == {"Sheet1!B1": 35.0, "Sheet1!C1": 36.0}
+        # Nothing leaks from the previous call
+        assert module["compute"]({})["Sheet1!C1"] == 8.0
+        with pytest.raises(KeyError):
+            module["compute"]({"Sheet1!B1": 1})
+
+    def test_ranges_under_a_header_are_computed(self):
+        """Test that a range over a header column sums the row-suffixed cells."""
+        model = _make_model({"Sheet1!A1": [], "Sheet1!A2": [], "Sheet1!A3": [], "Sheet1!B2": ["Sheet1!A2", "Sheet1!A3"]})
+        model.cells["Sheet1!A1"].value = "Total"
+        model.cells["Sheet1!A2"].value = 10
+        model.cells["Sheet1!A3"].value = 20
+        model.cells["Sheet1!B2"].formula = "SUM(Sheet1!A2:A3)"
+        module = self._load(generate_static_python_code(model, as_module=True))
+
+        assert module["compute"]({"Sheet1!A3": 5}) == {"Sheet1!B2": 15}
+
+    def test_cells_are_locals_of_compute(self):
+        """Test that no cell is assigned at module level, and a vectorized module imports numpy once."""
+        code = generate_static_python_code(self._model(), as_module=True, vectorize=True)
+        module = self._load(code)
+        assert not any(name.startswith("sheet1_") for name in module)
+        assert "load_workbook" not in module
+
+    def test_vectorized_module_with_headers(self):
+        """Test that a vectorized module over a workbook with a header row computes, headers staying scalar inputs."""
+        dependencies = {"Sheet1!A1": [], "Sheet1!B1": []}
+        for row in range(2, 22):
+            dependencies[f"Sheet1!A{row}"] = []
+            dependencies[f"Sheet1!B{row}"] = [f"Sheet1!A{row}"]
+        model = _make_model(dependencies)
+        model.cells["Sheet1!A1"].value = "Qty"
+        model.cells["Sheet1!B1"].value = "Cost"
+        for row in range(2, 22):
+            model.cells[f"Sheet1!A{row}"].value = row
+            model.cells[f"Sheet1!B{row}"].formula = f"Sheet1!A{row}*2"
+        code = generate_static_python_code(model, as_module=True, vectorize=True)
+        module = self._load(code)
+
+        assert "sheet1_Qty_1 = inputs.get('Sheet1!A1', 'Qty')" in code
+        outputs = module["compute"]({"Sheet1!A3": 10})
+        assert outputs["Sheet1!B2"] == 4
+        assert outputs["Sheet1!B3"] == 20
+
+    def test_fallback_cells_need_a_loaded_workbook(self):
+        """Test that runtime-evaluated cells go through a workbook loaded once with load_workbook()."""
+        code = generate_static_python_code(self._model(), as_module=True, force_evaluator=True)
+        module = self._load(code)
+
+        assert module["FALLBACK_CELLS"] == ("Sheet1!B1", "Sheet1!C1")
+        with pytest.raises(RuntimeError, match="load_workbook"):
+            module["compute"]({})
+
+        evaluator = MagicMock()
+        evaluator.evaluate.side_effect = lambda address: {"Sheet1!B1": 7.0, "Sheet1!C1": 8.0}[address]
+        module["_evaluator"] = evaluator
+        assert module["compute"]({"Sheet1!A1": 4}) == {"Sheet1!B1": 7.0, "Sheet1!C1": 8.0}
+        evaluator.set_cell_value.assert_any_call("Sheet1!A1", 4)
+        evaluator.set_cell_value.assert_any_call("Sheet1!A2", 3.5)
+
+    def test_fallback_cells_are_evaluated_in_one_seeded_batch(self):
+        """Test that the evaluator gets the translated values first, and dependents of fallback cells come after."""
+        model = self._model()
+        model.cells["Sheet1!C1"].formula = "Sheet1!B1+ RAND ()"
+        model.cells["Sheet1!D1"] = _make_model({"Sheet1!D1": ["Sheet1!C1"]}).cells["Sheet1!D1"]
+        model.cells["Sheet1!D1"].formula = "Sheet1!C1*2"
+        code = generate_static_python_code(model, as_module=True)
+        module = self._load(code)
+
+        assert code.index("_evaluate_fallback_cells({") < code.index("sheet1_d1 = sheet1_c1*2")
+        evaluator = MagicMock()
+        evaluator.evaluate.side_effect = lambda address: {"Sheet1!C1": 100}[address]
+        module["_evaluator"] = evaluator
+        assert module["compute"]({"Sheet1!A1": 4}) == {"Sheet1!B1": 14.0, "Sheet1!C1": 100, "Sheet1!D1": 200}
+        evaluator.set_cell_value.assert_any_call("Sheet1!B1", 14.0)
+        evaluator.evaluate.assert_called_once_with("Sheet1!C1")
+
+    def test_flat_script_loads_the_workbook_from_its_argument(self):
+        """Test that a flat script only imports xlcalculator to load the workbook it is given."""
+        code = generate_static_python_code(self._model(), force_evaluator=True)
+        assert "\nfrom xlcalculator" not in code and "\nimport xlcalculator" not in code
+        with patch("sys.argv", ["script.py"]):
+            with pytest.raises(RuntimeError, match="first argument"):
+                exec(code, {})
+
+    def test_module_loads_the_compiled_model_next_to_it(self, tmp_path):
+        """Test that the first batch loads the .xlmodel artifact named after the module file."""
+        code = generate_static_python_code(self._model(), force_evaluator=True, as_module=True)
+        (tmp_path / "model.xlmodel").write_bytes(b"artifact")
+        module = self._load(code)
+        module["__file__"] = str(tmp_path / "model.py")
+        evaluator = MagicMock()
+        evaluator.evaluate.return_value = 1
+        module["load_workbook"] = MagicMock(side_effect=lambda path: module.update(_evaluator=evaluator))
+
+        module["compute"]({})
+        module["compute"]({})
+
+        module["load_workbook"].assert_called_once_with(str(tmp_path / "model.xlmodel"))
+
+    def test_targets_prune_the_module(self):
+        """Test that only the targets' precedents get code and compute() returns just the targets."""
+        model = self._model()
+        model.cells["Sheet1!D1"] = _make_model({"Sheet1!D1": ["Sheet1!A2"]}).cells["Sheet1!D1"]
+        report = {}
+        code = generate_static_python_code(model, as_module=True, targets=["Sheet1!B1"], report=report)
+        module = self._load(code)
+
+        assert module["OUTPUTS"] == ("Sheet1!B1",)
+        assert module["compute"]({"Sheet1!A1": 10}) == {"Sheet1!B1": 35.0}
+        assert "sheet1_c1" not in code and "sheet1_d1" not in code
+        assert report["targets"] == {"target_cells": 1, "cells_kept": 3, "cells_total": 5}
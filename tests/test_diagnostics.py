@@ -0,0 +1,115 @@
+import asyncio
+import logging
+from unittest.mock import ANY, MagicMock
+
+from src.diagnostics import (
+    Diagnostics,
+    RequestWarningsHandler,
+    TRUNCATED_CODE,
+    collect_diagnostics,
+    request_diagnostics,
+    set_current_address,
+    warn,
+)
+
+class TestDiagnostics:
+    """Tests for the request-scoped warnings collector."""
+
+    def test_warnings_are_aggregated_by_code(self):
+        """Test that repeated warnings are kept once, with their count and unique, capped sample addresses."""
+        diagnostics = Diagnostics(max_samples=2)
+        for address in ("Sheet1!A1", "Sheet1!A1", "Sheet1!A2", "Sheet1!A3"):
+            diagnostics.add("circular_reference", "Cycle at %s", (address,), address)
+        diagnostics.add("unknown_formula_part", "Unknown part %s", ("FOO",))
+
+        assert diagnostics.to_list() == [
+            {"code": "circular_reference", "level": "warning", "message": "Cycle at Sheet1!A1", "count": 4, "samples": ["Sheet1!A1", "Sheet1!A2"]},
+            {"code": "unknown_formula_part", "level": "warning", "message": "Unknown part FOO", "count": 1, "samples": []},
+        ]
+        assert diagnostics.warnings() == ["Cycle at Sheet1!A1 [4 times; e.g. Sheet1!A1, Sheet1!A2]", "Unknown part FOO"]
+
+    def test_messages_are_formatted_lazily(self):
+        """Test that arguments are only formatted when the diagnostics are returned, and only the first occurrence's."""
+        argument = MagicMock()
+        argument.__str__.return_value = "FOO"
+        diagnostics = Diagnostics()
+        for _ in range(3):
+            diagnostics.add("unknown_formula_part", "Unknown part %s", (argument,))
+
+        argument.__str__.assert_not_called()
+        assert diagnostics.warnings() == ["Unknown part FOO [3 times]"]
+
+    def test_codes_past_the_cap_are_only_counted(self):
+        """Test that at most `max_codes` codes are kept and the rest is reported as a truncation entry."""
+        diagnostics = Diagnostics(max_codes=2)
+        for code in ("a", "b", "c", "c", "a"):
+            diagnostics.add(code, f"warning {code}")
+
+        entries = diagnostics.to_list()
+        assert [(entry["code"], entry["count"]) for entry in entries] == [("a", 2), ("b", 1), (TRUNCATED_CODE, 2)]
+
+    def test_merge_combines_the_entries_of_another_collector(self):
+        """Test that merging a worker's entries adds their counts, samples and truncated occurrences."""
+        first_worker = Diagnostics(max_codes=1)
+        first_worker.add("fallback_variable_name", "Fallback for %s", ("Sheet1!B2",), "Sheet1!B2")
+        first_worker.add("other", "Dropped")
+        second_worker = Diagnostics()
+        second_worker.add("fallback_variable_name", "Fallback for %s", ("Sheet1!B2",), "Sheet1!B3")
+        second_worker.add("fallback_variable_name", "Fallback for %s", ("Sheet1!B4",), "Sheet1!B4")
+        diagnostics = Diagnostics()
+
+        diagnostics.merge(first_worker.to_list())
+        diagnostics.merge(second_worker.to_list())
+
+        assert diagnostics.to_list() == [
+            {"code": "fallback_variable_name", "level": "warning", "message": "Fallback for Sheet1!B2", "count": 3, "samples": ["Sheet1!B2", "Sheet1!B3", "Sheet1!B4"]},
+            {"code": TRUNCATED_CODE, "level": "warning", "message": ANY, "count": 1, "samples": []},
+        ]
+
+    def test_warn_logs_only_the_first_occurrence(self):
+        """Test that `warn` logs each code once within a collector, and every time without one."""
+        logger = MagicMock()
+        with collect_diagnostics() as diagnostics:
+            set_current_address("Sheet1!C3")
+            for _ in range(3):
+                warn(logger, "unknown_formula_part", "Unknown part %s", "FOO")
+
+        assert logger.warning.call_count == 1
+        assert diagnostics.to_list()[0]["samples"] == ["Sheet1!C3"]
+        warn(logger, "unknown_formula_part", "Unknown part %s", "FOO")
+        assert logger.warning.call_count == 2
+
+    def test_collectors_are_not_shared(self):
+        """Test that there is no collector by default and concurrent requests get their own."""
+        assert request_diagnostics.get() is None
+
+        async def request(code):
+            with collect_diagnostics() as diagnostics:
+                await asyncio.sleep(0)
+                warn(MagicMock(), code, code)
+                await asyncio.sleep(0)
+                return [entry["code"] for entry in diagnostics.to_list()]
+
+        async def run_requests():
+            return await asyncio.gather(request("first"), request("second"))
+
+        assert asyncio.run(run_requests()) == [["first"], ["second"]]
+        assert request_diagnostics.get() is None
+
+    def test_handler_collects_logged_warnings_by_message(self):
+        """Test that warnings logged the usual way are aggregated, and those recorded by `warn` aren't added twice."""
+        test_logger = logging.getLogger("tests.diagnostics")
+        handler = RequestWarningsHandler()
+        test_logger.addHandler(handler)
+        test_logger.propagate = False
+        try:
+            with collect_diagnostics() as diagnostics:
+                for name in ("a.xlsx", "b.xlsx"):
+                    test_logger.warning("Could not read %s", name)
+                test_logger.info("Not a warning")
+                warn(test_logger, "orphan_shared_formula", "Orphan %s", "Sheet1!A1")
+        finally:
+            test_logger.removeHandler(handler)
+            test_logger.propagate = True
+
+        assert diagnostics.warnings() == ["Could not read a.xlsx [2 times]", "Orphan Sheet1!A1"]
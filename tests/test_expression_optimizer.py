@@ -0,0 +1,171 @@
+import pytest
+from unittest.mock import MagicMock
+from xlcalculator.model import Model
+
+from src.dependency_extractor import generate_static_python_code
+from src.expression_optimizer import ExpressionOptimizer
+
+def _name_for(reference: str) -> str:
+    return reference.lower().replace("!", "_")
+
+def _optimize(formulas: dict) -> tuple[ExpressionOptimizer, dict]:
+    """Optimizes {address: formula} in order; returns the optimizer and {address: rendered}."""
+    reserved = []
+    def reserve(name):
+        reserved.append(name)
+        return name
+    optimizer = ExpressionOptimizer(_name_for, reserve)
+    for address, formula in formulas.items():
+        optimizer.add(address, formula, _name_for(address))
+    optimizer.eliminate_common_subexpressions()
+    return optimizer, {address: optimizer.render(address) for address in formulas}
+
+def _expression(formula: str) -> str:
+    return _optimize({"S!Z1": formula})[1]["S!Z1"][1]
+
+class TestLocalPasses:
+    """Tests for the passes applied to each formula on its own."""
+
+    @pytest.mark.parametrize("formula, expected", [
+        ("IF(S!A1>=2,S!A1,S!B1)", "s_a1 if s_a1 >= 2 else s_b1"),
+        ("IF(S!A1<>0,1)", "1 if s_a1 != 0 else False"),
+        ("AND(S!A1>1,S!B1<=3)", "s_a1 > 1 and s_b1 <= 3"),
+        ("OR(S!A1,S!B1)", "bool(s_a1 or s_b1)"),
+        ("NOT(S!A1=1)", "not s_a1 == 1"),
+    ])
+    def test_inlines_lambda_wrapped_functions(self, formula, expected):
+        """Test that IF/AND/OR/NOT become native conditional and boolean expressions."""
+        assert _expression(formula) == expected
+
+    @pytest.mark.parametrize("formula, expected", [
+        ("S!A1*(2+3)", "s_a1 * 5"),
+        ("IF(1>2,S!A1,S!B1)", "s_b1"),
+        ("MAX(S!A1,ROUND(2.567,2))", "max(s_a1, 2.57)"),
+        ("S!A1^2", "s_a1 * s_a1"),
+        ("S!A1/4", "s_a1 * 0.25"),
+        ("S!A1/3", "s_a1 / 3"),
+        ("S!A1/0", "s_a1 / 0"),
+        ("10^400", "10 ** 400"),
+    ])
+    def test_folds_constants_and_reduces_strength(self, formula, expected):
+        """Test that literal subexpressions are computed once and cheap forms are substituted."""
+        assert _expression(formula) == expected
+
+    @pytest.mark.parametrize("formula, expected", [("-2^2", 4), ("2^3^2", 64), ("1+2*3-4/2", 5.0), ("2>1=TRUE", True)])
+    def test_follows_excel_precedence(self, formula, expected):
+        """Test that negation binds tighter than `^`, which is left-associative."""
+        assert eval(_expression(formula)) == expected
+
+    def test_parses_quoted_sheet_references(self):
+        """Test that references to quoted sheet names are tokenized, with `$` only stripped from their cells."""
+        references = []
+        def name_for(reference):
+            references.append(reference)
+            return f"v{len(references)}"
+        optimizer = ExpressionOptimizer(name_for, lambda name: name)
+
+        assert optimizer.add("S!Z1", "IF('My $heet'!$A$1>0,'It''s'!B2:B3,1)", "s_z1") is True
+        assert references == ["'My $heet'!A1", "'It''s'!B2:B3"]
+
+    @pytest.mark.parametrize("formula", ["S!A1&S!B1", "S!A1*10%", "VLOOKUP(S!A1,S!B1:C9,2)", "IF(S!A1,,1)", "S!A1+"])
+    def test_leaves_unsupported_formulas_to_the_translator(self, formula):
+        """Test that formulas the optimizer can't parse are reported as not optimized."""
+        optimizer = ExpressionOptimizer(_name_for, lambda name: name)
+        assert optimizer.add("S!Z1", formula, "s_z1") is False
+        assert optimizer.render("S!Z1") is None
+        assert optimizer.get_stats()["unsupported_formulas"] == 1
+
+class TestCommonSubexpressions:
+    """Tests for sharing subexpressions across formulas."""
+
+    def test_hoists_shared_subexpressions_before_first_use(self):
+        """Test that an expression computed by several formulas is assigned to a temporary once."""
+        optimizer, rendered = _optimize({
+            "S!C1": "(S!A1+S!B1)*S!D1+1",
+            "S!C2": "(S!A1+S!B1)*S!D1-1",
+        })
+        assert rendered["S!C1"] == ([("cse_1", "(s_a1 + s_b1) * s_d1")], "cse_1 + 1")
+        assert rendered["S!C2"] == ([], "cse_1 - 1")
+        assert optimizer.get_stats()["common_subexpressions"] == 1
+
+    def test_reuses_cells_computing_the_same_expression(self):
+        """Test that a later formula reads an earlier cell instead of recomputing it."""
+        _, rendered = _optimize({"S!C1": "ROUND(S!A1*S!B1,2)", "S!C2": "ROUND(S!A1*S!B1,2)/2"})
+        assert rendered["S!C1"] == ([], "round(s_a1 * s_b1, 2)")
+        assert rendered["S!C2"] == ([], "s_c1 * 0.5")
+
+    def test_does_not_hoist_out_of_branches(self):
+        """Test that expressions guarded by IF are not computed unconditionally."""
+        _, rendered = _optimize({
+            "S!C1": "IF(S!B1=0,0,MAX(S!A1,S!B1)/S!B1)",
+            "S!C2": "IF(S!B1=1,0,MAX(S!A1,S!B1)/S!B1)",
+            "S!C3": "MAX(S!A1,S!B1)/S!B1+1",
+        })
+        assert rendered["S!C1"] == ([], "0 if s_b1 == 0 else max(s_a1, s_b1) / s_b1")
+        # Once computed unconditionally, guarded occurrences after it may reuse the temporary
+        assert rendered["S!C3"][1] == "max(s_a1, s_b1) / s_b1 + 1"
+
+class TestOptimizedCode:
+    """Tests for code generated with optimize=True."""
+
+    def _make_model(self) -> MagicMock:
+        cells = {
+            "Sheet1!A2": (None, 3, []),
+            "Sheet1!B2": (None, 4, []),
+            "Sheet1!C2": ("IF(Sheet1!A2>Sheet1!B2,Sheet1!A2,Sheet1!B2)^2", None, ["Sheet1!A2", "Sheet1!B2"]),
+            "Sheet1!D2": ("(Sheet1!A2+Sheet1!B2)*MAX(Sheet1!A2,Sheet1!B2)", None, ["Sheet1!A2", "Sheet1!B2"]),
+            "Sheet1!E2": ("(Sheet1!A2+Sheet1!B2)*MAX(Sheet1!A2,Sheet1!B2)/2", None, ["Sheet1!A2", "Sheet1!B2"]),
+        }
+        mock_model = MagicMock(spec=Model)
+        mock_model.cells = {}
+        for address, (formula, value, precedent_addresses) in cells.items():
+            cell = MagicMock()
+            cell.formula = formula
+            cell.formula_address = address
+            cell.value = value
+            precedents = []
+            for precedent_address in precedent_addresses:
+                precedent = MagicMock()
+                precedent.formula_address = precedent_address
+                precedents.append(precedent)
+            cell.precedents = precedents
+            mock_model.cells[address] = cell
+        return mock_model
+
+    def test_optimized_module_computes_the_workbook(self):
+        """Test that the optimized module runs and returns the same values as the formulas."""
+        report = {}
+        code = generate_static_python_code(self._make_model(), as_module=True, optimize=True, report=report)
+        namespace = {}
+        exec(code, namespace)
+
+        assert "lambda" not in code
+        assert namespace["compute"]({"Sheet1!A2": 5}) == {"Sheet1!C2": 25, "Sheet1!D2": 45, "Sheet1!E2": 22.5}
+        assert report["optimizer"]["formulas"] == 3
+        assert report["optimizer"]["reused_cells"] == 1
+
+    def test_quoted_sheet_names_are_optimized(self):
+        """Test that formulas over a sheet whose name has spaces are optimized too."""
+        model = self._make_model()
+        model.cells = {
+            address.replace("Sheet1", "My Sheet"): cell for address, cell in model.cells.items()
+        }
+        for cell in model.cells.values():
+            if cell.formula:
+                cell.formula = cell.formula.replace("Sheet1!", "'My Sheet'!")
+            for precedent in cell.precedents:
+                precedent.formula_address = precedent.formula_address.replace("Sheet1", "My Sheet")
+        report = {}
+        code = generate_static_python_code(model, as_module=True, optimize=True, report=report)
+        namespace = {}
+        exec(code, namespace)
+
+        assert report["optimizer"]["formulas"] == 3
+        assert namespace["compute"]({"My Sheet!A2": 5}) == {"My Sheet!C2": 25, "My Sheet!D2": 45, "My Sheet!E2": 22.5}
+
+    def test_not_optimized_by_default(self):
+        """Test that the translator's output is kept unless optimization is requested."""
+        report = {}
+        code = generate_static_python_code(self._make_model(), report=report)
+        assert "lambda" in code
+        assert "optimizer" not in report
@@ -6,11 +6,19 @@ from unittest.mock import MagicMock, AsyncMock, patch
 
 from src.file_handler import (
     handle_file_upload,
+    receive_upload,
     FileValidationError,
     InvalidFileSizeError,
-    InvalidFileExtensionError
+    InvalidFileExtensionError,
+    InvalidFileContentError,
+    ZIP_MAGIC
 )
 
+def _set_content(mock_file, content: bytes):
+    """Make the mock upload return `content` in chunks, like UploadFile.read(size)."""
+    stream = BytesIO(content)
+    mock_file.read = AsyncMock(side_effect=lambda size=-1: stream.read(size))
+
 class TestFileValidation:
     """Tests for file validation functionality."""
 
@@ -20,11 +28,11 @@ class TestFileValidation:
         # Create a mock file with valid extension and size
         mock_file = MagicMock(spec=UploadFile)
         mock_file.filename = "test.xlsx"
-        mock_file.read = AsyncMock(return_value=b"x" * 1024)  # 1KB file
+        _set_content(mock_file, ZIP_MAGIC + b"x" * 1020)  # 1KB file
         
         # Call the function and assert no exceptions are raised
         file_content = await handle_file_upload(mock_file)
-        assert file_content == b"x" * 1024
+        assert file_content == ZIP_MAGIC + b"x" * 1020
 
     @pytest.mark.asyncio
     async def test_valid_csv_file(self):
@@ -32,7 +40,7 @@ class TestFileValidation:
         # Create a mock file with valid extension and size
         mock_file = MagicMock(spec=UploadFile)
         mock_file.filename = "test.csv"
-        mock_file.read = AsyncMock(return_value=b"x" * 1024)  # 1KB file
+        _set_content(mock_file, b"x" * 1024)  # 1KB file
         
         # Call the function and assert no exceptions are raised
         file_content = await handle_file_upload(mock_file)
@@ -44,7 +52,7 @@ class TestFileValidation:
         # Create a mock file with valid extension and size
         mock_file = MagicMock(spec=UploadFile)
         mock_file.filename = "test.tsv"
-        mock_file.read = AsyncMock(return_value=b"x" * 1024)  # 1KB file
+        _set_content(mock_file, b"x" * 1024)  # 1KB file
         
         # Call the function and assert no exceptions are raised
         file_content = await handle_file_upload(mock_file)
@@ -56,7 +64,7 @@ class TestFileValidation:
         # Create a mock file that's too large
         mock_file = MagicMock(spec=UploadFile)
         mock_file.filename = "test.xlsx"
-        mock_file.read = AsyncMock(return_value=b"x" * (11 * 1024 * 1024))
+        _set_content(mock_file, ZIP_MAGIC + b"x" * (11 * 1024 * 1024))
         
         # Call the function and expect an exception
         with pytest.raises(FileValidationError) as excinfo:
@@ -71,7 +79,7 @@ class TestFileValidation:
         # Create a mock file with invalid extension
         mock_file = MagicMock(spec=UploadFile)
         mock_file.filename = "test.pdf"
-        mock_file.read = AsyncMock(return_value=b"x" * 1024)
+        _set_content(mock_file, b"x" * 1024)
         
         # Call the function and expect an exception
         with pytest.raises(FileValidationError) as excinfo:
@@ -86,7 +94,7 @@ class TestFileValidation:
         # Create a mock file with no filename
         mock_file = MagicMock(spec=UploadFile)
         mock_file.filename = None
-        mock_file.read = AsyncMock(return_value=b"x" * 1024)
+        _set_content(mock_file, b"x" * 1024)
         
         # Call the function and expect an exception
         with pytest.raises(FileValidationError) as excinfo:
@@ -114,34 +122,44 @@ class TestFileValidation:
     async def test_empty_file(self):
         """Test handling of an empty file."""
         mock_file = MagicMock(spec=UploadFile)
-        mock_file.filename = "empty.xlsx"
-        mock_file.read = AsyncMock(return_value=b"")  # Empty file
+        mock_file.filename = "empty.csv"
+        _set_content(mock_file, b"")  # Empty file
         
-        # Empty files should be valid as long as they have the right extension
+        # Empty CSV/TSV files are valid as long as they have the right extension
         file_content = await handle_file_upload(mock_file)
         assert file_content == b""
+
+    @pytest.mark.asyncio
+    async def test_empty_xlsx_file(self):
+        """Test that an empty .xlsx file is rejected, since it can't be a workbook."""
+        mock_file = MagicMock(spec=UploadFile)
+        mock_file.filename = "empty.xlsx"
+        _set_content(mock_file, b"")
+
+        with pytest.raises(InvalidFileContentError):
+            await handle_file_upload(mock_file)
         
     @pytest.mark.asyncio
     async def test_uppercase_extension(self):
         """Test that file extensions are case-insensitive."""
         mock_file = MagicMock(spec=UploadFile)
         mock_file.filename = "test.XLSX"  # Uppercase extension
-        mock_file.read = AsyncMock(return_value=b"x" * 1024)
+        _set_content(mock_file, ZIP_MAGIC + b"x" * 1020)
         
         # Call the function and assert no exceptions are raised
         file_content = await handle_file_upload(mock_file)
-        assert file_content == b"x" * 1024
+        assert file_content == ZIP_MAGIC + b"x" * 1020
         
     @pytest.mark.asyncio
     async def test_filename_with_dots(self):
         """Test handling of filenames with multiple dots."""
         mock_file = MagicMock(spec=UploadFile)
         mock_file.filename = "test.backup.xlsx"  # Multiple dots in filename
-        mock_file.read = AsyncMock(return_value=b"x" * 1024)
+        _set_content(mock_file, ZIP_MAGIC + b"x" * 1020)
         
         # Call the function and assert no exceptions are raised
         file_content = await handle_file_upload(mock_file)
-        assert file_content == b"x" * 1024
+        assert file_content == ZIP_MAGIC + b"x" * 1020
         
     @pytest.mark.asyncio
     async def test_exactly_max_size(self):
@@ -149,8 +167,76 @@ class TestFileValidation:
         mock_file = MagicMock(spec=UploadFile)
         mock_file.filename = "test.xlsx"
         # Exactly 10MB file (the limit)
-        mock_file.read = AsyncMock(return_value=b"x" * (10 * 1024 * 1024))
+        _set_content(mock_file, ZIP_MAGIC + b"x" * (10 * 1024 * 1024 - 4))
         
         # Call the function and assert no exceptions are raised
         file_content = await handle_file_upload(mock_file)
-        assert len(file_content) == 10 * 1024 * 1024 
\ No newline at end of file
+        assert len(file_content) == 10 * 1024 * 1024
+
+class TestStreamingUpload:
+    """Tests for early rejection while streaming uploads."""
+
+    @pytest.mark.asyncio
+    async def test_xlsx_without_zip_header_is_rejected_after_first_chunk(self):
+        """Test that the ZIP header is checked before the rest of the body is read."""
+        mock_file = MagicMock(spec=UploadFile)
+        mock_file.filename = "test.xlsx"
+        _set_content(mock_file, b"not a zip" * 100000)
+
+        with pytest.raises(InvalidFileContentError) as excinfo:
+            await handle_file_upload(mock_file)
+
+        assert excinfo.value.status_code == 415
+        assert mock_file.read.await_count == 1
+
+    @pytest.mark.asyncio
+    async def test_invalid_extension_is_rejected_without_reading(self):
+        """Test that the extension is checked before the body is read."""
+        mock_file = MagicMock(spec=UploadFile)
+        mock_file.filename = "test.pdf"
+        _set_content(mock_file, b"x" * 1024)
+
+        with pytest.raises(InvalidFileExtensionError):
+            await handle_file_upload(mock_file)
+
+        mock_file.read.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_oversized_upload_stops_reading_at_the_limit(self):
+        """Test that reading stops as soon as the body passes the configured limit."""
+        mock_file = MagicMock(spec=UploadFile)
+        mock_file.filename = "test.csv"
+        _set_content(mock_file, b"x" * (1024 * 1024))
+
+        with pytest.raises(InvalidFileSizeError) as excinfo:
+            await handle_file_upload(mock_file, max_bytes=100 * 1024)
+
+        assert excinfo.value.status_code == 413
+        assert "102400 bytes" in excinfo.value.message
+        assert mock_file.read.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_declared_size_is_rejected_without_reading(self):
+        """Test that an upload whose size is already known is rejected before reading."""
+        mock_file = MagicMock(spec=UploadFile)
+        mock_file.filename = "test.csv"
+        mock_file.size = 20 * 1024 * 1024
+        _set_content(mock_file, b"")
+
+        with pytest.raises(InvalidFileSizeError):
+            await handle_file_upload(mock_file)
+
+        mock_file.read.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_receive_upload_spools_large_bodies_to_disk(self):
+        """Test that bodies above the spool threshold roll over to a temporary file."""
+        mock_file = MagicMock(spec=UploadFile)
+        mock_file.filename = "test.csv"
+        _set_content(mock_file, b"x" * (2 * 1024 * 1024))
+
+        with patch("src.file_handler.settings.UPLOAD_SPOOL_MAX_BYTES", 1024 * 1024):
+            spool = await receive_upload(mock_file, max_bytes=4 * 1024 * 1024)
+        with spool:
+            assert spool._rolled
+            assert len(spool.read()) == 2 * 1024 * 1024
@@ -0,0 +1,88 @@
+import pytest
+
+from src.formula_shapes import (
+    canonicalize_formula,
+    column_index_to_letters,
+    column_letters_to_index,
+    parse_cell_position,
+    translate_tokens,
+    TranslationCache
+)
+from src.formula_translator import tokenize_formula
+
+def _name_for_reference(reference):
+    """Simple reference naming used to check substitution."""
+    return reference.lower().replace("!", "_").replace(":", "_")
+
+class TestFormulaShapes:
+    """Tests for R1C1 canonicalization and the shape-keyed translation cache."""
+
+    def test_column_letters_to_index(self):
+        """Test conversion of column letters to 1-based indexes."""
+        assert column_letters_to_index("A") == 1
+        assert column_letters_to_index("Z") == 26
+        assert column_letters_to_index("AA") == 27
+        assert column_letters_to_index("XFD") == 16384
+
+    def test_column_index_to_letters(self):
+        """Test conversion of 1-based column indexes back to letters."""
+        for letters in ["A", "Z", "AA", "AZ", "BA", "XFD"]:
+            assert column_index_to_letters(column_letters_to_index(letters)) == letters
+
+    def test_parse_cell_position(self):
+        """Test parsing of the row and column of a cell address."""
+        assert parse_cell_position("Sheet1!C2") == (2, 3)
+        assert parse_cell_position("AB10") == (10, 28)
+        assert parse_cell_position("Sheet1!A1:B2") is None
+
+    def test_filled_down_formulas_share_a_shape(self):
+        """Test that a formula filled down a column has a single canonical form."""
+        shape_row_2, references_row_2 = canonicalize_formula("A2*B2", 2, 3)
+        shape_row_3, references_row_3 = canonicalize_formula("A3*B3", 3, 3)
+
+        assert shape_row_2 == shape_row_3 == "R[0]C[-2]*R[0]C[-1]"
+        assert references_row_2 == ["A2", "B2"]
+        assert references_row_3 == ["A3", "B3"]
+
+    def test_canonicalize_ranges_and_sheets(self):
+        """Test that sheet prefixes are kept and range ends are made relative."""
+        shape, references = canonicalize_formula("SUM(Sheet2!A1:A10)+C5", 5, 4)
+        assert shape == "SUM(Sheet2!R[-4]C[-3]:R[5]C[-3])+R[0]C[-1]"
+        assert references == ["Sheet2!A1:A10", "C5"]
+
+    def test_canonicalize_ignores_strings_and_identifiers(self):
+        """Test that references inside string literals or longer identifiers are left alone."""
+        shape, references = canonicalize_formula('IF(_X1="A1",B2,0)', 2, 3)
+        assert shape == 'IF(_X1="A1",R[0]C[-1],0)'
+        assert references == ["B2"]
+
+    def test_translation_cache_hits(self):
+        """Test that a shape is translated once and reused for every other cell."""
+        cache = TranslationCache(_name_for_reference)
+        translated = [cache.translate(f"A{row}*B{row}^2", f"Sheet1!C{row}") for row in range(2, 102)]
+
+        assert translated[0] == "a2*b2**2"
+        assert translated[-1] == "a101*b101**2"
+        stats = cache.get_stats()
+        assert stats["formulas"] == 100
+        assert stats["distinct_shapes"] == 1
+        assert stats["cache_hits"] == 99
+        assert stats["cache_hit_ratio"] == 0.99
+
+    @pytest.mark.parametrize("formula, cell_address", [
+        ("SUM(A1:B1)", "Sheet1!C1"),
+        ("IF(A2>B2,A2*B2,SUM(C2:E2))", "Sheet1!F2"),
+        ("Sheet2!A1+Sheet2!B1", "Sheet1!A5"),
+        ("a1+A1", "Sheet1!B1"),
+        ("$A$1*A1$B$2", "Sheet1!C3"),
+        ('"A1"&B1', "Sheet1!C1"),
+        ("LOG10(A1)+1.5E3", "Sheet1!B1"),
+        ("A1+B1", "NamedRange"),
+    ])
+    def test_translation_cache_matches_direct_translation(self, formula, cell_address):
+        """Test that cached translation produces exactly the direct translation."""
+        expected = translate_tokens(tokenize_formula(formula), _name_for_reference)
+        cache = TranslationCache(_name_for_reference)
+        assert cache.translate(formula, cell_address) == expected
+        # Second lookup of the same shape goes through the template
+        assert cache.translate(formula, cell_address) == expected
@@ -64,8 +64,7 @@ class TestIntegration:
         
         # Verify the generated script contains expected elements
         script = response_data["script"]
-        assert "from xlcalculator.model import Model" in script
-        assert "from xlcalculator.evaluator import Evaluator" in script
+        assert "# --- Start of Generated Excel to Python Conversion ---" in script
         
         # Check execution output
         assert "stdout" in response_data["execution_output"]
@@ -92,8 +91,7 @@ class TestIntegration:
             assert os.path.exists(output_path)
             with open(output_path, 'r') as f:
                 content = f.read()
-                assert "from xlcalculator.model import Model" in content
-                assert "from xlcalculator.evaluator import Evaluator" in content
+                assert "# --- Start of Generated Excel to Python Conversion ---" in content
         finally:
             # Clean up
             if os.path.exists(output_path):
@@ -252,7 +250,7 @@ class TestIntegration:
     async def test_mock_integration(self):
         """Test the integration flow with mocked components."""
         # Create a mock Excel file
-        mock_excel_content = b"mock excel content"
+        mock_excel_content = b"PK\x03\x04mock excel content" # Starts like a ZIP archive, as .xlsx uploads must
         
         # Mock the file handler function to pass validation
         with patch("src.file_handler.handle_file_upload") as mock_validate:
@@ -275,7 +273,7 @@ class TestIntegration:
                     mock_generate.return_value = "# Generated Python code\nimport pandas as pd\n\ndef calculate():\n    return A1 + B1"
                     
                     # Mock the sandbox execution to avoid errors
-                    with patch("src.main.execute_script_in_sandbox") as mock_execute:
+                    with patch("src.main.run_script_in_sandbox") as mock_execute:
                         mock_execute.return_value = ("Success", "", 0)  # stdout, stderr, returncode
                         
                         # Create a modified version of the function without Form parameters
@@ -290,7 +288,7 @@ class TestIntegration:
                             # Create a mock upload file with AsyncMock for read method
                             upload_file = MagicMock()
                             upload_file.filename = "test.xlsx"
-                            async_read = AsyncMock(return_value=mock_excel_content)
+                            async_read = AsyncMock(side_effect=[mock_excel_content, b""]) # Read in chunks until empty
                             upload_file.read = async_read
                             
                             # Call the function without output_filename parameter
@@ -307,15 +305,14 @@ class TestIntegration:
                             # Check that the response contains Python code
                             assert "script" in response_data
                             # Check for the expected content in the script
-                            assert "from xlcalculator.model import Model" in response_data["script"]
-                            assert "from xlcalculator.evaluator import Evaluator" in response_data["script"]
+                            assert "xlcalculator" not in response_data["script"]
                             assert "# --- Start of Generated Excel to Python Conversion ---" in response_data["script"]
 
     @pytest.mark.asyncio
     async def test_mock_integration_with_complex_formulas(self):
         """Test integration with complex formulas including functions and nested operations."""
         # Create a mock Excel file
-        mock_excel_content = b"mock excel content"
+        mock_excel_content = b"PK\x03\x04mock excel content" # Starts like a ZIP archive, as .xlsx uploads must
         
         # Mock the file handler function to pass validation
         with patch("src.file_handler.handle_file_upload") as mock_validate:
@@ -361,7 +358,7 @@ def calculate():
                     mock_generate.return_value = complex_code
                     
                     # Mock the sandbox execution
-                    with patch("src.main.execute_script_in_sandbox") as mock_execute:
+                    with patch("src.main.run_script_in_sandbox") as mock_execute:
                         mock_execute.return_value = ("{'A1': 10, 'A2': 20, 'A3': 30, 'B1': 60, 'B2': 40, 'C1': 20}", "", 0)
                         
                         # Create a wrapper function that doesn't use Form parameters
@@ -375,7 +372,7 @@ def calculate():
                             # Create a mock upload file
                             upload_file = MagicMock()
                             upload_file.filename = "test.xlsx"
-                            upload_file.read = AsyncMock(return_value=mock_excel_content)
+                            upload_file.read = AsyncMock(side_effect=[mock_excel_content, b""]) # Read in chunks until empty
                             
                             # Call the function
                             response = await modified_convert_excel_to_python(upload_file)
@@ -392,13 +389,13 @@ def calculate():
                             assert "# --- Start of Generated Excel to Python Conversion ---" in response_data["script"]
                             assert "# --- End of Generated Excel to Python Conversion ---" in response_data["script"]
                             
-                            # Check for variable initializations
-                            assert "sheet1_10 = 0 # Initialize for Sheet1!A1" in response_data["script"]
+                            # Check for variable initializations; cells under one header are suffixed with their row
+                            assert "sheet1_10_1 = 0 # Initialize for Sheet1!A1" in response_data["script"]
                             assert "sheet1_20 = 0 # Initialize for Sheet1!C1" in response_data["script"]
-                            assert "sheet1_60 = 0 # Initialize for Sheet1!B1" in response_data["script"]
+                            assert "sheet1_60_1 = 0 # Initialize for Sheet1!B1" in response_data["script"]
                             
                             # Check for formula translations (even if not exactly as expected)
-                            assert "sheet1_60 =" in response_data["script"]
+                            assert "sheet1_60_1 =" in response_data["script"]
                             assert "sheet1_20 =" in response_data["script"]
                             
                             # Check execution output contains the expected results
@@ -410,7 +407,7 @@ def calculate():
     async def test_mock_integration_with_cross_sheet_references(self):
         """Test integration with cross-sheet references."""
         # Create a mock Excel file
-        mock_excel_content = b"mock excel content"
+        mock_excel_content = b"PK\x03\x04mock excel content" # Starts like a ZIP archive, as .xlsx uploads must
         
         # Mock the file handler function to pass validation
         with patch("src.file_handler.handle_file_upload") as mock_validate:
@@ -449,7 +446,7 @@ def calculate():
                     mock_generate.return_value = cross_sheet_code
                     
                     # Mock the sandbox execution
-                    with patch("src.main.execute_script_in_sandbox") as mock_execute:
+                    with patch("src.main.run_script_in_sandbox") as mock_execute:
                         mock_execute.return_value = ("{'Sheet1!A1': 10, 'Sheet1!B1': 20, 'Sheet2!A1': 25, 'Sheet2!B1': 35}", "", 0)
                         
                         # Create a wrapper function that doesn't use Form parameters
@@ -463,7 +460,7 @@ def calculate():
                             # Create a mock upload file
                             upload_file = MagicMock()
                             upload_file.filename = "test.xlsx"
-                            upload_file.read = AsyncMock(return_value=mock_excel_content)
+                            upload_file.read = AsyncMock(side_effect=[mock_excel_content, b""]) # Read in chunks until empty
                             
                             # Call the function
                             response = await modified_convert_excel_to_python(upload_file)
@@ -499,7 +496,7 @@ def calculate():
     async def test_mock_integration_with_error_handling(self):
         """Test integration with error handling for invalid formulas."""
         # Create a mock Excel file
-        mock_excel_content = b"mock excel content"
+        mock_excel_content = b"PK\x03\x04mock excel content" # Starts like a ZIP archive, as .xlsx uploads must
         
         # Mock the file handler function to pass validation
         with patch("src.file_handler.handle_file_upload") as mock_validate:
@@ -535,7 +532,7 @@ def calculate():
                     mock_generate.return_value = error_code
                     
                     # Mock the sandbox execution
-                    with patch("src.main.execute_script_in_sandbox") as mock_execute:
+                    with patch("src.main.run_script_in_sandbox") as mock_execute:
                         mock_execute.return_value = ("{'Sheet1!A1': 10, 'Sheet1!B1': None}", "", 0)
                         
                         # Create a wrapper function that doesn't use Form parameters
@@ -549,7 +546,7 @@ def calculate():
                             # Create a mock upload file
                             upload_file = MagicMock()
                             upload_file.filename = "test.xlsx"
-                            upload_file.read = AsyncMock(return_value=mock_excel_content)
+                            upload_file.read = AsyncMock(side_effect=[mock_excel_content, b""]) # Read in chunks until empty
                             
                             # Call the function
                             response = await modified_convert_excel_to_python(upload_file)
@@ -0,0 +1,104 @@
+import pytest
+from unittest.mock import patch
+
+from src.conversion_cache import ConversionCache
+from src.conversion_pool import ConversionPool
+from src.job_runner import JobRunner
+from src.job_store import JobStore
+from src.pipeline import WorkbookParseError
+
+def _fake_convert(file_content, force_evaluator=False, vectorize=False, progress=None, as_module=False, targets=None, inputs=None, optimize=False, engine="xlcalculator"):
+    """Stand-in for convert_workbook that reports the pipeline stages."""
+    for stage in ("parse", "order", "naming", "codegen"):
+        progress(stage)
+    timings = {"parse": {"wall_ms": 1.0, "cpu_ms": 1.0}}
+    return {"script": "x = 1", "warnings": ["a warning"], "report": {"circular_references": []}, "timings": timings}
+
+class TestJobRunner:
+    """Tests for running queued jobs."""
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        """Create a job store in a temporary directory."""
+        return JobStore(str(tmp_path / "jobs"))
+
+    @pytest.fixture
+    def runner(self, store, tmp_path):
+        """Create a runner with an in-thread pool and a memory-only cache."""
+        cache = ConversionCache(cache_dir=None, memory_max_bytes=1024 * 1024)
+        return JobRunner(store, ConversionPool(max_workers=0), cache, worker_id="test-worker", poll_interval=0.01)
+
+    def _queue_job(self, store, options: dict) -> str:
+        job_id = store.new_job_id()
+        store.create_upload_dir()
+        input_path = store.upload_path(job_id, "book.xlsx")
+        with open(input_path, "wb") as f:
+            f.write(b"PK\x03\x04data")
+        store.create_job(job_id, "book.xlsx", input_path, options)
+        return job_id
+
+    @pytest.mark.asyncio
+    @patch("src.job_runner.run_script_in_sandbox")
+    @patch("src.job_runner.convert_workbook", side_effect=_fake_convert)
+    async def test_run_job_succeeds(self, mock_convert, mock_execute, runner, store):
+        """Test that a job runs every stage and stores the result."""
+        mock_execute.return_value = ("out", "", 0)
+        job_id = self._queue_job(store, {"force_evaluator": False, "vectorize": False, "execute": True})
+
+        assert await runner.run_once()
+        assert not await runner.run_once()
+
+        job = store.get_job(job_id)
+        assert job["status"] == "succeeded"
+        assert set(job["stages"].values()) == {"completed"}
+        assert job["result"]["script"] == "x = 1"
+        assert job["result"]["warnings"] == ["a warning"]
+        assert job["result"]["execution_output"] == {"stdout": "out", "stderr": "", "return_code": 0}
+        assert list(job["result"]["timings"]) == ["parse", "sandbox"]
+
+    @pytest.mark.asyncio
+    @patch("src.job_runner.run_script_in_sandbox")
+    @patch("src.job_runner.convert_workbook", side_effect=_fake_convert)
+    async def test_cached_conversion_skips_pipeline_stages(self, mock_convert, mock_execute, runner, store):
+        """Test that a second job for the same upload is served from the conversion cache."""
+        options = {"force_evaluator": False, "vectorize": False, "execute": False}
+        self._queue_job(store, options)
+        second_job_id = self._queue_job(store, options)
+
+        await runner.run_once()
+        await runner.run_once()
+
+        job = store.get_job(second_job_id)
+        assert job["result"]["cached"] is True
+        assert job["stages"]["parse"] == "skipped"
+        assert job["stages"]["sandbox"] == "skipped"
+        assert mock_convert.call_count == 1
+        mock_execute.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch("src.job_runner.convert_workbook", side_effect=WorkbookParseError("Error parsing or reading Excel file: bad"))
+    async def test_run_job_records_failure(self, mock_convert, runner, store):
+        """Test that pipeline errors mark the job failed."""
+        job_id = self._queue_job(store, {"execute": True})
+
+        await runner.run_once()
+
+        job = store.get_job(job_id)
+        assert job["status"] == "failed"
+        assert "Error parsing or reading Excel file" in job["error"]
+
+    @pytest.mark.asyncio
+    @patch("src.job_runner.convert_workbook", side_effect=_fake_convert)
+    async def test_as_module_job_stores_model(self, mock_convert, store, tmp_path):
+        """Test that as_module jobs store their compute module and report its model_id."""
+        from src.model_store import ModelStore
+        model_store = ModelStore(str(tmp_path / "models"))
+        cache = ConversionCache(cache_dir=None, memory_max_bytes=1024 * 1024)
+        runner = JobRunner(store, ConversionPool(max_workers=0), cache, model_store, worker_id="test-worker")
+        job_id = self._queue_job(store, {"as_module": True, "execute": False})
+
+        await runner.run_once()
+
+        model_id = store.get_job(job_id)["result"]["model_id"]
+        with open(model_store._path(model_id)) as f:
+            assert f.read() == "x = 1"
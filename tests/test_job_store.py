@@ -0,0 +1,124 @@
+import os
+import pytest
+
+from src.job_store import JobStore, JobProgress
+
+class TestJobStore:
+    """Tests for the SQLite-backed job queue."""
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        """Create a job store in a temporary directory."""
+        return JobStore(str(tmp_path), lease_seconds=60, max_attempts=2)
+
+    def _queue_job(self, store, content: bytes = b"PK\x03\x04data") -> str:
+        job_id = store.new_job_id()
+        store.create_upload_dir()
+        input_path = store.upload_path(job_id, "book.xlsx")
+        with open(input_path, "wb") as f:
+            f.write(content)
+        store.create_job(job_id, "book.xlsx", input_path, {"force_evaluator": False})
+        return job_id
+
+    def test_create_and_get_job(self, store):
+        """Test that a new job is queued with ingest completed."""
+        job_id = self._queue_job(store)
+        job = store.get_job(job_id)
+
+        assert job["status"] == "queued"
+        assert job["stages"] == {"ingest": "completed", "parse": "pending", "order": "pending", "naming": "pending", "codegen": "pending", "sandbox": "pending"}
+        assert job["options"] == {"force_evaluator": False}
+        assert store.get_job("missing") is None
+
+    def test_claims_are_exclusive_and_in_order(self, store):
+        """Test that jobs are claimed oldest first and only once."""
+        first_job_id = self._queue_job(store)
+        second_job_id = self._queue_job(store)
+
+        assert store.claim_next("worker-a")["id"] == first_job_id
+        assert store.claim_next("worker-b")["id"] == second_job_id
+        assert store.count_by_status() == {"queued": 0, "running": 2, "succeeded": 0, "failed": 0}
+        assert store.claim_next("worker-c") is None
+
+    def test_jobs_survive_a_new_store_instance(self, store):
+        """Test that queued jobs are visible to another process opening the same directory."""
+        job_id = self._queue_job(store)
+        other_store = JobStore(store.jobs_dir)
+
+        assert other_store.claim_next("worker-b")["id"] == job_id
+
+    def test_expired_lease_is_reclaimed_then_abandoned(self, store):
+        """Test that jobs of dead runners are reclaimed until max_attempts is reached."""
+        store.lease_seconds = -1 # Every lease is already expired
+        job_id = self._queue_job(store)
+
+        assert store.claim_next("worker-a")["attempts"] == 1
+        reclaimed = store.claim_next("worker-b")
+        assert reclaimed["attempts"] == 2
+        assert reclaimed["stages"]["parse"] == "pending"
+        assert store.claim_next("worker-c") is None
+        assert store.get_job(job_id)["status"] == "failed"
+
+    def test_stage_progress_and_completion(self, store):
+        """Test stage transitions and that the upload is removed once the job is done."""
+        job_id = self._queue_job(store)
+        input_path = store.get_job(job_id)["input_path"]
+        store.claim_next("worker-a")
+
+        progress = JobProgress(store.jobs_dir, job_id)
+        progress("parse")
+        progress("order")
+        job = store.get_job(job_id)
+        assert job["stage"] == "order"
+        assert job["stages"]["parse"] == "completed"
+        assert job["stages"]["order"] == "running"
+
+        assert store.complete_job(job_id, "worker-a", {"script": "x = 1"})
+        job = store.get_job(job_id)
+        assert job["status"] == "succeeded"
+        assert job["result"] == {"script": "x = 1"}
+        assert job["stages"]["order"] == "completed"
+        assert not os.path.exists(input_path)
+
+    def test_fail_job_marks_running_stage(self, store):
+        """Test that a failure is recorded with the stage it happened in."""
+        job_id = self._queue_job(store)
+        store.claim_next("worker-a")
+        store.start_stage(job_id, "parse")
+        assert store.fail_job(job_id, "worker-a", "Error parsing or reading Excel file: bad")
+
+        job = store.get_job(job_id)
+        assert job["status"] == "failed"
+        assert job["error"] == "Error parsing or reading Excel file: bad"
+        assert job["stages"]["parse"] == "failed"
+
+    def test_outcome_of_a_lost_lease_is_discarded(self, store):
+        """Test that a worker whose job was reclaimed can't finish it, nor remove its upload."""
+        store.lease_seconds = -1 # Every lease is already expired
+        job_id = self._queue_job(store)
+        input_path = store.get_job(job_id)["input_path"]
+        store.claim_next("worker-a")
+        store.claim_next("worker-b")
+
+        assert not store.complete_job(job_id, "worker-a", {"script": "x = 1"})
+        assert not store.fail_job(job_id, "worker-a", "too late")
+        job = store.get_job(job_id)
+        assert job["status"] == "running"
+        assert job["result"] is None
+        assert os.path.exists(input_path)
+
+        assert store.complete_job(job_id, "worker-b", {"script": "x = 1"})
+        assert store.get_job(job_id)["status"] == "succeeded"
+
+    def test_renew_and_release(self, store):
+        """Test that only the holder can renew a lease and released jobs are queued again."""
+        job_id = self._queue_job(store)
+        store.claim_next("worker-a")
+
+        assert store.renew_lease(job_id, "worker-a")
+        assert not store.renew_lease(job_id, "worker-b")
+
+        store.release_job(job_id, "worker-a")
+        job = store.get_job(job_id)
+        assert job["status"] == "queued"
+        assert job["attempts"] == 0
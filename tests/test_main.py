@@ -1,12 +1,12 @@
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock, AsyncMock
+from unittest.mock import patch, MagicMock, AsyncMock, ANY
 from io import BytesIO
 import json
 import os
 import tempfile
 
-from src.main import app, request_warnings
+from src.main import app
 
 class TestMainAPI:
     """Tests for the main API endpoints."""
@@ -22,12 +22,11 @@ class TestMainAPI:
         return b"mock excel file content"
     
     @patch("src.main.handle_file_upload")
-    @patch("src.main.ModelCompiler")
-    @patch("src.main.Evaluator")
-    @patch("src.main.generate_static_python_code")
-    @patch("src.main.execute_script_in_sandbox")
+    @patch("src.pipeline.ModelCompiler")
+    @patch("src.pipeline.generate_static_python_code")
+    @patch("src.main.run_script_in_sandbox")
     def test_convert_endpoint_without_output_file(
-        self, mock_execute, mock_generate_code, mock_evaluator, 
+        self, mock_execute, mock_generate_code,
         mock_model_compiler, mock_handle_upload, client, mock_file_content
     ):
         """Test the /convert endpoint without an output filename."""
@@ -59,16 +58,63 @@ class TestMainAPI:
         # Verify mocks were called
         mock_handle_upload.assert_called_once()
         mock_model_compiler.return_value.read_and_parse_archive.assert_called_once()
-        mock_generate_code.assert_called_once_with(mock_model)
+        mock_generate_code.assert_called_once_with(mock_model, force_evaluator=False, report=ANY, vectorize=False, progress=ANY, as_module=False, targets=None, inputs=None, optimize=False)
         mock_execute.assert_called_once()
     
     @patch("src.main.handle_file_upload")
-    @patch("src.main.ModelCompiler")
-    @patch("src.main.Evaluator")
-    @patch("src.main.generate_static_python_code")
+    @patch("src.pipeline.ModelCompiler")
+    @patch("src.pipeline.generate_static_python_code")
+    @patch("src.main.run_script_in_sandbox")
+    def test_convert_endpoint_reports_stage_timings(
+        self, mock_execute, mock_generate_code,
+        mock_model_compiler, mock_handle_upload, client, mock_file_content
+    ):
+        """Test that the response and its Server-Timing header carry the timing of every stage."""
+        mock_handle_upload.return_value = mock_file_content
+        mock_generate_code.return_value = "# Generated Python code"
+
+        async def execute(script, usage=None):
+            usage.update(cpu_seconds=0.25, max_rss_kb=20480)
+            return ("Execution output", "", 0)
+        mock_execute.side_effect = execute
+
+        test_file = {"file": ("test.xlsx", BytesIO(mock_file_content), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+        response = client.post("/convert/", files=test_file)
+
+        assert response.status_code == 200
+        timings = response.json()["timings"]
+        assert {"ingest", "cache", "queue", "parse", "sandbox", "total"} <= set(timings)
+        assert timings["sandbox"]["cpu_ms"] == 250.0
+        assert timings["sandbox"]["max_rss_kb"] == 20480
+        assert timings["ingest"]["cpu_ms"] is None
+        assert "sandbox;dur=" in response.headers["Server-Timing"]
+
+    @patch("src.main.handle_file_upload")
+    @patch("src.pipeline.ModelCompiler")
+    @patch("src.pipeline.generate_static_python_code")
+    @patch("src.main.run_script_in_sandbox")
+    def test_convert_endpoint_without_execution(
+        self, mock_execute, mock_generate_code,
+        mock_model_compiler, mock_handle_upload, client, mock_file_content
+    ):
+        """Test that `execute=false` returns the script without running it."""
+        mock_handle_upload.return_value = mock_file_content
+        mock_generate_code.return_value = "# Generated Python code"
+
+        test_file = {"file": ("test.xlsx", BytesIO(mock_file_content), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+        response = client.post("/convert/", files=test_file, data={"execute": "false"})
+
+        assert response.status_code == 200
+        assert "execution_output" not in response.json()
+        assert "sandbox" not in response.json()["timings"]
+        mock_execute.assert_not_called()
+
+    @patch("src.main.handle_file_upload")
+    @patch("src.pipeline.ModelCompiler")
+    @patch("src.pipeline.generate_static_python_code")
     @patch("builtins.open", new_callable=MagicMock)
     def test_convert_endpoint_with_output_file(
-        self, mock_open, mock_generate_code, mock_evaluator, 
+        self, mock_open, mock_generate_code,
         mock_model_compiler, mock_handle_upload, client, mock_file_content
     ):
         """Test the /convert endpoint with an output filename."""
@@ -104,17 +150,16 @@ class TestMainAPI:
         # Verify mocks were called
         mock_handle_upload.assert_called_once()
         mock_model_compiler.return_value.read_and_parse_archive.assert_called_once()
-        mock_generate_code.assert_called_once_with(mock_model)
+        mock_generate_code.assert_called_once_with(mock_model, force_evaluator=False, report=ANY, vectorize=False, progress=ANY, as_module=False, targets=None, inputs=None, optimize=False)
         mock_open.assert_called_once_with("output.py", "w")
         mock_file.write.assert_called_once()
     
     @patch("src.main.handle_file_upload")
-    @patch("src.main.ModelCompiler")
-    @patch("src.main.Evaluator")
-    @patch("src.main.generate_static_python_code")
-    @patch("src.main.execute_script_in_sandbox")
+    @patch("src.pipeline.ModelCompiler")
+    @patch("src.pipeline.generate_static_python_code")
+    @patch("src.main.run_script_in_sandbox")
     def test_convert_endpoint_with_force_evaluator(
-        self, mock_execute, mock_generate_code, mock_evaluator, 
+        self, mock_execute, mock_generate_code,
         mock_model_compiler, mock_handle_upload, client, mock_file_content
     ):
         """Test the /convert endpoint with force_evaluator=true."""
@@ -138,17 +183,14 @@ class TestMainAPI:
         assert "# Generated Python code with evaluator" in response_data["script"]
         
         # Verify generate_static_python_code was called with force_evaluator=True
-        # Note: In the current implementation, the force_evaluator parameter isn't actually passed to generate_static_python_code
-        # This test assumes it would be in a complete implementation
-        mock_generate_code.assert_called_once_with(mock_model)
+        mock_generate_code.assert_called_once_with(mock_model, force_evaluator=True, report=ANY, vectorize=False, progress=ANY, as_module=False, targets=None, inputs=None, optimize=False)
     
     @patch("src.main.handle_file_upload")
-    @patch("src.main.ModelCompiler")
-    @patch("src.main.Evaluator")
-    @patch("src.main.generate_static_python_code")
-    @patch("src.main.execute_script_in_sandbox")
+    @patch("src.pipeline.ModelCompiler")
+    @patch("src.pipeline.generate_static_python_code")
+    @patch("src.main.run_script_in_sandbox")
     def test_convert_endpoint_with_csv_file(
-        self, mock_execute, mock_generate_code, mock_evaluator, 
+        self, mock_execute, mock_generate_code,
         mock_model_compiler, mock_handle_upload, client
     ):
         """Test the /convert endpoint with a CSV file."""
@@ -173,6 +215,10 @@ class TestMainAPI:
         assert "# Generated Python code from CSV" in response_data["script"]
         assert "execution_output" in response_data
         assert response_data["execution_output"]["stdout"] == "CSV Execution output"
+        # CSV files are read by the CSV engine rather than xlcalculator
+        mock_model_compiler.return_value.read_and_parse_archive.assert_not_called()
+        assert mock_generate_code.call_args.args[0].cells["Sheet1!C2"].formula == "Sheet1!A1+Sheet1!B1"
+        assert response_data["report"]["ingest"]["engine"] == "csv"
     
     @patch("src.main.handle_file_upload")
     def test_convert_endpoint_file_validation_error(self, mock_handle_upload, client):
@@ -197,7 +243,29 @@ class TestMainAPI:
         assert "log_url" in response_data
     
     @patch("src.main.handle_file_upload")
-    @patch("src.main.ModelCompiler")
+    def test_convert_endpoint_rejects_malformed_targets(self, mock_handle_upload, client, mock_file_content):
+        """Test that malformed targets are rejected before the upload is read."""
+        test_file = {"file": ("test.xlsx", BytesIO(mock_file_content), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+
+        response = client.post("/convert/", files=test_file, data={"targets": "Summary!B2,B3"})
+
+        assert response.status_code == 400
+        assert "Invalid target 'B3'" in response.json()["detail"]
+        mock_handle_upload.assert_not_called()
+
+    @patch("src.main.handle_file_upload")
+    def test_convert_endpoint_rejects_unknown_engines(self, mock_handle_upload, client, mock_file_content):
+        """Test that an unknown ingest engine is rejected before the upload is read."""
+        test_file = {"file": ("test.xlsx", BytesIO(mock_file_content), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+
+        response = client.post("/convert/", files=test_file, data={"engine": "openpyxl"})
+
+        assert response.status_code == 400
+        assert "Unknown ingest engine 'openpyxl'" in response.json()["detail"]
+        mock_handle_upload.assert_not_called()
+
+    @patch("src.main.handle_file_upload")
+    @patch("src.pipeline.ModelCompiler")
     def test_convert_endpoint_parse_error(self, mock_model_compiler, mock_handle_upload, client, mock_file_content):
         """Test the /convert endpoint with parsing error."""
         # Set up mocks
@@ -215,12 +283,11 @@ class TestMainAPI:
         assert "Parsing error" in response.text
     
     @patch("src.main.handle_file_upload")
-    @patch("src.main.ModelCompiler")
-    @patch("src.main.Evaluator")
-    @patch("src.main.generate_static_python_code")
-    @patch("src.main.execute_script_in_sandbox")
+    @patch("src.pipeline.ModelCompiler")
+    @patch("src.pipeline.generate_static_python_code")
+    @patch("src.main.run_script_in_sandbox")
     def test_convert_endpoint_execution_error(
-        self, mock_execute, mock_generate_code, mock_evaluator, 
+        self, mock_execute, mock_generate_code,
         mock_model_compiler, mock_handle_upload, client, mock_file_content
     ):
         """Test the /convert endpoint with script execution error."""
@@ -246,13 +313,11 @@ class TestMainAPI:
         assert response_data["execution_output"]["return_code"] == 1
     
     @patch("src.main.handle_file_upload")
-    @patch("src.main.ModelCompiler")
-    @patch("src.main.Evaluator")
-    @patch("src.main.generate_static_python_code")
-    @patch("src.main.execute_script_in_sandbox")
-    @patch("tempfile.NamedTemporaryFile")
+    @patch("src.pipeline.ModelCompiler")
+    @patch("src.pipeline.generate_static_python_code")
+    @patch("src.main.run_script_in_sandbox")
     def test_convert_endpoint_sandbox_timeout(
-        self, mock_tempfile, mock_execute, mock_generate_code, mock_evaluator, 
+        self, mock_execute, mock_generate_code,
         mock_model_compiler, mock_handle_upload, client, mock_file_content
     ):
         """Test the /convert endpoint with sandbox execution timeout."""
@@ -262,12 +327,7 @@ class TestMainAPI:
         mock_model_compiler.return_value.read_and_parse_archive.return_value = mock_model
         mock_generate_code.return_value = "# Generated Python code"
         
-        # Mock the temporary file
-        mock_temp_file = MagicMock()
-        mock_temp_file.name = "/tmp/temp_script.py"
-        mock_tempfile.return_value.__enter__.return_value = mock_temp_file
-        
-        # Mock execute_script_in_sandbox to raise a timeout
+        # Mock run_script_in_sandbox to raise a timeout
         import subprocess
         mock_execute.side_effect = subprocess.TimeoutExpired(cmd="python", timeout=5)
         
@@ -331,45 +391,146 @@ class TestMainAPI:
         assert any("file" in error["loc"] for error in response_data["detail"])
     
     @patch("src.main.handle_file_upload")
-    @patch("src.main.ModelCompiler")
-    @patch("src.main.Evaluator")
-    @patch("src.main.generate_static_python_code")
-    @patch("src.main.execute_script_in_sandbox")
-    @patch("os.path.exists")
-    @patch("os.remove")
-    def test_convert_endpoint_temp_file_cleanup(
-        self, mock_remove, mock_exists, mock_execute, mock_generate, mock_evaluator, 
+    @patch("src.pipeline.ModelCompiler")
+    @patch("src.pipeline.generate_static_python_code")
+    @patch("src.main.run_script_in_sandbox")
+    @patch("tempfile.NamedTemporaryFile")
+    def test_convert_endpoint_sandbox_gets_script_without_temp_file(
+        self, mock_tempfile, mock_execute, mock_generate,
         mock_model_compiler, mock_handle_upload, client, mock_file_content
     ):
-        """Test that temporary files are cleaned up after execution."""
+        """Test that the generated script is handed to the sandbox directly, without a temporary file."""
         # Set up mocks
         mock_handle_upload.return_value = mock_file_content
-        mock_model = MagicMock()
-        mock_model_compiler.return_value.read_and_parse_archive.return_value = mock_model
+        mock_model_compiler.return_value.read_and_parse_archive.return_value = MagicMock()
         mock_generate.return_value = "# Generated Python code"
         mock_execute.return_value = ("Execution output", "", 0)  # stdout, stderr, returncode
-        
-        # Make os.path.exists return True for any path (to trigger cleanup)
-        mock_exists.return_value = True
-        
-        # Create a mock temporary file
-        temp_file_path = "/tmp/temp_script.py"
-        
-        # Use patch to mock tempfile.NamedTemporaryFile
-        with patch("tempfile.NamedTemporaryFile") as mock_tempfile:
-            # Setup the mock temp file
-            mock_temp_file = MagicMock()
-            mock_temp_file.name = temp_file_path
-            mock_tempfile.return_value.__enter__.return_value = mock_temp_file
-            
-            # Create a test file
+
+        test_file = {"file": ("test.xlsx", BytesIO(mock_file_content), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+        response = client.post("/convert/", files=test_file)
+
+        assert response.status_code == 200
+        mock_execute.assert_awaited_once()
+        assert "# Generated Python code" in mock_execute.call_args.args[0]
+        mock_tempfile.assert_not_called() 
+    @patch("src.main.handle_file_upload")
+    @patch("src.pipeline.ModelCompiler")
+    @patch("src.pipeline.generate_static_python_code")
+    @patch("src.main.run_script_in_sandbox")
+    def test_convert_endpoint_uses_conversion_cache(
+        self, mock_execute, mock_generate_code,
+        mock_model_compiler, mock_handle_upload, client, mock_file_content, tmp_path
+    ):
+        """Test that a repeated upload with the same options is served from the cache."""
+        from src.conversion_cache import ConversionCache
+        mock_handle_upload.return_value = mock_file_content
+        mock_generate_code.return_value = "# Generated Python code"
+        mock_execute.return_value = ("Execution output", "", 0)
+
+        with patch("src.main.conversion_cache", ConversionCache(cache_dir=str(tmp_path), memory_max_bytes=1024 * 1024)):
+            responses = []
+            for _ in range(2):
+                test_file = {"file": ("test.xlsx", BytesIO(mock_file_content), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+                responses.append(client.post("/convert/", files=test_file))
             test_file = {"file": ("test.xlsx", BytesIO(mock_file_content), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
-            
-            # Make the request
-            response = client.post("/convert/", files=test_file)
-            
-            # Check the response
-            assert response.status_code == 200
-            
-        # Verify the temporary file was cleaned up
-        mock_remove.assert_called_once() 
\ No newline at end of file
+            forced_response = client.post("/convert/", files=test_file, data={"force_evaluator": "true"})
+
+        assert responses[0].json()["cached"] is False
+        assert responses[1].json()["cached"] is True
+        assert responses[1].json()["script"] == responses[0].json()["script"]
+        # A different option is a different cache entry
+        assert forced_response.json()["cached"] is False
+        assert mock_generate_code.call_count == 2
+
+    def test_create_job_and_get_status(self, client, tmp_path):
+        """Test that POST /jobs queues the upload and GET /jobs/{id} reports it."""
+        from src.job_store import JobStore
+        with patch("src.main.job_store", JobStore(str(tmp_path))):
+            test_file = {"file": ("test.xlsx", BytesIO(b"PK\x03\x04 workbook"), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+            response = client.post("/jobs", files=test_file, data={"vectorize": "true"})
+
+            assert response.status_code == 202
+            job_id = response.json()["job_id"]
+            assert response.json()["status_url"] == f"/jobs/{job_id}"
+
+            status_response = client.get(f"/jobs/{job_id}")
+            assert status_response.status_code == 200
+            job = status_response.json()
+            assert job["status"] == "queued"
+            assert job["stages"]["ingest"] == "completed"
+            assert job["options"]["vectorize"] is True
+            assert "input_path" not in job
+
+    def test_create_job_rejects_invalid_upload(self, client, tmp_path):
+        """Test that uploads are validated before a job is queued."""
+        from src.job_store import JobStore
+        with patch("src.main.job_store", JobStore(str(tmp_path))):
+            test_file = {"file": ("test.xlsx", BytesIO(b"not a zip"), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+            response = client.post("/jobs", files=test_file)
+
+        assert response.status_code == 415
+
+    def test_get_unknown_job(self, client):
+        """Test that unknown job ids return 404."""
+        response = client.get("/jobs/does-not-exist")
+        assert response.status_code == 404
+
+    @patch("src.main.handle_file_upload")
+    def test_metrics_endpoint(self, mock_handle_upload, client, tmp_path):
+        """Test that /metrics reports validation rejections and the job queue in the Prometheus format."""
+        from src.file_handler import InvalidFileExtensionError
+        from src.job_store import JobStore
+        mock_handle_upload.side_effect = InvalidFileExtensionError("Invalid file extension: .pdf")
+        client.post("/convert/", files={"file": ("test.pdf", BytesIO(b"invalid file"), "application/pdf")})
+
+        with patch("src.main.job_store", JobStore(str(tmp_path))):
+            response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        lines = response.text.splitlines()
+        assert "# TYPE formulas_stage_duration_seconds histogram" in lines
+        assert any(line.startswith('formulas_validation_rejections_total{status="415"} ') for line in lines)
+        assert 'formulas_jobs{status="queued"} 0' in lines
+        assert "formulas_conversions_in_flight{source=\"api\"} 0" in lines
+
+    @patch("src.main.handle_file_upload")
+    @patch("src.pipeline.ModelCompiler")
+    @patch("src.pipeline.generate_static_python_code")
+    def test_evaluate_model_over_rows(self, mock_generate_code, mock_model_compiler, mock_handle_upload, client, mock_file_content, tmp_path):
+        """Test that an as_module conversion returns a model_id that /models/{id}/evaluate runs over many rows."""
+        from src.model_store import ModelStore
+        mock_handle_upload.return_value = mock_file_content
+        mock_generate_code.return_value = (
+            "INPUTS = {'Sheet1!A1': 1}\n"
+            "OUTPUTS = ('Sheet1!B1',)\n"
+            "def compute(inputs: dict) -> dict:\n"
+            "    sheet1_a1 = inputs.get('Sheet1!A1', 1)\n"
+            "    sheet1_b1 = sheet1_a1*2\n"
+            "    return {'Sheet1!B1': sheet1_b1}\n"
+        )
+
+        with patch("src.main.model_store", ModelStore(str(tmp_path))), patch("src.main.run_script_in_sandbox", side_effect=lambda script, usage=None: _run_locally(script)):
+            test_file = {"file": ("test.xlsx", BytesIO(mock_file_content), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+            conversion = client.post("/convert/", files=test_file, data={"as_module": "true", "execute": "false"}).json()
+            model_id = conversion["model_id"]
+
+            json_response = client.post(f"/models/{model_id}/evaluate", json=[{"Sheet1!A1": 2}, {}, {"Sheet1!A1": 5}])
+            csv_response = client.post(f"/models/{model_id}/evaluate", content=b"Sheet1!A1\n3\n", headers={"Content-Type": "text/csv"})
+            unknown_input_response = client.post(f"/models/{model_id}/evaluate", json=[{"Sheet1!B1": 2}])
+            missing_response = client.post(f"/models/{'0' * 64}/evaluate", json=[{"Sheet1!A1": 2}])
+
+        assert json_response.status_code == 200
+        assert json_response.json()["row_count"] == 3
+        assert json_response.json()["columns"] == {"Sheet1!B1": [4.0, 2.0, 10.0]}
+        assert "sandbox" in json_response.json()["timings"]
+        assert csv_response.json()["columns"] == {"Sheet1!B1": [6.0]}
+        assert unknown_input_response.status_code == 400
+        assert missing_response.status_code == 404
+
+def _run_locally(script: str):
+    """Stand-in for the sandbox that runs the evaluation script in a child interpreter."""
+    import subprocess
+    import sys
+    process = subprocess.run([sys.executable, "-"], input=script, capture_output=True, text=True, timeout=60)
+    return process.stdout, process.stderr, process.returncode
@@ -0,0 +1,88 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import pytest
+
+from src.metrics import MetricsRegistry
+
+def _exited_pid() -> int:
+    """Returns the pid of a process that has already exited."""
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+class TestMetricsRegistry:
+    """Tests for the Prometheus metrics shared across processes."""
+
+    @pytest.fixture
+    def registry(self):
+        registry = MetricsRegistry()
+        registry.counter("test_conversions_total", "Conversions.")
+        registry.gauge("test_in_flight", "In flight.")
+        registry.histogram("test_duration_seconds", "Durations.", buckets=(0.1, 1.0))
+        yield registry
+        registry.stop_sharing()
+
+    def _metric(self, registry, name):
+        return registry._metrics[name]
+
+    def test_render_text_format(self, registry):
+        """Test the exposition format of counters, gauges and cumulative histogram buckets."""
+        self._metric(registry, "test_conversions_total").inc(outcome="succeeded")
+        self._metric(registry, "test_conversions_total").inc(2, outcome="succeeded")
+        with self._metric(registry, "test_in_flight").track_in_flight():
+            in_flight_text = registry.render()
+        self._metric(registry, "test_duration_seconds").observe(0.5, stage="parse")
+        text = registry.render()
+
+        assert "test_in_flight 1" in in_flight_text.splitlines()
+        lines = text.splitlines()
+        assert "# TYPE test_conversions_total counter" in lines
+        assert 'test_conversions_total{outcome="succeeded"} 3' in lines
+        assert "test_in_flight 0" in lines
+        assert 'test_duration_seconds_bucket{stage="parse",le="0.1"} 0' in lines
+        assert 'test_duration_seconds_bucket{stage="parse",le="1"} 1' in lines
+        assert 'test_duration_seconds_bucket{stage="parse",le="+Inf"} 1' in lines
+        assert 'test_duration_seconds_sum{stage="parse"} 0.5' in lines
+        assert 'test_duration_seconds_count{stage="parse"} 1' in lines
+
+    def test_aggregates_processes_sharing_a_directory(self, registry, tmp_path):
+        """Test that counters add up over all processes, and gauges over running ones only."""
+        registry.enable_sharing(str(tmp_path))
+        self._metric(registry, "test_conversions_total").inc()
+        self._metric(registry, "test_in_flight").inc()
+
+        # Files written by another running process and by one that has exited
+        for name, pid in (("process-live.json", os.getppid()), ("process-exited.json", _exited_pid())):
+            with open(tmp_path / name, "w") as f:
+                json.dump({"pid": pid, "host": socket.gethostname(), "values": {"test_conversions_total": {"test_conversions_total": 10}, "test_in_flight": {"test_in_flight": 5}}}, f)
+
+        lines = registry.render().splitlines()
+        assert "test_conversions_total 21" in lines
+        assert "test_in_flight 6" in lines
+
+        # The exited process is folded into the archive and still counted
+        assert not (tmp_path / "process-exited.json").exists()
+        assert "test_conversions_total 21" in registry.render().splitlines()
+
+    def test_scraped_gauges(self, registry):
+        """Test gauges whose values are read at scrape time."""
+        text = registry.render([(self._metric(registry, "test_in_flight"), {"status": "queued"}, 4)])
+        assert 'test_in_flight{status="queued"} 4' in text.splitlines()
+
+    def test_changes_are_written_out_in_the_background(self, registry, tmp_path):
+        """Test that recording a metric doesn't write the file, and the background flush or stop_sharing does."""
+        registry.enable_sharing(str(tmp_path), flush_interval=0.2)
+        (path,) = tmp_path.glob("process-*.json")
+        self._metric(registry, "test_in_flight").inc()
+        assert json.loads(path.read_text())["values"] == {}
+
+        time.sleep(0.5)
+        assert json.loads(path.read_text())["values"] == {"test_in_flight": {"test_in_flight": 1}}
+
+        self._metric(registry, "test_conversions_total").inc()
+        registry.stop_sharing()
+        assert json.loads(path.read_text())["values"]["test_conversions_total"] == {"test_conversions_total": 1}
@@ -0,0 +1,99 @@
+import pytest
+from unittest.mock import MagicMock
+
+from src.model_artifact import (
+    ModelArtifactError, serialize_model, write_model_artifact, read_model_artifact, load_model_artifact,
+)
+
+def _make_model() -> MagicMock:
+    """A parsed model with a value cell, a formula cell, a range and two defined names."""
+    model = MagicMock()
+    value_cell = MagicMock(value=2, formula=None)
+    formula_cell = MagicMock(value=4, formula="Sheet1!A1*2")
+    model.cells = {"Sheet1!A1": value_cell, "Sheet1!B1": formula_cell}
+    xl_range = MagicMock(address_str="Sheet1!A1:B1")
+    xl_range.name = "Row"
+    model.ranges = {"Sheet1!A1:B1": xl_range}
+    rate = MagicMock(spec=["address"], address="Sheet1!A1")
+    model.defined_names = {"Rate": rate, "Row": xl_range}
+    return model
+
+class TestModelArtifact:
+    """Tests for writing and reading compiled-model artifacts."""
+
+    def test_round_trip(self, tmp_path):
+        """Test that cells, formulas, ranges and defined names are read back as written."""
+        path = write_model_artifact(serialize_model(_make_model()), str(tmp_path / "model.py"))
+
+        assert path == str(tmp_path / "model.xlmodel")
+        assert read_model_artifact(path) == {
+            "cells": [("Sheet1!A1", 2, None, None), ("Sheet1!B1", 4, "=Sheet1!A1*2", "Sheet1")],
+            "ranges": [("Sheet1!A1:B1", "Row")],
+            "defined_names": [("Rate", "cell", "Sheet1!A1"), ("Row", "range", "Sheet1!A1:B1")],
+        }
+
+    def test_values_marshal_cannot_store_become_text(self, tmp_path):
+        """Test that values like dates and Excel errors are stored as their text."""
+        model = _make_model()
+        model.cells["Sheet1!A1"].value = object.__new__(type("Error", (), {"__str__": lambda self: "#DIV/0!"}))
+        path = write_model_artifact(serialize_model(model), str(tmp_path / "model.py"))
+
+        assert read_model_artifact(path)["cells"][0] == ("Sheet1!A1", "#DIV/0!", None, None)
+
+    @pytest.mark.parametrize("corrupt, message", [
+        (lambda artifact: b"PK\x03\x04" + artifact[4:], "not a model artifact"),
+        (lambda artifact: artifact[:8] + b"\x00\x63" + artifact[10:], "format version 99"),
+        (lambda artifact: artifact[:-1] + bytes([artifact[-1] ^ 1]), "content hash mismatch"),
+        (lambda artifact: artifact[:-10], "content hash mismatch"),
+        (lambda artifact: artifact[:20], "not a model artifact"),
+    ])
+    def test_rejects_invalid_artifacts(self, tmp_path, corrupt, message):
+        """Test that foreign, newer, corrupted and truncated files are rejected."""
+        path = tmp_path / "model.xlmodel"
+        path.write_bytes(corrupt(serialize_model(_make_model())))
+
+        with pytest.raises(ModelArtifactError, match=message):
+            read_model_artifact(str(path))
+
+    def test_load_rebuilds_an_equivalent_xlcalculator_model(self, tmp_path):
+        """Test that the rebuilt model evaluates like the parsed one, defined names included."""
+        xlcalculator = pytest.importorskip("xlcalculator")
+        pytest.importorskip("xlcalculator.xltypes")
+        compiler = xlcalculator.ModelCompiler()
+        model = compiler.read_and_parse_dict({"Sheet1!A1": 2, "Sheet1!A2": 3, "Sheet1!B1": "=Sheet1!A1*Sheet1!A2+1", "Sheet1!B2": "=Sheet1!B1^2"})
+        model.defined_names["Rate"] = model.cells["Sheet1!A1"]
+        path = write_model_artifact(serialize_model(model), str(tmp_path / "model.py"))
+
+        loaded = load_model_artifact(path)
+
+        assert loaded.cells["Sheet1!B1"].formula.terms == ["Sheet1!A1", "Sheet1!A2"]
+        assert loaded.defined_names["Rate"] is loaded.cells["Sheet1!A1"]
+        evaluator = xlcalculator.Evaluator(loaded)
+        assert evaluator.evaluate("Sheet1!B2") == xlcalculator.Evaluator(model).evaluate("Sheet1!B2") == 49
+        assert evaluator.evaluate("Rate") == 2
+
+    def test_load_evaluates_formulas_stored_without_equals_sign(self, tmp_path):
+        """Test that models with plain-text formulas and ranges (e.g. streamed workbooks) evaluate once loaded."""
+        xlcalculator = pytest.importorskip("xlcalculator")
+        pytest.importorskip("xlcalculator.xltypes")
+        model = MagicMock()
+        model.cells = {
+            "Sheet1!A1": MagicMock(value=2, formula=None),
+            "Sheet1!A2": MagicMock(value=3, formula=None),
+            "Sheet1!B1": MagicMock(value=None, formula="Sheet1!A1*10+SUM(Sheet1!A1:A3)"),
+        }
+        # As the streaming engine lists them; Sheet1!A3 is not a cell of the workbook
+        model.ranges = {"Sheet1!A1:A3": "Sheet1!A1:A3"}
+        model.defined_names = {}
+        path = write_model_artifact(serialize_model(model), str(tmp_path / "model.py"))
+
+        assert xlcalculator.Evaluator(load_model_artifact(path)).evaluate("Sheet1!B1") == 25
+
+    def test_write_replaces_the_previous_artifact(self, tmp_path):
+        """Test that rewriting an artifact leaves no temporary files behind."""
+        script_path = str(tmp_path / "model.py")
+        write_model_artifact(b"old", script_path)
+        write_model_artifact(b"new", script_path)
+
+        assert [p.name for p in tmp_path.iterdir()] == ["model.xlmodel"]
+        assert (tmp_path / "model.xlmodel").read_bytes() == b"new"
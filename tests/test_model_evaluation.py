@@ -0,0 +1,155 @@
+import json
+import subprocess
+import sys
+import pytest
+
+from src.model_evaluation import CompiledModel, ModelEvaluationError, parse_input_rows
+
+MODEL_ID = "ab" * 32
+
+# A compute module in the shape generated with as_module
+MODEL_SOURCE = '''
+INPUTS = {
+    'Sheet1!A1': 2,
+    'Sheet1!A2': 3.5,
+}
+OUTPUTS = (
+    'Sheet1!B1',
+    'Sheet1!C1',
+    'Sheet1!D1',
+)
+
+def compute(inputs: dict) -> dict:
+    """Computes every cell in `OUTPUTS`."""
+    unknown = inputs.keys() - INPUTS.keys()
+    if unknown:
+        raise KeyError(f"Not input cells of this model: {sorted(unknown)}")
+    sheet1_a1 = inputs.get('Sheet1!A1', 2)
+    sheet1_a2 = inputs.get('Sheet1!A2', 3.5)
+    sheet1_b1 = sheet1_a2/sheet1_a1
+    sheet1_c1 = (lambda condition, true_val, false_val: true_val if condition else false_val)(sheet1_a1>2, sheet1_b1, 0)
+    sheet1_d1 = sheet1_c1+sheet1_a1
+    return {
+        'Sheet1!B1': sheet1_b1,
+        'Sheet1!C1': sheet1_c1,
+        'Sheet1!D1': sheet1_d1,
+    }
+'''
+
+# Column runs of a vectorized model are assigned element by element
+VECTORIZED_MODEL_SOURCE = '''
+import numpy as np
+
+INPUTS = {
+    'Sheet1!A1': 1,
+}
+OUTPUTS = (
+    'Sheet1!B1',
+)
+
+def compute(inputs: dict) -> dict:
+    """Computes every cell in `OUTPUTS`."""
+    sheet1_a = np.zeros(1)
+    sheet1_a[0] = inputs.get('Sheet1!A1', 1)
+    sheet1_b = sheet1_a*10
+    return {
+        'Sheet1!B1': sheet1_b[0],
+    }
+'''
+
+def _run(script: str) -> dict:
+    """Runs an evaluation script the way the sandbox does and returns its output."""
+    process = subprocess.run([sys.executable, "-"], input=script, capture_output=True, text=True, timeout=60)
+    assert process.returncode == 0, process.stderr
+    return json.loads(process.stdout)
+
+class TestParseInputRows:
+    """Tests for reading tables of input rows."""
+
+    def test_json_rows(self):
+        """Test both JSON layouts."""
+        rows = [{"Sheet1!A1": 1}, {"Sheet1!A1": 2.5, "Sheet1!A2": "x"}]
+        assert parse_input_rows(json.dumps(rows).encode(), "application/json", 10) == rows
+        assert parse_input_rows(json.dumps({"rows": rows}).encode(), None, 10) == rows
+
+    def test_csv_rows(self):
+        """Test that CSV fields are read as numbers and booleans, and empty ones as missing."""
+        body = b"Sheet1!A1,Sheet1!A2,Sheet1!A3\n1,2.5,TRUE\n,text,false\n"
+        assert parse_input_rows(body, "text/csv; charset=utf-8", 10) == [
+            {"Sheet1!A1": 1, "Sheet1!A2": 2.5, "Sheet1!A3": True},
+            {"Sheet1!A1": None, "Sheet1!A2": "text", "Sheet1!A3": False},
+        ]
+        assert parse_input_rows(b"Sheet1!A1\tSheet1!A2\n1\t2\n", "text/tab-separated-values", 10) == [{"Sheet1!A1": 1, "Sheet1!A2": 2}]
+
+    @pytest.mark.parametrize("body, content_type, status_code", [
+        (b"not json", "application/json", 400),
+        (b'{"Sheet1!A1": 1}', "application/json", 400),
+        (b'[{"Sheet1!A1": [1, 2]}]', "application/json", 400),
+        (b"[]", "application/json", 400),
+        (b'[{"Sheet1!A1": 1}, {"Sheet1!A1": 2}, {"Sheet1!A1": 3}]', "application/json", 413),
+        (b"<rows/>", "application/xml", 415),
+    ])
+    def test_invalid_rows(self, body, content_type, status_code):
+        """Test that unusable bodies are rejected with the right status."""
+        with pytest.raises(ModelEvaluationError) as excinfo:
+            parse_input_rows(body, content_type, 2)
+        assert excinfo.value.status_code == status_code
+
+class TestCompiledModel:
+    """Tests for evaluating a compute module over many rows."""
+
+    def test_describes_the_module(self):
+        """Test that inputs and outputs are read from the module."""
+        model = CompiledModel(MODEL_ID, MODEL_SOURCE)
+        assert model.inputs == {"Sheet1!A1": 2, "Sheet1!A2": 3.5}
+        assert model.outputs == ("Sheet1!B1", "Sheet1!C1", "Sheet1!D1")
+
+    def test_evaluates_columns_with_per_row_fallback(self):
+        """Test that broadcastable cells are computed on columns and the others row by row, like compute()."""
+        model = CompiledModel(MODEL_ID, MODEL_SOURCE)
+        rows = [{"Sheet1!A1": 1}, {"Sheet1!A1": 4, "Sheet1!A2": 2}, {"Sheet1!A1": 0}, {}]
+
+        result = _run(model.build_script(rows))
+
+        assert result["mode"] == "columns"
+        # The IF can't be computed on columns; the division only fails for the row dividing by zero
+        assert result["row_evaluated_cells"] == ["Sheet1!B1", "Sheet1!C1"]
+        assert result["columns"]["Sheet1!B1"] == [3.5, 0.5, None, 1.75]
+        # Like Excel, an error in the branch IF doesn't take doesn't spread to dependents
+        assert result["columns"]["Sheet1!C1"] == [0, 0.5, 0, 0]
+        assert result["columns"]["Sheet1!D1"] == [1, 4.5, 0, 2]
+        assert result["error_count"] == 1
+        assert result["errors"][0] == {"row": 2, "cell": "Sheet1!B1", "error": "ZeroDivisionError: float division by zero"}
+
+        namespace = {}
+        exec(MODEL_SOURCE, namespace)
+        expected = namespace["compute"](rows[1])
+        assert {address: column[1] for address, column in result["columns"].items()} == expected
+
+    def test_falls_back_to_compute_per_row(self):
+        """Test that models whose statements can't run on columns call compute() for every row."""
+        model = CompiledModel(MODEL_ID, VECTORIZED_MODEL_SOURCE)
+
+        result = _run(model.build_script([{"Sheet1!A1": 2}, {"Sheet1!A1": 3}]))
+
+        assert result["mode"] == "rows"
+        assert result["columns"] == {"Sheet1!B1": [20.0, 30.0]}
+
+    def test_rejects_unknown_inputs(self):
+        """Test that rows may only set input cells."""
+        model = CompiledModel(MODEL_ID, MODEL_SOURCE)
+        with pytest.raises(ModelEvaluationError, match="Sheet1!B1"):
+            model.build_script([{"Sheet1!B1": 1}])
+
+    def test_rejects_models_needing_the_workbook(self):
+        """Test that models with runtime-evaluated cells can't be evaluated without their workbook."""
+        model = CompiledModel(MODEL_ID, MODEL_SOURCE + "\nFALLBACK_CELLS = ('Sheet1!B1',)\n")
+        with pytest.raises(ModelEvaluationError) as excinfo:
+            model.build_script([{"Sheet1!A1": 1}])
+        assert excinfo.value.status_code == 422
+
+    def test_rejects_flat_scripts(self):
+        """Test that scripts generated without as_module are not models."""
+        with pytest.raises(ModelEvaluationError) as excinfo:
+            CompiledModel(MODEL_ID, "sheet1_b1 = 1\n")
+        assert excinfo.value.status_code == 409
@@ -0,0 +1,32 @@
+from src.model_store import ModelStore
+
+MODEL_ID = "ab" * 32
+MODEL_SOURCE = """
+INPUTS = {'Sheet1!A1': 2}
+OUTPUTS = ('Sheet1!B1',)
+
+def compute(inputs: dict) -> dict:
+    sheet1_a1 = inputs.get('Sheet1!A1', 2)
+    sheet1_b1 = sheet1_a1*2
+    return {'Sheet1!B1': sheet1_b1}
+"""
+
+class TestModelStore:
+    """Tests for storing models by id."""
+
+    def test_put_and_get(self, tmp_path):
+        """Test that stored models are compiled once and kept in memory."""
+        store = ModelStore(str(tmp_path))
+        store.put(MODEL_ID, MODEL_SOURCE)
+
+        model = store.get(MODEL_ID)
+        assert model.source == MODEL_SOURCE
+        assert store.get(MODEL_ID) is model
+        # Another process sharing the directory sees it too
+        assert ModelStore(str(tmp_path)).get(MODEL_ID).outputs == model.outputs
+
+    def test_unknown_and_invalid_ids(self, tmp_path):
+        """Test that ids that aren't cache keys never reach the file system."""
+        store = ModelStore(str(tmp_path))
+        assert store.get("cd" * 32) is None
+        assert store.get("../../etc/passwd") is None
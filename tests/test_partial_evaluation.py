@@ -0,0 +1,138 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from xlcalculator.model import Model
+
+from src.dependency_extractor import generate_static_python_code, get_evaluation_order
+from src.diagnostics import collect_diagnostics
+from src.partial_evaluation import plan_constant_folding
+from src.pruning import TargetSelectionError
+
+def _make_model(cells: dict) -> MagicMock:
+    """Builds a mock model from {address: (formula, value, [precedent addresses])}."""
+    mock_model = MagicMock(spec=Model)
+    mock_model.cells = {}
+    for address, (formula, value, precedent_addresses) in cells.items():
+        cell = MagicMock()
+        cell.formula = formula
+        cell.formula_address = address
+        cell.value = value
+        precedents = []
+        for precedent_address in precedent_addresses:
+            precedent = MagicMock()
+            precedent.formula_address = precedent_address
+            precedents.append(precedent)
+        cell.precedents = precedents
+        mock_model.cells[address] = cell
+    return mock_model
+
+def _workbook() -> MagicMock:
+    # A rate table (Rates!) derived from constants, and a price computed from the input Sheet1!A2.
+    # Row 1 is left empty so cells aren't named after headers.
+    return _make_model({
+        "Rates!A2": (None, 0.2, []),
+        "Rates!B2": ("Rates!A2*100", None, ["Rates!A2"]),
+        "Rates!C2": ("NOW()", None, []),
+        "Sheet1!A2": (None, 10, []),
+        "Sheet1!B2": ("Sheet1!A2*Rates!B2", None, ["Sheet1!A2", "Rates!B2"]),
+        "Sheet1!C2": ("Sheet1!B2+Rates!A2", None, ["Sheet1!B2", "Rates!A2"]),
+    })
+
+@pytest.fixture
+def mock_evaluator_class():
+    """Patch the conversion-time evaluator with one that knows the workbook's values."""
+    with patch("src.partial_evaluation.Evaluator") as mock_evaluator_class:
+        mock_evaluator_class.return_value.evaluate.side_effect = lambda address: {"Rates!B2": 20.0}[address]
+        yield mock_evaluator_class
+
+class TestPlanConstantFolding:
+    """Tests for deciding which formulas are precomputed."""
+
+    def test_folds_formulas_independent_of_inputs(self, mock_evaluator_class):
+        """Test that only formulas depending on no input, and not volatile, are evaluated."""
+        model = _workbook()
+        plan = plan_constant_folding(model, model, get_evaluation_order(model), ["Sheet1!A2"], set())
+
+        assert plan.folded == {"Rates!B2": "20.0"}
+        assert plan.referenced_constants == {"Rates!A2"}
+        assert plan.get_stats() == {"folded_cells": 1, "live_cells": 3, "unfoldable_cells": 0}
+        mock_evaluator_class.return_value.evaluate.assert_called_once_with("Rates!B2")
+
+    def test_values_without_literals_stay_live(self, mock_evaluator_class):
+        """Test that errors and values without a Python literal are left to the generated code."""
+        mock_evaluator_class.return_value.evaluate.side_effect = lambda address: float("inf")
+        model = _workbook()
+        plan = plan_constant_folding(model, model, get_evaluation_order(model), ["Sheet1!A2"], set())
+
+        assert plan.folded == {}
+        assert plan.get_stats()["unfoldable_cells"] == 1
+
+    def test_evaluation_failures_are_reported(self, mock_evaluator_class):
+        """Test that a formula the evaluator fails on stays live and is reported as a diagnostic."""
+        mock_evaluator_class.return_value.evaluate.side_effect = AttributeError("'str' object has no attribute 'evaluate'")
+        model = _workbook()
+        with collect_diagnostics() as diagnostics:
+            plan = plan_constant_folding(model, model, get_evaluation_order(model), ["Sheet1!A2"], set())
+
+        assert plan.get_stats()["unfoldable_cells"] == 1
+        entry, = diagnostics.to_list()
+        assert entry["code"] == "fold_failed"
+        assert entry["samples"] == ["Rates!B2"]
+        assert "no attribute 'evaluate'" in entry["message"]
+
+    def test_cyclic_cells_and_their_dependents_stay_live(self, mock_evaluator_class):
+        """Test that nothing on or after a circular reference is folded."""
+        model = _workbook()
+        plan = plan_constant_folding(model, model, get_evaluation_order(model), ["Sheet1!A2"], {"Rates!B2"})
+        assert plan.folded == {}
+        mock_evaluator_class.assert_not_called()
+
+    @pytest.mark.parametrize("inputs, message", [
+        (["Sheet1!B2"], "Inputs must be cells without formulas: Sheet1!B2"),
+        (["Sheet1!Z9"], "Inputs are not cells of this workbook: Sheet1!Z9"),
+    ])
+    def test_rejects_invalid_inputs(self, mock_evaluator_class, inputs, message):
+        """Test that inputs must be value cells of the workbook."""
+        model = _workbook()
+        with pytest.raises(TargetSelectionError, match=message):
+            plan_constant_folding(model, model, get_evaluation_order(model), inputs, set())
+
+class TestFoldedCode:
+    """Tests for the code generated with declared inputs."""
+
+    def test_module_only_takes_declared_inputs(self, mock_evaluator_class):
+        """Test that precomputed cells are literals and constants are not inputs of compute()."""
+        model = _workbook()
+        del model.cells["Rates!C2"] # Volatile cells need the workbook at runtime
+        code = generate_static_python_code(model, as_module=True, inputs=["Sheet1!A2"])
+        namespace = {}
+        exec(code, namespace)
+
+        assert namespace["INPUTS"] == {"Sheet1!A2": 10}
+        assert "= 20.0 # Precomputed at conversion time" in code
+        assert namespace["compute"]({"Sheet1!A2": 2})["Sheet1!C2"] == 40.2
+        with pytest.raises(KeyError):
+            namespace["compute"]({"Rates!A2": 1})
+
+    def test_flat_script_assigns_constants(self, mock_evaluator_class):
+        """Test that constants keep their workbook values instead of placeholders."""
+        report = {}
+        code = generate_static_python_code(_workbook(), inputs=["Sheet1!A2"], report=report)
+
+        assert "rates_a2 = 0.2 # Constant Rates!A2" in code
+        assert "sheet1_a2 = 0 # Initialize for Sheet1!A2" in code
+        assert report["constant_folding"]["folded_cells"] == 1
+
+    def test_flat_script_with_vectorize_and_headers(self, mock_evaluator_class):
+        """Test that header constants keep their own variables when the columns under them are vectorized."""
+        cells = {"Sheet1!A1": (None, "Qty", []), "Sheet1!B1": (None, "Cost", [])}
+        for row in range(2, 22):
+            cells[f"Sheet1!A{row}"] = (None, row, [])
+            cells[f"Sheet1!B{row}"] = (f"Sheet1!A{row}*2", None, [f"Sheet1!A{row}"])
+        report = {}
+        code = generate_static_python_code(_make_model(cells), inputs=["Sheet1!A2:A21"], vectorize=True, report=report)
+        namespace = {}
+        exec(code, namespace)
+
+        assert report["vectorization"]["runs"] == 1
+        assert "sheet1_Qty_1 = 'Qty' # Constant Sheet1!A1" in code
+        assert namespace["sheet1_Qty_1"] == "Qty"
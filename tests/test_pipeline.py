@@ -0,0 +1,171 @@
+import logging
+import pytest
+from unittest.mock import patch, MagicMock, ANY
+
+from src.diagnostics import install_request_warnings_handler, set_current_address
+from src.formula_translator import translate_formula_part
+from src.pipeline import convert_workbook, assemble_script, ingest_engine_for, parse_engine, IngestEngineError, WorkbookParseError
+
+class TestPipeline:
+    """Tests for the parse/analyze/codegen pipeline run by the conversion pool."""
+
+    @patch("src.pipeline.generate_static_python_code")
+    @patch("src.pipeline.ModelCompiler")
+    def test_convert_workbook(self, mock_model_compiler, mock_generate_code):
+        """Test that the workbook is parsed and the generated code is wrapped into a script."""
+        mock_model = MagicMock()
+        mock_model_compiler.return_value.read_and_parse_archive.return_value = mock_model
+        mock_generate_code.return_value = "sheet1_b1 = sheet1_a1*2"
+
+        result = convert_workbook(b"workbook bytes")
+
+        mock_generate_code.assert_called_once_with(mock_model, force_evaluator=False, report=ANY, vectorize=False, progress=ANY, as_module=False, targets=None, inputs=None, optimize=False)
+        assert "sheet1_b1 = sheet1_a1*2" in result["script"]
+        # Scripts without runtime-evaluated cells don't need xlcalculator
+        assert "xlcalculator" not in result["script"]
+        assert result["warnings"] == []
+
+    @patch("src.pipeline.generate_static_python_code")
+    @patch("src.pipeline.ModelCompiler")
+    def test_convert_workbook_reports_stage_timings(self, mock_model_compiler, mock_generate_code):
+        """Test that every stage reported by the code generator is timed and forwarded to `progress`."""
+        def generate_in_stages(model, force_evaluator=False, report=None, vectorize=False, progress=None, as_module=False, targets=None, inputs=None, optimize=False):
+            for stage in ("order", "naming", "codegen"):
+                progress(stage)
+            return "# code"
+        mock_generate_code.side_effect = generate_in_stages
+        progress = MagicMock()
+
+        result = convert_workbook(b"workbook bytes", progress=progress)
+
+        assert list(result["timings"]) == ["parse", "order", "naming", "codegen"]
+        assert all(entry["wall_ms"] >= 0 and entry["cpu_ms"] >= 0 for entry in result["timings"].values())
+        assert [call.args[0] for call in progress.call_args_list] == ["parse", "order", "naming", "codegen"]
+
+    @patch("src.pipeline.generate_static_python_code")
+    @patch("src.pipeline.ModelCompiler")
+    def test_convert_workbook_collects_warnings(self, mock_model_compiler, mock_generate_code):
+        """Test that warnings logged during the conversion are returned with the result."""
+        def generate_with_warning(model, force_evaluator=False, report=None, vectorize=False, progress=None, as_module=False, targets=None, inputs=None, optimize=False):
+            logging.getLogger("src.dependency_extractor").warning("Unknown Excel formula part encountered: FOO")
+            return "# code"
+        mock_generate_code.side_effect = generate_with_warning
+
+        install_request_warnings_handler()
+        result = convert_workbook(b"workbook bytes")
+
+        assert any("Unknown Excel formula part encountered: FOO" in w for w in result["warnings"])
+
+    @patch("src.pipeline.generate_static_python_code")
+    @patch("src.pipeline.ModelCompiler")
+    def test_convert_workbook_aggregates_repeated_warnings(self, mock_model_compiler, mock_generate_code):
+        """Test that a warning repeated for many cells is returned once, with its count and sample cells."""
+        def generate_with_warnings(model, force_evaluator=False, report=None, vectorize=False, progress=None, as_module=False, targets=None, inputs=None, optimize=False):
+            for row in range(1, 101):
+                set_current_address(f"Sheet1!C{row}")
+                translate_formula_part("FOO")
+            return "# code"
+        mock_generate_code.side_effect = generate_with_warnings
+
+        result = convert_workbook(b"workbook bytes")
+
+        assert result["warnings"] == ["Unknown Excel formula part encountered: FOO. Returning as is. [100 times; e.g. Sheet1!C1, Sheet1!C2, Sheet1!C3, Sheet1!C4, Sheet1!C5]"]
+        assert result["diagnostics"] == [{
+            "code": "unknown_formula_part", "level": "warning", "message": "Unknown Excel formula part encountered: FOO. Returning as is.",
+            "count": 100, "samples": ["Sheet1!C1", "Sheet1!C2", "Sheet1!C3", "Sheet1!C4", "Sheet1!C5"],
+        }]
+
+    @patch("src.pipeline.ModelCompiler")
+    def test_convert_workbook_parse_error(self, mock_model_compiler):
+        """Test that parse failures are reported as WorkbookParseError."""
+        mock_model_compiler.return_value.read_and_parse_archive.side_effect = Exception("bad zip")
+
+        with pytest.raises(WorkbookParseError) as excinfo:
+            convert_workbook(b"not a workbook")
+
+        assert "Error parsing or reading Excel file: bad zip" in str(excinfo.value)
+
+    @patch("src.pipeline.read_workbook_streaming")
+    @patch("src.pipeline.generate_static_python_code")
+    @patch("src.pipeline.ModelCompiler")
+    def test_convert_workbook_with_the_streaming_engine(self, mock_model_compiler, mock_generate_code, mock_read_streaming):
+        """Test that the streaming engine replaces xlcalculator's parser and reports into the same report."""
+        def read_streaming(file_content, report=None):
+            report["ingest"] = {"engine": "streaming"}
+            return streamed_model
+        streamed_model = MagicMock()
+        mock_read_streaming.side_effect = read_streaming
+        mock_generate_code.return_value = "# code"
+
+        result = convert_workbook(b"workbook bytes", engine="streaming")
+
+        mock_model_compiler.return_value.read_and_parse_archive.assert_not_called()
+        assert mock_generate_code.call_args.args[0] is streamed_model
+        assert result["report"]["ingest"] == {"engine": "streaming"}
+
+    def test_convert_workbook_with_the_streaming_engine_parse_error(self):
+        """Test that files the streaming engine can't read are reported as WorkbookParseError."""
+        with pytest.raises(WorkbookParseError):
+            convert_workbook(b"not a workbook", engine="streaming")
+
+    def test_parse_engine(self):
+        """Test that engine names are normalized, defaulted and validated."""
+        assert parse_engine(None) == "xlcalculator"
+        assert parse_engine(" Streaming ") == "streaming"
+        with pytest.raises(IngestEngineError) as excinfo:
+            parse_engine("openpyxl")
+        assert excinfo.value.status_code == 400
+
+    @patch("src.pipeline.generate_static_python_code", return_value="# code")
+    @patch("src.pipeline.ModelCompiler")
+    def test_convert_workbook_with_the_csv_engine(self, mock_model_compiler, mock_generate_code):
+        """Test that CSV files are read by the CSV engine, and unreadable ones reported as WorkbookParseError."""
+        result = convert_workbook(b"Price,Total\n2,=A2*2\n", engine="csv")
+
+        mock_model_compiler.return_value.read_and_parse_archive.assert_not_called()
+        assert mock_generate_code.call_args.args[0].cells["Sheet1!B2"].formula == "Sheet1!A2*2"
+        assert result["report"]["ingest"]["engine"] == "csv"
+        with pytest.raises(WorkbookParseError):
+            convert_workbook(b"\xff\xfe\x00", engine="tsv")
+
+    def test_ingest_engine_for(self):
+        """Test that delimited files get their own engine whatever engine was asked for."""
+        assert ingest_engine_for("books/Q3.CSV", "streaming") == "csv"
+        assert ingest_engine_for("export.tsv") == "tsv"
+        assert ingest_engine_for("book.xlsx", "streaming") == "streaming"
+
+    def test_assemble_script(self):
+        """Test that generated code is placed between the script markers."""
+        script = assemble_script("x = 1")
+        start = script.index("# --- Start of Generated Excel to Python Conversion ---")
+        end = script.index("# --- End of Generated Excel to Python Conversion ---")
+        assert start < script.index("x = 1") < end
+
+    @patch("src.pipeline.generate_static_python_code")
+    @patch("src.pipeline.ModelCompiler")
+    def test_convert_workbook_as_module(self, mock_model_compiler, mock_generate_code):
+        """Test that a compute() module is returned as generated, without the script wrapper."""
+        mock_generate_code.return_value = "def compute(inputs: dict) -> dict:\n    return {}\n"
+
+        result = convert_workbook(b"workbook bytes", as_module=True)
+
+        assert mock_generate_code.call_args.kwargs["as_module"] is True
+        assert result["script"] == "def compute(inputs: dict) -> dict:\n    return {}\n"
+
+    @patch("src.pipeline.serialize_model", return_value=b"artifact")
+    @patch("src.pipeline.generate_static_python_code")
+    @patch("src.pipeline.ModelCompiler")
+    def test_convert_workbook_returns_the_compiled_model_of_fallback_cells(self, mock_model_compiler, mock_generate_code, mock_serialize):
+        """Test that the parsed model is serialized only when some cells are evaluated at runtime."""
+        def generate(model, report=None, **kwargs):
+            report["fallback_cells"] = fallback_cells
+            return "# code"
+        mock_generate_code.side_effect = generate
+
+        fallback_cells = 0
+        assert "model_artifact" not in convert_workbook(b"workbook bytes")
+        fallback_cells = 2
+        result = convert_workbook(b"workbook bytes")
+
+        assert result["model_artifact"] == b"artifact"
+        mock_serialize.assert_called_once_with(mock_model_compiler.return_value.read_and_parse_archive.return_value)
@@ -0,0 +1,87 @@
+import pickle
+import pytest
+from unittest.mock import MagicMock
+from xlcalculator.model import Model
+
+from src.pruning import TargetSelectionError, parse_targets, prune_to_targets
+
+def _make_model(dependencies: dict) -> MagicMock:
+    """Build a mock model from a mapping of cell address to its precedent addresses."""
+    mock_model = MagicMock(spec=Model)
+    cells = {}
+    for address, precedent_addresses in dependencies.items():
+        cell = MagicMock()
+        cell.formula = "+".join(precedent_addresses) if precedent_addresses else None
+        cell.formula_address = address
+        cell.value = 0
+        precedents = []
+        for precedent_address in precedent_addresses:
+            precedent = MagicMock()
+            precedent.formula_address = precedent_address
+            precedents.append(precedent)
+        cell.precedents = precedents
+        cells[address] = cell
+    mock_model.cells = cells
+    return mock_model
+
+def _workbook() -> MagicMock:
+    # Summary!B2 needs Data!C1 <- Data!B1 <- Data!A1; Data!C2 and Data!A2 are unrelated
+    return _make_model({
+        "Data!A1": [],
+        "Data!A2": [],
+        "Data!B1": ["Data!A1"],
+        "Data!C1": ["Data!B1", "Data!Z9"],
+        "Data!C2": ["Data!A2"],
+        "Summary!B2": ["Data!C1"],
+        "Summary!B3": ["Data!C2"],
+    })
+
+class TestParseTargets:
+    """Tests for reading target selections."""
+
+    def test_normalizes_targets(self):
+        """Test that `$` markers, quotes, case and duplicates are normalized."""
+        assert parse_targets(" Summary!$b$2, 'My Sheet'!A1:c3,Summary!B2,") == ["My Sheet!A1:C3", "Summary!B2"]
+        assert parse_targets(["Summary!B2"]) == ["Summary!B2"]
+        assert parse_targets(None) is None
+        assert parse_targets(" , ") is None
+
+    @pytest.mark.parametrize("value", ["B2", "Summary!", "Summary!B", "Summary!B2:C", "Summary!B2;Summary!B3"])
+    def test_rejects_malformed_targets(self, value):
+        """Test that targets must be sheet-qualified cells or ranges."""
+        with pytest.raises(TargetSelectionError) as excinfo:
+            parse_targets(value)
+        assert excinfo.value.status_code == 400
+
+    def test_error_survives_the_conversion_pool(self):
+        """Test that the error keeps its message and status when pickled back from a worker."""
+        error = pickle.loads(pickle.dumps(TargetSelectionError("Targets are not cells of this workbook: X!A1")))
+        assert error.message == "Targets are not cells of this workbook: X!A1"
+        assert error.status_code == 400
+
+class TestPruneToTargets:
+    """Tests for keeping only what the targets depend on."""
+
+    def test_keeps_transitive_precedents_in_workbook_order(self):
+        """Test that unrelated cells are dropped and referenced empty cells aren't added."""
+        report = {}
+        pruned = prune_to_targets(_workbook(), ["Summary!B2"], report)
+
+        assert list(pruned.cells) == ["Data!A1", "Data!B1", "Data!C1", "Summary!B2"]
+        assert pruned.targets == ["Summary!B2"]
+        assert report["targets"] == {"target_cells": 1, "cells_kept": 4, "cells_total": 7}
+
+    def test_ranges_select_the_cells_they_cover(self):
+        """Test that a range selects every workbook cell inside it, whichever corner comes first."""
+        pruned = prune_to_targets(_workbook(), ["Summary!B3:B2"])
+        assert pruned.targets == ["Summary!B2", "Summary!B3"]
+        assert len(pruned.cells) == 7
+
+    def test_input_cells_can_be_targets(self):
+        """Test that a target without a formula keeps just itself."""
+        assert list(prune_to_targets(_workbook(), ["Data!A2"]).cells) == ["Data!A2"]
+
+    def test_rejects_targets_outside_the_workbook(self):
+        """Test that every missing cell and empty range is reported at once."""
+        with pytest.raises(TargetSelectionError, match="Summary!Z1, Other!A1:B2"):
+            prune_to_targets(_workbook(), ["Summary!B2", "Summary!Z1", "Other!A1:B2"])
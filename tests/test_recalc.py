@@ -0,0 +1,118 @@
+import logging
+import pytest
+from unittest.mock import MagicMock, patch
+
+from benchmarks.synthetic_workbook import WorkbookProfile, generate_workbook
+from src.dependency_extractor import generate_static_python_code
+from src.recalc import RecalcEngine
+
+def _make_model(cells: dict) -> MagicMock:
+    """Builds a model from {address: (formula, value, [precedent addresses])}."""
+    model = MagicMock()
+    model.cells = {}
+    for address, (formula, value, _) in cells.items():
+        cell = MagicMock()
+        cell.formula = formula
+        cell.formula_address = address
+        cell.value = value
+        model.cells[address] = cell
+    for address, (_, _, precedents) in cells.items():
+        model.cells[address].precedents = [model.cells[precedent] for precedent in precedents]
+    return model
+
+def _chain_model() -> MagicMock:
+    # A1 -> B1 -> C1 and, independently, A2 -> B2
+    return _make_model({
+        "Sheet1!A1": (None, 2, []),
+        "Sheet1!A2": (None, 5, []),
+        "Sheet1!B1": ("Sheet1!A1*10", None, ["Sheet1!A1"]),
+        "Sheet1!C1": ("Sheet1!B1+1", None, ["Sheet1!B1"]),
+        "Sheet1!B2": ("Sheet1!A2/Sheet1!A1", None, ["Sheet1!A2", "Sheet1!A1"]),
+        "Sheet1!D2": ("Sheet1!A2-1", None, ["Sheet1!A2"]),
+    })
+
+class TestRecalcEngine:
+    """Tests for incremental recalculation."""
+
+    def test_first_get_computes_everything(self):
+        """Test that all formulas start dirty and are computed on first access."""
+        engine = RecalcEngine(_chain_model())
+        assert engine.dirty_count == 4
+
+        assert engine.get("Sheet1!C1") == 21
+        assert engine.get("Sheet1!B2") == 2.5
+        assert engine.last_recalculated == 4
+        assert engine.dirty_count == 0
+
+    def test_only_dependents_are_recomputed(self):
+        """Test that an input change recomputes its transitive dependents and nothing else."""
+        engine = RecalcEngine(_chain_model())
+        engine.recalculate()
+
+        assert engine.set_inputs({"Sheet1!A1": 4}) == 3 # B1, C1 and B2
+        assert engine.get("Sheet1!C1") == 41
+        assert engine.get("Sheet1!B2") == 1.25
+        assert engine.last_recalculated == 3
+        assert engine.get("Sheet1!D2") == 4
+
+        # Setting an input to its current value dirties nothing
+        assert engine.set_inputs({"Sheet1!A1": 4}) == 0
+        assert engine.set_inputs({"Sheet1!A2": 1}) == 2
+        assert engine.recalculate() == 2
+
+    def test_rejects_formula_and_unknown_cells(self):
+        """Test that only input cells can be set and only cells can be read."""
+        engine = RecalcEngine(_chain_model())
+        with pytest.raises(KeyError):
+            engine.set_inputs({"Sheet1!B1": 1})
+        with pytest.raises(KeyError):
+            engine.set_inputs({"Sheet9!A1": 1})
+        with pytest.raises(KeyError):
+            engine.get("Sheet9!A1")
+
+    def test_failed_recalculation_resumes(self):
+        """Test that a formula raising keeps it dirty until the inputs are fixed."""
+        engine = RecalcEngine(_chain_model())
+        engine.recalculate()
+        engine.set_inputs({"Sheet1!A1": 0})
+
+        with pytest.raises(ZeroDivisionError):
+            engine.get("Sheet1!B2")
+        assert engine.dirty_count >= 1
+
+        engine.set_inputs({"Sheet1!A1": 1})
+        assert engine.get("Sheet1!B2") == 5
+        assert engine.get("Sheet1!C1") == 11
+
+    def test_runtime_fallback_cells_use_the_evaluator(self):
+        """Test that unsupported formulas are evaluated by xlcalculator with the current inputs."""
+        model = _make_model({
+            "Sheet1!A1": (None, 2, []),
+            "Sheet1!B1": ("Sheet1!A1* RAND ()", None, ["Sheet1!A1"]),
+        })
+        with patch("xlcalculator.Evaluator", create=True) as mock_evaluator_class:
+            mock_evaluator_class.return_value.evaluate.return_value = 0.5
+            engine = RecalcEngine(model)
+            engine.set_inputs({"Sheet1!A1": 3})
+
+            assert engine.get("Sheet1!B1") == 0.5
+
+        mock_evaluator_class.assert_called_once_with(model)
+        mock_evaluator_class.return_value.set_cell_value.assert_called_once_with("Sheet1!A1", 3)
+        mock_evaluator_class.return_value.evaluate.assert_called_once_with("Sheet1!B1")
+
+    def test_matches_generated_compute_module(self):
+        """Test that incremental results equal a full computation by the generated code."""
+        logging.getLogger("src").setLevel(logging.ERROR)
+        model = generate_workbook(WorkbookProfile("p", rows=40, columns=8, function_mix={"arithmetic": 1})).to_model()
+        namespace = {}
+        exec(generate_static_python_code(model, as_module=True), namespace)
+        engine = RecalcEngine(model)
+        engine.recalculate()
+
+        inputs = {}
+        for step, address in enumerate(list(namespace["INPUTS"])[:10]):
+            inputs[address] = step + 0.5
+            engine.set_inputs({address: step + 0.5})
+            expected = namespace["compute"](inputs)
+            assert {output: engine.get(output) for output in expected} == expected
@@ -1,3 +1,4 @@
+import asyncio
 import pytest
 import os
 import tempfile
@@ -5,7 +6,7 @@ import subprocess
 from unittest.mock import patch, MagicMock
 import resource
 
-from src.sandbox import execute_script_in_sandbox, set_resource_limits, MAX_CPU_TIME, MAX_MEMORY_BYTES
+from src.sandbox import execute_script_in_sandbox, run_script_in_sandbox, shutdown_sandbox_pool, set_resource_limits, MAX_CPU_TIME, MAX_MEMORY_BYTES
 
 class TestSandbox:
     """Tests for the sandbox execution functionality."""
@@ -73,4 +74,61 @@ class TestSandbox:
         finally:
             # Clean up
             if os.path.exists(script_path):
-                os.remove(script_path) 
\ No newline at end of file
+                os.remove(script_path) 
+
+@pytest.mark.parametrize("pool_size", [0, 1], ids=["subprocess", "pool"])
+class TestRunScriptInSandbox:
+    """Tests for the async sandbox API, with and without the warm worker pool."""
+
+    @pytest.fixture(autouse=True)
+    def sandbox_mode(self, pool_size):
+        with patch("src.sandbox.settings.SANDBOX_POOL_SIZE", pool_size), patch("src.sandbox.set_resource_limits"):
+            yield
+        shutdown_sandbox_pool()
+
+    @pytest.mark.asyncio
+    async def test_runs_script_source(self):
+        """Test that the script source is executed and its output returned."""
+        stdout, stderr, returncode = await run_script_in_sandbox('print("Hello, sandbox!")')
+        assert stdout == "Hello, sandbox!\n"
+        assert stderr == ""
+        assert returncode == 0
+
+    @pytest.mark.asyncio
+    async def test_reports_resource_usage(self, pool_size):
+        """Test that the child's CPU time is reported, and its max RSS where the pool measured it."""
+        usage = {}
+        await run_script_in_sandbox('sum(range(500000))', usage=usage)
+        assert usage["cpu_seconds"] > 0
+        assert (usage["max_rss_kb"] is None) == (pool_size == 0)
+
+    @pytest.mark.asyncio
+    async def test_script_error(self):
+        """Test that a failing script raises CalledProcessError with its stderr."""
+        with pytest.raises(subprocess.CalledProcessError) as exc_info:
+            await run_script_in_sandbox('raise ValueError("boom")')
+        assert exc_info.value.returncode == 1
+        assert "ValueError: boom" in exc_info.value.stderr
+
+    @pytest.mark.asyncio
+    async def test_timeout(self):
+        """Test that a script running past the timeout raises TimeoutExpired."""
+        with pytest.raises(subprocess.TimeoutExpired):
+            await run_script_in_sandbox('import time\nwhile True: time.sleep(1)', timeout=0.5)
+
+    @pytest.mark.asyncio
+    async def test_cancellation_kills_script(self, tmp_path):
+        """Test that cancelling the caller stops the script instead of letting it run on."""
+        marker = tmp_path / "still-running"
+        script = f'import time\ntime.sleep(1)\nopen({str(marker)!r}, "w").close()'
+        task = asyncio.create_task(run_script_in_sandbox(script, timeout=10))
+        await asyncio.sleep(0.3)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(1.5)
+        assert not marker.exists()
+
+        # The sandbox still works afterwards
+        stdout, _, _ = await run_script_in_sandbox('print("ok")')
+        assert stdout == "ok\n"
@@ -0,0 +1,158 @@
+import asyncio
+import os
+import signal
+import subprocess
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+
+from src.sandbox import MAX_CPU_TIME, MAX_MEMORY_BYTES
+from src.sandbox_pool import SandboxPool
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="The sandbox pool needs os.fork")
+
+@pytest.fixture
+def pool():
+    # No preloads keeps the workers quick to start
+    sandbox_pool = SandboxPool(size=1, max_runs_per_worker=3, preload_modules=[])
+    yield sandbox_pool
+    sandbox_pool.shutdown()
+
+@pytest.fixture
+def production_pool():
+    # The preloads and limits `get_sandbox_pool` uses
+    sandbox_pool = SandboxPool(size=1, max_cpu_seconds=MAX_CPU_TIME, max_memory_bytes=MAX_MEMORY_BYTES)
+    yield sandbox_pool
+    sandbox_pool.shutdown()
+
+class TestSandboxPool:
+    """Tests for the warm sandbox worker pool."""
+
+    def test_run_returns_output_and_return_code(self, pool):
+        """A script's stdout, stderr and exit code match a plain `python script.py` run."""
+        stdout, stderr, returncode = pool.run('import sys\nprint("out")\nprint("err", file=sys.stderr)', timeout=5)
+        assert stdout == "out\n"
+        assert stderr == "err\n"
+        assert returncode == 0
+
+    def test_run_reports_exceptions_and_exit_codes(self, pool):
+        """Uncaught exceptions exit with 1 and a traceback; sys.exit codes are passed through."""
+        _, stderr, returncode = pool.run('raise ValueError("boom")', timeout=5)
+        assert returncode == 1
+        assert "ValueError: boom" in stderr
+
+        _, _, returncode = pool.run('import sys\nsys.exit(3)', timeout=5)
+        assert returncode == 3
+
+        _, stderr, returncode = pool.run('print("unterminated', timeout=5)
+        assert returncode == 1
+        assert "SyntaxError" in stderr
+
+    def test_run_reports_child_resource_usage(self, pool):
+        """The CPU time and max RSS of the child that ran the script are reported."""
+        usage = {}
+        pool.run('data = bytearray(32 * 1024 * 1024)\nsum(range(200000))', timeout=5, usage=usage)
+        assert usage["cpu_seconds"] > 0
+        assert usage["max_rss_kb"] >= 32 * 1024
+
+    def test_runs_are_isolated(self, pool):
+        """State set by one script is not visible to the next one in the same worker."""
+        pool.run('import json\njson.leaked = True', timeout=5)
+        stdout, _, _ = pool.run('import json\nprint(hasattr(json, "leaked"))', timeout=5)
+        assert stdout == "False\n"
+
+    def test_timeout_kills_script_and_keeps_worker(self, pool):
+        """A script past its timeout raises TimeoutExpired without costing the worker."""
+        with pytest.raises(subprocess.TimeoutExpired):
+            pool.run('while True: pass', timeout=0.5)
+        stdout, _, _ = pool.run('print("still warm")', timeout=5)
+        assert stdout == "still warm\n"
+        assert pool.get_stats()["workers_started"] == 1
+
+    def test_worker_recycled_after_max_runs(self, pool):
+        """Workers are replaced after max_runs_per_worker scripts."""
+        pids = set()
+        for _ in range(4):
+            stdout, _, _ = pool.run('import os\nprint(os.getppid())', timeout=5)
+            pids.add(int(stdout))
+        assert len(pids) == 2
+        assert pool.get_stats()["workers_recycled"] == 1
+
+    def test_dead_worker_replaced(self, pool):
+        """A worker that dies is replaced and the pool keeps serving scripts."""
+        pool.run('pass', timeout=5)
+        worker = pool._idle.get()
+        os.kill(worker.process.pid, signal.SIGKILL)
+        worker.process.wait()
+        pool._idle.put(worker)
+
+        with pytest.raises(Exception):
+            pool.run('pass', timeout=5)
+        stdout, _, returncode = pool.run('print("recovered")', timeout=5)
+        assert (stdout, returncode) == ("recovered\n", 0)
+        assert pool.get_stats()["worker_crashes"] == 1
+
+    def test_scripts_get_the_limits_of_a_cold_run(self, production_pool):
+        """With the real preloads and limits, each script runs under the limits and can use about as much memory as a cold run."""
+        script = (
+            "import resource\n"
+            "print(resource.getrlimit(resource.RLIMIT_CPU)[0], resource.getrlimit(resource.RLIMIT_DATA)[0])\n"
+            "data = bytearray(48 * 1024 * 1024)\n"
+        )
+        for _ in range(2):
+            stdout, stderr, returncode = production_pool.run(script, timeout=10)
+            assert (stdout, returncode) == (f"{MAX_CPU_TIME} {MAX_MEMORY_BYTES}\n", 0), stderr
+
+        _, stderr, returncode = production_pool.run("data = bytearray(2 * 1024 * 1024 * 1024)", timeout=10)
+        assert returncode == 1
+        assert "MemoryError" in stderr
+
+    def test_scripts_cannot_reach_the_protocol_pipes(self, pool):
+        """A script reads end of file on stdin and has no pipe open besides its stdout and stderr."""
+        script = (
+            "import os, stat\n"
+            "try:\n"
+            "    input()\n"
+            "except EOFError:\n"
+            "    print('eof')\n"
+            "pipes = []\n"
+            "for fd in range(3, 256):\n"
+            "    try:\n"
+            "        if stat.S_ISFIFO(os.fstat(fd).st_mode):\n"
+            "            pipes.append(fd)\n"
+            "    except OSError:\n"
+            "        pass\n"
+            "print(pipes)\n"
+        )
+        stdout, _, returncode = pool.run(script, timeout=5)
+        assert (stdout, returncode) == ("eof\n[]\n", 0)
+        stdout, _, _ = pool.run('print("next")', timeout=5)
+        assert stdout == "next\n"
+
+    @pytest.mark.asyncio
+    async def test_async_callers_wait_without_holding_threads(self, pool):
+        """Callers waiting for a busy worker don't hold threads of the default executor."""
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=2)
+        loop.set_default_executor(executor)
+        runs = [asyncio.create_task(pool.run_async('import time\ntime.sleep(0.5)\nprint("done")', timeout=5)) for _ in range(4)]
+        await asyncio.sleep(0.2)
+
+        # One thread runs the script; the other is still free while three callers wait
+        assert await asyncio.wait_for(asyncio.to_thread(lambda: "free"), timeout=0.2) == "free"
+        results = await asyncio.gather(*runs)
+        assert [stdout for stdout, _, _ in results] == ["done\n"] * 4
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiters_pass_the_worker_on(self, pool):
+        """A caller cancelled while waiting for a worker doesn't keep the next one from getting it."""
+        first = asyncio.create_task(pool.run_async('import time\ntime.sleep(0.3)', timeout=5))
+        await asyncio.sleep(0.1)
+        cancelled = asyncio.create_task(pool.run_async('print("never")', timeout=5))
+        waiting = asyncio.create_task(pool.run_async('print("served")', timeout=5))
+        await asyncio.sleep(0.05)
+        cancelled.cancel()
+
+        await first
+        assert (await asyncio.wait_for(waiting, timeout=5))[0] == "served\n"
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
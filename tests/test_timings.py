@@ -0,0 +1,40 @@
+from unittest.mock import MagicMock
+
+from src.timings import StageTimings, server_timing_header, format_timings_table
+
+class TestStageTimings:
+    """Tests for per-stage wall and CPU timings."""
+
+    def test_progress_calls_time_consecutive_stages(self):
+        """Test that each call ends the running stage and forwards the stage name."""
+        progress = MagicMock()
+        timings = StageTimings(progress)
+        timings("parse")
+        sum(range(100000))
+        timings("order")
+        timings.stop()
+
+        assert list(timings.to_dict()) == ["parse", "order"]
+        assert timings.to_dict()["parse"]["cpu_ms"] > 0
+        assert [call.args[0] for call in progress.call_args_list] == ["parse", "order"]
+
+    def test_add_and_update(self):
+        """Test stages timed elsewhere, with and without CPU time and extra details."""
+        timings = StageTimings()
+        timings.add("ingest", 0.002)
+        timings.add("sandbox", 0.5, 0.25, max_rss_kb=2048)
+        timings.update({"parse": {"wall_ms": 10.0, "cpu_ms": 9.0}})
+
+        assert timings.to_dict()["ingest"] == {"wall_ms": 2.0, "cpu_ms": None}
+        assert timings.to_dict()["sandbox"] == {"wall_ms": 500.0, "cpu_ms": 250.0, "max_rss_kb": 2048}
+        assert timings.wall_seconds() == 0.512
+
+    def test_formatting(self):
+        """Test the Server-Timing header and the CLI table."""
+        timings = {"parse": {"wall_ms": 12.5, "cpu_ms": 11.9}, "total": {"wall_ms": 20.1, "cpu_ms": None}}
+        assert server_timing_header(timings) == 'parse;dur=12.5;desc="cpu 11.9ms", total;dur=20.1'
+
+        table = format_timings_table({**timings, "sandbox": {"wall_ms": 3.0, "cpu_ms": 2.0, "max_rss_kb": 9000}}).splitlines()
+        assert table[0].split() == ["stage", "wall", "ms", "cpu", "ms", "details"]
+        assert table[2].split() == ["total", "20.1", "-"]
+        assert table[3].split() == ["sandbox", "3.0", "2.0", "max_rss_kb=9000"]
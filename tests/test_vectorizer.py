@@ -0,0 +1,201 @@
+import pytest
+import numpy as np
+from unittest.mock import MagicMock, patch
+from xlcalculator.model import Model
+
+from src.dependency_extractor import generate_static_python_code
+from src.diagnostics import collect_diagnostics
+
+def _make_model(formulas: dict, input_cells: list) -> MagicMock:
+    """Build a mock model from input cell addresses and a mapping of cell address to (formula, precedents)."""
+    mock_model = MagicMock(spec=Model)
+    cells = {}
+    for address in input_cells:
+        cell = MagicMock()
+        cell.formula = None
+        cell.value = 0
+        cell.precedents = []
+        cells[address] = cell
+    for address, (formula, precedent_addresses) in formulas.items():
+        cell = MagicMock()
+        cell.formula = formula
+        cell.value = 0
+        precedents = []
+        for precedent_address in precedent_addresses:
+            precedent = MagicMock()
+            precedent.formula_address = precedent_address
+            precedents.append(precedent)
+        cell.precedents = precedents
+        cells[address] = cell
+    mock_model.cells = cells
+    return mock_model
+
+def _filled_down_model(rows: int, extra_formulas: dict | None = None) -> MagicMock:
+    """Sheet1!C2:C<rows+1> = A*B + 1, with A and B as inputs."""
+    input_cells = [f"Sheet1!{column}{row}" for row in range(2, rows + 2) for column in "AB"]
+    formulas = {
+        f"Sheet1!C{row}": (f"Sheet1!A{row}*Sheet1!B{row}+1", [f"Sheet1!A{row}", f"Sheet1!B{row}"])
+        for row in range(2, rows + 2)
+    }
+    formulas.update(extra_formulas or {})
+    return _make_model(formulas, input_cells)
+
+def _run(code: str) -> dict:
+    namespace = {}
+    exec(compile(code, "<generated>", "exec"), namespace)
+    return namespace
+
+class TestVectorizer:
+    """Tests for NumPy codegen of filled-down formula runs."""
+
+    def test_filled_down_column_becomes_one_statement(self):
+        """Test that a filled-down column is emitted as a single array expression."""
+        report = {}
+        code = generate_static_python_code(_filled_down_model(100), report=report, vectorize=True)
+
+        assert "import numpy as np" in code
+        # Arrays start at the first row the run reads or writes
+        assert "    sheet1_C[0:100] = sheet1_A[0:100]*sheet1_B[0:100]+1" in code
+        assert "sheet1_c2" not in code
+        assert report["vectorization"] == {"runs": 1, "vectorized_cells": 100, "arrays": 3}
+        assert np.all(_run(code)["sheet1_C"] == 1)
+
+    def test_vectorize_is_off_by_default(self):
+        """Test that the scalar codegen is unchanged unless vectorize is set."""
+        report = {}
+        code = generate_static_python_code(_filled_down_model(20), report=report)
+
+        assert "numpy" not in code
+        assert "sheet1_c2 = sheet1_a2*sheet1_b2+1" in code
+        assert "vectorization" not in report
+
+    def test_short_runs_stay_scalar(self):
+        """Test that runs shorter than the minimum length are not vectorized."""
+        code = generate_static_python_code(_filled_down_model(3), vectorize=True)
+
+        assert "numpy" not in code
+        assert "sheet1_c4 = sheet1_a4*sheet1_b4+1" in code
+
+    def test_scalar_cells_read_and_write_array_elements(self):
+        """Test that cells outside a run use array elements of vectorized columns."""
+        model = _filled_down_model(20, {
+            "Sheet1!D1": ("Sheet1!C5*2", ["Sheet1!C5"]),
+            "Sheet1!C30": ("Sheet1!A2-1", ["Sheet1!A2"]),
+        })
+        code = generate_static_python_code(model, vectorize=True)
+
+        assert "sheet1_d1 = sheet1_C[3]*2" in code
+        # Rows past the run keep variables of their own
+        assert "sheet1_c30 = sheet1_A[0]-1" in code
+        namespace = _run(code)
+        assert namespace["sheet1_d1"] == 2
+        assert namespace["sheet1_c30"] == -1
+
+    def test_dependents_run_after_the_run(self):
+        """Test that chained runs and their dependents keep evaluation order."""
+        rows = 20
+        extra = {
+            f"Sheet1!D{row}": (f"Sheet1!C{row}^2", [f"Sheet1!C{row}"]) for row in range(2, rows + 2)
+        }
+        extra["Sheet1!E1"] = ("Sheet1!D2+Sheet1!D21", ["Sheet1!D2", "Sheet1!D21"])
+        code = generate_static_python_code(_filled_down_model(rows, extra), vectorize=True)
+
+        lines = [line.strip() for line in code.splitlines()]
+        run_c = lines.index("sheet1_C[0:20] = sheet1_A[0:20]*sheet1_B[0:20]+1")
+        run_d = lines.index("sheet1_D[0:20] = sheet1_C[0:20]**2")
+        assert run_c < run_d < lines.index("sheet1_e1 = sheet1_D[0]+sheet1_D[19]")
+        assert _run(code)["sheet1_e1"] == 2
+
+    def test_headers_and_text_stay_out_of_arrays(self):
+        """Test that headers above a run keep their own variables, and text within the rows of an array keeps its column scalar."""
+        model = _filled_down_model(20)
+        for address, header in {"Sheet1!A1": "Qty", "Sheet1!B1": "Price", "Sheet1!C1": "Total"}.items():
+            model.cells[address] = MagicMock(formula=None, value=header, precedents=[])
+        report = {}
+        code = generate_static_python_code(model, report=report, vectorize=True)
+
+        assert report["vectorization"]["runs"] == 1
+        assert "np.zeros(20) # Sheet1!A2:A21" in code
+        assert "sheet1_Total_1 = 0 # Initialize for Sheet1!C1" in code
+        assert np.all(_run(code)["sheet1_C"] == 1)
+
+        model.cells["Sheet1!B7"].value = "n/a"
+        report = {}
+        code = generate_static_python_code(model, report=report, vectorize=True)
+
+        assert report["vectorization"]["runs"] == 0
+        assert "numpy" not in code
+
+    def test_running_totals_stay_scalar(self):
+        """Test that a column reading its own previous row is not vectorized."""
+        formulas = {"Sheet1!B1": ("Sheet1!A1", ["Sheet1!A1"])}
+        for row in range(2, 30):
+            formulas[f"Sheet1!B{row}"] = (f"Sheet1!B{row - 1}+Sheet1!A{row}", [f"Sheet1!B{row - 1}", f"Sheet1!A{row}"])
+        model = _make_model(formulas, [f"Sheet1!A{row}" for row in range(1, 30)])
+        report = {}
+        code = generate_static_python_code(model, report=report, vectorize=True)
+
+        assert report["vectorization"]["runs"] == 0
+        assert "sheet1_b29 = sheet1_b28+sheet1_a29" in code
+
+    def test_columns_with_runtime_cells_stay_scalar(self):
+        """Test that columns holding runtime-evaluated formulas are not turned into arrays."""
+        model = _filled_down_model(20, {"Sheet1!C22": ("SUM( INDIRECT ( Sheet1!A2 ) )", ["Sheet1!A2"])})
+        report = {}
+        code = generate_static_python_code(model, report=report, vectorize=True)
+
+        assert report["vectorization"]["runs"] == 0
+        assert "sheet1_c22 = _fallback_values['Sheet1!C22'] # Runtime evaluation" in code
+
+    @patch("src.partial_evaluation.Evaluator")
+    def test_precomputed_cells_are_assigned_like_values(self, mock_evaluator_class):
+        """Test that precomputed cells stay out of runs, and text ones keep their column scalar."""
+        mock_evaluator_class.return_value.evaluate.side_effect = lambda address: 3 if address == "Sheet1!D2" else "x"
+        inputs = ["Sheet1!A2:B21"]
+        report = {}
+        code = generate_static_python_code(_filled_down_model(20, {"Sheet1!D2": ("1+2", [])}), report=report, vectorize=True, inputs=inputs)
+
+        assert report["vectorization"]["runs"] == 1
+        assert "sheet1_d2 = 3 # Precomputed at conversion time" in code
+
+        report = {}
+        generate_static_python_code(_filled_down_model(20, {"Sheet1!C22": ('"x"', [])}), report=report, vectorize=True, inputs=inputs)
+        assert report["vectorization"]["runs"] == 0
+
+    def test_interleaved_dependencies_drop_the_run(self):
+        """Test that a run is kept scalar when emitting it at once would break the order."""
+        # E2 reads C2 and C3 reads E2, so C2:C21 can't be computed in one statement
+        formulas = {"Sheet1!E2": ("Sheet1!C2+1", ["Sheet1!C2"])}
+        for row in range(2, 22):
+            formulas[f"Sheet1!C{row}"] = (f"Sheet1!A{row}*2+Sheet1!E{row - 1}", [f"Sheet1!A{row}", f"Sheet1!E{row - 1}"])
+        model = _make_model(formulas, [f"Sheet1!A{row}" for row in range(2, 22)])
+        report = {}
+        code = generate_static_python_code(model, report=report, vectorize=True)
+
+        assert report["vectorization"]["runs"] == 0
+        assert _run(code)["sheet1_c3"] == 1
+
+    def test_division_by_zero_raises_like_scalar_cells(self):
+        """Test that a run dividing by zero raises, as the scalar cells it replaces do, instead of yielding inf."""
+        model = _make_model(
+            {f"Sheet1!C{row}": (f"Sheet1!A{row}/Sheet1!B{row}", [f"Sheet1!A{row}", f"Sheet1!B{row}"]) for row in range(2, 22)},
+            [f"Sheet1!{column}{row}" for row in range(2, 22) for column in "AB"],
+        )
+        code = generate_static_python_code(model, vectorize=True)
+
+        assert 'with np.errstate(divide="raise", invalid="raise"):' in code
+        with pytest.raises(FloatingPointError):
+            _run(code)
+
+    def test_formulas_are_tokenized_once(self):
+        """Test that vectorizing doesn't tokenize formulas again, so their warnings aren't doubled."""
+        # The spaces are reported by the tokenizer; 5 rows are too few for a run
+        formulas = {f"Sheet1!C{row}": (f"Sheet1!A{row} + 1", [f"Sheet1!A{row}"]) for row in range(2, 7)}
+        counts = []
+        for vectorize in (False, True):
+            with collect_diagnostics() as diagnostics:
+                generate_static_python_code(_make_model(formulas, [f"Sheet1!A{row}" for row in range(2, 7)]), vectorize=vectorize)
+            counts.append({entry["code"]: entry["count"] for entry in diagnostics.to_list()})
+
+        assert counts[0]["unrecognized_formula_text"] == 2
+        assert counts[1] == counts[0]
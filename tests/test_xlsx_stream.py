@@ -0,0 +1,136 @@
+import zipfile
+import pytest
+from io import BytesIO
+
+from src.xlsx_stream import read_workbook_streaming
+from src.dependency_extractor import generate_static_python_code
+
+_MAIN_NAMESPACE = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_RELATIONSHIPS_NAMESPACE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_RELATIONSHIP_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+def _make_xlsx(sheets: dict[str, str], defined_names: dict[str, str] | None = None, shared_strings: list[str] | None = None) -> bytes:
+    """Builds a minimal .xlsx archive; `sheets` maps sheet names to the rows of their <sheetData>."""
+    sheet_entries = "".join(f'<sheet name="{name}" sheetId="{i}" r:id="rId{i}"/>' for i, name in enumerate(sheets, 1))
+    name_entries = "".join(f'<definedName name="{name}">{definition}</definedName>' for name, definition in (defined_names or {}).items())
+    relationships = "".join(
+        f'<Relationship Id="rId{i}" Type="{_RELATIONSHIP_TYPE}/worksheet" Target="worksheets/sheet{i}.xml"/>'
+        for i in range(1, len(sheets) + 1)
+    )
+    archive = BytesIO()
+    with zipfile.ZipFile(archive, "w") as z:
+        z.writestr("_rels/.rels", f'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships"><Relationship Id="rId1" Type="{_RELATIONSHIP_TYPE}/officeDocument" Target="xl/workbook.xml"/></Relationships>')
+        z.writestr("xl/workbook.xml", f'<workbook xmlns="{_MAIN_NAMESPACE}" xmlns:r="{_RELATIONSHIPS_NAMESPACE}"><sheets>{sheet_entries}</sheets><definedNames>{name_entries}</definedNames></workbook>')
+        z.writestr("xl/_rels/workbook.xml.rels", f'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">{relationships}</Relationships>')
+        for i, rows in enumerate(sheets.values(), 1):
+            z.writestr(f"xl/worksheets/sheet{i}.xml", f'<worksheet xmlns="{_MAIN_NAMESPACE}"><sheetData>{rows}</sheetData></worksheet>')
+        if shared_strings is not None:
+            items = "".join(f"<si><t>{text}</t></si>" for text in shared_strings)
+            z.writestr("xl/sharedStrings.xml", f'<sst xmlns="{_MAIN_NAMESPACE}">{items}</sst>')
+    return archive.getvalue()
+
+class TestXlsxStream:
+    """Tests for the streaming .xlsx ingest engine."""
+
+    def test_shared_formula_groups_are_expanded(self):
+        """Test that each cell of a shared-formula group gets the formula moved to it, `$` references staying put."""
+        rows = (
+            '<row r="1"><c r="A1"><v>2</v></c><c r="B1"><v>10</v></c></row>'
+            '<row r="2"><c r="A2"><v>3</v></c><c r="B2"><f t="shared" ref="B2:B3" si="0">A1*$B$1+A2</f><v>23</v></c></row>'
+            '<row r="3"><c r="A3"><v>4</v></c><c r="B3"><f t="shared" si="0"/><v>34</v></c></row>'
+        )
+        report = {}
+        model = read_workbook_streaming(_make_xlsx({"Sheet1": rows}), report)
+
+        assert model.cells["Sheet1!B2"].formula == "Sheet1!A1*Sheet1!B1+Sheet1!A2"
+        assert model.cells["Sheet1!B3"].formula == "Sheet1!A2*Sheet1!B1+Sheet1!A3"
+        assert model.cells["Sheet1!B3"].value == 34
+        assert [p.formula_address for p in model.cells["Sheet1!B3"].precedents] == ["Sheet1!A2", "Sheet1!B1", "Sheet1!A3"]
+        assert report["ingest"]["formulas"] == 2
+        assert report["ingest"]["shared_formula_cells"] == 1
+
+    def test_only_referenced_constants_and_headers_are_kept(self):
+        """Test that constants no formula reads are skipped, except the header row, and ranges are clipped to the sheet."""
+        rows = (
+            '<row r="1"><c r="A1" t="inlineStr"><is><t>Price</t></is></c><c r="B1" t="inlineStr"><is><t>Total</t></is></c></row>'
+            '<row r="2"><c r="A2"><v>1.5</v></c><c r="B2"><f>SUM(A2:A1000)</f><v>4</v></c><c r="D2"><v>99</v></c></row>'
+            '<row r="3"><c r="A3"><v>2.5</v></c><c r="D3"><v>98</v></c></row>'
+        )
+        report = {}
+        model = read_workbook_streaming(_make_xlsx({"Sheet1": rows}), report)
+
+        assert list(model.cells) == ["Sheet1!A1", "Sheet1!B1", "Sheet1!A2", "Sheet1!B2", "Sheet1!A3"]
+        assert model.cells["Sheet1!A1"].value == "Price"
+        assert model.cells["Sheet1!A2"].value == 1.5
+        assert [p.formula_address for p in model.cells["Sheet1!B2"].precedents] == ["Sheet1!A2", "Sheet1!A3"]
+        assert report["ingest"]["constants"] == 4
+        assert report["ingest"]["skipped_constants"] == 2
+
+    def test_formulas_are_normalized(self):
+        """Test that defined names, function prefixes and sheet quotes are rewritten, and string literals left alone."""
+        books = {
+            "Sheet1": '<row r="1"><c r="A1"><f>_xlfn.STDEV.S(\'My Inputs\'!A1:A2)*Rate&amp;"A1"</f></c></row>',
+            "My Inputs": '<row r="1"><c r="A1"><v>1</v></c></row><row r="2"><c r="A2"><v>3</v></c><c r="B2"><v>0.5</v></c></row>',
+        }
+        model = read_workbook_streaming(_make_xlsx(books, {"Rate": "'My Inputs'!$B$2", "_xlnm.Print_Area": "Sheet1!$A$1:$B$2"}))
+
+        assert model.cells["Sheet1!A1"].formula == "STDEV.S('My Inputs'!A1:A2)*'My Inputs'!B2&\"A1\""
+        assert [p.formula_address for p in model.cells["Sheet1!A1"].precedents] == ["My Inputs!A1", "My Inputs!A2", "My Inputs!B2"]
+        assert model.defined_names == {"Rate": "'My Inputs'!$B$2"}
+        assert model.ranges == {"My Inputs!A1:A2": "My Inputs!A1:A2"}
+
+    def test_values_of_each_cell_type(self):
+        """Test that shared strings, booleans, errors and numbers are read with their types."""
+        rows = (
+            '<row r="1"><c r="A1" t="s"><v>1</v></c><c r="B1" t="b"><v>1</v></c><c r="C1" t="e"><v>#DIV/0!</v></c><c r="D1"><v>7</v></c></row>'
+            '<row r="2"><c r="A2" t="str"><f>A1&amp;B1&amp;C1&amp;D1</f><v>x</v></c></row>'
+        )
+        model = read_workbook_streaming(_make_xlsx({"Sheet1": rows}, shared_strings=["unused", "label"]))
+
+        assert [cell.value for cell in model.cells.values()] == ["label", True, "#DIV/0!", 7, "x"]
+
+    def test_rejects_files_that_are_not_archives(self):
+        """Test that a file that isn't an .xlsx archive raises instead of producing an empty model."""
+        with pytest.raises(zipfile.BadZipFile):
+            read_workbook_streaming(b"Name,Value\nA,1\n")
+
+    def test_streamed_model_converts(self):
+        """Test that the streamed model runs through the converter like a parsed one, headers naming variables."""
+        rows = (
+            '<row r="1"><c r="A1" t="inlineStr"><is><t>Qty</t></is></c><c r="B1" t="inlineStr"><is><t>Cost</t></is></c><c r="C1" t="inlineStr"><is><t>Price</t></is></c></row>'
+            '<row r="2"><c r="A2"><v>2</v></c><c r="B2"><f t="shared" ref="B2:B3" si="0">A2*$C$2</f></c><c r="C2"><v>10</v></c></row>'
+            '<row r="3"><c r="A3"><v>3</v></c><c r="B3"><f t="shared" si="0"/></c><c r="C3"><f>B2+B3</f></c></row>'
+        )
+        code = generate_static_python_code(read_workbook_streaming(_make_xlsx({"Sheet1": rows})))
+
+        assert "sheet1_Cost_2 = sheet1_Qty_2*sheet1_Price_2" in code
+        assert "sheet1_Cost_3 = sheet1_Qty_3*sheet1_Price_2" in code
+        assert "sheet1_Price_3 = sheet1_Cost_2+sheet1_Cost_3" in code
+
+    def test_sheet_names_with_spaces_convert(self):
+        """Test that quoted references to a sheet whose name has spaces resolve to the variables of its cells."""
+        rows = (
+            '<row r="1"><c r="A1" t="inlineStr"><is><t>Qty</t></is></c><c r="B1" t="inlineStr"><is><t>Total</t></is></c></row>'
+            '<row r="2"><c r="A2"><v>2</v></c><c r="B2"><f>A2*3</f></c></row>'
+            '<row r="3"><c r="A3"><v>4</v></c><c r="B3"><f>SUM(A2:A3)+B2</f></c></row>'
+        )
+        code = generate_static_python_code(read_workbook_streaming(_make_xlsx({"Client Billing": rows})), vectorize=True)
+
+        assert "client_billing_Total_2 = client_billing_Qty_2*3" in code
+        assert "client_billing_Total_3 = sum([client_billing_Qty_2, client_billing_Qty_3])+client_billing_Total_2" in code
+        compile(code, "<generated>", "exec")
+
+    def test_streamed_model_precomputes_constants(self):
+        """Test that formulas independent of the declared inputs are evaluated from a streamed model."""
+        pytest.importorskip("xlcalculator.xltypes")
+        rows = (
+            '<row r="1"><c r="A1" t="inlineStr"><is><t>Qty</t></is></c><c r="B1" t="inlineStr"><is><t>Rate</t></is></c><c r="C1" t="inlineStr"><is><t>Total</t></is></c></row>'
+            '<row r="2"><c r="A2"><v>2</v></c><c r="B2"><f>SUM(D2:D3)*10</f></c><c r="C2"><f>A2*B2</f></c><c r="D2"><v>0.5</v></c></row>'
+            '<row r="3"><c r="D3"><v>1.5</v></c></row>'
+        )
+        report = {}
+        code = generate_static_python_code(read_workbook_streaming(_make_xlsx({"My Sheet": rows})), report=report, inputs=["My Sheet!A2"])
+
+        assert "my_sheet_Rate_2 = 20.0 # Precomputed at conversion time" in code
+        assert "my_sheet_Total_2 = my_sheet_Qty_2*my_sheet_Rate_2" in code
+        assert report["constant_folding"]["folded_cells"] == 1